@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory, redirect
+from flask import Flask, request, jsonify, send_from_directory, redirect, Response
 from flask_cors import CORS
 from eth_account.messages import encode_defunct
 from eth_account import Account
@@ -7,10 +7,17 @@ import socket
 import json
 from datetime import datetime
 from persistence.repository_impl.richieste_repository_impl import RichiesteRepositoryImpl
+from persistence.repository_impl import db_default_string
 
 from web3 import Web3
 from presentation.controller.credential_controller import ControllerAutenticazione
 from presentation.controller.blockchain_controller import BlockchainController
+from presentation.controller.blockchain_outbox import BlockchainOutbox
+from presentation.controller.registro_esiti import RegistroEsiti
+from enforcement.guarantee_response_enforcer import response_metrics
+from persistence.repository_impl.co2_repository_impl import Co2RepositoryImpl
+from persistence.repository_impl.product_repository_impl import ProductRepositoryImpl
+from persistence.repository_impl.esiti_firma_repository_impl import EsitiFirmaRepositoryImpl
 
 # Ottieni il percorso assoluto della directory corrente (dove si trova questo file)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,9 +25,21 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 app = Flask(__name__)
 CORS(app) 
 
-esiti_operazioni = {}
-esiti_richieste_token = {}
-esiti_accettazioni_token = {}
+# Esiti delle firme: chi li attende su /attendi_esito viene svegliato appena conferma_* li registra.
+# Con ESITI_PERSISTENTI=1 sono salvati anche su SQLite, condivisi tra più processi del backend
+esiti = RegistroEsiti(repository=EsitiFirmaRepositoryImpl() if os.getenv("ESITI_PERSISTENTI") == "1" else None)
+
+# Attesa massima concessa a una singola richiesta di /attendi_esito
+ATTESA_MASSIMA = 300  # secondi
+
+
+def registra_esito_operazione(address, id_operazione, esito):
+    """Callback dell'outbox: salva l'esito arrivato con la ricevuta della transazione."""
+    esiti.registra(RegistroEsiti.OPERAZIONE, address, id_operazione, esito)
+    print(f"Salvato esito per {address}/{id_operazione}: {esito}")
+
+
+outbox = BlockchainOutbox(on_esito=registra_esito_operazione)
 
 
 @app.route("/firma.html")
@@ -117,9 +136,8 @@ def conferma_operazione():
         except Exception as e:
             error_msg = f"❌ Errore nel parsing del messaggio: {str(e)}"
             print(error_msg)
-            if address not in esiti_operazioni:
-                esiti_operazioni[address] = {}
-            esiti_operazioni[address][id_operazione] = error_msg
+            if 'id_operazione' in locals():
+                esiti.registra(RegistroEsiti.OPERAZIONE, address, id_operazione, error_msg)
             return jsonify({"message": error_msg}), 400
 
         # Verifica firma
@@ -128,41 +146,28 @@ def conferma_operazione():
 
         if recovered_address.lower() != address.lower():
             error_msg = "❌ Firma non valida"
-            if address not in esiti_operazioni:
-                esiti_operazioni[address] = {}
-            esiti_operazioni[address][id_operazione] = error_msg
+            esiti.registra(RegistroEsiti.OPERAZIONE, address, id_operazione, error_msg)
             return jsonify({"message": error_msg}), 400
             
         # Verifica che l'azienda sia registrata sulla blockchain
         controller = BlockchainController()
         if not controller.is_company_registered(address):
             error_msg = "❌ L'azienda non è registrata sulla blockchain. Registrare l'azienda prima di effettuare operazioni."
-            if address not in esiti_operazioni:
-                esiti_operazioni[address] = {}
-            esiti_operazioni[address][id_operazione] = error_msg
+            esiti.registra(RegistroEsiti.OPERAZIONE, address, id_operazione, error_msg)
             return jsonify({"message": error_msg}), 400
 
-        # Chiamata al controller per inviare sulla blockchain
-        controller = BlockchainController()
-        tx_hash = controller.invia_operazione(
-            operation_type=tipo,
-            description=messaggio,
-            batch_id=batch_id,
-            id_operazione=id_operazione,
-            account_address=address
-        )
+        # L'invio sulla blockchain avviene in background: l'esito arriva con la ricevuta
+        if not outbox.accoda(address, id_operazione, tipo, batch_id, messaggio):
+            return jsonify({"message": "⏳ Operazione già in elaborazione"}), 202
 
-        if address not in esiti_operazioni:
-            esiti_operazioni[address] = {}
-        esiti_operazioni[address][id_operazione] = f"✅ Operazione registrata con successo. Tx hash: {tx_hash}"
-        print(f"Salvato esito per {address}/{id_operazione}: {esiti_operazioni[address][id_operazione]}")
-        return jsonify({"message": esiti_operazioni[address][id_operazione]})
+        print(f"Operazione {address}/{id_operazione} in coda per la blockchain")
+        return jsonify({"message": "⏳ Operazione in coda per la registrazione sulla blockchain"}), 202
 
     except Exception as e:
-        if address not in esiti_operazioni:
-            esiti_operazioni[address] = {}
-        esiti_operazioni[address][id_operazione] = f"❌ Errore: {str(e)}"
-        return jsonify({"message": esiti_operazioni[address][id_operazione]}), 400
+        error_msg = f"❌ Errore: {str(e)}"
+        if 'address' in locals() and 'id_operazione' in locals():
+            esiti.registra(RegistroEsiti.OPERAZIONE, address, id_operazione, error_msg)
+        return jsonify({"message": error_msg}), 400
     
 @app.route("/firma_azione_compensativa.html")
 def firma_azione_compensativa_html():
@@ -206,32 +211,26 @@ def conferma_azione_compensativa():
         except Exception as e:
             error_msg = f"❌ Errore nel parsing del messaggio: {str(e)}"
             print(error_msg)
-            if address not in esiti_operazioni:
-                esiti_operazioni[address] = {}
-            esiti_operazioni[address][id_azione] = error_msg
-            return jsonify({"message": esiti_operazioni[address][id_azione]}), 400
+            esiti.registra(RegistroEsiti.AZIONE_COMPENSATIVA, address, id_azione, error_msg)
+            return jsonify({"message": error_msg}), 400
 
         # Verifica firma
         eth_message = encode_defunct(text=messaggio)
         recovered_address = Account.recover_message(eth_message, signature=signature)
 
         if recovered_address.lower() != address.lower():
-            if address not in esiti_operazioni:
-                esiti_operazioni[address] = {}
-            esiti_operazioni[address][id_azione] = "❌ Firma non valida"
-            return jsonify({"message": esiti_operazioni[address][id_azione]}), 400
+            error_msg = "❌ Firma non valida"
+            esiti.registra(RegistroEsiti.AZIONE_COMPENSATIVA, address, id_azione, error_msg)
+            return jsonify({"message": error_msg}), 400
             
         # Verifica che l'azienda sia registrata sulla blockchain
         controller = BlockchainController()
         if not controller.is_company_registered(address):
             error_msg = "❌ L'azienda non è registrata sulla blockchain. Registrare l'azienda prima di effettuare azioni compensative."
-            if address not in esiti_operazioni:
-                esiti_operazioni[address] = {}
-            esiti_operazioni[address][id_azione] = error_msg
+            esiti.registra(RegistroEsiti.AZIONE_COMPENSATIVA, address, id_azione, error_msg)
             return jsonify({"message": error_msg}), 400
 
-        # Chiamata al controller per inviare sulla blockchain
-        controller = BlockchainController()
+        # Stesso controller della verifica di registrazione per inviare sulla blockchain
         description = f"Azione compensativa: {tipo}, CO2 compensata: {co2_compensata}"
         
         # Assicurati che co2_compensata sia un intero
@@ -249,114 +248,72 @@ def conferma_azione_compensativa():
             account_address=address
         )
 
-        # Converti id_azione in intero per garantire coerenza
-        try:
-            id_azione_int = int(id_azione)
-        except (ValueError, TypeError):
-            id_azione_int = id_azione  # Mantieni come stringa se non convertibile
-
-        if address not in esiti_operazioni:
-            esiti_operazioni[address] = {}
-        esiti_operazioni[address][id_azione_int] = f"✅ Azione compensativa registrata con successo. Tx hash: {tx_hash}"
-        return jsonify({"message": esiti_operazioni[address][id_azione_int]})
+        esito = f"✅ Azione compensativa registrata con successo. Tx hash: {tx_hash}"
+        esiti.registra(RegistroEsiti.AZIONE_COMPENSATIVA, address, id_azione, esito)
+        return jsonify({"message": esito})
 
     except Exception as e:
-        if address not in esiti_operazioni:
-            esiti_operazioni[address] = {}
-        if 'id_azione_int' in locals():
-            esiti_operazioni[address][id_azione_int] = f"❌ Errore: {str(e)}"
-            return jsonify({"message": esiti_operazioni[address][id_azione_int]}), 400
-        elif 'id_azione' in locals():
-            # Converti id_azione in intero per garantire coerenza
-            try:
-                id_azione_int = int(id_azione)
-            except (ValueError, TypeError):
-                id_azione_int = id_azione  # Mantieni come stringa se non convertibile
-            esiti_operazioni[address][id_azione_int] = f"❌ Errore: {str(e)}"
-            return jsonify({"message": esiti_operazioni[address][id_azione_int]}), 400
-        else:
-            error_message = f"❌ Errore: {str(e)}"
-            return jsonify({"message": error_message}), 400
+        error_msg = f"❌ Errore: {str(e)}"
+        if 'address' in locals() and 'id_azione' in locals():
+            esiti.registra(RegistroEsiti.AZIONE_COMPENSATIVA, address, id_azione, error_msg)
+        return jsonify({"message": error_msg}), 400
 
 
 
 
-@app.route("/esito_operazione/<address>/<id_operazione>", methods=["GET"])
-def esito_operazione(address, id_operazione):
-    # Normalizza l'indirizzo per garantire corrispondenza case-insensitive
-    address = address.lower()
-    print(f"Verifico esito operazione per {address}/{id_operazione}, esiti disponibili: {esiti_operazioni.get(address, {})}")
-    
-    # Prova a convertire l'ID in intero
+def esito_da_outbox(address, id_operazione):
+    """Esito di un'operazione non più in memoria (es. dopo un riavvio): lo stato è nell'outbox."""
     try:
-        id_operazione_int = int(id_operazione)
-        print(f"ID operazione convertito in intero: {id_operazione_int}")
+        esito_outbox = outbox.repository.get_esito(address.lower(), int(id_operazione))
     except (ValueError, TypeError):
-        id_operazione_int = None
-        print(f"Impossibile convertire l'ID operazione in intero: {id_operazione}")
-    
-    # Controlla sia l'ID come stringa che come intero
-    if address in esiti_operazioni:
-        if id_operazione in esiti_operazioni[address]:
-            esito = esiti_operazioni[address][id_operazione]
-            print(f"Trovato esito per ID stringa {id_operazione}: {esito}")
-            return jsonify({"status": "completed", "esito": esito}), 200
-        elif id_operazione_int is not None and id_operazione_int in esiti_operazioni[address]:
-            esito = esiti_operazioni[address][id_operazione_int]
-            print(f"Trovato esito per ID intero {id_operazione_int}: {esito}")
-            return jsonify({"status": "completed", "esito": esito}), 200
-        else:
-            print(f"Nessun esito trovato per ID {id_operazione} o {id_operazione_int}")
-    else:
-        print(f"Nessuna operazione trovata per l'indirizzo {address}")
-
-    return jsonify({"status": "pending"}), 202
+        return None
+    if esito_outbox:
+        stato, tx_hash, errore = esito_outbox
+        if stato == db_default_string.STATO_OUTBOX_CONFERMATA:
+            return f"✅ Operazione registrata con successo. Tx hash: {tx_hash}"
+        if stato == db_default_string.STATO_OUTBOX_FALLITA:
+            return f"❌ Errore: {errore}"
+    return None
+
+
+def risposta_esito(esito):
+    if esito is None:
+        return jsonify({"status": "pending"}), 202
+    return jsonify({"status": "completed", "esito": esito}), 200
+
+
+@app.route("/attendi_esito/<tipo>/<address>/<id_riferimento>", methods=["GET"])
+def attendi_esito(tipo, address, id_riferimento):
+    """
+    Long-poll: la risposta parte appena conferma_* registra l'esito, o dopo ?timeout= secondi
+    (al massimo ATTESA_MASSIMA) con status pending. Sostituisce le richieste ripetute a /esito_*.
+    """
+    if tipo not in RegistroEsiti.TIPI:
+        return jsonify({"message": f"Tipo non valido: {tipo}"}), 400
+    try:
+        timeout = min(max(float(request.args.get("timeout", 30)), 0), ATTESA_MASSIMA)
+    except ValueError:
+        return jsonify({"message": "timeout deve essere un numero di secondi"}), 400
+
+    if tipo == RegistroEsiti.OPERAZIONE and esiti.get(tipo, address, id_riferimento) is None:
+        esito = esito_da_outbox(address, id_riferimento)
+        if esito is not None:
+            return risposta_esito(esito)
+    return risposta_esito(esiti.attendi(tipo, address, id_riferimento, timeout))
+
+
+@app.route("/esito_operazione/<address>/<id_operazione>", methods=["GET"])
+def esito_operazione(address, id_operazione):
+    esito = esiti.get(RegistroEsiti.OPERAZIONE, address, id_operazione)
+    return risposta_esito(esito if esito is not None else esito_da_outbox(address, id_operazione))
 
 @app.route("/esito_azione_compensativa/<address>", methods=["GET"])
 @app.route("/esito_azione_compensativa/<address>/<id_azione>", methods=["GET"])
 def esito_azione_compensativa(address, id_azione=None):
-    print(f"Richiesta esito azione compensativa per {address} con ID {id_azione}")
-    print(f"Contenuto esiti_operazioni: {esiti_operazioni}")
-    
-    # Normalizza l'indirizzo per garantire corrispondenza case-insensitive
-    address = address.lower()
-    
-    if address in esiti_operazioni:
-        print(f"Trovate operazioni per l'indirizzo {address}: {esiti_operazioni[address]}")
-        
-        # Se è stato specificato un ID azione
-        if id_azione is not None:
-            print(f"Cercando l'ID azione: {id_azione}")
-            
-            # Prova a convertire l'ID in intero se è una stringa numerica
-            id_azione_int = None
-            try:
-                id_azione_int = int(id_azione)
-                print(f"ID azione convertito in intero: {id_azione_int}")
-            except (ValueError, TypeError):
-                print(f"Impossibile convertire l'ID azione in intero: {id_azione}")
-            
-            # Controlla sia l'ID come stringa che come intero
-            if id_azione in esiti_operazioni[address]:
-                esito = esiti_operazioni[address][id_azione]
-                print(f"Trovato esito per ID stringa {id_azione}: {esito}")
-                return jsonify({"status": "completed", "esito": esito}), 200
-            elif id_azione_int is not None and id_azione_int in esiti_operazioni[address]:
-                esito = esiti_operazioni[address][id_azione_int]
-                print(f"Trovato esito per ID intero {id_azione_int}: {esito}")
-                return jsonify({"status": "completed", "esito": esito}), 200
-            else:
-                print(f"Nessun esito trovato per ID {id_azione} o {id_azione_int}")
-        elif id_azione is None:
-            # Se non è stato specificato un ID azione, restituisci il primo esito trovato
-            print("Nessun ID azione specificato, restituisco il primo esito trovato")
-            for action_id, esito in esiti_operazioni[address].items():
-                print(f"Restituisco esito per ID {action_id}: {esito}")
-                return jsonify({"status": "completed", "esito": esito}), 200
-    else:
-        print(f"Nessuna operazione trovata per l'indirizzo {address}")
-
-    return jsonify({"status": "pending"}), 202
+    if id_azione is None:
+        # Senza ID azione viene restituito il primo esito trovato per l'indirizzo
+        return risposta_esito(esiti.primo(RegistroEsiti.AZIONE_COMPENSATIVA, address))
+    return risposta_esito(esiti.get(RegistroEsiti.AZIONE_COMPENSATIVA, address, id_azione))
 
 @app.route("/conferma_richiesta_token", methods=["POST"])
 def conferma_richiesta_token():
@@ -408,10 +365,8 @@ def conferma_richiesta_token():
             )
             
             # Salva l'esito positivo
-            if address not in esiti_richieste_token:
-                esiti_richieste_token[address] = {}
-            
-            esiti_richieste_token[address][destinatario] = f"✅ Richiesta token inviata con successo! ID: {id_richiesta} - Tx Hash: {tx_hash}"
+            esiti.registra(RegistroEsiti.RICHIESTA_TOKEN, address, destinatario,
+                           f"✅ Richiesta token inviata con successo! ID: {id_richiesta} - Tx Hash: {tx_hash}")
             
             return jsonify({
                 "message": "Richiesta token inviata con successo",
@@ -420,10 +375,8 @@ def conferma_richiesta_token():
             })
         except Exception as e:
             # Salva l'esito negativo
-            if address not in esiti_richieste_token:
-                esiti_richieste_token[address] = {}
-            
-            esiti_richieste_token[address][destinatario] = f"❌ Errore nell'invio della richiesta token: {str(e)}"
+            esiti.registra(RegistroEsiti.RICHIESTA_TOKEN, address, destinatario,
+                           f"❌ Errore nell'invio della richiesta token: {str(e)}")
             
             return jsonify({"message": f"Errore nell'invio della richiesta token: {str(e)}"}), 500
 
@@ -460,11 +413,8 @@ def conferma_accettazione_token():
             )
 
             
-            if address not in esiti_accettazioni_token:
-                esiti_accettazioni_token[address] = {}
-            
-            esiti_accettazioni_token[address][id_richiesta] = f"✅ Richiesta token accettata con successo! ID: {id_richiesta} - Tx Hash: {tx_hash}"
-            print(f"Salvato esito per {address}/{id_richiesta}: {esiti_accettazioni_token[address][id_richiesta]}")
+            esito = f"✅ Richiesta token accettata con successo! ID: {id_richiesta} - Tx Hash: {tx_hash}"
+            print(f"Salvato esito per {address}/{id_richiesta}: {esito}")
             
             # Aggiorna lo stato della richiesta nel database
             try:
@@ -474,6 +424,9 @@ def conferma_accettazione_token():
                 print(f"Stato della richiesta token {id_richiesta} aggiornato a 'Accettata' nel database")
             except Exception as e:
                 print(f"Errore nell'aggiornamento dello stato della richiesta token: {e}")
+
+            # Registrato dopo l'aggiornamento del database: chi attende l'esito trova la richiesta già accettata
+            esiti.registra(RegistroEsiti.ACCETTAZIONE_TOKEN, address, id_richiesta, esito)
             
             return jsonify({
                 "message": "Richiesta token accettata con successo",
@@ -482,10 +435,8 @@ def conferma_accettazione_token():
             })
         except Exception as e:
             # Salva l'esito negativo
-            if address not in esiti_richieste_token:
-                esiti_richieste_token[address] = {}
-            
-            esiti_richieste_token[address][id_richiesta] = f"❌ Errore nell'accettazione della richiesta token: {str(e)}"
+            esiti.registra(RegistroEsiti.ACCETTAZIONE_TOKEN, address, id_richiesta,
+                           f"❌ Errore nell'accettazione della richiesta token: {str(e)}")
             
             return jsonify({"message": f"Errore nell'accettazione della richiesta token: {str(e)}"}), 500
 
@@ -494,48 +445,50 @@ def conferma_accettazione_token():
 
 @app.route("/esito_richiesta_token/<address>/<destinatario>", methods=["GET"])
 def esito_richiesta_token(address, destinatario):
-    # Normalizza l'indirizzo per garantire corrispondenza case-insensitive
-    address = address.lower()
-    
-    if address in esiti_richieste_token and destinatario in esiti_richieste_token[address]:
-        esito = esiti_richieste_token[address][destinatario]
-        return jsonify({"status": "completed", "esito": esito}), 200
-
-    return jsonify({"status": "pending"}), 202
+    return risposta_esito(esiti.get(RegistroEsiti.RICHIESTA_TOKEN, address, destinatario))
 
 @app.route("/esito_accettazione_token/<address>/<id_richiesta>", methods=["GET"])
 def esito_accettazione_token(address, id_richiesta):
-    # Normalizza l'indirizzo per garantire corrispondenza case-insensitive
-    address = address.lower()
-    print(f"Verifico esito per {address}/{id_richiesta}, disponibili: {esiti_accettazioni_token.get(address, {})}")
-    
-    # Prova a convertire l'ID in intero
-    try:
-        id_richiesta_int = int(id_richiesta)
-        print(f"ID richiesta convertito in intero: {id_richiesta_int}")
-    except (ValueError, TypeError):
-        id_richiesta_int = None
-        print(f"Impossibile convertire l'ID richiesta in intero: {id_richiesta}")
-    
-    # Controlla sia l'ID come stringa che come intero
-    if address in esiti_accettazioni_token:
-        if id_richiesta in esiti_accettazioni_token[address]:
-            esito = esiti_accettazioni_token[address][id_richiesta]
-            print(f"Trovato esito per ID stringa {id_richiesta}: {esito}")
-            return jsonify({"status": "completed", "esito": esito}), 200
-        elif id_richiesta_int is not None and id_richiesta_int in esiti_accettazioni_token[address]:
-            esito = esiti_accettazioni_token[address][id_richiesta_int]
-            print(f"Trovato esito per ID intero {id_richiesta_int}: {esito}")
-            return jsonify({"status": "completed", "esito": esito}), 200
-        else:
-            print(f"Nessun esito trovato per ID {id_richiesta} o {id_richiesta_int}")
-    else:
-        print(f"Nessuna operazione trovata per l'indirizzo {address}")
-
-    return jsonify({"status": "pending"}), 202
-
-
+    return risposta_esito(esiti.get(RegistroEsiti.ACCETTAZIONE_TOKEN, address, id_richiesta))
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Latenze di repository e blockchain in formato Prometheus (text exposition 0.0.4)."""
+    return Response(response_metrics.export_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/catalogo_co2", methods=["GET"])
+def catalogo_co2():
+    """
+    Prodotti in vendita con la CO2 totale e unitaria del lotto.
+    ?ordine=asc|desc ordina per CO2 unitaria, ?aggiorna=1 ricalcola tutto il catalogo prima di leggerlo.
+    """
+    ordine = request.args.get("ordine", "").upper()
+    if ordine not in ("", "ASC", "DESC"):
+        return jsonify({"message": "ordine deve essere asc o desc"}), 400
+    if request.args.get("aggiorna") == "1":
+        Co2RepositoryImpl().aggiorna_catalogo(completo=True)
+
+    prodotti = ProductRepositoryImpl().iter_catalogo_co2(ordine or None)
+
+    def genera():
+        # Lista JSON scritta un prodotto alla volta mentre viene letto, senza costruirla in memoria
+        yield "["
+        for i, p in enumerate(prodotti):
+            yield ("," if i else "") + json.dumps({
+                "nome": p.nome,
+                "id_lotto": p.numero_lotto,
+                "azienda": p.nome_azienda,
+                "id_prodotto": p.prodotto_id,
+                "co2_totale": p.co2_totale,
+                "co2_unitaria": p.co2_unitaria,
+            })
+        yield "]"
 
+    return Response(genera(), content_type="application/json")
 
 if __name__ == "__main__":
-    app.run(port=5001)
+    outbox.avvia()
+    # Un thread per richiesta: le attese su /attendi_esito non bloccano le conferme
+    app.run(port=5001, threaded=True)
@@ -0,0 +1,114 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+"""
+Confronto di memoria e tempo nel materializzare le operazioni di un'azienda come:
+  - dataclass senza slots (come erano i modelli),
+  - OperazioneEstesaModel con slots, costruita come nei repository,
+  - OperazioneEstesaRiga (NamedTuple) costruita dalla row factory del cursore.
+
+Uso: python benchmark_modelli.py [numero_operazioni]   (predefinito 1.000.000)
+"""
+import argparse
+import dataclasses
+import gc
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+from model.operation_estesa_model import OperazioneEstesaModel, OperazioneEstesaRiga
+from persistence.row_factory import crea_row_factory
+
+# Stessi campi di OperazioneEstesaModel, ma con __dict__ per istanza
+OperazioneEstesaSenzaSlots = dataclasses.make_dataclass(
+    "OperazioneEstesaSenzaSlots",
+    [(f.name, f.type, f) for f in dataclasses.fields(OperazioneEstesaModel)],
+)
+
+QUERY = """
+    SELECT Id_operazione, Id_prodotto, Nome, Data_operazione, Consumo_CO2, Tipo, quantita, blockchain_registered, Id_lotto
+    FROM Operazione
+"""
+
+
+def crea_database(numero_operazioni: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE Operazione (
+            Id_operazione INTEGER PRIMARY KEY, Id_prodotto INTEGER, Nome TEXT, Data_operazione TEXT,
+            Consumo_CO2 INTEGER, Tipo TEXT, quantita INTEGER, blockchain_registered INTEGER, Id_lotto INTEGER
+        )""")
+    conn.executemany(
+        "INSERT INTO Operazione VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((i, i % 50, f"Prodotto {i % 50}", "2025-01-01 10:00:00", i % 300, "produzione", 1 + i % 20, i % 2, i)
+         for i in range(numero_operazioni)),
+    )
+    return conn
+
+
+def da_modello_keyword(riga):
+    # Il modello non ha lo stesso ordine dei campi della query: è la costruzione usata dai repository
+    return OperazioneEstesaModel(id_operazione=riga[0], id_lotto=riga[8], id_prodotto=riga[1], nome_prodotto=riga[2],
+                                 data_operazione=riga[3], consumo_co2=riga[4], nome_operazione=riga[5],
+                                 quantita_prodotto=riga[6], blockchain_registered=bool(riga[7]))
+
+
+def da_senza_slots(riga):
+    return OperazioneEstesaSenzaSlots(id_operazione=riga[0], id_lotto=riga[8], id_prodotto=riga[1], nome_prodotto=riga[2],
+                                      data_operazione=riga[3], consumo_co2=riga[4], nome_operazione=riga[5],
+                                      quantita_prodotto=riga[6], blockchain_registered=bool(riga[7]))
+
+
+def materializza(conn, row_factory):
+    cur = conn.cursor()
+    cur.row_factory = row_factory
+    return cur.execute(QUERY).fetchall()
+
+
+def dimensione_oggetto(oggetto) -> int:
+    """Byte occupati dall'oggetto e dal suo eventuale __dict__, esclusi i valori dei campi."""
+    dimensione = sys.getsizeof(oggetto)
+    if hasattr(oggetto, "__dict__"):
+        dimensione += sys.getsizeof(oggetto.__dict__)
+    return dimensione
+
+
+def misura(nome, conn, row_factory, ripetizioni=3):
+    # Miglior tempo su più letture, per ridurre il rumore della garbage collection
+    durate = []
+    for _ in range(ripetizioni):
+        gc.collect()
+        inizio = time.perf_counter()
+        oggetti = materializza(conn, row_factory)
+        durate.append(time.perf_counter() - inizio)
+        del oggetti
+
+    # Lettura con tracemalloc attivo: memoria trattenuta dalla lista, valori dei campi compresi
+    gc.collect()
+    tracemalloc.start()
+    oggetti = materializza(conn, row_factory)
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nome:<38} {min(durate):8.2f} s {memoria / 2**20:10.1f} MiB {dimensione_oggetto(oggetti[0]):10d} B")
+    del oggetti
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("numero_operazioni", nargs="?", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    conn = crea_database(args.numero_operazioni)
+    print(f"Operazioni materializzate: {args.numero_operazioni}")
+    print(f"{'Modello':<38} {'Tempo':>10} {'Memoria totale':>14} {'Oggetto':>12}")
+    misura("tuple sqlite3 (riferimento)", conn, None)
+    misura("dataclass senza slots", conn, lambda _c, riga: da_senza_slots(riga))
+    misura("OperazioneEstesaModel (slots)", conn, lambda _c, riga: da_modello_keyword(riga))
+    misura("OperazioneEstesaRiga (row factory)", conn, crea_row_factory(OperazioneEstesaRiga))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
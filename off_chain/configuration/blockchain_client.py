@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from configuration.log_load_setting import logger
+from presentation.controller.nonce_manager import NonceManager
+
+NODE_URL = "http://127.0.0.1:8545"  # Nodo Hardhat
+
+
+class RegistroBlockchain:
+    """
+    Client blockchain condiviso dal processo: un solo provider Web3 su una sessione HTTP keep-alive
+    con il suo NonceManager, ABI e indirizzi letti dai file JSON una volta per versione del file (mtime),
+    oggetti contratto riusati per (indirizzo, ABI) e disponibilità del nodo controllata in background.
+
+    Si ottiene con RegistroBlockchain(): le chiamate successive restituiscono la stessa istanza.
+    """
+
+    _instance = None
+    _lock_istanza = threading.Lock()
+
+    INTERVALLO_SONDA = 10  # secondi tra due controlli del nodo
+    TIMEOUT_SONDA = 2  # secondi
+    CONNESSIONI = 16  # connessioni HTTP tenute aperte verso il nodo, una per thread che lo usa in parallelo
+
+    def __new__(cls):
+        with cls._lock_istanza:
+            if cls._instance is None:
+                istanza = super().__new__(cls)
+                istanza._initialize()
+                cls._instance = istanza
+        return cls._instance
+
+    def _initialize(self):
+        self.sessione = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.CONNESSIONI)
+        self.sessione.mount("http://", adapter)
+        self.sessione.mount("https://", adapter)
+        self.w3 = Web3(Web3.HTTPProvider(NODE_URL, session=self.sessione))
+        # Unico per processo: chi invia transazioni dagli stessi account non deve assegnare nonce in conflitto
+        self.nonce_manager = NonceManager(self.w3)
+
+        self._lock = threading.Lock()
+        self._json: dict[str, tuple[float, Any]] = {}  # percorso -> (mtime, contenuto)
+        self._contratti: dict[tuple, Any] = {}  # (indirizzo, percorso ABI, mtime) -> contratto
+        self._artefatti: dict[tuple, str] = {}  # (cartella artifacts, nome contratto) -> file
+        self._disponibile: Optional[bool] = None
+        self._sonda_avviata = False
+
+    def leggi_json(self, percorso: str) -> Any:
+        """Contenuto del file JSON, riletto solo se il file è cambiato dall'ultima lettura."""
+        mtime = os.stat(percorso).st_mtime
+        with self._lock:
+            in_cache = self._json.get(percorso)
+            if in_cache is not None and in_cache[0] == mtime:
+                return in_cache[1]
+        with open(percorso, encoding="utf-8") as f:
+            contenuto = json.load(f)
+        with self._lock:
+            self._json[percorso] = (mtime, contenuto)
+        return contenuto
+
+    def abi(self, percorso: str) -> list:
+        """ABI da un artefatto Hardhat ({"abi": [...]}) o da un file che contiene solo l'ABI."""
+        contenuto = self.leggi_json(percorso)
+        return contenuto["abi"] if isinstance(contenuto, dict) else contenuto
+
+    def contratto(self, indirizzo: str, percorso_abi: str):
+        """Oggetto contratto per l'indirizzo, creato una sola volta finché il file dell'ABI non cambia."""
+        indirizzo = Web3.to_checksum_address(indirizzo)
+        chiave = (indirizzo, percorso_abi, os.stat(percorso_abi).st_mtime)
+        with self._lock:
+            contratto = self._contratti.get(chiave)
+        if contratto is None:
+            contratto = self.w3.eth.contract(address=indirizzo, abi=self.abi(percorso_abi))
+            with self._lock:
+                # Le versioni precedenti dello stesso contratto non servono più
+                for vecchia in [k for k in self._contratti if k[:2] == chiave[:2]]:
+                    del self._contratti[vecchia]
+                self._contratti[chiave] = contratto
+        return contratto
+
+    def trova_artefatto(self, cartella_artifacts: str, nome_contratto: str) -> Optional[str]:
+        """
+        File dell'artefatto compilato del contratto sotto cartella_artifacts.
+        La cartella viene percorsa solo la prima volta, o se il file trovato non esiste più.
+        """
+        chiave = (cartella_artifacts, nome_contratto)
+        with self._lock:
+            percorso = self._artefatti.get(chiave)
+        if percorso is not None and os.path.exists(percorso):
+            return percorso
+
+        percorso = None
+        for radice, _, files in os.walk(cartella_artifacts):
+            # Hardhat salva l'artefatto come <Contratto>.sol/<Contratto>.json: si prova prima quello
+            for file in sorted(files, key=lambda f: f != f"{nome_contratto}.json"):
+                if not file.endswith(".json") or file.endswith(".dbg.json"):
+                    continue
+                candidato = os.path.join(radice, file)
+                try:
+                    # Letto senza cache: degli altri artefatti non serve tenere il contenuto
+                    with open(candidato, encoding="utf-8") as f:
+                        contenuto = json.load(f)
+                    if isinstance(contenuto, dict) and contenuto.get("contractName") == nome_contratto:
+                        percorso = candidato
+                        break
+                except Exception as e:
+                    logger.warning(f"Errore nella lettura del file {candidato}: {e}")
+            if percorso is not None:
+                break
+
+        if percorso is not None:
+            with self._lock:
+                self._artefatti[chiave] = percorso
+        return percorso
+
+    def nodo_disponibile(self) -> bool:
+        """
+        Ultimo stato noto del nodo. Solo la prima chiamata attende la risposta del nodo (al massimo TIMEOUT_SONDA):
+        poi lo stato viene aggiornato ogni INTERVALLO_SONDA secondi da un thread in background.
+        """
+        if self._disponibile is None:
+            self._sonda()
+        with self._lock:
+            if not self._sonda_avviata:
+                self._sonda_avviata = True
+                threading.Thread(target=self._ciclo_sonda, name="sonda-nodo-blockchain", daemon=True).start()
+        return bool(self._disponibile)
+
+    def _sonda(self) -> bool:
+        try:
+            risposta = self.sessione.post(NODE_URL, timeout=self.TIMEOUT_SONDA, json={
+                "jsonrpc": "2.0", "method": "web3_clientVersion", "params": [], "id": 1
+            })
+            disponibile = risposta.status_code == 200 and "result" in risposta.json()
+        except (requests.RequestException, ValueError):
+            disponibile = False
+
+        if disponibile != self._disponibile:
+            if disponibile:
+                logger.info(f"Nodo blockchain raggiungibile su {NODE_URL}")
+            else:
+                logger.warning(f"Nodo blockchain non raggiungibile su {NODE_URL}: funzionalità blockchain disabilitate")
+        self._disponibile = disponibile
+        return disponibile
+
+    def _ciclo_sonda(self):
+        fermo = threading.Event()
+        while not fermo.wait(self.INTERVALLO_SONDA):
+            self._sonda()
@@ -1,26 +1,124 @@
 import sqlite3
 import os
-from configuration.db_load_setting import DATABASE_PATH
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from itertools import groupby
+from configuration.db_load_setting import DATABASE_PATH, configDatabase
 from configuration.log_load_setting import logger
+from configuration.sql_tracing import TracciamentoSQL
+from persistence.row_factory import crea_row_factory
+
+class PoolConnessioni:
+    """
+    Pool limitato di connessioni SQLite riusate tra i thread.
+    Le connessioni vengono create alla prima richiesta (fino a `dimensione`) e restituite al pool
+    dopo ogni utilizzo: un thread che trova il pool esaurito attende fino a `attesa` secondi.
+    """
+
+    def __init__(self, crea_connessione, dimensione: int, attesa: float):
+        self._crea_connessione = crea_connessione
+        self._attesa = attesa
+        self._posti = threading.BoundedSemaphore(dimensione)
+        # LIFO: si riusa per prima la connessione usata più di recente, con cache e statement già caldi
+        self._libere = queue.LifoQueue()
+        self._tutte: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def acquisisci(self) -> sqlite3.Connection:
+        if not self._posti.acquire(timeout=self._attesa):
+            raise sqlite3.OperationalError(f"Nessuna connessione libera nel pool dopo {self._attesa} secondi")
+        try:
+            return self._libere.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = self._crea_connessione()
+        except BaseException:
+            self._posti.release()
+            raise
+        with self._lock:
+            self._tutte.append(conn)
+        return conn
+
+    def rilascia(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                # Una transazione implicita lasciata aperta non deve passare al prossimo thread
+                conn.rollback()
+            self._libere.put(conn)
+        except sqlite3.ProgrammingError:
+            pass  # Connessione già chiusa da close()
+        finally:
+            self._posti.release()
+
+    @property
+    def aperte(self) -> int:
+        """Connessioni create finora (al massimo `dimensione`)."""
+        with self._lock:
+            return len(self._tutte)
+
+    def chiudi(self) -> None:
+        with self._lock:
+            for conn in self._tutte:
+                conn.close()
+            self._tutte.clear()
+        self._libere = queue.LifoQueue()
+
 
 class Database:
-    _instance = None  # Singleton per la connessione al database
+    """
+    Punto di accesso al database condiviso da tutta l'applicazione.
+    Le connessioni (WAL) vengono prese da un pool limitato per la durata di ogni chiamata:
+    le letture non si bloccano a vicenda e non si contendono lo stato di un unico cursore,
+    e i thread che si succedono (es. le richieste HTTP) riusano connessioni già aperte.
+    Le chiamate annidate di uno stesso thread (transazioni, iter_results) usano la stessa connessione.
+    """
+    _instance = None  # Singleton per il pool di connessioni
     _connection_initialized = False
 
+    # Tracciamento delle query (vedi configuration.sql_tracing): None = disattivo, nessun costo
+    tracciamento = None
+
+    # Pragma applicati a ogni nuova connessione del pool
+    PRAGMA_CONNESSIONE = (
+        "PRAGMA foreign_keys = ON",
+        "PRAGMA journal_mode = WAL",        # Letture concorrenti alle scritture
+        "PRAGMA synchronous = NORMAL",      # Sicuro in WAL, evita un fsync per commit
+        "PRAGMA cache_size = -20000",       # ~20 MB di cache per connessione
+        "PRAGMA mmap_size = 268435456",     # 256 MB letti tramite memory map
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    # Attesa massima (secondi) sul lock di scrittura prima di restituire "database is locked"
+    BUSY_TIMEOUT = 10
+
+    # Connessioni aperte al massimo contemporaneamente e attesa massima (secondi) di una connessione libera
+    DIMENSIONE_POOL = 8
+    ATTESA_POOL = 30
+
+    # Statement preparati tenuti da ogni connessione: le query di QueryBuilder hanno testo stabile per forma
+    STATEMENT_CACHE = 256
+
+    # Righe lette per ogni fetchmany di iter_results
+    DIMENSIONE_BLOCCO = 500
+
     def __new__(cls):
-        """Implementa il pattern Singleton per mantenere una singola connessione al database."""
+        """Implementa il pattern Singleton per mantenere un solo pool di connessioni."""
         if cls._instance is None:
             cls._instance = super(Database, cls).__new__(cls)
         return cls._instance
 
     def __init__(self):
-        """Initialize the database connection if not already initialized."""
+        """Initialize the connection pool if not already initialized."""
         if not self._connection_initialized:
+            self._locale = threading.local()
+            self._pool = PoolConnessioni(self._crea_connessione, self.DIMENSIONE_POOL, self.ATTESA_POOL)
             try:
-                self.conn = sqlite3.connect(DATABASE_PATH, timeout=10, check_same_thread=False)  # Connessione al database
-                # Enable foreign key constraints
-                self.conn.execute("PRAGMA foreign_keys = ON")
-                self.cur = self.conn.cursor()  # Cursore
+                # Apre subito la prima connessione del pool per segnalare errori di configurazione
+                with self._connessione():
+                    pass
                 logger.info(f"BackEnd: get_connection: Name database is: {os.path.basename(DATABASE_PATH)}")
                 logger.info(f"BackEnd: get_connection: Path for the database is: {DATABASE_PATH}")
                 self._connection_initialized = True
@@ -34,18 +132,105 @@ class Database:
                 logger.error(f"Unexpected Error: {e}")
                 raise Exception(f"Unexpected Error: {e}")
 
+    def _crea_connessione(self) -> sqlite3.Connection:
+        # check_same_thread=False: la connessione passa da un thread all'altro tramite il pool
+        conn = sqlite3.connect(DATABASE_PATH, timeout=self.BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=self.STATEMENT_CACHE)
+        for pragma in self.PRAGMA_CONNESSIONE:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def _connessione(self):
+        """
+        Connessione del pool per il thread corrente. Se il thread ne ha già una (chiamata annidata
+        in una transazione o durante un iter_results) la riusa; altrimenti la prende dal pool
+        e la restituisce all'uscita dal blocco più esterno.
+        """
+        conn = getattr(self._locale, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._pool.acquisisci()
+        self._locale.conn = conn
+        try:
+            yield conn
+        finally:
+            self._locale.conn = None
+            self._pool.rilascia(conn)
+
+    @contextmanager
+    def lettura(self):
+        """
+        Transazione di lettura: tutte le query del blocco vedono la stessa istantanea del database,
+        senza bloccare le scritture degli altri thread.
+        """
+        with self._connessione() as conn:
+            if conn.in_transaction:
+                # Già dentro una transazione di questo thread: la lettura ne fa parte
+                yield conn.cursor()
+                return
+
+            cur = conn.cursor()
+            cur.execute("BEGIN DEFERRED")
+            try:
+                yield cur
+            finally:
+                conn.rollback()
+
+    @contextmanager
+    def scrittura(self):
+        """
+        Transazione di scrittura: prende subito il lock di scrittura (BEGIN IMMEDIATE),
+        esegue il commit all'uscita dal blocco e il rollback in caso di eccezione.
+        """
+        with self._connessione() as conn:
+            if conn.in_transaction:
+                # Transazione annidata: il commit spetta al blocco più esterno
+                yield conn.cursor()
+                return
+
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @classmethod
+    def attiva_tracciamento(cls, tracciamento: TracciamentoSQL = None) -> TracciamentoSQL:
+        """Attiva il tracciamento delle query per tutte le connessioni e lo restituisce."""
+        cls.tracciamento = tracciamento or TracciamentoSQL()
+        return cls.tracciamento
+
+    @classmethod
+    def disattiva_tracciamento(cls) -> None:
+        cls.tracciamento = None
+
+    @classmethod
+    def report_query(cls, n: int = 10) -> list:
+        """Le n forme di query con il tempo totale più alto (vuoto se il tracciamento è disattivo)."""
+        return cls.tracciamento.report(n) if cls.tracciamento else []
+
     def execute_query(self, query, params=()):
         """Esegue una query di modifica (INSERT, UPDATE, DELETE) con gestione errori."""
-        if not hasattr(self, "conn") or self.conn is None:
+        if not self._connection_initialized:
             raise ConnectionError("La connessione al database non è attiva.")
-        
+
+        tracciamento = self.tracciamento
         try:
-            print(f"Provo ad eseguire {query} con par {params}")
-            self.cur.execute(query, params)
-            self.conn.commit()
+            # Come blocco più esterno la scrittura esegue il commit; dentro una transazione ne fa parte
+            with self.scrittura() as cur:
+                inizio = time.perf_counter() if tracciamento else 0
+                cur.execute(query, params)
+                if tracciamento:
+                    tracciamento.registra(query, time.perf_counter() - inizio, cur.rowcount)
             return True
         except sqlite3.IntegrityError as e:
-            print("Errore: Violazione di vincolo di unicità.")
+            logger.error(f"Violazione di vincolo: {e}")
             if "UNIQUE constraint failed" in str(e):
                 raise Exception("Duplicate key violation")
             raise e
@@ -53,39 +238,116 @@ class Database:
             if "locked" in str(e).lower():
                 logger.error(f"Database bloccato (timeout raggiunto?): {e}")
             else:
-                print(f"Errore SQL: {e}")
+                logger.error(f"Errore SQL: {e}")
             raise e
         except sqlite3.Error as e:
-            print(f"Errore generico nel database: {e}")
+            logger.error(f"Errore generico nel database: {e}")
             raise e
 
-    def fetch_results(cls, query, params=()):
+    def fetch_results(self, query, params=()):
         """Esegue una query di selezione e restituisce i risultati."""
-        if not hasattr(cls, "conn") or cls.conn is None:
+        if not self._connection_initialized:
             raise ConnectionError("La connessione al database non è attiva.")
-        
+
+        tracciamento = self.tracciamento
         try:
-            cls._instance.cur.execute(query, params)
-            return cls._instance.cur.fetchall()
-        
+            with self._connessione() as conn:
+                inizio = time.perf_counter() if tracciamento else 0
+                risultati = conn.execute(query, params).fetchall()
+            if tracciamento:
+                tracciamento.registra(query, time.perf_counter() - inizio, len(risultati))
+            return risultati
+
         except sqlite3.OperationalError as e:
             if "locked" in str(e).lower():
                 logger.error(f"Database bloccato (timeout raggiunto?): {e}")
             else:
-                print(f"Errore SQL: {e}")
+                logger.error(f"Errore SQL: {e}")
         except sqlite3.Error as e:
-            print(f"Errore nella query: {e}")
+            logger.error(f"Errore nella query: {e}")
             return None
         
+    def fetch_models(self, query, params=(), modello=None):
+        """
+        Esegue una query di selezione e restituisce le righe già convertite in modello
+        dalla row factory del cursore (vedi persistence.row_factory).
+        """
+        tracciamento = self.tracciamento
+        try:
+            with self._connessione() as conn:
+                cur = conn.cursor()
+                cur.row_factory = crea_row_factory(modello)
+                inizio = time.perf_counter() if tracciamento else 0
+                cur.execute(query, params)
+                risultati = cur.fetchall()
+                cur.close()
+            if tracciamento:
+                tracciamento.registra(query, time.perf_counter() - inizio, len(risultati))
+            return risultati
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e).lower():
+                logger.error(f"Database bloccato (timeout raggiunto?): {e}")
+            else:
+                logger.error(f"Errore SQL: {e}")
+            raise e
+        except sqlite3.Error as e:
+            logger.error(f"Errore nella query: {e}")
+            raise e
+
+    def iter_results(self, query, params=(), arraysize: int = None, row_factory=None):
+        """
+        Esegue una query di selezione e ne restituisce le righe una alla volta, leggendole a blocchi
+        di arraysize: la memoria usata non dipende dalla dimensione del risultato.
+        Usa un cursore proprio, quindi le altre query del thread non interrompono l'iterazione;
+        la connessione resta al thread finché l'iterazione non termina o il generatore non viene chiuso.
+        Se indicato, row_factory trasforma ogni riga (ad esempio in un modello) solo quando viene letta.
+        """
+        tracciamento = self.tracciamento
+        # Con il tracciamento attivo si misura solo il tempo passato in SQLite, non quello del chiamante
+        durata, righe = 0.0, 0
+        try:
+            with self._connessione() as conn:
+                cur = conn.cursor()
+                cur.arraysize = arraysize or self.DIMENSIONE_BLOCCO
+                try:
+                    inizio = time.perf_counter() if tracciamento else 0
+                    cur.execute(query, params)
+                    while True:
+                        blocco = cur.fetchmany()
+                        if tracciamento:
+                            durata += time.perf_counter() - inizio
+                            righe += len(blocco)
+                        if not blocco:
+                            if tracciamento:
+                                tracciamento.registra(query, durata, righe)
+                            return
+                        for riga in blocco:
+                            yield row_factory(riga) if row_factory else riga
+                        inizio = time.perf_counter() if tracciamento else 0
+                finally:
+                    cur.close()
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e).lower():
+                logger.error(f"Database bloccato (timeout raggiunto?): {e}")
+            else:
+                logger.error(f"Errore SQL: {e}")
+            raise e
+        except sqlite3.Error as e:
+            logger.error(f"Errore nella query: {e}")
+            raise e
+
     def fetch_one(self, query, params=()):
         """Execute a query and return the first column of the first row."""
-        if not hasattr(self, "conn") or self.conn is None:
+        if not self._connection_initialized:
             raise ConnectionError("La connessione al database non è attiva.")
-        
+
+        tracciamento = self.tracciamento
         try:
-            print(f"Executing query: {query} with params {params}")
-            self.cur.execute(query, params)
-            result = self.cur.fetchone()
+            with self._connessione() as conn:
+                inizio = time.perf_counter() if tracciamento else 0
+                result = conn.execute(query, params).fetchone()
+            if tracciamento:
+                tracciamento.registra(query, time.perf_counter() - inizio, int(result is not None))
             if result is None:
                 return None
             return result[0]  # Return the first column
@@ -93,51 +355,97 @@ class Database:
             if "locked" in str(e).lower():
                 logger.error(f"Database bloccato (timeout raggiunto?): {e}")
             else:
-                print(f"Errore SQL: {e}")
+                logger.error(f"Errore SQL: {e}")
+            raise e
+        except sqlite3.Error as e:
+            logger.error(f"Errore nella query: {e}")
+            raise e
+
+    def execute_returning(self, query, params=()):
+        """Esegue una query di modifica con clausola RETURNING e restituisce la prima riga prodotta."""
+        tracciamento = self.tracciamento
+        try:
+            with self.scrittura() as cur:
+                inizio = time.perf_counter() if tracciamento else 0
+                cur.execute(query, params)
+                riga = cur.fetchone()
+                if tracciamento:
+                    tracciamento.registra(query, time.perf_counter() - inizio, int(riga is not None))
+                return riga
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e).lower():
+                logger.error(f"Database bloccato (timeout raggiunto?): {e}")
+            else:
+                logger.error(f"Errore SQL: {e}")
             raise e
         except sqlite3.Error as e:
-            print(f"Errore nella query: {e}")
+            logger.error(f"Errore nella query: {e}")
             raise e
 
+    def execute_many(self, query, seq_of_params):
+        """
+        Esegue la stessa query di modifica per ogni insieme di parametri, in un'unica transazione
+        (quella già aperta, se chiamata dentro un blocco scrittura()). Restituisce le righe modificate.
+        """
+        seq_of_params = list(seq_of_params)
+        tracciamento = self.tracciamento
+        try:
+            with self.scrittura() as cur:
+                inizio = time.perf_counter() if tracciamento else 0
+                cur.executemany(query, seq_of_params)
+                if tracciamento:
+                    tracciamento.registra(query, time.perf_counter() - inizio, cur.rowcount)
+                return cur.rowcount
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e).lower():
+                logger.error(f"Database bloccato (timeout raggiunto?): {e}")
+            else:
+                logger.error(f"Errore SQL: {e}")
+            raise Exception(f"Transaction error: {e}")
+        except Exception as e:
+            raise Exception(f"Transaction error: {e}")
+
     def execute_transaction(self, queries):
         """
         Esegue più query SQL all'interno di una singola transazione.
+        Le query consecutive con lo stesso testo vengono eseguite con un solo executemany.
 
         Parameters:
         - queries: Lista di tuple contenenti (query, params).
         """
-        if not hasattr(self, "conn") or self.conn is None:
-            raise ConnectionError("La connessione al database non è attiva.")
-
+        tracciamento = self.tracciamento
         try:
-            self.cur.execute("BEGIN TRANSACTION;")
-
-            for query, params in queries:
-                logger.info(f"BackEnd: execute_transaction: Info executing query: {query} with params: {params}")
-                self.cur.execute(query, params)
-
-            self.conn.commit()  # Commit di tutte le modifiche
+            with self.scrittura() as cur:
+                for query, gruppo in groupby(queries, key=lambda q: q[0]):
+                    params_gruppo = [params for _, params in gruppo]
+                    inizio = time.perf_counter() if tracciamento else 0
+                    if len(params_gruppo) == 1:
+                        cur.execute(query, params_gruppo[0])
+                    else:
+                        cur.executemany(query, params_gruppo)
+                    if tracciamento:
+                        tracciamento.registra(query, time.perf_counter() - inizio, cur.rowcount)
         except sqlite3.OperationalError as e:
             if "locked" in str(e).lower():
                 logger.error(f"Database bloccato (timeout raggiunto?): {e}")
-                self.conn.rollback()  # Rollback in caso di errore
-                raise Exception(f"Transaction error: {e}")
             else:
-                print(f"Errore SQL: {e}")
+                logger.error(f"Errore SQL: {e}")
+            raise Exception(f"Transaction error: {e}")
         except Exception as e:
-            self.conn.rollback()  # Rollback in caso di errore
             raise Exception(f"Transaction error: {e}")
 
     def close(self):
-        """Close the database connection safely."""
-        if hasattr(self, 'conn') and self.conn:
-            try:
-                self.conn.close()
-                self._connection_initialized = False
-                Database._instance = None  # Reset the Singleton
-                logger.info("BackEnd: Closing database .....")
-            except Exception as e:
-                logger.error(f"Error closing database connection: {e}")
+        """Close every pooled connection safely."""
+        if not self._connection_initialized:
+            return
+        try:
+            self._pool.chiudi()
+            self._locale = threading.local()
+            self._connection_initialized = False
+            Database._instance = None  # Reset the Singleton
+            logger.info("BackEnd: Closing database .....")
+        except Exception as e:
+            logger.error(f"Error closing database connection: {e}")
 
     # Alias for close() for backward compatibility
     close_connection = close
@@ -145,3 +453,12 @@ class Database:
     def __del__(self):
         """Ensure safe connection closure when the instance is destroyed."""
         self.close()
+
+
+# Tracciamento delle query da db_setting.yaml (sezione facoltativa, disattivo se assente)
+_config_tracciamento = configDatabase.get("tracciamento_sql") or {}
+if _config_tracciamento.get("attivo"):
+    Database.attiva_tracciamento(TracciamentoSQL(
+        soglia_lenta=_config_tracciamento.get("soglia_query_lenta_ms", 100) / 1000,
+        file_log=_config_tracciamento.get("file_query_lente"),
+    ))
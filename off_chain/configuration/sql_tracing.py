@@ -0,0 +1,102 @@
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+from dataclasses import dataclass, field
+
+
+# Letterali e liste di parametri vengono ridotti a segnaposto: query con la stessa forma finiscono insieme
+_RE_STRINGHE = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERI = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LISTE_PARAMETRI = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_SPAZI = re.compile(r"\s+")
+
+# File di questi moduli non sono mai il "chiamante" di una query: si risale fino al repository
+_MODULI_INTERNI = ("database.py", "sql_tracing.py", "query_builder.py", "paginazione.py", "contextlib.py")
+
+
+@functools.lru_cache(maxsize=1024)
+def normalizza_sql(query: str) -> str:
+    """Forma normalizzata di una query: spazi compattati, letterali e liste IN (?, ?, ...) sostituiti."""
+    forma = _RE_STRINGHE.sub("?", query)
+    forma = _RE_NUMERI.sub("?", forma)
+    forma = _RE_LISTE_PARAMETRI.sub("(?, ...)", forma)
+    return _RE_SPAZI.sub(" ", forma).strip().rstrip(";")
+
+
+def trova_chiamante() -> str:
+    """Primo metodo fuori dallo strato database nello stack corrente, come 'modulo:Classe.metodo'."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        nome_file = os.path.basename(frame.f_code.co_filename)
+        if nome_file not in _MODULI_INTERNI:
+            codice = frame.f_code
+            return f"{os.path.splitext(nome_file)[0]}:{getattr(codice, 'co_qualname', codice.co_name)}"
+        frame = frame.f_back
+    return "sconosciuto"
+
+
+@dataclass(slots=True)
+class StatisticaQuery:
+    """Tempi e righe accumulati per una forma di query."""
+    forma: str
+    chiamate: int = 0
+    tempo_totale: float = 0.0
+    tempo_massimo: float = 0.0
+    righe: int = 0
+    chiamanti: dict = field(default_factory=dict)  # chiamante -> numero di esecuzioni
+
+    @property
+    def tempo_medio(self) -> float:
+        return self.tempo_totale / self.chiamate if self.chiamate else 0.0
+
+
+class TracciamentoSQL:
+    """
+    Raccoglie latenza, righe e chiamante di ogni query eseguita da Database, aggregandoli per forma.
+    Le query più lente di soglia_lenta (secondi) vengono scritte nel log delle query lente.
+    Va installato con Database.attiva_tracciamento(); di default Database non traccia nulla.
+    """
+
+    NOME_LOGGER = "app_logger.sql_lento"
+
+    def __init__(self, soglia_lenta: float = 0.1, file_log: str = None):
+        self.soglia_lenta = soglia_lenta
+        self._statistiche: dict[str, StatisticaQuery] = {}
+        self._lock = threading.Lock()
+        self.logger_lente = logging.getLogger(self.NOME_LOGGER)
+        if file_log:
+            handler = logging.FileHandler(file_log, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+            self.logger_lente.addHandler(handler)
+            self.logger_lente.propagate = False
+
+    def registra(self, query: str, durata: float, righe: int = 0) -> None:
+        """Chiamato da Database dopo ogni esecuzione; durata in secondi."""
+        forma = normalizza_sql(query)
+        chiamante = trova_chiamante()
+        with self._lock:
+            statistica = self._statistiche.get(forma)
+            if statistica is None:
+                statistica = self._statistiche[forma] = StatisticaQuery(forma)
+            statistica.chiamate += 1
+            statistica.tempo_totale += durata
+            statistica.tempo_massimo = max(statistica.tempo_massimo, durata)
+            statistica.righe += max(righe, 0)
+            statistica.chiamanti[chiamante] = statistica.chiamanti.get(chiamante, 0) + 1
+
+        if durata >= self.soglia_lenta:
+            self.logger_lente.warning(f"Query lenta: {durata * 1000:.1f} ms, {righe} righe, da {chiamante}: {forma}")
+
+    def report(self, n: int = 10) -> list[StatisticaQuery]:
+        """Le n forme di query con il tempo totale più alto."""
+        with self._lock:
+            statistiche = [StatisticaQuery(s.forma, s.chiamate, s.tempo_totale, s.tempo_massimo, s.righe, dict(s.chiamanti))
+                           for s in self._statistiche.values()]
+        return sorted(statistiche, key=lambda s: s.tempo_totale, reverse=True)[:n]
+
+    def azzera(self) -> None:
+        with self._lock:
+            self._statistiche.clear()
@@ -153,6 +153,85 @@ class Database:
 class DatabaseMigrations:
     # Variable of the class to track if the migrations were executed
     _migrations_executed = False
+
+    # Indici secondari come migrazioni versionate: (versione, query).
+    # La versione applicata è salvata in PRAGMA user_version, quindi ogni passo viene eseguito una sola volta.
+    INDEX_MIGRATIONS = [
+        (1, [
+            # Ultimo lotto di un prodotto per tipo di operazione (vista richieste)
+            'CREATE INDEX IF NOT EXISTS idx_operazione_prodotto_tipo ON Operazione (Id_prodotto, Tipo, Id_operazione, Id_lotto)'
+        ]),
+        (2, [
+            # Navigazione del grafo dei lotti, in entrambe le direzioni
+            'CREATE INDEX IF NOT EXISTS idx_composizione_output ON ComposizioneLotto (id_lotto_output)',
+            'CREATE INDEX IF NOT EXISTS idx_composizione_input ON ComposizioneLotto (id_lotto_input)',
+            'CREATE INDEX IF NOT EXISTS idx_operazione_azienda_tipo ON Operazione (Id_azienda, Tipo)',
+            'CREATE INDEX IF NOT EXISTS idx_operazione_tipo ON Operazione (Tipo)',
+            'CREATE INDEX IF NOT EXISTS idx_magazzino_lotto ON Magazzino (id_lotto)',
+            'CREATE INDEX IF NOT EXISTS idx_richiesta_ricevente ON Richiesta (Id_ricevente)',
+            'CREATE INDEX IF NOT EXISTS idx_richiesta_trasportatore ON Richiesta (Id_trasportatore, Stato_ricevente)',
+            'CREATE INDEX IF NOT EXISTS idx_richiesta_richiedente ON Richiesta (Id_richiedente)',
+            'CREATE INDEX IF NOT EXISTS idx_richiesta_token_ricevente ON RichiestaToken (Id_ricevente, Stato)',
+            'CREATE INDEX IF NOT EXISTS idx_richiesta_token_richiedente ON RichiestaToken (Id_richiedente)',
+            'CREATE INDEX IF NOT EXISTS idx_certificato_lotto ON Certificato (Id_lotto)',
+            'CREATE INDEX IF NOT EXISTS idx_certificato_certificatore ON Certificato (Id_azienda_certificatore)',
+            'CREATE INDEX IF NOT EXISTS idx_azioni_azienda ON Azioni_compensative (Id_azienda, Data)'
+        ]),
+        (3, [
+            'CREATE INDEX IF NOT EXISTS idx_outbox_stato ON OutboxBlockchain (Stato, Id_outbox)'
+        ]),
+        (4, [
+            # Versione del contenuto di Soglie: il registro delle soglie verificate si ricarica solo se cambia
+            "INSERT OR IGNORE INTO Sequenza (Nome, Valore) VALUES ('soglie', 0)",
+            "CREATE TRIGGER IF NOT EXISTS trg_soglie_insert AFTER INSERT ON Soglie BEGIN UPDATE Sequenza SET Valore = Valore + 1 WHERE Nome = 'soglie'; END",
+            "CREATE TRIGGER IF NOT EXISTS trg_soglie_update AFTER UPDATE ON Soglie BEGIN UPDATE Sequenza SET Valore = Valore + 1 WHERE Nome = 'soglie'; END",
+            "CREATE TRIGGER IF NOT EXISTS trg_soglie_delete AFTER DELETE ON Soglie BEGIN UPDATE Sequenza SET Valore = Valore + 1 WHERE Nome = 'soglie'; END"
+        ]),
+        (5, [
+            # Indice di ricerca full-text su prodotti, aziende, certificati e lotti.
+            # rowid = id * 4 + tipo (0 prodotto, 1 azienda, 2 certificato, 3 lotto): i trigger aggiornano una riga per rowid
+            "CREATE VIRTUAL TABLE IF NOT EXISTS IndiceRicerca USING fts5(tipo UNINDEXED, id_riferimento UNINDEXED, id_azienda UNINDEXED, nome, dettagli, tokenize = 'unicode61 remove_diacritics 2')",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_prodotto_insert AFTER INSERT ON Prodotto BEGIN INSERT INTO IndiceRicerca (rowid, tipo, id_riferimento, id_azienda, nome, dettagli) VALUES (new.Id_prodotto * 4, 'prodotto', new.Id_prodotto, NULL, new.Nome, ''); END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_prodotto_update AFTER UPDATE OF Nome ON Prodotto BEGIN UPDATE IndiceRicerca SET nome = new.Nome WHERE rowid = new.Id_prodotto * 4; UPDATE IndiceRicerca SET nome = new.Nome WHERE rowid IN (SELECT Id_lotto * 4 + 3 FROM Operazione WHERE Id_prodotto = new.Id_prodotto); END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_prodotto_delete AFTER DELETE ON Prodotto BEGIN DELETE FROM IndiceRicerca WHERE rowid = old.Id_prodotto * 4; END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_azienda_insert AFTER INSERT ON Azienda BEGIN INSERT INTO IndiceRicerca (rowid, tipo, id_riferimento, id_azienda, nome, dettagli) VALUES (new.Id_azienda * 4 + 1, 'azienda', new.Id_azienda, new.Id_azienda, new.Nome, new.Indirizzo); END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_azienda_update AFTER UPDATE OF Nome, Indirizzo ON Azienda BEGIN UPDATE IndiceRicerca SET nome = new.Nome, dettagli = new.Indirizzo WHERE rowid = new.Id_azienda * 4 + 1; END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_azienda_delete AFTER DELETE ON Azienda BEGIN DELETE FROM IndiceRicerca WHERE rowid = old.Id_azienda * 4 + 1; END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_certificato_insert AFTER INSERT ON Certificato BEGIN INSERT INTO IndiceRicerca (rowid, tipo, id_riferimento, id_azienda, nome, dettagli) VALUES (new.Id_certificato * 4 + 2, 'certificato', new.Id_certificato, new.Id_azienda_certificatore, coalesce(new.Descrizione, ''), new.Id_lotto); END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_certificato_update AFTER UPDATE OF Descrizione, Id_lotto ON Certificato BEGIN UPDATE IndiceRicerca SET nome = coalesce(new.Descrizione, ''), dettagli = new.Id_lotto WHERE rowid = new.Id_certificato * 4 + 2; END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_certificato_delete AFTER DELETE ON Certificato BEGIN DELETE FROM IndiceRicerca WHERE rowid = old.Id_certificato * 4 + 2; END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_lotto_insert AFTER INSERT ON Operazione BEGIN INSERT INTO IndiceRicerca (rowid, tipo, id_riferimento, id_azienda, nome, dettagli) VALUES (new.Id_lotto * 4 + 3, 'lotto', new.Id_lotto, new.Id_azienda, coalesce((SELECT Nome FROM Prodotto WHERE Id_prodotto = new.Id_prodotto), ''), new.Tipo || ' ' || new.Id_lotto); END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_lotto_update AFTER UPDATE OF Id_prodotto, Tipo ON Operazione BEGIN UPDATE IndiceRicerca SET nome = coalesce((SELECT Nome FROM Prodotto WHERE Id_prodotto = new.Id_prodotto), ''), dettagli = new.Tipo || ' ' || new.Id_lotto WHERE rowid = new.Id_lotto * 4 + 3; END",
+            "CREATE TRIGGER IF NOT EXISTS trg_ricerca_lotto_delete AFTER DELETE ON Operazione BEGIN DELETE FROM IndiceRicerca WHERE rowid = old.Id_lotto * 4 + 3; END",
+            # Righe già presenti prima dei trigger
+            "DELETE FROM IndiceRicerca",
+            "INSERT INTO IndiceRicerca (rowid, tipo, id_riferimento, id_azienda, nome, dettagli) SELECT Id_prodotto * 4, 'prodotto', Id_prodotto, NULL, Nome, '' FROM Prodotto",
+            "INSERT INTO IndiceRicerca (rowid, tipo, id_riferimento, id_azienda, nome, dettagli) SELECT Id_azienda * 4 + 1, 'azienda', Id_azienda, Id_azienda, Nome, Indirizzo FROM Azienda",
+            "INSERT INTO IndiceRicerca (rowid, tipo, id_riferimento, id_azienda, nome, dettagli) SELECT Id_certificato * 4 + 2, 'certificato', Id_certificato, Id_azienda_certificatore, coalesce(Descrizione, ''), Id_lotto FROM Certificato",
+            "INSERT INTO IndiceRicerca (rowid, tipo, id_riferimento, id_azienda, nome, dettagli) SELECT o.Id_lotto * 4 + 3, 'lotto', o.Id_lotto, o.Id_azienda, coalesce(p.Nome, ''), o.Tipo || ' ' || o.Id_lotto FROM Operazione AS o LEFT JOIN Prodotto AS p ON p.Id_prodotto = o.Id_prodotto"
+        ]),
+        (6, [
+            # Pulizia degli esiti delle firme scaduti
+            'CREATE INDEX IF NOT EXISTS idx_esiti_firma_scadenza ON EsitiFirma (Scadenza)'
+        ])
+    ]
+
+    @staticmethod
+    def run_index_migrations(db):
+        """Applica in ordine le migrazioni degli indici non ancora presenti nel database."""
+        versione_corrente = db.fetch_results('PRAGMA user_version')[0][0]
+
+        for versione, queries in DatabaseMigrations.INDEX_MIGRATIONS:
+            if versione <= versione_corrente:
+                continue
+
+            queries_with_params = [(query, ()) for query in queries]
+            queries_with_params.append((f'PRAGMA user_version = {versione}', ()))
+            db.execute_transaction(queries_with_params)
+
+            if db.fetch_results('PRAGMA user_version')[0][0] != versione:
+                raise Exception(f"Index migration {versione} not applied")
+            print(f"BackEnd: run_index_migrations: indici aggiornati alla versione {versione}.")
     
     @staticmethod
     def run_migrations():
@@ -168,7 +247,12 @@ class DatabaseMigrations:
             'DROP TABLE IF EXISTS Soglie',     # No dependencies
             'DROP TABLE IF EXISTS Azienda',    # Depends on Credenziali
             'DROP TABLE IF EXISTS Credenziali', # No dependencies
-            'DROP TABLE IF EXISTS RichiestaToken'
+            'DROP TABLE IF EXISTS RichiestaToken',
+            'DROP TABLE IF EXISTS Sequenza',   # No dependencies
+            'DROP TABLE IF EXISTS OutboxBlockchain',  # No dependencies
+            'DROP TABLE IF EXISTS CatalogoCo2',  # No dependencies
+            'DROP TABLE IF EXISTS EsitiFirma',  # No dependencies
+            'DROP TABLE IF EXISTS IndiceRicerca'  # Indice FTS5, ricostruito dalla migrazione 5
         ]
 
         TABLE_CREATION_QUERIES = [
@@ -292,6 +376,55 @@ class DatabaseMigrations:
                 FOREIGN KEY (Id_richiedente) REFERENCES Azienda(Id_azienda) ON DELETE CASCADE,
                 FOREIGN KEY (Id_ricevente) REFERENCES Azienda(Id_azienda) ON DELETE CASCADE
             )
+            ''',
+            '''
+            CREATE TABLE Sequenza (
+                Nome TEXT PRIMARY KEY,
+                Valore INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            # Operazioni firmate in attesa di essere inviate / confermate sulla blockchain
+            '''
+            CREATE TABLE OutboxBlockchain (
+                Id_outbox INTEGER PRIMARY KEY AUTOINCREMENT,
+                Address TEXT NOT NULL,
+                Id_operazione INTEGER NOT NULL,
+                Tipo TEXT NOT NULL,
+                Id_lotto INTEGER NOT NULL,
+                Messaggio TEXT,
+                Stato TEXT NOT NULL DEFAULT 'In coda' CHECK(Stato IN ('In coda', 'In invio', 'Inviata', 'Confermata', 'Fallita')),
+                Tx_hash TEXT,
+                Nonce INTEGER,
+                Errore TEXT,
+                Data TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (Address, Id_operazione)
+            )
+            ''',
+            # CO2 dei lotti in vendita, calcolata sul grafo delle composizioni (vedi Co2RepositoryImpl.aggiorna_catalogo)
+            '''
+            CREATE TABLE CatalogoCo2 (
+                Id_lotto INTEGER PRIMARY KEY,
+                Co2_totale INTEGER NOT NULL,
+                Co2_unitaria INTEGER NOT NULL,
+                Data_calcolo TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            # Esiti delle firme MetaMask condivisi dai processi del backend (vedi RegistroEsiti)
+            '''
+            CREATE TABLE EsitiFirma (
+                Tipo TEXT NOT NULL,
+                Address TEXT NOT NULL,
+                Id_riferimento TEXT NOT NULL,
+                Esito TEXT NOT NULL,
+                Scadenza REAL NOT NULL,
+                PRIMARY KEY (Tipo, Address, Id_riferimento)
+            )
+            ''',
+            # Il contatore dei lotti parte dal massimo id già in uso
+            '''
+            INSERT INTO Sequenza (Nome, Valore)
+            SELECT 'lotto', MAX(IFNULL((SELECT MAX(Id_lotto) FROM Operazione), 0),
+                                IFNULL((SELECT MAX(id_lotto_output) FROM ComposizioneLotto), 0))
             '''
         ]
         
@@ -305,7 +438,10 @@ class DatabaseMigrations:
         try:
             db = Database()
             queries_with_params = [(query, ()) for query in TABLE_DELETION_QUERIES + TABLE_CREATION_QUERIES]
+            # Le tabelle sono state ricreate senza indici secondari
+            queries_with_params.append(('PRAGMA user_version = 0', ()))
             db.execute_transaction(queries_with_params)
+            DatabaseMigrations.run_index_migrations(db)
 
             # Check if the migrations were executed
             DatabaseMigrations._migrations_executed = True
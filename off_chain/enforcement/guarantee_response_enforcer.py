@@ -1,11 +1,28 @@
-from typing import Any, Callable, Optional, List, Dict
+from typing import Any, Callable, Optional, List, Dict, Tuple
 from functools import wraps
+from bisect import bisect_left
+from collections import deque
 import asyncio
+import inspect
+import threading
 import time
 import logging
 from datetime import datetime
 from dataclasses import dataclass, field
 
+# Bucket boundaries in seconds: 4 per doubling from 100 µs to ~105 s.
+# Every histogram has the same fixed buckets, so memory does not grow with the number of calls.
+LATENCY_BUCKETS: Tuple[float, ...] = tuple(0.0001 * 2 ** (i / 4) for i in range(81))
+
+# Only every 4th bucket (the powers of two) is exported to Prometheus
+EXPORTED_BUCKETS: Tuple[int, ...] = tuple(range(0, len(LATENCY_BUCKETS), 4))
+
+# Percentiles exported next to each histogram
+EXPORTED_QUANTILES: Tuple[float, ...] = (0.5, 0.95, 0.99)
+
+# Most recent violations kept in memory
+MAX_VIOLATIONS = 1000
+
 # Definiamo un dataclass per contenere le informazioni sulla violazione
 @dataclass
 class ViolationInfo:
@@ -20,9 +37,64 @@ class GuaranteeResponseError(Exception):
     """Custom exception for response time violations."""
     pass
 
+
+class LatencyHistogram:
+    """Streaming latency histogram over LATENCY_BUCKETS, with an overflow bucket."""
+    __slots__ = ("counts", "count", "total", "max", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if error:
+            self.errors += 1
+
+    def percentile(self, q: float) -> float:
+        """Estimate of the q-th quantile (0..1), interpolated inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max
+                estimate = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                return min(estimate, self.max)
+            cumulative += bucket_count
+        return self.max
+
+    def cumulative_counts(self, bucket_indexes) -> List[int]:
+        """Observations <= LATENCY_BUCKETS[i] for each requested bucket index."""
+        result = []
+        cumulative = 0
+        previous = 0
+        for index in bucket_indexes:
+            cumulative += sum(self.counts[previous:index + 1])
+            previous = index + 1
+            result.append(cumulative)
+        return result
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
 class GuaranteeResponseEnforcer:
     def __init__(self):
-        self.response_violations: List[ViolationInfo] = [] # Tipo specificato
+        # Bounded: only the most recent violations are kept, the totals are in violation_counts
+        self.response_violations: deque = deque(maxlen=MAX_VIOLATIONS)
+        self.violation_counts: Dict[str, int] = {}
+        # (operation_type, function) -> latency histogram
+        self.latency_histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._metrics_lock = threading.Lock()
         self.timeout_limits: Dict[str, int] = {      # Tipo specificato
             'default': 5.0,                 # seconds
             'blockchain_operation': 30.0,   # longer timeout for blockchain operations
@@ -40,7 +112,7 @@ class GuaranteeResponseEnforcer:
                 # C0301: Line too long - spezzata l'assegnazione di timeout
                 default_timeout = self.timeout_limits['default']
                 timeout = self.timeout_limits.get(operation_type, default_timeout)
-                start_time = time.time()
+                start_time = time.perf_counter()
 
                 try:
                     # La chiamata ad asyncio.wait_for è mantenuta su una riga se possibile
@@ -48,7 +120,8 @@ class GuaranteeResponseEnforcer:
                         function(*args, **kwargs),
                         timeout=timeout
                     )
-                    execution_time = time.time() - start_time
+                    execution_time = time.perf_counter() - start_time
+                    self.observe(operation_type, function.__qualname__, execution_time)
 
                     self._log_execution_metrics(
                         function.__name__,
@@ -61,7 +134,8 @@ class GuaranteeResponseEnforcer:
 
                 # W0707: raise-missing-from
                 except asyncio.TimeoutError as te:
-                    execution_time = time.time() - start_time
+                    execution_time = time.perf_counter() - start_time
+                    self.observe(operation_type, function.__qualname__, execution_time, error=True)
                     # R0913, R0917: Usare ViolationInfo
                     error_msg = "Async operation timed out via asyncio.wait_for"
                     violation_details = ViolationInfo(
@@ -84,11 +158,13 @@ class GuaranteeResponseEnforcer:
                 # C0301: Line too long - spezzata l'assegnazione di timeout
                 default_timeout = self.timeout_limits['default']
                 timeout = self.timeout_limits.get(operation_type, default_timeout)
-                start_time = time.time()
+                start_time = time.perf_counter()
 
                 try:
                     result = function(*args, **kwargs)
-                    execution_time = time.time() - start_time
+                    execution_time = time.perf_counter() - start_time
+                    self.observe(operation_type, function.__qualname__, execution_time,
+                                 error=execution_time > timeout)
 
                     if execution_time > timeout:
                         # R0913, R0917: Usare ViolationInfo
@@ -116,9 +192,12 @@ class GuaranteeResponseEnforcer:
                     )
 
                     return result
+                except GuaranteeResponseError:
+                    raise # Già registrata sopra
                 # C0103: invalid-name (rinominato 'e' in 'exc')
                 except Exception as exc:
-                    execution_time = time.time() - start_time
+                    execution_time = time.perf_counter() - start_time
+                    self.observe(operation_type, function.__qualname__, execution_time, error=True)
                     # R0913, R0917: Usare ViolationInfo
                     violation_details = ViolationInfo(
                         function_name=function.__name__,
@@ -133,10 +212,102 @@ class GuaranteeResponseEnforcer:
             return async_wrapper if asyncio.iscoroutinefunction(function) else sync_wrapper
         return decorator
 
+    def measure_latency(self, operation_type: str = 'default') -> Callable:
+        """
+        Records the latency of every call in the histograms without enforcing the timeout:
+        for existing code paths whose behaviour must not change.
+        """
+        def decorator(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs) -> Any:
+                start_time = time.perf_counter()
+                error = True
+                try:
+                    result = function(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    self.observe(operation_type, function.__qualname__, time.perf_counter() - start_time, error)
+            return wrapper
+        return decorator
+
+    def measure_public_methods(self, operation_type: str = 'default') -> Callable:
+        """Class decorator: measure_latency on every public method defined by the class."""
+        def decorator(cls):
+            for name, attribute in list(vars(cls).items()):
+                if not name.startswith("_") and inspect.isfunction(attribute):
+                    setattr(cls, name, self.measure_latency(operation_type)(attribute))
+            return cls
+        return decorator
+
+    def observe(self, operation_type: str, function_name: str, seconds: float, error: bool = False) -> None:
+        """Add one execution to the histogram of (operation_type, function_name)."""
+        key = (operation_type, function_name)
+        with self._metrics_lock:
+            histogram = self.latency_histograms.get(key)
+            if histogram is None:
+                histogram = self.latency_histograms[key] = LatencyHistogram()
+            histogram.observe(seconds, error)
+
+    def get_latency_stats(self) -> List[Dict[str, Any]]:
+        """Count, errors, p50/p95/p99, max and total time for every measured function."""
+        with self._metrics_lock:
+            return [
+                {
+                    "operation_type": operation_type,
+                    "function": function_name,
+                    "count": histogram.count,
+                    "errors": histogram.errors,
+                    "p50": histogram.percentile(0.5),
+                    "p95": histogram.percentile(0.95),
+                    "p99": histogram.percentile(0.99),
+                    "max": histogram.max,
+                    "sum": histogram.total,
+                }
+                for (operation_type, function_name), histogram in sorted(self.latency_histograms.items())
+            ]
+
+    def export_prometheus(self, prefix: str = "offchain") -> str:
+        """Histograms, quantiles and violation counters in Prometheus text exposition format."""
+        name = f"{prefix}_operation_latency_seconds"
+        lines = [
+            f"# HELP {name} Execution time of measured operations.",
+            f"# TYPE {name} histogram",
+        ]
+        quantile_lines = [
+            f"# HELP {name}_quantile Estimated latency quantiles of measured operations.",
+            f"# TYPE {name}_quantile gauge",
+        ]
+        error_lines = [
+            f"# HELP {prefix}_operation_errors_total Measured operations that raised or exceeded their timeout.",
+            f"# TYPE {prefix}_operation_errors_total counter",
+        ]
+        with self._metrics_lock:
+            for (operation_type, function_name), histogram in sorted(self.latency_histograms.items()):
+                labels = f'operation_type="{_escape_label(operation_type)}",function="{_escape_label(function_name)}"'
+                for index, cumulative in zip(EXPORTED_BUCKETS, histogram.cumulative_counts(EXPORTED_BUCKETS)):
+                    lines.append(f'{name}_bucket{{{labels},le="{LATENCY_BUCKETS[index]:.6g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+                for quantile in EXPORTED_QUANTILES:
+                    quantile_lines.append(f'{name}_quantile{{{labels},quantile="{quantile}"}} {histogram.percentile(quantile):.6f}')
+                error_lines.append(f"{prefix}_operation_errors_total{{{labels}}} {histogram.errors}")
+            violation_lines = [
+                f"# HELP {prefix}_response_violations_total Response time violations by operation type.",
+                f"# TYPE {prefix}_response_violations_total counter",
+            ] + [
+                f'{prefix}_response_violations_total{{operation_type="{_escape_label(operation_type)}"}} {count}'
+                for operation_type, count in sorted(self.violation_counts.items())
+            ]
+        return "\n".join(lines + quantile_lines + error_lines + violation_lines) + "\n"
+
     # R0913, R0917: Modificato per accettare un oggetto ViolationInfo
     def _record_violation(self, info: ViolationInfo) -> None:
         """Record a response time violation"""
-        self.response_violations.append(info)
+        with self._metrics_lock:
+            self.response_violations.append(info)
+            self.violation_counts[info.operation_type] = self.violation_counts.get(info.operation_type, 0) + 1
 
         # W1203: Use lazy % formatting in logging functions
         # C0301: Line too long - spezzata la stringa di formato del log
@@ -165,7 +336,8 @@ class GuaranteeResponseEnforcer:
             "Operation metrics - Function: %s, Type: %s, "
             "Time: %.2fs, Limit: %.2fs"
         )
-        self.logger.info(
+        # Una riga per chiamata: solo a livello DEBUG, i tempi sono già negli istogrammi
+        self.logger.debug(
             log_format_string,
             function_name,
             operation_type,
@@ -174,8 +346,9 @@ class GuaranteeResponseEnforcer:
         )
 
     def get_response_violations(self) -> List[ViolationInfo]: 
-        """Return list of all response time violations"""
-        return self.response_violations
+        """Return the most recent response time violations (at most MAX_VIOLATIONS)"""
+        with self._metrics_lock:
+            return list(self.response_violations)
 
     def update_timeout_limit(self, operation_type: str, timeout: int) -> None:
         """Update timeout limit for an operation type"""
@@ -193,3 +366,7 @@ class GuaranteeResponseEnforcer:
         """Get timeout limit for an operation type"""
         default_timeout = self.timeout_limits['default']
         return self.timeout_limits.get(operation_type, default_timeout)
+
+
+# Istanza condivisa dai repository e dal controller blockchain, esportata da backend.py su /metrics
+response_metrics = GuaranteeResponseEnforcer()
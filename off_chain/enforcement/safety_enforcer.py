@@ -72,8 +72,8 @@ class SafetyEnforcer:
             quality = kwargs['quality_score']
             if quality < self.safety_rules['min_quality_score']:
                 raise SafetyViolationError(
-                    f"Quality score {quality} is below minimum threshold {
-                        self.safety_rules['min_quality_score']}"
+                    f"Quality score {quality} is below minimum threshold "
+                    f"{self.safety_rules['min_quality_score']}"
                 )
 
         if 'co2_emissions' in kwargs:
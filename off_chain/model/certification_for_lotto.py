@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class CertificationForLotto:
     descrizione : str
     nome_azienda : str
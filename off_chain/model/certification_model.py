@@ -2,7 +2,7 @@ import datetime
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class CertificationModel:
     """
     Data model for transporting product information between layers.
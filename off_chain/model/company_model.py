@@ -3,7 +3,7 @@ from typing import Optional
 import datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class CompanyModel:
     """
     Data model for transporting company information between layers.
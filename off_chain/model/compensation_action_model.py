@@ -2,7 +2,7 @@ import datetime
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class CompensationActionModel:
     """
     Model for CompensationActionModel.
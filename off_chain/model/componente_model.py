@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from model.operation_model import OperationModel
-@dataclass
+@dataclass(slots=True)
 class Componente:
     prodotto_id: int
     trasformazioni: list[OperationModel] = field(default_factory=list)
\ No newline at end of file
@@ -6,16 +6,15 @@ from dataclasses import dataclass, field
 from typing import Optional
 
 
-@dataclass
+@dataclass(slots=True, init=False)
 class Lotto:
     id_lotto: int
     tipo: str
     quantita: int
     cons_co2: int
     composizione: list["Composizione"] = field(default_factory=list)
-    uc_co2 = int
     co2_costo_composizione : int = 0
-    co2_totale_lotto : int = 0
+    co2_totale_lotto_unitario : int = 0
 
     def __init__(self, id_lotto, tipo, quantita, consumo_co2):
         self.id_lotto = id_lotto
@@ -23,23 +22,30 @@ class Lotto:
         self.quantita = quantita
         self.cons_co2 = consumo_co2
         self.composizione = []
+        self.co2_costo_composizione = 0
+        self.co2_totale_lotto_unitario = 0
         
 
 
 
-    def get_costo_totale_lotto_unitario(self):
+    def get_costo_totale_lotto_unitario(self, memo: dict = None):
+        # memo: id_lotto -> CO2 unitaria, evita di ricalcolare i lotti raggiunti da più percorsi
+        memo = {} if memo is None else memo
+        if self.id_lotto in memo:
+            return memo[self.id_lotto]
+
         self.co2_costo_composizione = 0
-        if  self.composizione.__len__:
-            for comp in self.composizione:
-                self.co2_costo_composizione += comp.get_co2_consumata_quantità_utilizzata()
+        for comp in self.composizione:
+            self.co2_costo_composizione += comp.get_co2_consumata_quantità_utilizzata(memo)
         self.co2_totale_lotto_unitario = int((self.co2_costo_composizione + self.cons_co2 ) / self.quantita)
 
+        memo[self.id_lotto] = self.co2_totale_lotto_unitario
         return self.co2_totale_lotto_unitario 
 
 
     
 
-@dataclass
+@dataclass(slots=True, init=False)
 class Composizione:
     id_lotto_input: int
     quantita_utilizzata: int
@@ -50,9 +56,9 @@ class Composizione:
         self.quantita_utilizzata = quantita_utilizzata
         self.lotto_input = lotto_input
 
-    def get_co2_consumata_quantità_utilizzata(self) -> int:
+    def get_co2_consumata_quantità_utilizzata(self, memo: dict = None) -> int:
         if isinstance(self.lotto_input,Lotto):
-            return self.lotto_input.get_costo_totale_lotto_unitario() * self.quantita_utilizzata
+            return self.lotto_input.get_costo_totale_lotto_unitario(memo) * self.quantita_utilizzata
         else :
             return 0
         
@@ -2,7 +2,7 @@ from dataclasses import dataclass
 import datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class LottoForCertificaion:
     id_lotto: int
     tipo_operazione : str
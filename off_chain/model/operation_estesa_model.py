@@ -4,10 +4,11 @@
 # pylint: disable= trailing-whitespace
 from dataclasses import dataclass
 import datetime
+from typing import NamedTuple
 from model.operation_model import OperationModel
 from model.product_model import ProductModel
 
-@dataclass
+@dataclass(slots=True)
 class OperazioneEstesaModel:
 
     id_operazione: int
@@ -24,3 +25,19 @@ class OperazioneEstesaModel:
 
     
    
+
+
+class OperazioneEstesaRiga(NamedTuple):
+    """
+    Variante in sola lettura di OperazioneEstesaModel, con i campi nell'ordine delle colonne
+    di OperationRepositoryImpl._select_operazioni_azienda: viene costruita direttamente dalla riga.
+    """
+    id_operazione: int
+    id_prodotto: int
+    nome_prodotto: str
+    data_operazione: datetime
+    consumo_co2: int
+    nome_operazione: str
+    quantita_prodotto: int
+    blockchain_registered: bool
+    id_lotto: int
@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class OutboxModel:
+    """
+    Operazione firmata in coda per l'invio sulla blockchain.
+    """
+    id_outbox: int
+    address: str
+    id_operazione: int
+    tipo: str
+    id_lotto: int
+    messaggio: str
+    stato: str
+    tx_hash: Optional[str] = None
+    nonce: Optional[int] = None
+    errore: Optional[str] = None
@@ -0,0 +1,16 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class Pagina:
+    """
+    Una pagina di risultati. token_successivo va passato alla richiesta della pagina seguente;
+    è None quando non ci sono altre righe.
+    """
+    elementi: list = field(default_factory=list)
+    token_successivo: Optional[str] = None
+
+    @property
+    def ultima(self) -> bool:
+        return self.token_successivo is None
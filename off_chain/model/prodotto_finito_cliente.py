@@ -1,7 +1,13 @@
 class ProdottoFinito:
-    def __init__(self, nome : str, numero_lotto :int,nome_azienda : str, id_prodotto : int ):
+    __slots__ = ("nome", "numero_lotto", "nome_azienda", "prodotto_id", "co2_totale", "co2_unitaria")
+
+    def __init__(self, nome : str, numero_lotto :int,nome_azienda : str, id_prodotto : int,
+                 co2_totale : int = None, co2_unitaria : int = None):
         
         self.nome : str = nome
         self.numero_lotto : int= numero_lotto
         self.nome_azienda : str = nome_azienda
-        self.prodotto_id :int = id_prodotto
\ No newline at end of file
+        self.prodotto_id :int = id_prodotto
+        # Valorizzati solo se il prodotto viene dal catalogo della CO2
+        self.co2_totale : int = co2_totale
+        self.co2_unitaria : int = co2_unitaria
@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
 from model.componente_model import Componente
 
-@dataclass
+@dataclass(slots=True)
 class ProductModel:
     """
     Data model for transporting product information between layers.
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 
-@dataclass
+@dataclass(slots=True)
 class ProductStandardModel:
     """
     Data model for transporting product information between layers.
@@ -6,7 +6,7 @@ import datetime
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class RichiestaModel:
     """
     Data model for transporting product information between layers.
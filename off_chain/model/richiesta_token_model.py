@@ -1,4 +1,6 @@
 class RichiestaTokenModel:
+    __slots__ = ("id_richiesta", "id_mittente", "id_destinatario", "mittente", "destinatario", "quantita", "stato")
+
     id_richiesta : int
     id_mittente : int
     id_destinatario : int
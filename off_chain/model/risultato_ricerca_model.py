@@ -0,0 +1,15 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class RisultatoRicercaModel:
+    """
+    Una riga dell'indice di ricerca: tipo è 'prodotto', 'azienda', 'certificato' o 'lotto'
+    e id_riferimento è la chiave della riga corrispondente nella sua tabella.
+    """
+    tipo: str
+    id_riferimento: int
+    id_azienda: Optional[int]
+    nome: str
+    dettagli: str
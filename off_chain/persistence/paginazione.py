@@ -0,0 +1,53 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+import base64
+import json
+from persistence.query_builder import QueryBuilder
+
+# Righe per pagina usate dai metodi *_pagina dei repository
+DIMENSIONE_PAGINA = 200
+
+
+def codifica_token(valori) -> str:
+    """Token di continuazione opaco con i valori del cursore dell'ultima riga restituita."""
+    return base64.urlsafe_b64encode(json.dumps(list(valori)).encode()).decode()
+
+
+def decodifica_token(token):
+    """Valori del cursore contenuti nel token, o None per la prima pagina."""
+    if not token:
+        return None
+    try:
+        valori = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Token di continuazione non valido: {e}")
+    if not isinstance(valori, list):
+        raise ValueError("Token di continuazione non valido")
+    return valori
+
+
+def leggi_pagina(db, query_builder: QueryBuilder, colonne_cursore, indici_cursore, dimensione: int, token=None,
+                 direzione: str = "ASC", modello=None):
+    """
+    Completa la select già impostata sul query_builder con il cursore keyset ed esegue la query.
+
+    :param colonne_cursore: colonne su cui ordinare e riprendere la lettura (l'ultima deve essere univoca)
+    :param indici_cursore: posizione delle stesse colonne nelle righe restituite
+    :param modello: se indicato, le righe vengono restituite già convertite (Database.fetch_models);
+                    per leggere il cursore il modello deve restare indicizzabile, come i NamedTuple
+    :return: (righe della pagina, token della pagina successiva o None)
+    """
+    query, value = (
+        query_builder
+            .after(colonne_cursore, decodifica_token(token), direzione)
+            .limit(dimensione + 1)  # Una riga in più indica che esiste una pagina successiva
+            .get_query()
+    )
+    righe = (db.fetch_models(query, value, modello) if modello else db.fetch_results(query, value)) or []
+    if len(righe) <= dimensione:
+        return righe, None
+
+    righe = righe[:dimensione]
+    return righe, codifica_token(righe[-1][i] for i in indici_cursore)
@@ -3,10 +3,20 @@
 # pylint: disable= line-too-long
 # pylint: disable= trailing-whitespace
 # pylint: disable= attribute-defined-outside-init
+import threading
+from collections import OrderedDict
 from configuration.database import Database
 
 
 class QueryBuilder:
+    # Cache LRU delle query compilate, condivisa da tutti i builder: forma della query -> SQL.
+    # I valori non fanno parte della forma, quindi ogni chiamata ricostruisce solo la lista dei parametri.
+    CACHE_MAX_SIZE = 256
+    _cache_query: "OrderedDict[tuple, str]" = OrderedDict()
+    _cache_lock = threading.Lock()
+    _cache_hit = 0
+    _cache_miss = 0
+
     def __init__(self):
         self.reset()
 
@@ -16,12 +26,14 @@ class QueryBuilder:
         self.query_select = []
         self.query_where = []  # Adesso contiene tuple: (connettivo, field, operator, value)
         self.query_insert = {}
+        self.query_insert_rows = []
         self.query_update = {}
         self.query_limit = None
         self.query_order_by = None
         self.query_joins = []
         self.query_group_by = []
         self.query_aggregates = []
+        self.query_after = None  # (colonne cursore, valori o None, direzione)
 
     def table(self, table_name):
         self.query_table = table_name
@@ -54,6 +66,25 @@ class QueryBuilder:
         self.query_insert = kwargs
         return self
 
+    def insert_many(self, rows):
+        """
+        Inserimento di più righe con le stesse colonne (lista di dict).
+        get_query() restituisce la query di una singola riga e la lista dei parametri di ogni riga,
+        da passare a Database.execute_many (anche dentro un blocco Database.scrittura, per unirle
+        ad altre scritture nella stessa transazione).
+        """
+        rows = list(rows)
+        if not rows:
+            raise ValueError("insert_many() richiede almeno una riga.")
+        columns = list(rows[0].keys())
+        if any(list(row.keys()) != columns for row in rows):
+            raise ValueError("Tutte le righe di insert_many() devono avere le stesse colonne.")
+
+        self.query_type = 'insert_many'
+        self.query_insert = dict.fromkeys(columns)
+        self.query_insert_rows = rows
+        return self
+
     def update(self, **kwargs):
         self.query_type = 'update'
         for k, v in kwargs.items():
@@ -67,6 +98,21 @@ class QueryBuilder:
         self.query_type = 'delete'
         return self
 
+    def after(self, cursor_columns, values=None, direction="ASC"):
+        """
+        Paginazione keyset: ordina per cursor_columns e, se values non è None, restituisce solo le righe
+        che seguono (in quell'ordine) la riga con quei valori. Le colonne devono identificare la riga
+        in modo univoco, ad esempio terminando con la chiave primaria.
+        """
+        cursor_columns = tuple(cursor_columns)
+        direction = direction.upper()
+        if direction not in ("ASC", "DESC"):
+            raise ValueError("La direzione di after() deve essere 'ASC' o 'DESC'.")
+        if values is not None and len(values) != len(cursor_columns):
+            raise ValueError("after() richiede un valore per ogni colonna del cursore.")
+        self.query_after = (cursor_columns, tuple(values) if values is not None else None, direction)
+        return self
+
     def limit(self, limit):
         self.query_limit = limit
         return self
@@ -90,24 +136,99 @@ class QueryBuilder:
         if not self.query_table:
             raise ValueError("Tabella non specificata. Chiama table() prima di get_query().")
 
-        if self.query_type == 'select':
-            query, values = self._build_select_query()
-        elif self.query_type == 'insert':
-            query, values = self._build_insert_query()
-        elif self.query_type == 'update':
-            if not self.query_where:
-                raise ValueError("Le query UPDATE senza WHERE sono pericolose! Aggiungi una condizione.")
-            query, values = self._build_update_query()
-        elif self.query_type == 'delete':
-            if not self.query_where:
-                raise ValueError("Le query DELETE senza WHERE sono pericolose! Aggiungi una condizione.")
-            query, values = self._build_delete_query()
-        else:
+        builders = {
+            'select': self._build_select_query,
+            'insert': self._build_insert_query,
+            'insert_many': self._build_insert_many_query,
+            'update': self._build_update_query,
+            'delete': self._build_delete_query,
+        }
+        if self.query_type not in builders:
             raise ValueError("Tipo di query non specificato.")
+        if self.query_type == 'update' and not self.query_where:
+            raise ValueError("Le query UPDATE senza WHERE sono pericolose! Aggiungi una condizione.")
+        if self.query_type == 'delete' and not self.query_where:
+            raise ValueError("Le query DELETE senza WHERE sono pericolose! Aggiungi una condizione.")
+
+        key = self._shape_key()
+        query = QueryBuilder._get_compiled(key)
+        if query is None:
+            query, values = builders[self.query_type]()
+            QueryBuilder._store_compiled(key, query)
+        else:
+            values = self._bind_values()
 
         self.reset()
         return query, values
 
+    def _shape_key(self):
+        """Tutto ciò che determina il testo SQL, esclusi i valori dei parametri."""
+        return (
+            self.query_type,
+            self.query_table,
+            tuple(self.query_select),
+            tuple(self.query_aggregates),
+            tuple(self.query_joins),
+            tuple((logic, field, operator) for logic, field, operator, _ in self.query_where),
+            tuple(self.query_group_by),
+            self.query_order_by,
+            (self.query_after[0], self.query_after[1] is not None, self.query_after[2]) if self.query_after else None,
+            self.query_limit is not None,
+            tuple(self.query_insert.keys()),
+            tuple((col, expr, len(vals)) for col, (expr, vals) in self.query_update.items()),
+        )
+
+    def _bind_values(self):
+        """Parametri nello stesso ordine in cui i _build_*_query li inseriscono nella query."""
+        where_values = [value for *_, value in self.query_where]
+        if self.query_type == 'select':
+            after_values = list(self.query_after[1]) if self.query_after and self.query_after[1] is not None else []
+            return where_values + after_values + ([self.query_limit] if self.query_limit is not None else [])
+        if self.query_type == 'insert':
+            return list(self.query_insert.values())
+        if self.query_type == 'insert_many':
+            return [tuple(row.values()) for row in self.query_insert_rows]
+        if self.query_type == 'update':
+            return [v for _, vals in self.query_update.values() for v in vals] + where_values
+        return where_values
+
+    @classmethod
+    def _get_compiled(cls, key):
+        with cls._cache_lock:
+            query = cls._cache_query.get(key)
+            if query is None:
+                cls._cache_miss += 1
+            else:
+                cls._cache_hit += 1
+                cls._cache_query.move_to_end(key)
+            return query
+
+    @classmethod
+    def _store_compiled(cls, key, query):
+        with cls._cache_lock:
+            cls._cache_query[key] = query
+            cls._cache_query.move_to_end(key)
+            while len(cls._cache_query) > cls.CACHE_MAX_SIZE:
+                cls._cache_query.popitem(last=False)
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        """Statistiche della cache delle query compilate."""
+        with cls._cache_lock:
+            return {
+                "hits": cls._cache_hit,
+                "misses": cls._cache_miss,
+                "size": len(cls._cache_query),
+                "max_size": cls.CACHE_MAX_SIZE,
+            }
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._cache_lock:
+            cls._cache_query.clear()
+            cls._cache_hit = 0
+            cls._cache_miss = 0
+
     def _build_select_query(self):
         fields = ", ".join(self.query_select + self.query_aggregates) if self.query_aggregates else ", ".join(self.query_select)
         query = f"SELECT {fields} FROM {self.query_table}"
@@ -116,19 +237,34 @@ class QueryBuilder:
             query += " " + " ".join(self.query_joins)
 
         values = []
-        if self.query_where:
-            query += " WHERE "
-            conditions = []
-            for i, (logic, field, operator, value) in enumerate(self.query_where):
-                prefix = "" if i == 0 else f" {logic} "
-                conditions.append(f"{prefix}{field} {operator} ?")
-                values.append(value)
-            query += "".join(conditions)
+        conditions = []
+        for i, (logic, field, operator, value) in enumerate(self.query_where):
+            prefix = "" if i == 0 else f" {logic} "
+            conditions.append(f"{prefix}{field} {operator} ?")
+            values.append(value)
+        where = "".join(conditions)
+
+        if self.query_after and self.query_after[1] is not None:
+            columns, after_values, direction = self.query_after
+            comparison = ">" if direction == "ASC" else "<"
+            if len(columns) == 1:
+                keyset = f"{columns[0]} {comparison} ?"
+            else:
+                keyset = f"({', '.join(columns)}) {comparison} ({', '.join('?' for _ in columns)})"
+            # Le condizioni precedenti possono contenere OR: vanno racchiuse prima di aggiungere il cursore
+            where = f"({where}) AND {keyset}" if where else keyset
+            values.extend(after_values)
+
+        if where:
+            query += " WHERE " + where
 
         if self.query_group_by:
             query += " GROUP BY " + ", ".join(self.query_group_by)
 
-        if self.query_order_by:
+        if self.query_after:
+            columns, _, direction = self.query_after
+            query += " ORDER BY " + ", ".join(f"{column} {direction}" for column in columns)
+        elif self.query_order_by:
             query += f" ORDER BY {self.query_order_by[0]} {self.query_order_by[1]}"
 
         if self.query_limit is not None:
@@ -144,6 +280,10 @@ class QueryBuilder:
         values = list(self.query_insert.values())
         return query, values
 
+    def _build_insert_many_query(self):
+        query, _ = self._build_insert_query()
+        return query, self._bind_values()
+
     def _build_update_query(self):
         set_clauses = []
         values = []
@@ -180,23 +320,16 @@ class QueryBuilder:
         return query, values
 
     def execute_and_return_last_id(self):
-        db = Database()
-        conn = db.conn
         query_type = self.query_type
         query, values = self.get_query()
 
-        cursor = conn.cursor()
-        cursor.execute(query, values)
-        conn.commit()
+        with Database().scrittura() as cursor:
+            cursor.execute(query, values)
 
         if query_type == 'insert':
             return cursor.lastrowid
         return None
 
     def execute_and_fetch_one(self):
-        db = Database()
         query, values = self.get_query()
-        cursor = db.conn.cursor()
-        cursor.execute(query, values)
-        result = cursor.fetchone()
-        return result[0] if result else None
+        return Database().fetch_one(query, values)
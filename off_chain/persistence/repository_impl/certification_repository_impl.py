@@ -2,25 +2,55 @@
 # pylint: disable= import-error
 # pylint: disable= line-too-long
 # pylint: disable= trailing-whitespace
+import threading
 from abc import ABC
 from configuration.database import Database
 from model.certification_model import CertificationModel
 from model.lotto_for_cetification_model import LottoForCertificaion
 from model.certification_for_lotto import CertificationForLotto
+from model.pagina_model import Pagina
 from persistence.query_builder import QueryBuilder
+from persistence.paginazione import DIMENSIONE_PAGINA, leggi_pagina
+from persistence.repository_impl.co2_repository_impl import QUERY_DISCENDENTI_LOTTO
 from configuration.log_load_setting import logger
-
-
+from enforcement.guarantee_response_enforcer import response_metrics
+
+
+# Certificati del lotto indicato e di tutti i lotti a monte: UNION visita ogni lotto una sola volta,
+# anche se raggiunto da più percorsi nel grafo delle composizioni
+QUERY_CERTIFICATI_CATENA = """
+    WITH RECURSIVE catena(id_lotto) AS (
+        SELECT ?
+        UNION
+        SELECT c.id_lotto_input
+        FROM ComposizioneLotto AS c
+        JOIN catena ON c.id_lotto_output = catena.id_lotto
+    )
+    SELECT ce.Id_certificato, ce.Id_lotto, ce.Descrizione, az.Nome, ce.Data
+    FROM catena
+    JOIN Certificato AS ce ON ce.Id_lotto = catena.id_lotto
+    JOIN Azienda AS az ON ce.Id_azienda_certificatore = az.Id_azienda
+    ORDER BY ce.Id_certificato
+"""
+
+@response_metrics.measure_public_methods('database_query')
 class CertificationRepositoryImpl(ABC):
     """
      Implementing the certificato repository.
      """    
 
+    # Certificati della catena di ogni lotto radice, condivisi tra le istanze.
+    # Invalidati per i lotti a valle di un nuovo certificato o di una nuova composizione:
+    # ogni invalidazione incrementa _generazione e una catena letta nel frattempo non viene salvata
+    # (come in Co2RepositoryImpl).
+    _cache_catene: dict[int, tuple[CertificationModel, ...]] = {}
+    _generazione = 0
+    _lock = threading.Lock()
+
 
     def __init__(self):
         super().__init__()
         self.db = Database()
-        self.query_builder = QueryBuilder()
         
 
     def get_certifications_by_product_interface(self,id_prodotto: int) -> list:
@@ -37,7 +67,7 @@ class CertificationRepositoryImpl(ABC):
         JOIN Prodotto ON Certificato.Id_prodotto = Prodotto.Id_prodotto
         WHERE Certificato.Id_prodotto = ?;
         """
-        query, value = (self.query_builder
+        query, value = (QueryBuilder()
                                 .select("Certificato.Id_certificato", "Prodotto.Nome","Certificato.Descrizione",
                                         "Azienda.Nome","Certificato.Data"
                                         ).table("Certificato")
@@ -52,7 +82,7 @@ class CertificationRepositoryImpl(ABC):
 
     def get_numero_certificazioni(self, id_azienda: int) -> int:
         query, values = (
-                self.query_builder
+                QueryBuilder()
                     .table("Certificato")
                     .select("COUNT(*)")
                     .where("Id_azienda_certificatore", "=", id_azienda)
@@ -65,7 +95,7 @@ class CertificationRepositoryImpl(ABC):
 
     def is_certificato(self, id_prodotto: int) -> bool:
         query, value = (
-            self.query_builder 
+            QueryBuilder() 
                     .table("Certificato")
                     .select("*")
                     .where("Id_prodotto","=", id_prodotto)
@@ -79,7 +109,7 @@ class CertificationRepositoryImpl(ABC):
     # Restituisce la certificazione del prodotto selezionato
     def get_certificazione_by_prodotto(self, prodotto):
         query, values = (
-            self.query_builder
+            QueryBuilder()
                     .select("Certificato.Id_certificato",
                         "Prodotto.Nome",
                         "Certificato.Descrizione",
@@ -98,62 +128,86 @@ class CertificationRepositoryImpl(ABC):
 
     
     def get_certificati_catena(self, id_lotto: int) -> list[CertificationModel]:
-        try:
-            certificati: list[CertificationModel] = []
+        """Certificati del lotto e di tutti i lotti usati per produrlo, ognuno una sola volta."""
+        with self._lock:
+            certificati = self._cache_catene.get(id_lotto)
+            generazione = CertificationRepositoryImpl._generazione
+        if certificati is not None:
+            return list(certificati)
 
-            query, value = (
-                self.query_builder
-                .select("Id_certificato", "Id_lotto", "Descrizione", "az.Nome", "Data")
-                .table("Certificato")
-                .join("Azienda AS az", "Id_azienda_certificatore", "az.Id_azienda")
-                .where("Id_lotto", "=", id_lotto)
-                .get_query()
-            )
-
-            result = self.db.fetch_results(query, value)
-            certificati.extend([CertificationModel(*r) for r in result])
-
-
-            lotti_input = self.db.fetch_results("""
-                SELECT id_lotto_input FROM ComposizioneLotto WHERE id_lotto_output = ?
-            """, (id_lotto,))
-
-            for (id_lotto_input,) in lotti_input:
-                certificati.extend(self.get_certificati_catena(id_lotto_input))
+        try:
+            certificati = tuple(self.db.fetch_models(QUERY_CERTIFICATI_CATENA, (id_lotto,), CertificationModel))
+        except Exception as e:
+            logger.error(f"Errore durante il recupero dei certificati della catena del lotto {id_lotto}: {e}")
+            return []
 
-            return certificati
+        with self._lock:
+            # Un'invalidazione durante la lettura può averla resa obsoleta: si restituisce ma non si salva
+            if generazione == CertificationRepositoryImpl._generazione:
+                self._cache_catene[id_lotto] = certificati
+        return list(certificati)
 
+    def invalida_lotto(self, id_lotto: int) -> None:
+        """
+        Da chiamare dopo aver aggiunto un certificato al lotto o una riga di ComposizioneLotto
+        con questo lotto in output: cambiano le catene del lotto e di tutti i lotti a valle.
+        """
+        with self._lock:
+            # Anche a cache vuota: una lettura in corso può aver visto il database prima della scrittura
+            CertificationRepositoryImpl._generazione += 1
+            if not self._cache_catene:
+                return
+        try:
+            discendenti = [r[0] for r in self.db.iter_results(QUERY_DISCENDENTI_LOTTO, (id_lotto,))]
         except Exception as e:
-            print(f"Errore durante la conversione dei certificati: {e}")
-            return []
-        
+            logger.error(f"Errore nel recupero dei lotti a valle di {id_lotto}: {e}")
+            discendenti = None
+
+        with self._lock:
+            if discendenti is None:
+                self._cache_catene.clear()
+                return
+            for id_discendente in discendenti:
+                self._cache_catene.pop(id_discendente, None)
 
     def get_lotti_certificabili(self) -> list[LottoForCertificaion]:
         try:
-            query,value =(
-                self.query_builder
-                    .select("o.Id_lotto","o.Tipo","o.Data_operazione","o.Consumo_CO2","a.Nome","p.Nome")
-                    .table("Operazione AS o")
-                    .where("o.Tipo","!=","trasporto")
-                    .where("o.Tipo","!=","vendita")
-                    .join("Prodotto AS p","o.Id_prodotto","p.Id_prodotto")
-                    .join("Azienda AS a","o.Id_azienda","a.Id_azienda")
-                    .get_query()
-            )
+            query,value = self._select_lotti_certificabili().get_query()
 
-            result = self.db.fetch_results(query,value)
+            result = self.db.fetch_models(query, value, LottoForCertificaion)
             logger.warning(f"lista {result}")
-            return [LottoForCertificaion(*r) for r in result]
+            return result
 
         except Exception as e:
             logger.error(f"Errore nel recupero dei lotti: {e}")
 
+    def get_lotti_certificabili_pagina(self, token: str = None, dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """Come get_lotti_certificabili, una pagina alla volta (in ordine di Id_lotto)."""
+        try:
+            righe, token_successivo = leggi_pagina(self.db, self._select_lotti_certificabili(),
+                                                   ("o.Id_lotto",), (0,), dimensione, token)
+            return Pagina([LottoForCertificaion(*r) for r in righe], token_successivo)
+        except Exception as e:
+            logger.error(f"Errore nel recupero dei lotti: {e}")
+            return Pagina()
+
+    def _select_lotti_certificabili(self) -> QueryBuilder:
+        return (
+            QueryBuilder()
+                .select("o.Id_lotto","o.Tipo","o.Data_operazione","o.Consumo_CO2","a.Nome","p.Nome")
+                .table("Operazione AS o")
+                .where("o.Tipo","!=","trasporto")
+                .where("o.Tipo","!=","vendita")
+                .join("Prodotto AS p","o.Id_prodotto","p.Id_prodotto")
+                .join("Azienda AS a","o.Id_azienda","a.Id_azienda")
+        )
+
 
     def get_certificati_lotto(self,id_lotto : int) ->list[CertificationForLotto]:
         try:
 
             query, value = (
-                self.query_builder
+                QueryBuilder()
                 .select("Descrizione", "az.Nome", "Data")
                 .table("Certificato")
                 .join("Azienda AS az", "Id_azienda_certificatore", "az.Id_azienda")
@@ -161,10 +215,10 @@ class CertificationRepositoryImpl(ABC):
                 .get_query()
             )
 
-            result = self.db.fetch_results(query, value)
+            result = self.db.fetch_models(query, value, CertificationForLotto)
             if not result:
                 logger.warning("Ritorno lista vuota")
-            return [CertificationForLotto(*r) for r in result] or []
+            return result
         except Exception as e:
             logger.error(f"Errore nel recupero dei certificati {e}")
 
@@ -173,6 +227,7 @@ class CertificationRepositoryImpl(ABC):
             query = """INSERT INTO Certificato(Id_lotto,Descrizione,Id_azienda_certificatore) VALUES (?, ?, ?)"""
             value =(id_lotto,descrizione,id_azienda)
             self.db.execute_query(query,value)
+            self.invalida_lotto(id_lotto)
         except Exception as e:
             logger.error(f"Errore nel aggiunta del certificato {e}")
 
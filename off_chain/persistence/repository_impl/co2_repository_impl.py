@@ -0,0 +1,258 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+import threading
+from abc import ABC
+from configuration.database import Database
+from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
+from persistence.repository_impl import db_default_string
+
+
+# Tutti i lotti a monte dei lotti iniziali, con i rispettivi archi di composizione
+_QUERY_ANTENATI = """
+    WITH RECURSIVE catena(id_lotto) AS (
+        {lotti_iniziali}
+        UNION
+        SELECT c.id_lotto_input
+        FROM ComposizioneLotto AS c
+        JOIN catena ON c.id_lotto_output = catena.id_lotto
+    )
+    SELECT o.Id_lotto, o.quantita, o.Consumo_CO2, o.Tipo, c.id_lotto_input, c.quantità_utilizzata
+    FROM catena
+    JOIN Operazione AS o ON o.Id_lotto = catena.id_lotto
+    LEFT JOIN ComposizioneLotto AS c ON c.id_lotto_output = o.Id_lotto
+"""
+
+QUERY_ANTENATI_LOTTI = _QUERY_ANTENATI.format(
+    lotti_iniziali="SELECT Id_lotto FROM Operazione WHERE Id_lotto IN ({placeholders})")
+
+# Grafo di tutti i lotti in vendita, o solo di quelli non ancora presenti in CatalogoCo2
+QUERY_ANTENATI_VENDITA = _QUERY_ANTENATI.format(
+    lotti_iniziali="SELECT Id_lotto FROM Operazione WHERE Tipo = ?")
+
+QUERY_ANTENATI_VENDITA_FUORI_CATALOGO = _QUERY_ANTENATI.format(lotti_iniziali="""
+        SELECT o.Id_lotto FROM Operazione AS o
+        LEFT JOIN CatalogoCo2 AS k ON k.Id_lotto = o.Id_lotto
+        WHERE o.Tipo = ? AND k.Id_lotto IS NULL""")
+
+# Lotti per singola query IN (limite storico di SQLite: 999 parametri), come in RichiesteRepositoryImpl
+MAX_PARAMETRI_IN = 500
+
+QUERY_SCRIVI_CATALOGO = "INSERT OR REPLACE INTO CatalogoCo2 (Id_lotto, Co2_totale, Co2_unitaria) VALUES (?, ?, ?)"
+
+# Il lotto indicato e tutti i lotti che lo usano (direttamente o indirettamente)
+QUERY_DISCENDENTI_LOTTO = """
+    WITH RECURSIVE discendenti(id_lotto) AS (
+        SELECT ?
+        UNION
+        SELECT c.id_lotto_output
+        FROM ComposizioneLotto AS c
+        JOIN discendenti ON c.id_lotto_input = discendenti.id_lotto
+    )
+    SELECT id_lotto FROM discendenti
+"""
+
+# Le righe del catalogo a valle di un lotto vanno ricalcolate alla prossima lettura
+QUERY_INVALIDA_CATALOGO = QUERY_DISCENDENTI_LOTTO.replace(
+    "SELECT id_lotto FROM discendenti", "DELETE FROM CatalogoCo2 WHERE Id_lotto IN (SELECT id_lotto FROM discendenti)")
+
+
+def calcola_co2_unitaria(nodi: dict, archi: dict, noti: dict = None) -> dict[int, int]:
+    """
+    Calcola la CO2 unitaria di ogni lotto una sola volta, in ordine topologico.
+
+    :param nodi: id_lotto -> (quantita, consumo_co2)
+    :param archi: id_lotto_output -> lista di (id_lotto_input, quantita_utilizzata)
+    :param noti: valori già calcolati (cache), non vengono ricalcolati
+    """
+    risultato: dict[int, int] = dict(noti or {})
+    for radice in nodi:
+        if radice in risultato:
+            continue
+        # Visita in post-ordine iterativa: un lotto è calcolato dopo tutti i suoi input
+        stack = [(radice, False)]
+        in_visita = set()
+        while stack:
+            id_lotto, espanso = stack.pop()
+            if id_lotto in risultato:
+                continue
+            if not espanso:
+                if id_lotto in in_visita:
+                    logger.warning(f"Ciclo nella composizione del lotto {id_lotto}")
+                    continue
+                in_visita.add(id_lotto)
+                stack.append((id_lotto, True))
+                for id_input, _ in archi.get(id_lotto, []):
+                    if id_input in nodi and id_input not in risultato:
+                        stack.append((id_input, False))
+                continue
+
+            quantita, consumo_co2 = nodi[id_lotto]
+            co2_composizione = sum(risultato.get(id_input, 0) * quantita_usata
+                                   for id_input, quantita_usata in archi.get(id_lotto, []))
+            risultato[id_lotto] = int((co2_composizione + consumo_co2) / quantita)
+    return risultato
+
+
+def calcola_co2_totale(nodi: dict, archi: dict, unitarie: dict, lotti) -> dict[int, int]:
+    """
+    CO2 complessiva dei lotti indicati (prima della divisione per la quantità),
+    a partire dalla CO2 unitaria già calcolata dei loro input.
+    """
+    return {
+        id_lotto: int(sum(unitarie.get(id_input, 0) * quantita_usata for id_input, quantita_usata in archi.get(id_lotto, []))
+                      + nodi[id_lotto][1])
+        for id_lotto in lotti if id_lotto in nodi
+    }
+
+
+@response_metrics.measure_public_methods('database_query')
+class Co2RepositoryImpl(ABC):
+    """
+    Calcolo della CO2 unitaria dei lotti sul grafo delle composizioni.
+    I valori sono condivisi tra le istanze e invalidati solo per i lotti a valle di una scrittura.
+
+    I calcoli avvengono fuori dal lock: ogni invalidazione incrementa `_generazione` e un risultato
+    calcolato durante un'invalidazione non viene scritto, né in cache né in CatalogoCo2.
+    """
+
+    _cache_co2_unitaria: dict[int, int] = {}
+    _generazione = 0
+    _lock = threading.Lock()
+
+    def __init__(self):
+        super().__init__()
+        self.db = Database()
+
+    def get_co2_unitaria(self, id_lotto: int):
+        """Restituisce la CO2 unitaria di un lotto, o None se il lotto non esiste."""
+        return self.get_co2_unitaria_lotti([id_lotto]).get(id_lotto)
+
+    def get_co2_unitaria_lotti(self, id_lotti: list[int]) -> dict[int, int]:
+        """Restituisce la CO2 unitaria di più lotti con una sola visita del grafo."""
+        with self._lock:
+            noti = dict(self._cache_co2_unitaria)
+            generazione = Co2RepositoryImpl._generazione
+
+        mancanti = list({id_lotto for id_lotto in id_lotti if id_lotto not in noti})
+        if mancanti:
+            try:
+                nodi, archi = self._carica_antenati(mancanti)
+            except Exception as e:
+                logger.error(f"Errore nel calcolo della CO2 dei lotti {mancanti}: {e}")
+                nodi, archi = {}, {}
+
+            calcolati = calcola_co2_unitaria(nodi, archi, noti)
+            with self._lock:
+                # Un'invalidazione nel frattempo può aver reso obsoleti i valori letti: non si salvano
+                if generazione == Co2RepositoryImpl._generazione:
+                    self._cache_co2_unitaria.update({k: v for k, v in calcolati.items() if k not in noti})
+            noti = calcolati
+
+        return {id_lotto: noti[id_lotto] for id_lotto in id_lotti if id_lotto in noti}
+
+    def aggiorna_catalogo(self, completo: bool = False) -> int:
+        """
+        Scrive in CatalogoCo2 la CO2 totale e unitaria dei lotti in vendita che non vi compaiono ancora
+        (di tutti, se completo). Il grafo viene letto con una sola query e ogni lotto è calcolato una volta;
+        le righe sono scritte in un'unica transazione. Restituisce il numero di lotti scritti.
+        """
+        try:
+            with self._lock:
+                generazione = Co2RepositoryImpl._generazione
+            query = QUERY_ANTENATI_VENDITA if completo else QUERY_ANTENATI_VENDITA_FUORI_CATALOGO
+            nodi, archi, in_vendita = self._carica_grafo(query, (db_default_string.TIPO_OP_VENDITA,))
+            if not in_vendita and not completo:
+                return 0
+
+            with self._lock:
+                # I lotti in vendita vanno ricalcolati comunque: serve anche il loro totale
+                noti = {} if completo else {k: v for k, v in self._cache_co2_unitaria.items() if k not in in_vendita}
+            unitarie = calcola_co2_unitaria(nodi, archi, noti)
+            totali = calcola_co2_totale(nodi, archi, unitarie, in_vendita)
+
+            righe = [(id_lotto, totale, unitarie[id_lotto]) for id_lotto, totale in totali.items()]
+            with self.db.scrittura() as cur:
+                # Controllo con il lock di scrittura già preso: un'invalidazione successiva
+                # cancella le righe solo dopo il commit, una precedente annulla la scrittura
+                with self._lock:
+                    if generazione != Co2RepositoryImpl._generazione:
+                        logger.info("Catalogo della CO2 invalidato durante il calcolo: aggiornamento rimandato")
+                        return 0
+                if completo:
+                    cur.execute("DELETE FROM CatalogoCo2")
+                cur.executemany(QUERY_SCRIVI_CATALOGO, righe)
+
+            with self._lock:
+                if generazione == Co2RepositoryImpl._generazione:
+                    self._cache_co2_unitaria.update(unitarie)
+            return len(righe)
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento del catalogo della CO2: {e}")
+            return 0
+
+    def invalida_lotto(self, id_lotto: int) -> None:
+        """
+        Da chiamare dopo aver scritto una riga di ComposizioneLotto con questo lotto in output
+        o dopo aver modificato il Consumo_CO2 della sua operazione.
+        """
+        # Prima della cancellazione: i calcoli già in corso non scriveranno più i loro risultati
+        with self._lock:
+            Co2RepositoryImpl._generazione += 1
+        try:
+            self.db.execute_query(QUERY_INVALIDA_CATALOGO, (id_lotto,))
+        except Exception as e:
+            logger.error(f"Errore nell'invalidazione del catalogo della CO2 a valle di {id_lotto}: {e}")
+
+        with self._lock:
+            if not self._cache_co2_unitaria:
+                return
+        try:
+            discendenti = [r[0] for r in self.db.iter_results(QUERY_DISCENDENTI_LOTTO, (id_lotto,))]
+        except Exception as e:
+            logger.error(f"Errore nel recupero dei lotti a valle di {id_lotto}: {e}")
+            discendenti = None
+
+        with self._lock:
+            # Anche dopo: un calcolo partito da una copia della cache presa prima della rimozione
+            Co2RepositoryImpl._generazione += 1
+            if discendenti is None:
+                # Senza il grafo non sappiamo cosa è a valle: meglio svuotare tutto
+                self._cache_co2_unitaria.clear()
+                return
+            for id_discendente in discendenti:
+                self._cache_co2_unitaria.pop(id_discendente, None)
+
+    def _carica_antenati(self, id_lotti: list[int]):
+        nodi: dict = {}
+        archi: dict = {}
+        for i in range(0, len(id_lotti), MAX_PARAMETRI_IN):
+            # I lotti già raggiunti da un blocco precedente hanno già tutti i loro antenati
+            blocco = [id_lotto for id_lotto in id_lotti[i:i + MAX_PARAMETRI_IN] if id_lotto not in nodi]
+            if not blocco:
+                continue
+            placeholders = ", ".join("?" for _ in blocco)
+            nodi_blocco, archi_blocco, _ = self._carica_grafo(QUERY_ANTENATI_LOTTI.format(placeholders=placeholders),
+                                                              tuple(blocco))
+            # Un antenato comune a più blocchi ha gli stessi archi: si tiene solo la prima lettura
+            for id_lotto, nodo in nodi_blocco.items():
+                if id_lotto not in nodi:
+                    nodi[id_lotto] = nodo
+                    if id_lotto in archi_blocco:
+                        archi[id_lotto] = archi_blocco[id_lotto]
+        return nodi, archi
+
+    def _carica_grafo(self, query: str, params: tuple):
+        # Le righe vengono consumate man mano: in memoria resta solo il grafo
+        nodi: dict = {}
+        archi: dict = {}
+        in_vendita: set = set()
+        for id_lotto, quantita, consumo_co2, tipo, id_input, quantita_usata in self.db.iter_results(query, params):
+            nodi[id_lotto] = (quantita, consumo_co2)
+            if tipo == db_default_string.TIPO_OP_VENDITA:
+                in_vendita.add(id_lotto)
+            if id_input is not None:
+                archi.setdefault(id_lotto, []).append((id_input, quantita_usata))
+        return nodi, archi, in_vendita
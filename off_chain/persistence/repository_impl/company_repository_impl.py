@@ -5,12 +5,14 @@
 from abc import ABC
 from configuration.database import Database
 from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
 from model.company_model import CompanyModel
 from persistence.query_builder import QueryBuilder
 from persistence.repository_impl.database_standard import *
 from persistence.repository_impl import db_default_string 
 
 
+@response_metrics.measure_public_methods('database_query')
 class CompanyRepositoryImpl(ABC):
     """
      Implementing the aziende repository.
@@ -19,18 +21,17 @@ class CompanyRepositoryImpl(ABC):
     def __init__(self):
         super().__init__()
         self.db = Database()
-        self.query_builder = QueryBuilder()
 
 
     def get_aziende_trasporto(self) -> list[CompanyModel]:
         """
         Get all the transport companies from the database.
         """
-        self.query_builder.select("*").table("Azienda").where("Tipo", "=", "Trasportatore")
-        query, value = (self.query_builder.get_query())
-        result = self.db.fetch_results(query, value)
+        query_builder = QueryBuilder()
+        query_builder.select("*").table("Azienda").where("Tipo", "=", "Trasportatore")
+        query, value = (query_builder.get_query())
         try:
-            return [CompanyModel(*x) for x in result]
+            return self.db.fetch_models(query, value, CompanyModel)
         except Exception as e:
             print(e)
             return []
@@ -39,26 +40,25 @@ class CompanyRepositoryImpl(ABC):
     def get_lista_aziende(self, tipo: aziende_enum = None, 
                           nome : str = None, id : int = None, escludi_azienda : int = None) -> list[CompanyModel]:
         
-        self.query_builder.select("*").table("Azienda")
+        query_builder = QueryBuilder()
+        query_builder.select("*").table("Azienda")
 
 
         if not tipo: 
-                self.query_builder.where("Tipo", "!=" , db_default_string.TIPO_AZIENDA_CERTIFICATORE)
+                query_builder.where("Tipo", "!=" , db_default_string.TIPO_AZIENDA_CERTIFICATORE)
 
         if nome:
-            self.query_builder.where("Nome", "=",nome)
+            query_builder.where("Nome", "=",nome)
 
         if id:
-            self.query_builder.where("Id_azienda", "=",id)
+            query_builder.where("Id_azienda", "=",id)
         if escludi_azienda:
-            self.query_builder.where("Id_azienda", "!=", escludi_azienda)
+            query_builder.where("Id_azienda", "!=", escludi_azienda)
             
 
-        query, value= (self.query_builder.get_query())
-        result = self.db.fetch_results(query,value)
+        query, value= (query_builder.get_query())
         try:
-            print(result[0])
-            return [CompanyModel(*x) for x in result]
+            return self.db.fetch_models(query, value, CompanyModel)
         
         except Exception as e:
             print(e)
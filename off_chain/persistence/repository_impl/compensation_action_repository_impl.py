@@ -6,16 +6,19 @@ import datetime
 from abc import ABC
 from configuration.database import Database
 from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
 from persistence.query_builder import QueryBuilder
+from persistence.paginazione import DIMENSIONE_PAGINA, leggi_pagina
+from model.pagina_model import Pagina
 from model.compensation_action_model import CompensationActionModel
 
 
+@response_metrics.measure_public_methods('database_query')
 class CompensationActionRepositoryImpl( ABC):
     # Class variable that stores the single instance
     def __init__(self):
         super().__init__()
         self.db = Database()
-        self.query_builder = QueryBuilder()
 
 
 
@@ -23,46 +26,69 @@ class CompensationActionRepositoryImpl( ABC):
     def get_lista_azioni(self, id_azienda: int,  data_start: datetime = None, data_end: datetime = None, ordinamento: str = None) -> list[CompensationActionModel]:
         try:
 
-
-            self.query_builder.select("Id_azione","Id_azienda","Data","Co2_compensata","Nome_azione","blockchain_registered").table("Azioni_compensative").where("Id_azienda", "=", id_azienda)
-
-            if data_start and data_end:
-                self.query_builder.where("Data", ">", data_start).where("Data", "<", data_end)
+            query_builder = self._select_azioni(id_azienda, data_start, data_end)
                 
             if ordinamento:
-                self.query_builder.order_by("Co2_compensata", "DESC")
+                query_builder.order_by("Co2_compensata", "DESC")
 
             query,value = (
-                self.query_builder.get_query()
+                query_builder.get_query()
             )
             results = self.db.fetch_results(query, value)
             if not results:
                 logger.info("Nessuna azione compensativa trovata per l'azienda specificata.")
                 return []
-            lista_op= [
-                    CompensationActionModel(
-                        id_azione=row[0],
-                        id_azienda=row[1],
-                        data_azione=row[2],
-                        co2_compensata=row[3],
-                        nome_azione=row[4],
-                        blockchain_registered=bool(row[5]) if len(row) > 5 else False,
-                )
-                for row in results
-                ]
-
-            return lista_op
+            return self._crea_azioni(results)
         except Exception as e:
             logger.error(f"Errore nel recuero delle azioni compensative: {e}")
             return []
+
+    def get_lista_azioni_pagina(self, id_azienda: int, data_start: datetime = None, data_end: datetime = None,
+                                ordinamento: str = None, token: str = None,
+                                dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """Come get_lista_azioni, una pagina alla volta. Con ordinamento le azioni sono in ordine di CO2 decrescente."""
+        if ordinamento:
+            cursore, indici, direzione = ("Co2_compensata", "Id_azione"), (3, 0), "DESC"
+        else:
+            cursore, indici, direzione = ("Id_azione",), (0,), "ASC"
+        try:
+            righe, token_successivo = leggi_pagina(self.db, self._select_azioni(id_azienda, data_start, data_end),
+                                                   cursore, indici, dimensione, token, direzione)
+            return Pagina(self._crea_azioni(righe), token_successivo)
+        except Exception as e:
+            logger.error(f"Errore nel recuero delle azioni compensative: {e}")
+            return Pagina()
+
+    def _select_azioni(self, id_azienda: int, data_start: datetime = None, data_end: datetime = None) -> QueryBuilder:
+        query_builder = QueryBuilder()
+        query_builder.select("Id_azione","Id_azienda","Data","Co2_compensata","Nome_azione","blockchain_registered").table("Azioni_compensative").where("Id_azienda", "=", id_azienda)
+
+        if data_start and data_end:
+            query_builder.where("Data", ">", data_start).where("Data", "<", data_end)
+        return query_builder
+
+    @staticmethod
+    def _crea_azioni(results) -> list[CompensationActionModel]:
+        return [
+                CompensationActionModel(
+                    id_azione=row[0],
+                    id_azienda=row[1],
+                    data_azione=row[2],
+                    co2_compensata=row[3],
+                    nome_azione=row[4],
+                    blockchain_registered=bool(row[5]) if len(row) > 5 else False,
+            )
+            for row in results
+            ]
     
 
     def get_co2_compensata(self, id_azienda: int) -> int:
         query,value = (
-            self.query_builder
+            QueryBuilder()
                 .select("SUM(Co2_compensata)")
                 .table("Azioni_compensative")
                 .where("Id_azienda", "=", id_azienda)
+                .get_query()
         )
         try:
             return int(self.db.fetch_one(query, value))
@@ -8,6 +8,7 @@ from typing import Union
 from domain.exception.database_exceptions import UniqueConstraintError
 from configuration.database import Database
 from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
 from domain.exception.login_exceptions import HaveToWaitException, ToManyTryLogEXcepition
 from persistence.query_builder import QueryBuilder
 from model.credential_model import UserModel
@@ -24,17 +25,17 @@ class "CredentialRepositoryImpl(CredentialRepository, ABC)"
 """
 
 
+@response_metrics.measure_public_methods('database_query')
 class CredentialRepositoryImpl(ABC):
   
     def __init__(self):
         self.db = Database()
-        self.query_builder = QueryBuilder()
         logger.info("BackEnd: Successfully initializing the instance for CredentialRepositoryImpl.")
 
     def get_user(self, user: str) -> Union[UserModel, None]:
         try:
             query,value = ( 
-                self.query_builder.select("Id_credenziali","Username","Password" )
+                QueryBuilder().select("Id_credenziali","Username","Password" )
                 .table("Credenziali").where("Username", "=",user).get_query())    
             results = self.db.fetch_results(query,value)
             
@@ -52,7 +53,7 @@ class CredentialRepositoryImpl(ABC):
 
     def get_azienda_by_id(self, id: int) -> CompanyModel:
         query, value = (
-            self.query_builder.select("*").table("Azienda").where("Id_azienda","=",id).get_query()
+            QueryBuilder().select("*").table("Azienda").where("Id_azienda","=",id).get_query()
         )
 
         try:
@@ -67,32 +68,26 @@ class CredentialRepositoryImpl(ABC):
     def register(self, username: str, password: str, tipo: aziende_enum, indirizzo: str, blockchain_address: str) -> int:
         try:
             
-            self.db.cur.execute("BEGIN TRANSACTION;")  # Inizio transazione manuale
-            # Prima INSERT: credenziali
-            query_credenziali = """
-                INSERT INTO Credenziali (Username, Password, address)
-                VALUES (?, ?, ?);
-            """
-
-            self.db.cur.execute(query_credenziali, (username, password,blockchain_address))
-            logger.info(f"Inserisco le credenziali del nuovo utente {username}")
-            id_credenziali = self.db.cur.lastrowid  # Ottieni l'ID appena creato
-            
-            # Seconda INSERT: azienda
-            query_azienda = """
-                INSERT INTO Azienda (Id_credenziali, Tipo, Nome, Indirizzo)
-                VALUES (?, ?, ?, ?);
-            """
-            self.db.cur.execute(query_azienda, (id_credenziali, tipo, username, indirizzo))
-            logger.info(f"Inserisco le informazione dell'azienda collegata all'utente {username}")
-
-            # Commit manuale dell'intera transazione
-            self.db.conn.commit()
-            
-            # Ottieni l'ID dell'azienda appena creata
-            query_id_azienda = "SELECT Id_azienda FROM Azienda WHERE Id_credenziali = ?"
-            self.db.cur.execute(query_id_azienda, (id_credenziali,))
-            id_azienda = self.db.cur.fetchone()[0]
+            # Credenziali e azienda nella stessa transazione di scrittura
+            with self.db.scrittura() as cur:
+                # Prima INSERT: credenziali
+                query_credenziali = """
+                    INSERT INTO Credenziali (Username, Password, address)
+                    VALUES (?, ?, ?);
+                """
+
+                cur.execute(query_credenziali, (username, password,blockchain_address))
+                logger.info(f"Inserisco le credenziali del nuovo utente {username}")
+                id_credenziali = cur.lastrowid  # Ottieni l'ID appena creato
+
+                # Seconda INSERT: azienda
+                query_azienda = """
+                    INSERT INTO Azienda (Id_credenziali, Tipo, Nome, Indirizzo)
+                    VALUES (?, ?, ?, ?);
+                """
+                cur.execute(query_azienda, (id_credenziali, tipo, username, indirizzo))
+                logger.info(f"Inserisco le informazione dell'azienda collegata all'utente {username}")
+                id_azienda = cur.lastrowid
             
             # Registra l'azienda sulla blockchain
             try:
@@ -109,12 +104,11 @@ class CredentialRepositoryImpl(ABC):
             return id_credenziali
 
         except sqlite3.IntegrityError:
-            self.db.conn.rollback()  # Rollback su vincolo violato
+            # Il rollback è già stato eseguito all'uscita dalla transazione
             logger.error(f"Errore: Username già esistente.")
             raise UniqueConstraintError("Errore: Username già esistente.")
 
         except Exception as e:
-            self.db.conn.rollback()
             logger.error(f"Errore durante l'inserimento delle credenziali e dell'azienda: {str(e)}")
             raise e
 
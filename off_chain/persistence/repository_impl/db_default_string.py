@@ -17,4 +17,13 @@ STATO_ATTESA = "In attesa"
 STATO_ACCETTATA = "Accettata"
 STATO_RIFIUTATA = "Rifiutata"
 
+# Stati dell'outbox blockchain
+STATO_OUTBOX_IN_CODA = "In coda"
+STATO_OUTBOX_IN_INVIO = "In invio"
+STATO_OUTBOX_INVIATA = "Inviata"
+STATO_OUTBOX_CONFERMATA = "Confermata"
+STATO_OUTBOX_FALLITA = "Fallita"
 
+# Sequenze (tabella Sequenza)
+SEQUENZA_LOTTI = "lotto"
+SEQUENZA_SOGLIE = "soglie"  # Versione del contenuto di Soglie, incrementata dai trigger
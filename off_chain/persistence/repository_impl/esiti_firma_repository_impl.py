@@ -0,0 +1,79 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+from abc import ABC
+from typing import Final, Optional
+from configuration.database import Database
+from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
+
+
+@response_metrics.measure_public_methods('database_query')
+class EsitiFirmaRepositoryImpl(ABC):
+    """
+    Esiti delle firme MetaMask salvati su SQLite: sopravvivono al riavvio del backend
+    e sono visti da tutti i processi del backend che usano lo stesso database.
+    Le chiavi arrivano già normalizzate da RegistroEsiti; Scadenza è in secondi epoch.
+    Lo stesso repository è usato insieme da tutte le richieste del backend: le query sono costanti,
+    senza un QueryBuilder condiviso tra i thread.
+    """
+
+    QUERY_SALVA : Final = """
+        INSERT INTO EsitiFirma (Tipo, Address, Id_riferimento, Esito, Scadenza) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (Tipo, Address, Id_riferimento) DO UPDATE SET Esito = excluded.Esito, Scadenza = excluded.Scadenza
+    """
+
+    QUERY_GET : Final = """
+        SELECT Esito, Scadenza FROM EsitiFirma
+        WHERE Tipo = ? AND Address = ? AND Id_riferimento = ? AND Scadenza > ?
+    """
+
+    QUERY_PRIMO : Final = """
+        SELECT Esito FROM EsitiFirma
+        WHERE Tipo = ? AND Address = ? AND Scadenza > ?
+        ORDER BY Scadenza LIMIT 1
+    """
+
+    QUERY_ELIMINA_SCADUTI : Final = "DELETE FROM EsitiFirma WHERE Scadenza <= ?"
+
+    # Tiene le righe con la scadenza più lontana, cioè le registrate più di recente
+    QUERY_RIDUCI : Final = """
+        DELETE FROM EsitiFirma WHERE rowid IN (
+            SELECT rowid FROM EsitiFirma ORDER BY Scadenza DESC LIMIT -1 OFFSET ?
+        )
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.db = Database()
+
+    def salva(self, tipo: str, address: str, id_riferimento: str, esito: str, scadenza: float) -> None:
+        try:
+            self.db.execute_query(self.QUERY_SALVA, (tipo, address, id_riferimento, esito, scadenza))
+        except Exception as e:
+            logger.error(f"Errore nel salvataggio dell'esito {tipo}/{address}/{id_riferimento}: {e}")
+
+    def get(self, tipo: str, address: str, id_riferimento: str, adesso: float) -> Optional[tuple[str, float]]:
+        """(esito, scadenza) non ancora scaduto, o None."""
+        try:
+            risultati = self.db.fetch_results(self.QUERY_GET, (tipo, address, id_riferimento, adesso))
+            return tuple(risultati[0]) if risultati else None
+        except Exception as e:
+            logger.error(f"Errore nella lettura dell'esito {tipo}/{address}/{id_riferimento}: {e}")
+            return None
+
+    def primo(self, tipo: str, address: str, adesso: float) -> Optional[str]:
+        try:
+            risultati = self.db.fetch_results(self.QUERY_PRIMO, (tipo, address, adesso))
+            return risultati[0][0] if risultati else None
+        except Exception as e:
+            logger.error(f"Errore nella lettura degli esiti di {address}: {e}")
+            return None
+
+    def elimina_scaduti(self, adesso: float, massimo: int) -> None:
+        """Elimina gli esiti scaduti e, oltre `massimo` righe, i meno recenti."""
+        try:
+            self.db.execute_transaction([(self.QUERY_ELIMINA_SCADUTI, (adesso,)), (self.QUERY_RIDUCI, (massimo,))])
+        except Exception as e:
+            logger.error(f"Errore nella pulizia degli esiti scaduti: {e}")
@@ -8,14 +8,22 @@ import sqlite3
 from typing import Final
 from pydantic import BaseModel
 import hmac
-import hashlib
 import os
+import csv
+import json
 from configuration.database import Database
 from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
 from model.operation_model import OperationModel
-from model.operation_estesa_model import OperazioneEstesaModel
+from model.operation_estesa_model import OperazioneEstesaRiga
 from model.prodotto_finito_model import ProdottoLottoModel
+from model.pagina_model import Pagina
 from persistence.query_builder import QueryBuilder
+from persistence.paginazione import DIMENSIONE_PAGINA, leggi_pagina
+from persistence.repository_impl.certification_repository_impl import CertificationRepositoryImpl
+from persistence.repository_impl.co2_repository_impl import Co2RepositoryImpl
+from persistence.repository_impl.search_repository_impl import CURSORE_RICERCA, espressione_ricerca
+from persistence.repository_impl.threshold_repository_impl import ThresholdRepositoryImpl, firma_soglia
 
 from persistence.repository_impl import db_default_string
 
@@ -29,8 +37,7 @@ class VerificaRequest(FirmaRequest):
     signature: str
 
 
-SECRET_KEY = os.getenv("_KEY", "default_dev_key")
-
+@response_metrics.measure_public_methods('database_query')
 class OperationRepositoryImpl(ABC):
     # Class variable that stores the single instance
 
@@ -39,20 +46,85 @@ class OperationRepositoryImpl(ABC):
                             SET Co2_emessa = Co2_emessa + ?, Token = Token + ?  
                             WHERE Id_azienda = ?;
                         """
+
+    # Campi obbligatori di ogni operazione nei file di importazione
+    CAMPI_IMPORTAZIONE : Final = ("Id_azienda", "Id_prodotto", "Consumo_CO2", "quantita", "Tipo")
+
+    # Riserva un blocco di id lotto con un solo UPDATE atomico: restituisce l'ultimo id del blocco
+    QUERY_RISERVA_LOTTI : Final = """
+                            UPDATE Sequenza
+                            SET Valore = Valore + ?
+                            WHERE Nome = ?
+                            RETURNING Valore;
+                        """
     
 
     def __init__(self):
         super().__init__()
         self.db = Database()
-        self.query_builder = QueryBuilder()
+        self.co2_repository = Co2RepositoryImpl()
+        self.certification_repository = CertificationRepositoryImpl()
+        self.threshold_repository = ThresholdRepositoryImpl()
         
 
-    def get_operazioni_by_azienda(self, azienda: int) -> list[OperazioneEstesaModel]:
+    def _invalida_composizione(self, *id_lotti: int) -> None:
+        """Dopo aver scritto la composizione dei lotti indicati: CO2 e certificati a valle vanno ricalcolati."""
+        for id_lotto in id_lotti:
+            self.co2_repository.invalida_lotto(id_lotto)
+            self.certification_repository.invalida_lotto(id_lotto)
+
+    def get_operazioni_by_azienda(self, azienda: int) -> list[OperazioneEstesaRiga]:
         """Restituisce la lista di tutte le operazioni effettuate da una certa azienda """
+        query, value = self._select_operazioni_azienda(azienda).get_query()
+
+        try:
+            # Le righe diventano OperazioneEstesaRiga direttamente nel cursore (vedi persistence.row_factory)
+            return self.db.fetch_models(query, value, OperazioneEstesaRiga)
+        except Exception as e:
+            logger.error(f"Error fetching operations by company: {e}", exc_info=True)
+            return []
+
+    def get_operazioni_by_azienda_pagina(self, azienda: int, token: str = None,
+                                         dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """Come get_operazioni_by_azienda, una pagina alla volta (in ordine di Id_operazione)."""
+        try:
+            righe, token_successivo = leggi_pagina(
+                self.db, self._select_operazioni_azienda(azienda),
+                ("Operazione.Id_operazione",), (0,), dimensione, token, modello=OperazioneEstesaRiga
+            )
+            return Pagina(righe, token_successivo)
+        except Exception as e:
+            logger.error(f"Error fetching operations page by company: {e}", exc_info=True)
+            return Pagina()
 
+    def cerca_operazioni_azienda_pagina(self, azienda: int, testo: str, token: str = None,
+                                        dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """
+        Operazioni dell'azienda il cui prodotto, tipo o lotto corrisponde al testo (prefissi di parola),
+        dalla più rilevante, una pagina alla volta. Usa l'indice full-text, non le operazioni già caricate.
+        """
+        espressione = espressione_ricerca(testo)
+        if not espressione:
+            return self.get_operazioni_by_azienda_pagina(azienda, token, dimensione)
+        try:
+            builder = (
+                self._select_operazioni_azienda(azienda, *CURSORE_RICERCA)
+                    .join("IndiceRicerca", "IndiceRicerca.id_riferimento", "Operazione.Id_lotto")
+                    .where("IndiceRicerca", "MATCH", espressione)
+                    .where("IndiceRicerca.tipo", "=", "lotto")
+            )
+            righe, token_successivo = leggi_pagina(self.db, builder, CURSORE_RICERCA, (9, 10), dimensione, token)
+            # Le colonne del cursore di ricerca seguono quelle di OperazioneEstesaRiga
+            campi = len(OperazioneEstesaRiga._fields)
+            return Pagina([OperazioneEstesaRiga._make(riga[:campi]) for riga in righe], token_successivo)
+        except Exception as e:
+            logger.error(f"Error searching operations by company: {e}", exc_info=True)
+            return Pagina()
+
+    def _select_operazioni_azienda(self, azienda: int, *campi_extra: str) -> QueryBuilder:
         # Utilizziamo una query senza la colonna descrizione per sicurezza
-        query, value = (
-            self.query_builder
+        return (
+            QueryBuilder()
                 .select(
                     "Operazione.Id_operazione",
                     "Prodotto.Id_prodotto",
@@ -62,46 +134,14 @@ class OperationRepositoryImpl(ABC):
                     "Operazione.Tipo",
                     "Operazione.quantita",
                     "Operazione.blockchain_registered",
-                    "Operazione.Id_lotto"
+                    "Operazione.Id_lotto",
+                    *campi_extra
                 )
                 .table("Operazione")
                 .join("Prodotto", "Operazione.Id_prodotto", "Prodotto.Id_prodotto")
                 .where("Operazione.Id_azienda", "=", azienda)
-                .get_query()
         )
 
-        try:
-            results = self.db.fetch_results(query, value)
-            if results is None:
-                logger.error("No results returned from database")
-                return []
-                
-            operazioni_estese = []
-            for row in results:
-                try:
-                    operazione = OperazioneEstesaModel(
-                        id_operazione=row[0],
-                        id_lotto= row[8],  # Assuming id_lotto is the second column
-                        id_prodotto=row[1],
-                        nome_prodotto=row[2],
-                        data_operazione=row[3],
-                        consumo_co2=row[4],
-                        nome_operazione=row[5],
-                        quantita_prodotto=row[6],
-                        blockchain_registered=bool(row[7]) if len(row) > 7 else False
-                    )
-                    operazioni_estese.append(operazione)
-                except Exception as e:
-                    logger.error(f"Error creating OperazioneEstesaModel: {e} for row: {row}", exc_info=True)
-            
-            return operazioni_estese   
-        except Exception as e:
-            logger.error(f"Error fetching operations by company: {e}", exc_info=True)
-            return []
-    
-
-
-
     def inserisci_operazione_azienda_rivenditore(self, azienda: int, prodotto: int, data: datetime, co2: int,
                                                  evento: str, id_lotto_input: int, quantita : int):
         """
@@ -141,6 +181,7 @@ class OperationRepositoryImpl(ABC):
             queries.append((query, params))
 
             self.db.execute_transaction(queries)
+            self._invalida_composizione(value_output_lotto)
 
         
         except Exception as e:
@@ -153,6 +194,7 @@ class OperationRepositoryImpl(ABC):
         """
         Inserts a new agricultural product and logs the operation.
         """
+        query_builder = QueryBuilder()
         try:
 
             queries = []
@@ -160,7 +202,7 @@ class OperationRepositoryImpl(ABC):
             tipo_evento = db_default_string.TIPO_OP_PRODUZIONE
             id_lotto = self.get_next_id_lotto_output()
             query, value = (
-                self.query_builder.table("Operazione")
+                query_builder.table("Operazione")
                 .insert(Id_azienda=azienda, Id_prodotto=id_tipo_prodotto, Data_operazione=data, Consumo_CO2=co2,
                         Tipo=tipo_evento, Id_lotto= id_lotto, quantita=quantita)
                 .get_query()
@@ -170,7 +212,7 @@ class OperationRepositoryImpl(ABC):
             
 
             query, value = (
-                self.query_builder.table("Magazzino")
+                query_builder.table("Magazzino")
                 .insert(Id_azienda=azienda, id_lotto=id_lotto, quantita=quantita)
                 .get_query()
             )
@@ -184,6 +226,7 @@ class OperationRepositoryImpl(ABC):
             queries.append((query, params))
 
             self.db.execute_transaction(queries)
+            self.co2_repository.invalida_lotto(id_lotto)
 
             logger.info(f"Operazione registrata con successo.")
         except Exception as e:
@@ -213,8 +256,8 @@ class OperationRepositoryImpl(ABC):
             if quantita_disponibile < quantita:
                 raise Exception( f"Quantità insufficiente: disponibile {quantita_disponibile}, richiesta {quantita}.")
             
-            #vendita
-            value_output_lotto = self.get_next_id_lotto_output()
+            #vendita (il lotto successivo è riservato per il trasporto)
+            value_output_lotto = self.get_next_id_lotto_output(2)
 
             query = "INSERT INTO ComposizioneLotto (id_lotto_output,id_lotto_input, quantità_utilizzata) VALUES (?, ?, ?)"
             params = (value_output_lotto, id_lotto_input, quantita)  
@@ -271,6 +314,7 @@ class OperationRepositoryImpl(ABC):
 
 
             self.db.execute_transaction(queries)
+            self._invalida_composizione(value_output_lotto, lotto_vendita)
 
             logger.info(f"Operazione di trasporto inserita con successo.")
 
@@ -315,17 +359,20 @@ class OperationRepositoryImpl(ABC):
             # 4. Prepara update quantità materie prime
             for _, (materia, quantita_usata) in materie_prime_usate.items():
                 if isinstance(materia, ProdottoLottoModel):
-                    print(f"\n\\nn\n\nn\n\n\n\n\n\n\ {quantita_usata}\n\n\n\n\n")
                     query_update_materia ="UPDATE Magazzino SET quantita = quantita - ? WHERE id_lotto = ?"
                     value = (quantita_usata,materia.id_lotto)
                     queries.append((query_update_materia, value))
             
             # 5. Ora crea le composizioni del lotto (dopo aver creato l'operazione)
-            for _, (materia, quantita_usata) in materie_prime_usate.items():
-                if isinstance(materia, ProdottoLottoModel):
-                    query_comp = "INSERT INTO ComposizioneLotto (id_lotto_output, id_lotto_input, quantità_utilizzata) VALUES (?, ?, ?)"
-                    params = (value_output_lotto, materia.id_lotto, quantita_usata)
-                    queries.append((query_comp, params))
+            composizioni = [
+                {"id_lotto_output": value_output_lotto, "id_lotto_input": materia.id_lotto, "quantità_utilizzata": quantita_usata}
+                for _, (materia, quantita_usata) in materie_prime_usate.items()
+                if isinstance(materia, ProdottoLottoModel)
+            ]
+            if composizioni:
+                query_comp, righe_comp = QueryBuilder().table("ComposizioneLotto").insert_many(composizioni).get_query()
+                # Righe consecutive con la stessa query: execute_transaction le esegue con un solo executemany
+                queries.extend((query_comp, riga) for riga in righe_comp)
 
             # 6. Aggiorna solo la CO2 dell'azienda (senza assegnazione token)
             # I token verranno assegnati solo quando l'operazione sarà registrata sulla blockchain
@@ -335,32 +382,138 @@ class OperationRepositoryImpl(ABC):
             
             # 7. Esegui la transazione
             self.db.execute_transaction(queries)
+            self._invalida_composizione(value_output_lotto)
 
             return self.recupera_soglia(tipo_evento, id_tipo_prodotto)
 
         except sqlite3.IntegrityError as e:
             print("IntegrityError:", e)
-            self.db.conn.rollback()
 
         except Exception as e:
-            # Se c'è un errore, rollback dell'intera transazione
-            self.db.conn.rollback()
+            # execute_transaction ha già annullato l'intera transazione
             raise Exception(f"Errore durante la creazione del prodotto trasformato: {e}")
          
 
-    def get_next_id_lotto_output(self):
+    def importa_operazioni(self, percorso_file: str) -> list[int]:
+        """
+        Importa in blocco le operazioni da un file CSV (con intestazione) o JSON (lista di oggetti).
+        Ogni operazione crea un nuovo lotto nel magazzino della sua azienda.
+        Tutto avviene in una sola transazione; restituisce gli id lotto assegnati.
+        """
+        operazioni = self._leggi_operazioni_da_file(percorso_file)
+        if not operazioni:
+            return []
+
+        primo_lotto = self.get_next_id_lotto_output(len(operazioni))
+        adesso = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        righe_operazione = []
+        righe_magazzino = []
+        co2_per_azienda: dict[int, int] = {}
+        for id_lotto, op in enumerate(operazioni, start=primo_lotto):
+            righe_operazione.append({
+                "Id_azienda": op["Id_azienda"], "Id_prodotto": op["Id_prodotto"], "Id_lotto": id_lotto,
+                "Data_operazione": op.get("Data_operazione") or adesso, "Consumo_CO2": op["Consumo_CO2"],
+                "quantita": op["quantita"], "Tipo": op["Tipo"]
+            })
+            righe_magazzino.append({"id_azienda": op["Id_azienda"], "id_lotto": id_lotto, "quantita": op["quantita"]})
+            co2_per_azienda[op["Id_azienda"]] = co2_per_azienda.get(op["Id_azienda"], 0) + op["Consumo_CO2"]
+
+        # Un executemany per tabella, tutti nella stessa transazione: un errore annulla l'intera importazione
+        with self.db.scrittura():
+            for tabella, righe in (("Operazione", righe_operazione), ("Magazzino", righe_magazzino)):
+                self.db.execute_many(*QueryBuilder().table(tabella).insert_many(righe).get_query())
+            self.db.execute_many("UPDATE Azienda SET Co2_emessa = Co2_emessa + ? WHERE Id_azienda = ?",
+                                 [(co2, id_azienda) for id_azienda, co2 in co2_per_azienda.items()])
+        logger.info(f"Importate {len(operazioni)} operazioni da {percorso_file}")
+        return list(range(primo_lotto, primo_lotto + len(operazioni)))
+
+    def esporta_operazioni(self, percorso_file: str, azienda: int = None) -> int:
+        """
+        Esporta le operazioni (di una sola azienda, se indicata) in un file CSV o JSON
+        nello stesso formato letto da importa_operazioni. Le righe vengono scritte man mano
+        che sono lette, quindi la memoria usata non dipende dal numero di operazioni.
+        Restituisce il numero di operazioni esportate.
+        """
+        query_builder = QueryBuilder()
+        estensione = os.path.splitext(percorso_file)[1].lower()
+        if estensione not in (".csv", ".json"):
+            raise ValueError(f"Formato di esportazione non supportato: {estensione}")
+
+        campi = self.CAMPI_IMPORTAZIONE + ("Data_operazione",)
+        query_builder.select(*campi).table("Operazione")
+        if azienda is not None:
+            query_builder.where("Id_azienda", "=", azienda)
+        query, value = query_builder.order_by("Id_operazione").get_query()
+        righe = self.db.iter_results(query, value, row_factory=lambda riga: dict(zip(campi, riga)))
+
+        esportate = 0
+        with open(percorso_file, "w", encoding="utf-8", newline="") as file:
+            if estensione == ".csv":
+                writer = csv.DictWriter(file, fieldnames=campi)
+                writer.writeheader()
+                for riga in righe:
+                    writer.writerow(riga)
+                    esportate += 1
+            else:
+                # Lista JSON scritta un oggetto alla volta, senza costruirla in memoria
+                file.write("[")
+                for riga in righe:
+                    file.write(("," if esportate else "") + "\n" + json.dumps(riga, default=str))
+                    esportate += 1
+                file.write("\n]\n")
+
+        logger.info(f"Esportate {esportate} operazioni in {percorso_file}")
+        return esportate
+
+    def _leggi_operazioni_da_file(self, percorso_file: str) -> list[dict]:
+        estensione = os.path.splitext(percorso_file)[1].lower()
+        with open(percorso_file, "r", encoding="utf-8", newline="") as file:
+            if estensione == ".csv":
+                righe = list(csv.DictReader(file))
+            elif estensione == ".json":
+                righe = json.load(file)
+                if not isinstance(righe, list):
+                    raise ValueError("Il file JSON deve contenere una lista di operazioni")
+            else:
+                raise ValueError(f"Formato di importazione non supportato: {estensione}")
+
+        tipi_validi = (db_default_string.TIPO_OP_PRODUZIONE, db_default_string.TIPO_OP_CESSIONE,
+                       db_default_string.TIPO_OP_TRASPORTO, db_default_string.TIPO_OP_TRASFORMAZIONE,
+                       db_default_string.TIPO_OP_VENDITA)
+        operazioni = []
+        for numero, riga in enumerate(righe, start=1):
+            if not isinstance(riga, dict):
+                raise ValueError(f"Riga {numero}: attesa un'operazione (oggetto), trovato {type(riga).__name__}")
+            mancanti = [campo for campo in self.CAMPI_IMPORTAZIONE if riga.get(campo) in (None, "")]
+            if mancanti:
+                raise ValueError(f"Riga {numero}: campi mancanti {mancanti}")
+            if riga["Tipo"] not in tipi_validi:
+                raise ValueError(f"Riga {numero}: tipo di operazione non valido '{riga['Tipo']}'")
+            try:
+                operazioni.append({
+                    "Id_azienda": int(riga["Id_azienda"]),
+                    "Id_prodotto": int(riga["Id_prodotto"]),
+                    "Consumo_CO2": int(riga["Consumo_CO2"]),
+                    "quantita": int(riga["quantita"]),
+                    "Tipo": riga["Tipo"],
+                    "Data_operazione": riga.get("Data_operazione") or None,
+                })
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Riga {numero}: valore numerico non valido ({e})")
+        return operazioni
+
+    def get_next_id_lotto_output(self, numero_lotti: int = 1) -> int:
+        """
+        Riserva numero_lotti id lotto consecutivi e restituisce il primo.
+        Gli id riservati non vengono mai riassegnati, anche se l'inserimento successivo fallisce.
+        """
         try:
-            # Ottieni il massimo ID lotto dalla tabella ComposizioneLotto
-            max_composizione = self.db.fetch_one("SELECT IFNULL(MAX(id_lotto_output), 0) FROM ComposizioneLotto;")
-            
-            # Ottieni il massimo ID lotto dalla tabella Operazione
-            max_operazione = self.db.fetch_one("SELECT IFNULL(MAX(Id_lotto), 0) FROM Operazione;")
-            
-            # Usa il massimo tra i due valori e aggiungi 1
-            max_id = max(max_composizione or 0, max_operazione or 0)
-            value_output_lotto = max_id + 1
-            
-            return value_output_lotto
+            riga = self.db.execute_returning(self.QUERY_RISERVA_LOTTI, (numero_lotti, db_default_string.SEQUENZA_LOTTI))
+            if riga is None:
+                raise ValueError("sequenza dei lotti non inizializzata")
+
+            return riga[0] - numero_lotti + 1
         except Exception as e:
             logger.error(f"Errore nell'ottenimento del nuovo id lotto: {str(e)}")
             raise ValueError(f"Errore nell'ottenimento del nuovo id lotto: {str(e)}")
@@ -376,35 +529,12 @@ class OperationRepositoryImpl(ABC):
     def recupera_soglia(self, tipo_operazione: str, id_prodotto: int) ->int:
         if tipo_operazione == db_default_string.TIPO_OP_CESSIONE:
             return 0
-        result = self.db.fetch_results("""
-            SELECT Operazione, Prodotto, Soglia_Massima, firma FROM Soglie WHERE Operazione = ? AND Prodotto = ?
-        """, (tipo_operazione, id_prodotto))
-
-        if not result:
-            raise ValueError(f"Soglia non trovata. {tipo_operazione},{id_prodotto}")
-        
-
-        tipo_operazione, id_prodotto, soglia_massima, firma = result[0]
-        
-        # Assicurati che i tipi siano coerenti con quelli usati nella firma originale
-        payload : dict = {
-            "tipo_operazione": tipo_operazione,
-            "id_prodotto": id_prodotto,
-            "soglia_massima": soglia_massima,
-    
-        }
-
-        logger.info(f"{firma}")
-
-        if not self.verifica_dati(payload,firma):
-            raise ValueError("Dati soglia corrotti o manomessi!")
-
-        return soglia_massima
+        # Soglia già verificata (HMAC) dal registro in memoria di ThresholdRepositoryImpl
+        return self.threshold_repository.get_soglia(tipo_operazione, id_prodotto)
         
 
     def verifica_dati(self,payload : dict,signature : str):
-        raw_string = f"{payload['tipo_operazione']}|{payload['id_prodotto']}|{payload['soglia_massima']}"
-        expected_signature = hmac.new(SECRET_KEY.encode(), raw_string.encode(), hashlib.sha256).hexdigest()
+        expected_signature = firma_soglia(payload['tipo_operazione'], payload['id_prodotto'], payload['soglia_massima'])
 
         if not hmac.compare_digest(expected_signature, signature):
             return False
@@ -0,0 +1,126 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+from abc import ABC
+from typing import Final
+from configuration.database import Database
+from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
+from model.outbox_model import OutboxModel
+from persistence.query_builder import QueryBuilder
+from persistence.repository_impl import db_default_string
+
+
+@response_metrics.measure_public_methods('database_query')
+class OutboxRepositoryImpl(ABC):
+    """
+    Outbox persistente delle operazioni da registrare sulla blockchain.
+    Usata insieme dai worker dell'outbox, dal thread delle ricevute e dalle richieste HTTP del backend:
+    le query sono costanti, o costruite con un QueryBuilder nuovo a ogni chiamata, mai con uno condiviso.
+    """
+
+    COLONNE : Final = "Id_outbox, Address, Id_operazione, Tipo, Id_lotto, Messaggio, Stato, Tx_hash, Nonce, Errore"
+
+    # Prende in carico in modo atomico le prime righe in coda, così due worker non inviano la stessa operazione
+    QUERY_PRELEVA : Final = f"""
+        UPDATE OutboxBlockchain SET Stato = ?
+        WHERE Id_outbox IN (
+            SELECT Id_outbox FROM OutboxBlockchain WHERE Stato = ? ORDER BY Id_outbox LIMIT ?
+        )
+        RETURNING {COLONNE}
+    """
+
+    QUERY_INVIATE : Final = f"SELECT {COLONNE} FROM OutboxBlockchain WHERE Stato = ? ORDER BY Id_outbox"
+
+    QUERY_ESITO : Final = "SELECT Stato, Tx_hash, Errore FROM OutboxBlockchain WHERE Address = ? AND Id_operazione = ?"
+
+    # Solo una riga ancora 'Inviata' diventa 'Confermata': una seconda conferma non ha effetto
+    QUERY_CONFERMA : Final = "UPDATE OutboxBlockchain SET Stato = ? WHERE Id_outbox = ? AND Stato = ?"
+
+    def __init__(self):
+        super().__init__()
+        self.db = Database()
+
+    def accoda_operazione(self, address: str, id_operazione: int, tipo: str, id_lotto: int, messaggio: str) -> bool:
+        """
+        Accoda un'operazione firmata. Una nuova conferma di un'operazione già in corso viene ignorata,
+        mentre un'operazione fallita torna in coda. Restituisce True se l'operazione è stata (ri)accodata.
+        """
+        query = """
+            INSERT INTO OutboxBlockchain (Address, Id_operazione, Tipo, Id_lotto, Messaggio, Stato)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (Address, Id_operazione) DO UPDATE
+                SET Stato = excluded.Stato, Messaggio = excluded.Messaggio, Tx_hash = NULL, Nonce = NULL, Errore = NULL
+                WHERE Stato = ?
+            RETURNING Id_outbox
+        """
+        riga = self.db.execute_returning(
+            query,
+            (address.lower(), id_operazione, tipo, id_lotto, messaggio,
+             db_default_string.STATO_OUTBOX_IN_CODA, db_default_string.STATO_OUTBOX_FALLITA)
+        )
+        return riga is not None
+
+    def preleva_in_coda(self, limite: int) -> list[OutboxModel]:
+        """Segna come 'In invio' e restituisce fino a `limite` operazioni in coda."""
+        righe = []
+        with self.db.scrittura() as cur:
+            cur.execute(self.QUERY_PRELEVA, (db_default_string.STATO_OUTBOX_IN_INVIO,
+                                             db_default_string.STATO_OUTBOX_IN_CODA, limite))
+            righe = cur.fetchall()
+        return sorted((OutboxModel(*r) for r in righe), key=lambda o: o.id_outbox)
+
+    def get_inviate(self) -> list[OutboxModel]:
+        """Operazioni inviate di cui si attende ancora la ricevuta."""
+        return self.db.fetch_models(self.QUERY_INVIATE, (db_default_string.STATO_OUTBOX_INVIATA,), OutboxModel)
+
+    def get_in_invio(self) -> list[OutboxModel]:
+        """Operazioni prese in carico da un worker e non ancora segnate come inviate o fallite."""
+        return self.db.fetch_models(self.QUERY_INVIATE, (db_default_string.STATO_OUTBOX_IN_INVIO,), OutboxModel)
+
+    def segna_nonce(self, id_outbox: int, nonce: int) -> None:
+        """Salva il nonce prenotato prima dell'invio: dopo un'interruzione permette di cercare la transazione."""
+        self._aggiorna(id_outbox, Nonce=nonce)
+
+    def segna_inviata(self, id_outbox: int, tx_hash: str, nonce: int) -> None:
+        self._aggiorna(id_outbox, Stato=db_default_string.STATO_OUTBOX_INVIATA, Tx_hash=tx_hash, Nonce=nonce)
+
+    def segna_confermata(self, id_outbox: int, sincronizza=None) -> bool:
+        """
+        Segna come confermata un'operazione 'Inviata'. `sincronizza(cursor)` viene eseguita nella stessa
+        transazione: se fallisce, l'operazione resta 'Inviata' e nulla di quanto scritto viene salvato.
+        Restituisce False se l'operazione non era (più) 'Inviata'.
+        """
+        with self.db.scrittura() as cur:
+            if sincronizza is not None:
+                sincronizza(cur)
+            cur.execute(self.QUERY_CONFERMA, (db_default_string.STATO_OUTBOX_CONFERMATA, id_outbox,
+                                              db_default_string.STATO_OUTBOX_INVIATA))
+            return cur.rowcount == 1
+
+    def segna_fallita(self, id_outbox: int, errore: str) -> None:
+        self._aggiorna(id_outbox, Stato=db_default_string.STATO_OUTBOX_FALLITA, Errore=errore)
+
+    def rimetti_in_coda(self, id_outbox: int) -> None:
+        """Rimette in coda un'operazione 'In invio' la cui transazione non è mai arrivata al nodo."""
+        self._aggiorna(id_outbox, Stato=db_default_string.STATO_OUTBOX_IN_CODA, Nonce=None)
+
+    def get_esito(self, address: str, id_operazione: int):
+        """Restituisce (stato, tx_hash, errore) dell'operazione, o None se non è mai stata accodata."""
+        risultati = self.db.fetch_results(self.QUERY_ESITO, (address.lower(), id_operazione))
+        return risultati[0] if risultati else None
+
+    def _aggiorna(self, id_outbox: int, **campi) -> None:
+        # Colonne diverse a ogni chiamata: builder nuovo, il suo stato non è condiviso tra thread
+        query, value = (
+            QueryBuilder().table("OutboxBlockchain")
+            .update(**campi)
+            .where("Id_outbox", "=", id_outbox)
+            .get_query()
+        )
+        try:
+            self.db.execute_query(query, value)
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento dell'outbox {id_outbox}: {e}")
+            raise
@@ -5,16 +5,64 @@
 from abc import ABC
 from configuration.database import Database
 from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
 from model.prodotto_finito_model import ProdottoLottoModel
 from model.info_product_for_choice_model import ProductForChoiceModel
 from model.lotto_composizione_model import Composizione, Lotto
 from model.prodotto_finito_cliente import ProdottoFinito
 from model.product_standard_model import ProductStandardModel
+from model.pagina_model import Pagina
 from persistence.query_builder import QueryBuilder
+from persistence.paginazione import DIMENSIONE_PAGINA, leggi_pagina
+from persistence.row_factory import riga_a_modello
+from persistence.repository_impl.co2_repository_impl import Co2RepositoryImpl
+from persistence.repository_impl.search_repository_impl import CURSORE_RICERCA, espressione_ricerca
 from model.prodotto_finito_model import ProdottoLottoModel
 from persistence.repository_impl import db_default_string
 
 
+# Risale tutto il DAG a monte di un lotto in un'unica query. UNION (e non UNION ALL)
+# visita ogni lotto una sola volta anche se raggiunto da più percorsi.
+QUERY_LINEAGE_LOTTO = """
+    WITH RECURSIVE catena(id_lotto, profondita) AS (
+        SELECT ?, 0
+        UNION
+        SELECT c.id_lotto_input, catena.profondita + 1
+        FROM ComposizioneLotto AS c
+        JOIN catena ON c.id_lotto_output = catena.id_lotto
+    )
+    SELECT o.Id_lotto, o.Tipo, o.quantita, o.Consumo_CO2,
+           c.id_lotto_input, c.quantità_utilizzata, l.profondita
+    FROM (SELECT id_lotto, MIN(profondita) AS profondita FROM catena GROUP BY id_lotto) AS l
+    JOIN Operazione AS o ON o.Id_lotto = l.id_lotto
+    LEFT JOIN ComposizioneLotto AS c ON c.id_lotto_output = o.Id_lotto
+    ORDER BY l.profondita, o.Id_lotto, c.id
+"""
+
+
+def costruisci_grafo_lotti(rows) -> dict[int, Lotto]:
+    """
+    Costruisce in memoria il grafo Lotto/Composizione a partire dalle righe
+    (id_lotto, tipo, quantita, consumo_co2, id_lotto_input, quantita_utilizzata, ...).
+    Restituisce un dizionario id_lotto -> Lotto con i nodi condivisi.
+    """
+    lotti: dict[int, Lotto] = {}
+    archi = []
+    for id_lotto, tipo, quantita, consumo_co2, id_input, quantita_usata, *_ in rows:
+        if id_lotto not in lotti:
+            lotti[id_lotto] = Lotto(id_lotto, tipo, quantita, consumo_co2)
+        if id_input is not None:
+            archi.append((id_lotto, id_input, quantita_usata))
+
+    for id_output, id_input, quantita_usata in archi:
+        lotti[id_output].composizione.append(
+            Composizione(id_lotto_input=id_input, quantita_utilizzata=quantita_usata,
+                         lotto_input=lotti.get(id_input))
+        )
+    return lotti
+
+
+@response_metrics.measure_public_methods('database_query')
 class ProductRepositoryImpl( ABC):
     """
      Implementing the prodotto repository.
@@ -22,23 +70,38 @@ class ProductRepositoryImpl( ABC):
     def __init__(self):
         super().__init__()
         self.db = Database()
-        self.query_builder = QueryBuilder()
+        self.co2_repository = Co2RepositoryImpl()
+
+    def get_catalogo_co2(self, ordine: str = None) -> list[ProdottoFinito]:
+        """
+        Tutti i prodotti in vendita con la CO2 totale e unitaria del loro lotto, letta da CatalogoCo2
+        dopo aver calcolato in blocco i lotti che non vi compaiono ancora.
+        ordine: "ASC" o "DESC" sulla CO2 unitaria, None per lasciare l'ordine di lettura.
+        """
+        try:
+            return list(self.iter_catalogo_co2(ordine))
+        except Exception as e:
+            logger.error(f"Errore nella lettura del catalogo della CO2: {e}")
+            return []
+
+    def iter_catalogo_co2(self, ordine: str = None):
+        """
+        Come get_catalogo_co2, ma i prodotti vengono letti uno alla volta (Database.iter_results):
+        la memoria usata non dipende dalla dimensione del catalogo, adatto al report /catalogo_co2.
+        """
+        self.co2_repository.aggiorna_catalogo()
 
-    def co2_consumata_prodotti(self, prodotti: [int]) -> list:
-        lista_con_co2 = []
-        for prodotto in prodotti:
-            #repo = ProductRepositoryImpl()
-            storico = self.get_storico_prodotto(prodotto[0])
-            totale_co2 = sum(t[4] for t in storico)
-            lista_con_co2.append((prodotto, totale_co2))
-        return lista_con_co2
+        builder = self._select_prodotti_in_vendita("CatalogoCo2.Co2_totale", "CatalogoCo2.Co2_unitaria")
+        builder.join("CatalogoCo2", "CatalogoCo2.Id_lotto", "Operazione.Id_lotto", type="LEFT")
+        if ordine:
+            builder.order_by("CatalogoCo2.Co2_unitaria", ordine)
+        query, value = builder.get_query()
+        return self.db.iter_results(query, value, row_factory=riga_a_modello(ProdottoFinito))
 
 
     def get_prodotti_standard_agricoli(self) ->list[ProductStandardModel]:
         try:
-            result = self.db.fetch_results("SELECT Id_prodotto, Nome  FROM Prodotto WHERE  Stato = 0")
-            print(result)
-            return [ProductStandardModel(*x) for x in result] if result else []
+            return self.db.fetch_models("SELECT Id_prodotto, Nome  FROM Prodotto WHERE  Stato = 0", (), ProductStandardModel)
         except Exception as e:
             logger.warning(f"Nessun prodotto trovato {e}")
             return[]
@@ -46,9 +109,7 @@ class ProductRepositoryImpl( ABC):
 
     def get_prodotti_standard_trasformazione(self)  -> list[ProductStandardModel]:
         try:
-            result = self.db.fetch_results("SELECT Id_prodotto, Nome  FROM Prodotto WHERE  Stato = 1")
-            print(f"risultao----{result}")
-            return [ProductStandardModel(*x) for x in result] if result else []
+            return self.db.fetch_models("SELECT Id_prodotto, Nome  FROM Prodotto WHERE  Stato = 1", (), ProductStandardModel)
         except Exception as e:
             logger.warning(f"Nessun prodotto trovato {e}")
             return[]
@@ -60,7 +121,7 @@ class ProductRepositoryImpl( ABC):
 
     def get_materie_prime_magazzino_azienda(self, id_azienda : int) -> list[ProdottoLottoModel]:
         query, value = (
-            self.query_builder
+            QueryBuilder()
             .select("Prodotto.id_prodotto","Magazzino.id_azienda","Magazzino.quantita", "Prodotto.nome", "Operazione.id_lotto")
             .table("Magazzino")
             .join("Operazione", "Magazzino.id_lotto", "Operazione.id_lotto")
@@ -72,7 +133,7 @@ class ProductRepositoryImpl( ABC):
 
         try:
             logger.info(f"Query in get_materie_prime_magazzino_azienda: {query} - Value: {value}")
-            result = self.db.fetch_results(query, value)
+            result = self.db.fetch_models(query, value, ProdottoLottoModel)
         except Exception as e:
             logger.error(f"Error in get_materie_prime_magazzino_azienda: {e}")
             return []
@@ -82,17 +143,13 @@ class ProductRepositoryImpl( ABC):
             logger.warning("The get_materie_prime_magazzino_azienda is empty or the query returned no results.")
         else:
             logger.info(f"Obtained in get_materie_prime_magazzino_azienda: {result}")
-        try:
-            return [ProdottoLottoModel(*x) for x in result] if result else [] 
-        except Exception as e:
-            logger.error(f"Error in converting result to ProdottoLottoModel: {e}")
-            return []   
+        return result   
      # Assicurati che il path sia corretto
 
 
     def get_prodotti_finiti_magazzino_azienda (self, id_azienda : int) -> list[ProdottoLottoModel]:
         query, value = (
-            self.query_builder
+            QueryBuilder()
             .select("Prodotto.id_prodotto","Magazzino.id_azienda","Magazzino.quantita", "Prodotto.nome", "Operazione.id_lotto")
             .table("Magazzino")
             .join("Operazione", "Magazzino.id_lotto", "Operazione.id_lotto")
@@ -104,7 +161,7 @@ class ProductRepositoryImpl( ABC):
 
         try:
             logger.info(f"Query in get_prodotti_finiti_magazzino_azienda : {query} - Value: {value}")
-            result = self.db.fetch_results(query, value)
+            result = self.db.fetch_models(query, value, ProdottoLottoModel)
         except Exception as e:
             logger.error(f"Error in get_prodotti_finiti_magazzino_azienda: {e}")
             return []
@@ -114,16 +171,13 @@ class ProductRepositoryImpl( ABC):
             logger.warning("The get_prodotti_finiti_magazzino_azienda is empty or the query returned no results.")
         else:
             logger.info(f"Obtained in get_prodotti_finiti_magazzino_azienda: {result}")
-        try:
-            return [ProdottoLottoModel(*x) for x in result] if result else [] 
-        except Exception as e:
-            logger.error(f"Error in converting result to ProdottoLottoModel: {e}")
-            return []
+        return result
 
 
     def get_prodotti_ordinabili(self,tipo_prodoto : int = 0) -> list[ProductForChoiceModel]:
         
-        self.query_builder \
+        query_builder = QueryBuilder()
+        query_builder \
             .select("Azienda.Nome","Prodotto.Nome","Magazzino.quantita",
                     "Prodotto.Id_prodotto","Azienda.Id_azienda",  "Operazione.Consumo_CO2") \
             .table("Magazzino") \
@@ -133,21 +187,21 @@ class ProductRepositoryImpl( ABC):
             .where("Magazzino.quantita", ">", 0)
             
         if tipo_prodoto == 0:
-            self.query_builder.where("Prodotto.Stato", "=", 0)\
+            query_builder.where("Prodotto.Stato", "=", 0)\
                              .where("Azienda.Tipo", "=", db_default_string.TIPO_AZIENDA_AGRICOLA)
         elif tipo_prodoto == 1:
-            self.query_builder.where("Prodotto.Stato", "=", 1) \
+            query_builder.where("Prodotto.Stato", "=", 1) \
                             .where("Azienda.Tipo", "=", db_default_string.TIPO_AZIENDA_TRASFORMATORE)
         else:
             raise ValueError("Tipo di prodotto non identificato")
 
 
 
-        query,value = self.query_builder.get_query()
+        query,value = query_builder.get_query()
 
         try:
             logger.info(f"Query in get_prodotti_ordinabili: {query} - Value: {value}")
-            result = self.db.fetch_results(query, value)
+            result = self.db.fetch_models(query, value, ProductForChoiceModel)
         except Exception as e:
             logger.error(f"Error in get_prodotti_ordinabili: {e}")
             return []
@@ -157,93 +211,94 @@ class ProductRepositoryImpl( ABC):
             logger.warning("The get_prodotti_ordinabili is empty or the query returned no results.")
         else:
             logger.info(f"Obtained in get_prodotti_ordinabili: {result}")
-        try:
-            return [ProductForChoiceModel(*x) for x in result] if result else []
-        except Exception as e:
-            logger.error(f"Error in converting result to ProductForChoiceModel: {e}")
-            return []
+        return result
 
 
 
 # Funzione per caricare un lotto e la sua composizione ricorsiva
     def carica_lotto_con_composizione(self, id_lotto) -> Lotto:
-    # 1. Recupero dati dell'operazione (lotto)
-        query, value = (
-            self.query_builder
-            .select("Id_lotto", "Tipo", "quantita", "Consumo_CO2")
-            .table("Operazione")
-            .where("Id_lotto", "=", id_lotto)
-            .get_query()
-        )
-
+        """
+        Carica il lotto richiesto con l'intera catena a monte (DAG delle composizioni)
+        usando una sola query ricorsiva. I lotti raggiunti da più percorsi sono
+        condivisi: ogni id_lotto corrisponde a un'unica istanza di Lotto.
+        """
         try:
-            rows = self.db.fetch_results(query, value)
-           
-            if not rows:
-                logger.warning(f"Nessuna operazione trovata per id_lotto: {id_lotto}")
-                return None
-            row = rows[0]
-            lotto = Lotto(*row)  # Istanza singola
+            rows = self.db.fetch_results(QUERY_LINEAGE_LOTTO, (id_lotto,))
         except Exception as e:
-            logger.error(f"Errore nel recupero dell'operazione: {e}")
+            logger.error(f"Errore nel recupero della catena del lotto {id_lotto}: {e}")
             return None
 
-        # 2. Recupero composizioni
-        query, value = (
-            self.query_builder
-            .select("id_lotto_input", "quantità_utilizzata")
-            .table("ComposizioneLotto")
-            .where("id_lotto_output", "=", id_lotto)
-            .get_query()
-        )
-
-        try:
-            rows = self.db.fetch_results(query, value)
-            composizioni_raw: list[Composizione] = [Composizione(*x) for x in rows] if rows else []
-        except Exception as e:
-            logger.error(f"Errore nel recupero della composizione: {e}")
+        # La radice ha profondità 0: se manca, il lotto non ha un'operazione associata
+        if not rows or rows[0][6] != 0:
+            logger.warning(f"Nessuna operazione trovata per id_lotto: {id_lotto}")
             return None
 
-        # 3. Ricorsione per ogni composizione
-        for comp in composizioni_raw:
-            input_lotto = self.carica_lotto_con_composizione(comp.id_lotto_input)
-            composizione = Composizione(
-                id_lotto_input=comp.id_lotto_input,
-                quantita_utilizzata=comp.quantita_utilizzata,
-                lotto_input=input_lotto
-            )
-            lotto.composizione.append(composizione)
+        return costruisci_grafo_lotti(rows).get(rows[0][0])
 
-        return lotto
-    
 
     def get_lista_prodotti(self):
 
-        query,value = (
-            self.query_builder.select(
+        query,value = self._select_prodotti_in_vendita().get_query()
+        
+        try:
+            prodotti = self.db.fetch_models(query, value, ProdottoFinito)
+            if prodotti:
+                return prodotti
+            else:
+                logger.warning("Nessun risultato trovato ")
+                return []
+        except Exception as e:
+            logger.error(f"Errore in calcola_co2_totale_per_prodotti_finiti: {e}")
+            return []
+
+    def get_lista_prodotti_pagina(self, token: str = None, dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """Come get_lista_prodotti, una pagina alla volta (in ordine di Id_lotto)."""
+        try:
+            righe, token_successivo = leggi_pagina(self.db, self._select_prodotti_in_vendita(),
+                                                   ("Operazione.Id_lotto",), (1,), dimensione, token)
+            return Pagina([ProdottoFinito(*r) for r in righe], token_successivo)
+        except Exception as e:
+            logger.error(f"Errore nel recupero della pagina dei prodotti: {e}")
+            return Pagina()
+
+    def cerca_prodotti_in_vendita_pagina(self, testo: str, token: str = None,
+                                         dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """
+        Prodotti in vendita il cui lotto corrisponde al testo nell'indice full-text (prodotto, tipo
+        o numero di lotto, prefissi di parola), dal più rilevante, una pagina alla volta,
+        con la CO2 letta da CatalogoCo2 come in get_catalogo_co2.
+        """
+        espressione = espressione_ricerca(testo)
+        if not espressione:
+            return Pagina()
+        try:
+            if token is None:
+                self.co2_repository.aggiorna_catalogo()
+            builder = (
+                self._select_prodotti_in_vendita("CatalogoCo2.Co2_totale", "CatalogoCo2.Co2_unitaria", *CURSORE_RICERCA)
+                    .join("IndiceRicerca", "IndiceRicerca.id_riferimento", "Operazione.Id_lotto")
+                    .join("CatalogoCo2", "CatalogoCo2.Id_lotto", "Operazione.Id_lotto", type="LEFT")
+                    .where("IndiceRicerca", "MATCH", espressione)
+                    .where("IndiceRicerca.tipo", "=", "lotto")
+            )
+            righe, token_successivo = leggi_pagina(self.db, builder, CURSORE_RICERCA, (6, 7), dimensione, token)
+            return Pagina([ProdottoFinito(*r[:6]) for r in righe], token_successivo)
+        except Exception as e:
+            logger.error(f"Errore nella ricerca dei prodotti in vendita '{testo}': {e}")
+            return Pagina()
+
+    def _select_prodotti_in_vendita(self, *campi_extra: str) -> QueryBuilder:
+        return (
+            QueryBuilder().select(
                 "Prodotto.nome",
                 "Operazione.Id_lotto",
                 "Azienda.nome",
                 "Operazione.Id_prodotto",
+                *campi_extra,
             )
             .table("Operazione")
             .join("Azienda", "Operazione.Id_azienda", "Azienda.Id_azienda")
             .join("Prodotto", "Operazione.Id_prodotto", "Prodotto.Id_prodotto")
             .where("Operazione.Tipo", "=", db_default_string.TIPO_OP_VENDITA)
-            .get_query()
         )
-        
-        try:
-            # Esegui direttamente il raw SQL (non serve builder qui)
-            results = self.db.fetch_results(query, value)
-            if results:
-                prodotti_co2 = [ProdottoFinito(*r) for r in results]
-            
-                return prodotti_co2
-            else:
-                logger.warning("Nessun risultato trovato ")
-                return []
-        except Exception as e:
-            logger.error(f"Errore in calcola_co2_totale_per_prodotti_finiti: {e}")
-            return []
     
\ No newline at end of file
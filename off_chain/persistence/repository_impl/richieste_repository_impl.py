@@ -6,15 +6,37 @@ import sqlite3
 import json
 import os
 import subprocess
-import requests
 import sys
 import re
+from typing import Optional
+from web3 import Web3
+from web3.logs import DISCARD
 from configuration.database import Database
 from model.richiesta_model import RichiestaModel
 from model.richiesta_token_model import RichiestaTokenModel
+from model.pagina_model import Pagina
 from persistence.query_builder import QueryBuilder
+from persistence.paginazione import DIMENSIONE_PAGINA, leggi_pagina
 from persistence.repository_impl import db_default_string
 from configuration.log_load_setting import logger
+from configuration.blockchain_client import RegistroBlockchain, NODE_URL
+from enforcement.guarantee_response_enforcer import response_metrics
+
+# Ultimo lotto (operazione più recente) di ciascun prodotto, filtrato per tipo di operazione.
+# SQLite restituisce Id_lotto dalla stessa riga del MAX(Id_operazione).
+QUERY_ULTIMO_LOTTO_PRODOTTI = """
+    SELECT Id_prodotto, Id_lotto, MAX(Id_operazione)
+    FROM Operazione
+    WHERE Id_prodotto IN ({placeholders}) AND {filtro_tipo}
+    GROUP BY Id_prodotto
+"""
+
+# Numero massimo di parametri per singola query IN (limite storico di SQLite: 999)
+MAX_PARAMETRI_IN = 500
+
+# Cartella degli script generati per la modalità Node.js (BLOCKCHAIN_SCRIPT_NODE=1)
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
+                           "off_chain", "temp_scripts")
 
 # Funzione di supporto per generare script JavaScript con i percorsi corretti
 def generate_js_script(script_type, params):
@@ -166,8 +188,22 @@ def generate_js_script(script_type, params):
             console.log("Transaction confirmed in block:", receipt.blockNumber);
             console.log("Transaction status:", receipt.status);
             
-            // Ottieni l'ID della richiesta creata
-            const requestId = await contract.getLastRequestId();
+            // Ottieni l'ID della richiesta creata dall'evento RequestCreated della transazione
+            let requestId = null;
+            for (const log of receipt.logs) {{
+                try {{
+                    const evento = contract.interface.parseLog(log);
+                    if (evento && evento.name === "RequestCreated") {{
+                        requestId = evento.args.requestId;
+                        break;
+                    }}
+                }} catch (e) {{
+                    // Log di un altro evento o contratto
+                }}
+            }}
+            if (requestId === null) {{
+                throw new Error("Evento RequestCreated non trovato nella transazione");
+            }}
             console.log("Request ID:", requestId.toString());
             
             process.exit(0);
@@ -256,31 +292,36 @@ def generate_js_script(script_type, params):
         raise ValueError(f"Tipo di script non supportato: {script_type}")
 
 
-# Configurazione ethers.js e Hardhat per la blockchain
+# Configurazione web3 e Hardhat per la blockchain
 class BlockchainConfig:
+
+    # Le transazioni vengono eseguite nel processo con web3; gli script Node.js generati
+    # da generate_js_script restano solo come alternativa esplicita
+    SCRIPT_NODE = os.getenv("BLOCKCHAIN_SCRIPT_NODE") == "1"
+    TIMEOUT_RICEVUTA = 120  # secondi
+
     def __init__(self):
         # Inizializzazione delle variabili per la connessione blockchain
         self.contract_abis = {}
         self.contract_addresses = {}
+        self.contract_files = {}
         self.contracts = {}
-        self.hardhat_url = "http://127.0.0.1:8545"  # URL predefinito per Hardhat
+        self.hardhat_url = NODE_URL  # URL predefinito per Hardhat
+        # Stato del nodo, file JSON e artefatti arrivano dal registro condiviso: nessuna richiesta né lettura ripetuta
+        self.registro = RegistroBlockchain()
         
         # Flag per indicare se la blockchain è disponibile
         self.blockchain_available = False
         
         # Tenta di inizializzare la connessione blockchain
         try:
-            # Verifica se la rete Hardhat è attiva
-            response = requests.get(self.hardhat_url, timeout=5)
-            if response.status_code == 200:
+            # Ultimo stato noto del nodo Hardhat, aggiornato in background
+            if self.registro.nodo_disponibile():
                 self.blockchain_available = True
                 self.load_contract_info()
                 self.initialize_contracts()
-                logger.info("Connessione alla blockchain Hardhat stabilita con successo")
             else:
                 logger.warning("Impossibile connettersi alla blockchain Hardhat. Funzionalità blockchain disabilitate.")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Errore di connessione alla blockchain Hardhat: {e}. Funzionalità blockchain disabilitate.")
         except Exception as e:
             logger.warning(f"Errore nell'inizializzazione della blockchain: {e}. Funzionalità blockchain disabilitate.")
     
@@ -305,12 +346,10 @@ class BlockchainConfig:
             # Se il file esiste, leggiamo gli indirizzi dei contratti da lì
             if os.path.exists(contract_address_file):
                 try:
-                    with open(contract_address_file, 'r') as f:
-                        contract_addresses_data = json.load(f)
-                        for contract_name in contract_names:
-                            if contract_name in contract_addresses_data:
-                                self.contract_addresses[contract_name] = contract_addresses_data[contract_name]
-                                logger.info(f"Indirizzo del contratto {contract_name} caricato dal file contract_address.json: {self.contract_addresses[contract_name]}")
+                    contract_addresses_data = self.registro.leggi_json(contract_address_file)
+                    for contract_name in contract_names:
+                        if contract_name in contract_addresses_data:
+                            self.contract_addresses[contract_name] = contract_addresses_data[contract_name]
                 except Exception as e:
                     logger.warning(f"Errore nella lettura del file contract_address.json: {e}")
             else:
@@ -337,25 +376,12 @@ class BlockchainConfig:
             for contract_name in contract_names:
                 if contract_name not in self.contract_abis:
                     try:
-                        # Cerca il file JSON corrispondente al contratto
-                        contract_files = []
-                        for root, dirs, files in os.walk(artifacts_dir):
-                            for file in files:
-                                if file.endswith('.json') and not file.endswith('.dbg.json'):
-                                    file_path = os.path.join(root, file)
-                                    try:
-                                        with open(file_path, 'r') as f:
-                                            contract_data = json.load(f)
-                                            if 'contractName' in contract_data and contract_data['contractName'] == contract_name:
-                                                contract_files.append((file_path, contract_data))
-                                    except Exception as file_error:
-                                        logger.warning(f"Errore nella lettura del file {file_path}: {file_error}")
+                        # Cerca il file JSON corrispondente al contratto (percorso e contenuto restano in cache)
+                        file_path = self.registro.trova_artefatto(artifacts_dir, contract_name)
                         
-                        if contract_files:
-                            # Usa il primo file trovato
-                            file_path, contract_data = contract_files[0]
-                            self.contract_abis[contract_name] = contract_data['abi']
-                            logger.info(f"ABI per il contratto {contract_name} trovato in {file_path}")
+                        if file_path:
+                            self.contract_abis[contract_name] = self.registro.abi(file_path)
+                            self.contract_files[contract_name] = file_path
                             
                             # Se non abbiamo ancora l'indirizzo del contratto, usiamo quello predefinito di Hardhat
                             if contract_name not in self.contract_addresses:
@@ -390,7 +416,6 @@ class BlockchainConfig:
                         'address': self.contract_addresses[contract_name],
                         'abi': abi
                     }
-                    logger.info(f"Contratto {contract_name} inizializzato con successo")
                 else:
                     logger.warning(f"Impossibile inizializzare il contratto {contract_name}: indirizzo mancante")
         except Exception as e:
@@ -432,18 +457,135 @@ class BlockchainConfig:
             # Fallback: indirizzo fittizio basato sull'ID
             return f"0x{id_azienda:040x}"
 
+    def esegui_transazione(self, tipo: str, params: dict):
+        """
+        Esegue sulla blockchain una delle operazioni di generate_js_script
+        (register_company, create_token, accept_token, reject_token) e ne attende la conferma.
+
+        Args:
+            tipo: Tipo di operazione, come per generate_js_script
+            params: Parametri dell'operazione, come per generate_js_script
+
+        Returns:
+            L'ID della richiesta creata per create_token, altrimenti None
+
+        Raises:
+            ValueError: se la transazione fallisce; il messaggio contiene l'errore del contratto
+        """
+        if self.SCRIPT_NODE:
+            return self._esegui_script(tipo, params)
+        return self._esegui_web3(tipo, params)
+
+    def _esegui_web3(self, tipo: str, params: dict):
+        # Stesso contratto, provider e NonceManager usati da BlockchainController: nessun processo esterno
+        contratto = self._contratto_web3(params.get("registry_address") or params["contract_address"])
+        mittente = self._mittente(params.get("company_address"))
+        try:
+            if tipo == "register_company":
+                if contratto.functions.isCompanyAddressRegistered(Web3.to_checksum_address(params["company_address"])).call():
+                    logger.info(f"L'azienda {params['company_name']} è già registrata sulla blockchain")
+                    return None
+                funzione = contratto.functions.registerCompany(
+                    params["company_name"], params["company_type"], params["company_location"], params["certifications"]
+                )
+            elif tipo == "create_token":
+                funzione = contratto.functions.createTokenRequest(
+                    Web3.to_checksum_address(params["provider_address"]), int(params["amount"]),
+                    params["purpose"], int(params["co2_reduction"])
+                )
+            elif tipo == "accept_token":
+                funzione = contratto.functions.acceptTokenRequest(int(params["request_id"]))
+            elif tipo == "reject_token":
+                funzione = contratto.functions.rejectTokenRequest(int(params["request_id"]), params["reason"])
+            else:
+                raise ValueError(f"Tipo di script non supportato: {tipo}")
+
+            tx_hash, _ = self.registro.nonce_manager.invia(mittente, lambda nonce: funzione.build_transaction({
+                'from': mittente,
+                'nonce': nonce,
+            }))
+            receipt = self.registro.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=self.TIMEOUT_RICEVUTA)
+            if receipt.status != 1:
+                raise ValueError(f"Transazione {tx_hash} ({tipo}) fallita nel blocco {receipt.blockNumber}")
+            logger.info(f"Transazione {tipo} confermata nel blocco {receipt.blockNumber}: {tx_hash}")
+            if tipo != "create_token":
+                return None
+            # L'ID viene dall'evento della propria transazione: una lettura successiva del contratto
+            # potrebbe vedere la richiesta creata nel frattempo da un'altra azienda
+            eventi = contratto.events.RequestCreated().process_receipt(receipt, errors=DISCARD)
+            if not eventi:
+                raise ValueError(f"Evento RequestCreated non trovato nella transazione {tx_hash}")
+            return eventi[0].args.requestId
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(str(e)) from e
+
+    def _contratto_web3(self, indirizzo: str):
+        file_path = self.contract_files.get("SustainableFoodChain")
+        if file_path:
+            return self.registro.contratto(indirizzo, file_path)
+        abi = self.contract_abis.get("SustainableFoodChain")
+        if abi is None:
+            raise ValueError("ABI del contratto SustainableFoodChain non disponibile")
+        return self.registro.w3.eth.contract(address=Web3.to_checksum_address(indirizzo), abi=abi)
+
+    def _mittente(self, indirizzo: Optional[str]) -> str:
+        """Account del nodo che firma: quello dell'azienda se il nodo lo gestisce, altrimenti il primo (come negli script)."""
+        accounts = self.registro.w3.eth.accounts
+        if not accounts:
+            raise ValueError("Nessun account disponibile sul nodo blockchain")
+        if indirizzo:
+            for account in accounts:
+                if account.lower() == indirizzo.lower():
+                    return account
+        return accounts[0]
+
+    def _esegui_script(self, tipo: str, params: dict):
+        os.makedirs(SCRIPTS_DIR, exist_ok=True)
+        suffisso = f"_{params['request_id']}" if "request_id" in params else ""
+        script_path = os.path.join(SCRIPTS_DIR, f"{tipo}{suffisso}_{os.getpid()}.js")
+        with open(script_path, 'w') as f:
+            f.write(generate_js_script(tipo, params))
+        try:
+            logger.info(f"Esecuzione dello script Node.js {script_path}")
+            result = subprocess.run(["node", script_path], capture_output=True, text=True)
+        finally:
+            os.remove(script_path)
+
+        if result.returncode != 0:
+            raise ValueError(result.stderr)
+        logger.info(f"Script {tipo} completato: {result.stdout}")
+        if tipo == "create_token":
+            trovato = re.search(r"Request ID: (\d+)", result.stdout)
+            return int(trovato.group(1)) if trovato else None
+        return None
+
+@response_metrics.measure_public_methods('database_query')
 class RichiesteRepositoryImpl():
+
+    # Operazioni da cui prendere l'ultimo lotto del prodotto richiesto: (filtro su Tipo, parametri)
+    FILTRO_LOTTO_RICEVUTE = ("Tipo IN (?, ?)", (db_default_string.TIPO_OP_PRODUZIONE, db_default_string.TIPO_OP_TRASFORMAZIONE))
+    FILTRO_LOTTO_EFFETTUATE = ("Tipo != ?", (db_default_string.TIPO_OP_TRASPORTO,))
+
     def __init__(self):
         super().__init__()
         self.db = Database()
-        self.query_builder = QueryBuilder()
-        self.blockchain_config = BlockchainConfig()
+        self._blockchain_config = None
+
+    @property
+    def blockchain_config(self) -> BlockchainConfig:
+        # Creata al primo uso: la maggior parte delle richieste non tocca la blockchain
+        if getattr(self, "_blockchain_config", None) is None:
+            self._blockchain_config = BlockchainConfig()
+        return self._blockchain_config
 
     def inserisci_richiesta(self, id_az_richiedente: int,id_az_ricevente: int,id_az_trasporto: int, id_prodotto: int, quantita: int) :
         """
         Inserisce una nuova richiesta di prodotto nel database.
         """
-        self.query_builder.table("Richiesta").insert(
+        query_builder = QueryBuilder()
+        query_builder.table("Richiesta").insert(
             id_richiedente = id_az_richiedente,
             id_ricevente = id_az_ricevente,
             id_trasportatore = id_az_trasporto,
@@ -453,7 +595,7 @@ class RichiesteRepositoryImpl():
             stato_trasportatore="In attesa",
 
         )
-        query, value = self.query_builder.get_query()
+        query, value = query_builder.get_query()
         try:
             self.db.execute_query(query, value)
             
@@ -462,54 +604,14 @@ class RichiesteRepositoryImpl():
 
     def get_richieste_ricevute(self, id_azienda: int, check_trasporto: bool = False) -> list:
         try:
-            
-            self.query_builder \
-                .select(
-                    "r.Id_richiesta",
-                    "r.Id_richiedente", "rich.Nome AS Nome_richiedente",
-                    "r.Id_ricevente", "rice.Nome AS Nome_ricevente",
-                    "r.Id_trasportatore", "tras.Nome AS Nome_trasportatore",
-                    "r.Id_prodotto", "prod.Nome AS Nome_prodotto",
-                    "r.Quantita", "r.Stato_ricevente",
-                    "r.Stato_trasportatore", "r.Data"
-                ) \
-                .table("Richiesta AS r") \
-                .join("Azienda AS rich", "rich.Id_azienda", "r.Id_richiedente") \
-                .join("Azienda AS rice", "rice.Id_azienda", "r.Id_ricevente") \
-                .join("Azienda AS tras", "tras.Id_azienda", "r.Id_trasportatore") \
-                .join("Prodotto AS prod", "prod.Id_prodotto", "r.Id_prodotto")
-
-            # Filtro condizionato
-            if not check_trasporto:
-                self.query_builder.where("r.Id_ricevente", "=", id_azienda)  
-            else:
-                self.query_builder.where("r.Stato_ricevente", "=", db_default_string.STATO_ACCETTATA)
-                self.query_builder.where("r.Id_trasportatore", "=", id_azienda)
-
-            query, value = self.query_builder.get_query()
+            query, value = self._select_richieste_ricevute(id_azienda, check_trasporto).get_query()
             risultati_raw = self.db.fetch_results(query, value)
 
             if not risultati_raw:
                 logger.info(f"Nessuna richiesta ricevuta trovata per l'azienda con ID {id_azienda}.")
                 return []
 
-            risultati = []
-            for r in risultati_raw:
-                id_prodotto = r[7]  # Posizione di Id_prodotto nella tupla
-
-                # Recupera Id_lotto SOLO se op.Tipo è produzione o trasformazione
-                query_lotto = """
-                    SELECT Id_lotto 
-                    FROM Operazione 
-                    WHERE Id_prodotto = ? 
-                    AND (Tipo = ? OR Tipo = ?)
-                    ORDER BY Id_operazione DESC LIMIT 1;
-                """
-                res_lotto = self.db.fetch_one(query_lotto, (id_prodotto,db_default_string.TIPO_OP_PRODUZIONE,
-                                                            db_default_string.TIPO_OP_TRASFORMAZIONE))
-                id_lotto = res_lotto if res_lotto is not None else None
-
-                risultati.append(RichiestaModel(*r, id_lotto))
+            risultati = self._crea_richieste(risultati_raw, *self.FILTRO_LOTTO_RICEVUTE)
 
             logger.info(f"Richieste ricevute per l'azienda con ID {id_azienda}: {risultati}")
             return risultati
@@ -518,77 +620,123 @@ class RichiesteRepositoryImpl():
             logger.error(f"Errore nel recupero delle richieste ricevute: {e}", exc_info=True)
             return []
 
-        
+    def get_richieste_ricevute_pagina(self, id_azienda: int, check_trasporto: bool = False, token: str = None,
+                                      dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """Come get_richieste_ricevute, una pagina alla volta (in ordine di Id_richiesta)."""
+        try:
+            righe, token_successivo = leggi_pagina(self.db, self._select_richieste_ricevute(id_azienda, check_trasporto),
+                                                   ("r.Id_richiesta",), (0,), dimensione, token)
+            return Pagina(self._crea_richieste(righe, *self.FILTRO_LOTTO_RICEVUTE), token_successivo)
+        except Exception as e:
+            logger.error(f"Errore nel recupero delle richieste ricevute: {e}", exc_info=True)
+            return Pagina()
+
     def get_richieste_effettuate(self, id_azienda: int) -> list[RichiestaModel]:
         """
         Restituisce tutte le richieste effettuate da un'azienda.
         """
         try:
             # 1. Recupera le richieste
-            query, value = (
-                self.query_builder
-                    .select(
-                        "r.Id_richiesta",
-                        "r.Id_richiedente", "rich.Nome AS Nome_richiedente",
-                        "r.Id_ricevente", "rice.Nome AS Nome_ricevente",
-                        "r.Id_trasportatore", "tras.Nome AS Nome_trasportatore",
-                        "r.Id_prodotto", "prod.Nome AS Nome_prodotto",
-                        "r.Quantita", "r.Stato_ricevente",
-                        "r.Stato_trasportatore", "r.Data"
-                    )
-                    .table("Richiesta AS r")
-                    .join("Azienda AS rich", "rich.Id_azienda", "r.Id_richiedente")
-                    .join("Azienda AS rice", "rice.Id_azienda", "r.Id_ricevente")
-                    .join("Azienda AS tras", "tras.Id_azienda", "r.Id_trasportatore")
-                    .join("Prodotto AS prod", "prod.Id_prodotto", "r.Id_prodotto")
-                    .where("r.Id_richiedente", "=", id_azienda)
-                    .get_query()
-            )
+            query, value = self._select_richieste().where("r.Id_richiedente", "=", id_azienda).get_query()
             richieste = self.db.fetch_results(query, value)
 
             if not richieste:
                 logger.info(f"Nessuna richiesta effettuata trovata per l'azienda con ID {id_azienda}.")
                 return []
 
-            risultati = []
-            for r in richieste:
-                id_prodotto = r[7]  # posizione di Id_prodotto nella tupla
-                query_lotto = """
-                    SELECT Id_lotto 
-                    FROM Operazione 
-                    WHERE Id_prodotto = ? AND Tipo != ?
-                    ORDER BY Id_operazione DESC LIMIT 1;
-                """
-                res_lotto = self.db.fetch_one(query_lotto, (id_prodotto,db_default_string.TIPO_OP_TRASPORTO))
-                id_lotto = res_lotto if res_lotto is not None else None
+            return self._crea_richieste(richieste, *self.FILTRO_LOTTO_EFFETTUATE)
 
-                risultati.append(RichiestaModel(*r, id_lotto))
-
-            return risultati
+        except Exception as e:
+            logger.error(f"Errore nel recupero delle richieste effettuate: {e}", exc_info=True)
+            return []
 
+    def get_richieste_effettuate_pagina(self, id_azienda: int, token: str = None,
+                                        dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """Come get_richieste_effettuate, una pagina alla volta (in ordine di Id_richiesta)."""
+        try:
+            righe, token_successivo = leggi_pagina(self.db, self._select_richieste().where("r.Id_richiedente", "=", id_azienda),
+                                                   ("r.Id_richiesta",), (0,), dimensione, token)
+            return Pagina(self._crea_richieste(righe, *self.FILTRO_LOTTO_EFFETTUATE), token_successivo)
         except Exception as e:
             logger.error(f"Errore nel recupero delle richieste effettuate: {e}", exc_info=True)
+            return Pagina()
+
+    def _select_richieste(self) -> QueryBuilder:
+        return (
+            QueryBuilder()
+                .select(
+                    "r.Id_richiesta",
+                    "r.Id_richiedente", "rich.Nome AS Nome_richiedente",
+                    "r.Id_ricevente", "rice.Nome AS Nome_ricevente",
+                    "r.Id_trasportatore", "tras.Nome AS Nome_trasportatore",
+                    "r.Id_prodotto", "prod.Nome AS Nome_prodotto",
+                    "r.Quantita", "r.Stato_ricevente",
+                    "r.Stato_trasportatore", "r.Data"
+                )
+                .table("Richiesta AS r")
+                .join("Azienda AS rich", "rich.Id_azienda", "r.Id_richiedente")
+                .join("Azienda AS rice", "rice.Id_azienda", "r.Id_ricevente")
+                .join("Azienda AS tras", "tras.Id_azienda", "r.Id_trasportatore")
+                .join("Prodotto AS prod", "prod.Id_prodotto", "r.Id_prodotto")
+        )
+
+    def _select_richieste_ricevute(self, id_azienda: int, check_trasporto: bool) -> QueryBuilder:
+        query_builder = self._select_richieste()
+
+        # Filtro condizionato
+        if not check_trasporto:
+            query_builder.where("r.Id_ricevente", "=", id_azienda)  
+        else:
+            query_builder.where("r.Stato_ricevente", "=", db_default_string.STATO_ACCETTATA)
+            query_builder.where("r.Id_trasportatore", "=", id_azienda)
+        return query_builder
+
+    def _crea_richieste(self, righe, filtro_tipo: str, parametri_tipo: tuple) -> list[RichiestaModel]:
+        if not righe:
             return []
+        lotti = self._get_ultimo_lotto_prodotti(
+            {r[7] for r in righe},  # Posizione di Id_prodotto nella tupla
+            filtro_tipo,
+            parametri_tipo
+        )
+        return [RichiestaModel(*r, lotti.get(r[7])) for r in righe]
+
+    def _get_ultimo_lotto_prodotti(self, id_prodotti, filtro_tipo: str, parametri_tipo: tuple) -> dict[int, int]:
+        """
+        Restituisce id_prodotto -> Id_lotto dell'operazione più recente che soddisfa filtro_tipo,
+        con una query per blocco di prodotti invece di una per richiesta.
+        """
+        id_prodotti = list(id_prodotti)
+        lotti: dict[int, int] = {}
+        for i in range(0, len(id_prodotti), MAX_PARAMETRI_IN):
+            blocco = id_prodotti[i:i + MAX_PARAMETRI_IN]
+            query = QUERY_ULTIMO_LOTTO_PRODOTTI.format(
+                placeholders=", ".join("?" for _ in blocco),
+                filtro_tipo=filtro_tipo
+            )
+            for id_prodotto, id_lotto, _ in self.db.fetch_results(query, (*blocco, *parametri_tipo)) or []:
+                lotti[id_prodotto] = id_lotto
+        return lotti
 
-        
     def update_richiesta(self, id_richiesta: int, nuovo_stato: str,azienda_role : str) -> None:
         """
         Aggiorna lo stato di una richiesta.
         """
-        self.query_builder.table("Richiesta").where("Id_richiesta", "=", id_richiesta)
+        query_builder = QueryBuilder()
+        query_builder.table("Richiesta").where("Id_richiesta", "=", id_richiesta)
         if azienda_role == db_default_string.TIPO_AZIENDA_TRASPORTATORE:
-            self.query_builder.update(
+            query_builder.update(
                 Stato_trasportatore=nuovo_stato
             )
         elif azienda_role == db_default_string.TIPO_AZIENDA_AGRICOLA or azienda_role == db_default_string.TIPO_AZIENDA_TRASFORMATORE:
-            self.query_builder.update(
+            query_builder.update(
                 Stato_ricevente=nuovo_stato
             )
         else:
             logger.error(f"Ruolo aziendale non valido: {azienda_role}.")
             raise ValueError("Ruolo aziendale non valido.")
 
-        query, value = self.query_builder.get_query()
+        query, value = query_builder.get_query()
         try:
             self.db.execute_query(query, value)
             logger.info(f"Richiesta con ID {id_richiesta} aggiornata a {nuovo_stato}.")
@@ -599,66 +747,75 @@ class RichiesteRepositoryImpl():
     def get_richieste_ric_token(self, id_azienda: int) -> list[RichiestaTokenModel]:
 
         try:
-            # Query allineata con il costruttore RichiestaTokenModel:
-            # (id_richiesta, id_mittente, mittente, id_destinatario, destinatario, quantita, stato)
-            self.query_builder.select(
-                "r.Id_richiesta",      # id_richiesta
-                "r.Id_richiedente",    # id_mittente
-                "rich.Nome",           # mittente
-                "r.Id_ricevente",     # id_destinatario
-                "rice.Nome",          # destinatario
-                "r.Quantita",         # quantita
-                "r.Stato"             # stato
-            )\
-            .table("RichiestaToken AS r") \
-            .join("Azienda AS rich", "rich.Id_azienda", "r.Id_richiedente") \
-            .join("Azienda AS rice", "rice.Id_azienda", "r.Id_ricevente") \
-            .where("r.Id_ricevente", "=", id_azienda) \
-            .where("r.Stato", "=", db_default_string.STATO_ATTESA)
-            query, value = self.query_builder.get_query()
-            risultati_raw = self.db.fetch_results(query, value)
-
-            return [RichiestaTokenModel(*r) for r in risultati_raw]
+            query, value = self._select_richieste_ric_token(id_azienda).get_query()
+            return self.db.fetch_models(query, value, RichiestaTokenModel)
         except Exception as e:
             logger.error(f"Errore nel recupero delle richieste di token: {e}", exc_info=True)
             return []
+
+    def get_richieste_ric_token_pagina(self, id_azienda: int, token: str = None,
+                                       dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """Come get_richieste_ric_token, una pagina alla volta (in ordine di Id_richiesta)."""
+        try:
+            righe, token_successivo = leggi_pagina(self.db, self._select_richieste_ric_token(id_azienda),
+                                                   ("r.Id_richiesta",), (0,), dimensione, token)
+            return Pagina([RichiestaTokenModel(*r) for r in righe], token_successivo)
+        except Exception as e:
+            logger.error(f"Errore nel recupero delle richieste di token: {e}", exc_info=True)
+            return Pagina()
     
     def get_richiesta_inviata_token(self, id_azienda: int) -> list[RichiestaTokenModel]:
 
         try:
-            # Query allineata con il costruttore RichiestaTokenModel:
-            # (id_richiesta, id_mittente, mittente, id_destinatario, destinatario, quantita, stato)
-            self.query_builder.select(
-                "r.Id_richiesta",      # id_richiesta
-                "r.Id_richiedente",    # id_mittente
-                "rich.Nome",           # mittente
-                "r.Id_ricevente",     # id_destinatario
-                "rice.Nome",          # destinatario
-                "r.Quantita",         # quantita
-                "r.Stato"             # stato
-            )\
-            .table("RichiestaToken AS r") \
-            .join("Azienda AS rich", "rich.Id_azienda", "r.Id_richiedente") \
-            .join("Azienda AS rice", "rice.Id_azienda", "r.Id_ricevente") \
-            .where("r.Id_richiedente", "=", id_azienda)
-            query, value = self.query_builder.get_query()
-            risultati_raw = self.db.fetch_results(query, value)
-            
-            return [RichiestaTokenModel(*r) for r in risultati_raw]
+            query, value = self._select_richieste_token().where("r.Id_richiedente", "=", id_azienda).get_query()
+            return self.db.fetch_models(query, value, RichiestaTokenModel)
         except Exception as e:
             logger.error(f"Errore nel recupero delle richieste di token inviate: {e}", exc_info=True)
             return []
-    
+
+    def get_richiesta_inviata_token_pagina(self, id_azienda: int, token: str = None,
+                                           dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """Come get_richiesta_inviata_token, una pagina alla volta (in ordine di Id_richiesta)."""
+        try:
+            righe, token_successivo = leggi_pagina(self.db, self._select_richieste_token().where("r.Id_richiedente", "=", id_azienda),
+                                                   ("r.Id_richiesta",), (0,), dimensione, token)
+            return Pagina([RichiestaTokenModel(*r) for r in righe], token_successivo)
+        except Exception as e:
+            logger.error(f"Errore nel recupero delle richieste di token inviate: {e}", exc_info=True)
+            return Pagina()
+
+    def _select_richieste_token(self) -> QueryBuilder:
+        # Query allineata con il costruttore RichiestaTokenModel:
+        # (id_richiesta, id_mittente, mittente, id_destinatario, destinatario, quantita, stato)
+        return QueryBuilder().select(
+            "r.Id_richiesta",      # id_richiesta
+            "r.Id_richiedente",    # id_mittente
+            "rich.Nome",           # mittente
+            "r.Id_ricevente",     # id_destinatario
+            "rice.Nome",          # destinatario
+            "r.Quantita",         # quantita
+            "r.Stato"             # stato
+        )\
+        .table("RichiestaToken AS r") \
+        .join("Azienda AS rich", "rich.Id_azienda", "r.Id_richiedente") \
+        .join("Azienda AS rice", "rice.Id_azienda", "r.Id_ricevente")
+
+    def _select_richieste_ric_token(self, id_azienda: int) -> QueryBuilder:
+        return self._select_richieste_token() \
+            .where("r.Id_ricevente", "=", id_azienda) \
+            .where("r.Stato", "=", db_default_string.STATO_ATTESA)
+        
     def get_operazioni_token(self, id_azienda: int) -> list[RichiestaTokenModel]:
         """
         Recupera le operazioni di token per un'azienda dal database locale.
         Se la blockchain è disponibile, tenta di recuperare anche da lì.
         """
+        query_builder = QueryBuilder()
         try:
             # Recupera le operazioni dal database locale
             # Query allineata con il costruttore RichiestaTokenModel:
             # (id_richiesta, id_mittente, mittente, id_destinatario, destinatario, quantita, stato)
-            self.query_builder.select(
+            query_builder.select(
                 "r.Id_richiesta",      # id_richiesta
                 "r.Id_richiedente",    # id_mittente
                 "rich.Nome",           # mittente
@@ -673,12 +830,12 @@ class RichiesteRepositoryImpl():
             .where("r.Id_richiedente" ,"=", id_azienda) \
             .or_where("r.Id_ricevente", "=" , id_azienda) \
             
-            query, value = self.query_builder.get_query()
+            query, value = query_builder.get_query()
             logger.info(f"Query: {query}")
             logger.info(f"Valori: {value}")
-            risultati_raw = self.db.fetch_results(query, value)
-            logger.info(f"Risultati: {risultati_raw}")
-            logger.info(f"Operazioni token recuperate dal database: {len(risultati_raw) if risultati_raw else 0}")
+            operazioni = self.db.fetch_models(query, value, RichiestaTokenModel)
+            logger.info(f"Risultati: {operazioni}")
+            logger.info(f"Operazioni token recuperate dal database: {len(operazioni)}")
             
             # Tenta di inizializzare la connessione blockchain (ma non blocca se fallisce)
             try:
@@ -695,7 +852,7 @@ class RichiesteRepositoryImpl():
                 logger.warning(f"Errore nel tentativo di recupero dalla blockchain: {e}")
                 # Continua con i risultati del database locale
             
-            return [RichiestaTokenModel(*r) for r in risultati_raw] if risultati_raw else []
+            return operazioni
         except Exception as e:
             logger.error(f"Errore nel recupero delle operazioni di token: {e}", exc_info=True)
             return []
@@ -754,14 +911,6 @@ class RichiesteRepositoryImpl():
                 # Continuiamo con la registrazione tramite script diretto
                 # NON ritorniamo qui, ma procediamo con la registrazione
             
-            company_registry = blockchain_config.contracts['SustainableFoodChain']
-            
-            # Crea uno script temporaneo per verificare e registrare l'azienda
-            scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 
-                                    "off_chain", "temp_scripts")
-            os.makedirs(scripts_dir, exist_ok=True)
-            script_path = os.path.join(scripts_dir, "register_company.js")
-            
             # Ottieni l'indirizzo del contratto CompanyRegistry
             # Prima controlla se è disponibile in blockchain_config
             company_registry_address = None
@@ -835,41 +984,35 @@ class RichiesteRepositoryImpl():
                 "registry_address": company_registry_address  # Indirizzo del contratto CompanyRegistry
             }
             
-            # Genera lo script
-            script_content = generate_js_script("register_company", script_params)
-            
-            # Scrivi lo script su file
-            with open(script_path, 'w') as f:
-                f.write(script_content)
-            
-            # Esegui lo script Node.js
-            logger.info(f"Esecuzione dello script per registrare l'azienda {id_azienda} sulla blockchain")
-            result = subprocess.run(["node", script_path], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                logger.info(f"Registrazione dell'azienda {id_azienda} completata: {result.stdout}")
+            # Esegui la registrazione (web3 nel processo, o script Node.js in modalità BLOCKCHAIN_SCRIPT_NODE)
+            logger.info(f"Registrazione dell'azienda {id_azienda} sulla blockchain")
+            try:
+                blockchain_config.esegui_transazione("register_company", script_params)
+                logger.info(f"Registrazione dell'azienda {id_azienda} completata")
                 return True
-            else:
+            except ValueError as errore:
                 # Se l'errore contiene "already registered", consideriamo l'operazione riuscita
-                if "already registered" in result.stderr:
+                if "already registered" in str(errore):
                     logger.info(f"L'azienda {id_azienda} è già registrata sulla blockchain")
                     return True
                 # Se l'errore contiene "Company not registered", potrebbe essere un problema con il TokenExchange
                 # ma non con la registrazione stessa, quindi consideriamo l'operazione riuscita
-                elif "Company not registered" in result.stderr:
+                elif "Company not registered" in str(errore):
                     logger.warning(f"Possibile problema di sincronizzazione di SustainableFoodChain per l'azienda {id_azienda}")
                     # Proviamo a forzare la registrazione una seconda volta
                     logger.info(f"Tentativo aggiuntivo di registrazione per l'azienda {id_azienda}")
-                    retry_result = subprocess.run(["node", script_path], capture_output=True, text=True)
-                    if retry_result.returncode == 0 or "already registered" in retry_result.stderr:
+                    try:
+                        blockchain_config.esegui_transazione("register_company", script_params)
                         logger.info(f"Secondo tentativo di registrazione riuscito per l'azienda {id_azienda}")
-                        return True
-                    else:
-                        logger.error(f"Errore anche nel secondo tentativo di registrazione: {retry_result.stderr}")
-                        # Continuiamo comunque, potrebbe funzionare
-                        return True
+                    except ValueError as errore_retry:
+                        if "already registered" in str(errore_retry):
+                            logger.info(f"Secondo tentativo di registrazione riuscito per l'azienda {id_azienda}")
+                        else:
+                            logger.error(f"Errore anche nel secondo tentativo di registrazione: {errore_retry}")
+                    # Continuiamo comunque, potrebbe funzionare
+                    return True
                 else:
-                    logger.error(f"Errore nella registrazione dell'azienda {id_azienda}: {result.stderr}")
+                    logger.error(f"Errore nella registrazione dell'azienda {id_azienda}: {errore}")
                     # In modalità sviluppo, continuiamo comunque per permettere i test
                     logger.warning(f"Continuiamo nonostante l'errore di registrazione per l'azienda {id_azienda} (modalità sviluppo)")
                     return True
@@ -904,12 +1047,6 @@ class RichiesteRepositoryImpl():
                 if not provider_address:
                     raise ValueError(f"Impossibile trovare l'indirizzo blockchain per l'azienda {richiesta.id_destinatario}")
                 
-                # Crea uno script temporaneo per accettare la richiesta di token sulla blockchain
-                scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 
-                                        "off_chain", "temp_scripts")
-                os.makedirs(scripts_dir, exist_ok=True)
-                script_path = os.path.join(scripts_dir, f"accept_token_request_{richiesta.id_richiesta}.js")
-                
                 # Ottieni l'indirizzo del contratto SustainableFoodChain
                 contract_address = None
                 if 'SustainableFoodChain' in self.blockchain_config.contracts:
@@ -928,23 +1065,16 @@ class RichiesteRepositoryImpl():
                     "company_address": provider_address  # Aggiungiamo l'indirizzo dell'azienda destinataria
                 }
                 
-                # Genera lo script
-                script_content = generate_js_script("accept_token", script_params)
-                
-                # Scrivi lo script su file
-                with open(script_path, 'w') as f:
-                    f.write(script_content)
-                
-                # Esegui lo script Node.js
-                logger.info(f"Esecuzione dello script per accettare la richiesta token {richiesta.id_richiesta} sulla blockchain")
-                result = subprocess.run(["node", script_path], capture_output=True, text=True)
-                
-                if result.returncode != 0:
-                    error_msg = f"Errore nell'accettazione della richiesta token sulla blockchain: {result.stderr}"
+                # Accetta la richiesta sulla blockchain (web3 nel processo, o script Node.js in modalità BLOCKCHAIN_SCRIPT_NODE)
+                logger.info(f"Accettazione della richiesta token {richiesta.id_richiesta} sulla blockchain")
+                try:
+                    self.blockchain_config.esegui_transazione("accept_token", script_params)
+                except ValueError as errore:
+                    error_msg = f"Errore nell'accettazione della richiesta token sulla blockchain: {errore}"
                     logger.error(error_msg)
-                    raise ValueError(error_msg)
+                    raise ValueError(error_msg) from errore
                 
-                logger.info(f"Richiesta token {richiesta.id_richiesta} accettata con successo sulla blockchain: {result.stdout}")
+                logger.info(f"Richiesta token {richiesta.id_richiesta} accettata con successo sulla blockchain")
             
             # Aggiornamento nel database locale
             queries = []
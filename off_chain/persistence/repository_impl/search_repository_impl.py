@@ -0,0 +1,75 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+import re
+from abc import ABC
+from typing import Final
+from configuration.database import Database
+from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
+from model.pagina_model import Pagina
+from model.risultato_ricerca_model import RisultatoRicercaModel
+from persistence.query_builder import QueryBuilder
+from persistence.paginazione import DIMENSIONE_PAGINA, leggi_pagina
+
+_RE_PAROLE = re.compile(r"\w+")
+
+# Cursore delle pagine: rilevanza (bm25, più bassa = più rilevante) e rowid per i pari merito
+CURSORE_RICERCA: Final = ("IndiceRicerca.rank", "IndiceRicerca.rowid")
+
+
+def espressione_ricerca(testo: str) -> str:
+    """
+    Espressione MATCH di FTS5 per il testo digitato: ogni parola è cercata come prefisso
+    e devono comparire tutte. Stringa vuota se il testo non contiene parole.
+    """
+    # Le parole vanno tra virgolette: il testo dell'utente non deve essere letto come sintassi FTS5
+    return " ".join(f'"{parola}"*' for parola in _RE_PAROLE.findall(testo or ""))
+
+
+@response_metrics.measure_public_methods('database_query')
+class SearchRepositoryImpl(ABC):
+    """
+    Ricerca full-text su prodotti, aziende, certificati e lotti (tabella IndiceRicerca,
+    mantenuta aggiornata dai trigger della migrazione 5).
+    """
+
+    TIPI: Final = ("prodotto", "azienda", "certificato", "lotto")
+
+    def __init__(self):
+        super().__init__()
+        self.db = Database()
+
+    def cerca(self, testo: str, tipo: str = None, id_azienda: int = None, token: str = None,
+              dimensione: int = DIMENSIONE_PAGINA) -> Pagina:
+        """
+        Risultati ordinati per rilevanza, una pagina alla volta.
+        tipo e id_azienda restringono la ricerca a un tipo di riga o alle righe di un'azienda.
+        """
+        espressione = espressione_ricerca(testo)
+        if not espressione:
+            return Pagina()
+        try:
+            righe, token_successivo = leggi_pagina(self.db, self._select_ricerca(espressione, tipo, id_azienda),
+                                                   CURSORE_RICERCA, (5, 6), dimensione, token)
+            return Pagina([RisultatoRicercaModel(*r[:5]) for r in righe], token_successivo)
+        except Exception as e:
+            logger.error(f"Errore nella ricerca di '{testo}': {e}")
+            return Pagina()
+
+    def _select_ricerca(self, espressione: str, tipo: str = None, id_azienda: int = None) -> QueryBuilder:
+        if tipo is not None and tipo not in self.TIPI:
+            raise ValueError(f"Tipo di ricerca non valido: {tipo}")
+
+        builder = (
+            QueryBuilder()
+                .select("tipo", "id_riferimento", "id_azienda", "nome", "dettagli", *CURSORE_RICERCA)
+                .table("IndiceRicerca")
+                .where("IndiceRicerca", "MATCH", espressione)
+        )
+        if tipo is not None:
+            builder.where("tipo", "=", tipo)
+        if id_azienda is not None:
+            builder.where("id_azienda", "=", id_azienda)
+        return builder
@@ -2,35 +2,120 @@
 # pylint: disable= import-error
 # pylint: disable= line-too-long
 # pylint: disable= trailing-whitespace
+import hashlib
+import hmac
+import os
+import threading
 from abc import ABC
+from typing import Final
 from configuration.database import Database
 from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
 from model.threshold_model import ThresholdModel
 from persistence.query_builder import QueryBuilder
+from persistence.repository_impl import db_default_string
 
 
+SECRET_KEY = os.getenv("_KEY", "default_dev_key")
 
+
+def firma_soglia(tipo_operazione: str, id_prodotto: int, soglia_massima: int) -> str:
+    """Firma HMAC-SHA256 di una riga di Soglie."""
+    raw_string = f"{tipo_operazione}|{id_prodotto}|{soglia_massima}"
+    return hmac.new(SECRET_KEY.encode(), raw_string.encode(), hashlib.sha256).hexdigest()
+
+
+@response_metrics.measure_public_methods('database_query')
 class ThresholdRepositoryImpl(ABC):
-    # Class variable that stores the single instance
+    """
+    Soglie di CO2 per (operazione, prodotto).
+    Le righe di Soglie vengono verificate una volta e tenute in memoria, condivise tra le istanze:
+    il registro si ricarica quando cambia il contatore 'soglie' della tabella Sequenza
+    (incrementato dai trigger su Soglie) e la firma viene ricalcolata solo per le righe modificate.
+    """
+
+    QUERY_VERSIONE_SOGLIE : Final = "SELECT Valore FROM Sequenza WHERE Nome = ?"
+    QUERY_SOGLIE : Final = "SELECT Operazione, Prodotto, Soglia_Massima, firma FROM Soglie"
+
+    # (Operazione, Prodotto) -> (Soglia_Massima, firma) delle righe con firma valida
+    _soglie_verificate: dict[tuple[str, int], tuple[int, str]] = {}
+    # Righe presenti ma con firma non valida
+    _soglie_manomesse: set[tuple[str, int]] = set()
+    _versione_registro = None
+    _lock = threading.Lock()
 
     def __init__(self):
         super().__init__()
         self.db = Database()
-        self.query_builder = QueryBuilder()
    
 
     def get_lista_soglie(self) -> list[ThresholdModel]:
-        self.query_builder.select("P.Nome","Soglia_Massima","Operazione").table("Soglie") \
+        query_builder = QueryBuilder()
+        query_builder.select("P.Nome","Soglia_Massima","Operazione").table("Soglie") \
                         .join("Prodotto AS P","P.Id_prodotto", "Prodotto")
     
             
-        query, value = (self.query_builder.get_query() )
+        query, value = (query_builder.get_query() )
 
         try:
         
-            return [ThresholdModel(*x) for x in self.db.fetch_results(query, value)]
+            return self.db.fetch_models(query, value, ThresholdModel)
     
         except Exception as err:
             logger.error(f"Errore durante il recupero delle soglie: {err}")
         return []
-        
+
+    def get_soglia(self, tipo_operazione: str, id_prodotto: int) -> int:
+        """Restituisce la soglia massima verificata, o solleva ValueError se manca o è stata manomessa."""
+        chiave = (tipo_operazione, int(id_prodotto))
+        soglia = self.get_soglie([chiave]).get(chiave)
+        if soglia is None:
+            raise ValueError(f"Soglia non trovata. {tipo_operazione},{id_prodotto}")
+        return soglia
+
+    def get_soglie(self, coppie) -> dict[tuple[str, int], int]:
+        """
+        Restituisce le soglie di più coppie (operazione, prodotto) con un solo controllo del registro.
+        Le coppie senza soglia non compaiono nel risultato; una coppia manomessa solleva ValueError.
+        """
+        self._aggiorna_registro()
+        soglie = {}
+        for tipo_operazione, id_prodotto in coppie:
+            chiave = (tipo_operazione, int(id_prodotto))
+            if chiave in self._soglie_manomesse:
+                raise ValueError("Dati soglia corrotti o manomessi!")
+            riga = self._soglie_verificate.get(chiave)
+            if riga is not None:
+                soglie[chiave] = riga[0]
+        return soglie
+
+    @classmethod
+    def invalida(cls) -> None:
+        """Forza il controllo di tutte le righe alla prossima lettura (le firme non cambiate non vengono ricalcolate)."""
+        with cls._lock:
+            cls._versione_registro = None
+
+    def _aggiorna_registro(self) -> None:
+        versione = self.db.fetch_one(self.QUERY_VERSIONE_SOGLIE, (db_default_string.SEQUENZA_SOGLIE,))
+        with self._lock:
+            if versione is not None and versione == self._versione_registro:
+                return
+            verificate_prima = dict(self._soglie_verificate)
+
+        verificate = {}
+        manomesse = set()
+        for tipo_operazione, id_prodotto, soglia_massima, firma in self.db.fetch_results(self.QUERY_SOGLIE) or []:
+            chiave = (tipo_operazione, int(id_prodotto))
+            if verificate_prima.get(chiave) == (soglia_massima, firma):
+                # Riga identica a quella già verificata
+                verificate[chiave] = (soglia_massima, firma)
+            elif hmac.compare_digest(firma_soglia(tipo_operazione, id_prodotto, soglia_massima), firma):
+                verificate[chiave] = (soglia_massima, firma)
+            else:
+                logger.error(f"Firma non valida per la soglia {chiave}")
+                manomesse.add(chiave)
+
+        with self._lock:
+            ThresholdRepositoryImpl._soglie_verificate = verificate
+            ThresholdRepositoryImpl._soglie_manomesse = manomesse
+            ThresholdRepositoryImpl._versione_registro = versione
@@ -0,0 +1,26 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+
+
+def is_riga_nominata(modello) -> bool:
+    """True per i modelli basati su NamedTuple."""
+    return isinstance(modello, type) and issubclass(modello, tuple) and hasattr(modello, "_fields")
+
+
+def riga_a_modello(modello):
+    """
+    Funzione riga -> modello, da passare come row_factory a Database.iter_results.
+    I modelli NamedTuple vengono creati dalla tupla della riga così com'è, senza spacchettarla
+    negli argomenti del costruttore; gli altri modelli con modello(*riga).
+    """
+    if is_riga_nominata(modello):
+        return modello._make
+    return lambda riga: modello(*riga)
+
+
+def crea_row_factory(modello):
+    """Row factory sqlite3 (cursore, riga) -> modello, da assegnare a Cursor.row_factory."""
+    costruttore = riga_a_modello(modello)
+    return lambda _cursore, riga: costruttore(riga)
@@ -1,7 +1,6 @@
 from eth_account import Account
 from eth_account.messages import encode_defunct
 from web3 import Web3
-import json
 import os
 import sqlite3
 from session import Session
@@ -14,9 +13,11 @@ import subprocess
 import requests
 import time
 from configuration.database import Database
+from configuration.blockchain_client import RegistroBlockchain
 
 # CONFIGURAZIONE
-NODE_URL = "http://127.0.0.1:8545"  # Nodo Hardhat
+BACKEND_URL = "http://localhost:5001"
+SCADENZA_FIRMA = 120  # secondi concessi all'utente per firmare con MetaMask
 
 # Ottieni il percorso assoluto alla directory del progetto
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
@@ -28,41 +29,77 @@ ADDRESS_PATH = os.path.join(PROJECT_ROOT, "on_chain", "contract_address.json")
 # Definizione diretta del percorso del database
 DATABASE_PATH = os.path.join(PROJECT_ROOT, 'off_chain', 'database', 'database.db')
 
-# Web3 setup
-w3 = Web3(Web3.HTTPProvider(NODE_URL))
+# Web3 setup: provider e sessione HTTP condivisi da tutto il processo
+w3 = RegistroBlockchain().w3
+
+# Nonce assegnati localmente: più transazioni per account senza attendere le ricevute
+nonce_manager = RegistroBlockchain().nonce_manager
 
 class BlockchainController:
     def __init__(self):
         self.controller = CredentialRepositoryImpl()
         self.richieste_controller = RichiesteRepositoryImpl()
-        with open(ABI_PATH) as f:
-            contract_json = json.load(f)
-            abi = contract_json["abi"]
-
-        with open(ADDRESS_PATH) as f:
-            address_json = json.load(f)
-            contract_address = address_json.get("SustainableFoodChain")
-            if not contract_address:
-                raise ValueError("Indirizzo del contratto non trovato nel file contract_address.json sotto la chiave 'SustainableFoodChain'.")
+        # ABI, indirizzo e oggetto contratto vengono letti una volta e riusati da tutti i controller
+        registro = RegistroBlockchain()
+        contract_address = registro.leggi_json(ADDRESS_PATH).get("SustainableFoodChain")
+        if not contract_address:
+            raise ValueError("Indirizzo del contratto non trovato nel file contract_address.json sotto la chiave 'SustainableFoodChain'.")
 
-        self.contract = w3.eth.contract(address=Web3.to_checksum_address(contract_address), abi=abi)
+        self.contract = registro.contratto(contract_address, ABI_PATH)
 
     @staticmethod
     def verifica_possesso_chiave(address_eth, signature, challenge):
         message = encode_defunct(text=challenge)
         recovered = Account.recover_message(message, signature=signature)
         return recovered.lower() == address_eth.lower()
+
+    @staticmethod
+    def invia_transazione(account, funzione_contratto, gas):
+        """Costruisce e invia la chiamata al contratto con il prossimo nonce dell'account. Non attende la ricevuta."""
+        tx_hash, _ = nonce_manager.invia(account, lambda nonce: funzione_contratto.build_transaction({
+            'from': account,
+            'nonce': nonce,
+            'gasPrice': w3.eth.gas_price,
+            'gas': gas,
+        }))
+        return tx_hash
     
     
 
-    def firma_operazione(self,tipo, id_lotto, id_operazione):
+    @staticmethod
+    def attendi_esito(tipo, account, id_riferimento, scadenza=None):
+        """
+        Attende l'esito di una firma con una richiesta long-poll a /attendi_esito, che risponde appena
+        il backend lo registra. Riprova solo se la connessione cade o il backend chiude l'attesa prima della scadenza;
+        solleva ValueError se il backend rifiuta la richiesta (400).
+        """
+        scadenza = SCADENZA_FIRMA if scadenza is None else scadenza
+        fine = time.monotonic() + scadenza
+        while (rimanente := fine - time.monotonic()) > 0:
+            try:
+                logger.info(f"Attendo esito {tipo} {id_riferimento} per l'account {account}")
+                response = requests.get(f"{BACKEND_URL}/attendi_esito/{tipo}/{account}/{id_riferimento}",
+                                        params={"timeout": rimanente}, timeout=rimanente + 5)
+                data = response.json()
+                if response.status_code == 400:
+                    # Richiesta non valida (es. tipo sconosciuto): ripeterla non cambierebbe la risposta
+                    raise ValueError(f"Richiesta di esito non valida: {data.get('message', response.text)}")
+                if "esito" in data:
+                    return data["esito"]
+            except requests.RequestException as e:
+                logger.warning(f"Errore nella richiesta HTTP in attesa dell'esito {tipo} {id_riferimento}: {e}")
+                time.sleep(min(1, max(fine - time.monotonic(), 0)))  # Backend non ancora raggiungibile
+
+        raise TimeoutError("Timeout in attesa della firma tramite MetaMask")
+
+    def firma_operazione(self,tipo, id_lotto, id_operazione, scadenza=None):
 
         account = self.get_address()  # Funzione che recupera account locale
 
         messaggio = f"Conferma operazione {tipo} lotto {id_lotto} con id op {id_operazione}"
         messaggio_encoded = messaggio.replace(" ", "%20")
 
-        url = f"http://localhost:5001/firma_operazione.html?messaggio={messaggio_encoded}&tipo={tipo}&lotto={id_lotto}&op={id_operazione}"
+        url = f"{BACKEND_URL}/firma_operazione.html?messaggio={messaggio_encoded}&tipo={tipo}&lotto={id_lotto}&op={id_operazione}"
         # Rileva il sistema operativo e apri il browser in modo appropriato
         import platform
         import webbrowser
@@ -82,29 +119,12 @@ class BlockchainController:
         except Exception as e:
             raise Exception(f"Errore nell'apertura del browser: {str(e)}")
         
-        max_wait = 10  # secondi
-        wait_interval = 2  # secondi
-        start_time = time.time()
-
-        while time.time() - start_time < max_wait:
-
-            try:
-                print(f"Attendo esito operazione {id_operazione} per l'account {account}")
-                response = requests.get(f"http://localhost:5001/esito_operazione/{account}/{id_operazione}", timeout=10)
-                data = response.json()
-                if "esito" in data:
-                    esito = data["esito"]
-                    logger.info(f"Esito  {esito}")
-                    return esito
-            except requests.RequestException:
-                pass  # Continua a riprovare
-
-            time.sleep(wait_interval)
-
-        raise TimeoutError("Timeout in attesa della firma tramite MetaMask")
+        esito = self.attendi_esito("operazione", account, id_operazione, scadenza)
+        logger.info(f"Esito  {esito}")
+        return esito
 
 
-    def firma_azione_compensativa(self, tipo, id_azione, co2_compensata):
+    def firma_azione_compensativa(self, tipo, id_azione, co2_compensata, scadenza=None):
         """
         Gestisce la firma di un'azione compensativa tramite MetaMask.
         
@@ -112,6 +132,7 @@ class BlockchainController:
             tipo: Il tipo di azione compensativa (es. 'Piantumazione', 'Energia rinnovabile')
             id_azione: L'ID dell'azione compensativa
             co2_compensata: La quantità di CO2 compensata dall'azione
+            scadenza: Secondi di attesa della firma (predefinito SCADENZA_FIRMA)
         
         Returns:
             str: L'esito dell'operazione
@@ -123,7 +144,7 @@ class BlockchainController:
         messaggio_encoded = messaggio.replace(" ", "%20")
 
         # Costruisci l'URL con tutti i parametri necessari
-        url = f"http://localhost:5001/firma_azione_compensativa.html?messaggio={messaggio_encoded}&tipo={tipo}&id_azione={id_azione}&co2_compensata={co2_compensata}"
+        url = f"{BACKEND_URL}/firma_azione_compensativa.html?messaggio={messaggio_encoded}&tipo={tipo}&id_azione={id_azione}&co2_compensata={co2_compensata}"
         
         # Rileva il sistema operativo e apri il browser in modo appropriato
         import platform
@@ -145,26 +166,9 @@ class BlockchainController:
             raise Exception(f"Errore nell'apertura del browser: {str(e)}")
         
         # Attendi la risposta dal servizio web
-        max_wait = 60  # secondi
-        wait_interval = 3  # secondi
-        start_time = time.time()
-
-        while time.time() - start_time < max_wait:
-            try:
-                print(f"Attendo esito azione compensativa {id_azione} per l'account {account}")
-                response = requests.get(f"http://localhost:5001/esito_azione_compensativa/{account}/{id_azione}", timeout=10)
-                data = response.json()
-                if "esito" in data:
-                    esito = data["esito"]
-                    logger.info(f"Esito azione compensativa: {esito}")
-                    return esito
-            except requests.RequestException as e:
-                print(f"Errore nella richiesta HTTP: {e}")
-                pass  # Continua a riprovare
-
-            time.sleep(wait_interval)
-
-        raise TimeoutError("Timeout in attesa della firma tramite MetaMask")
+        esito = self.attendi_esito("azione_compensativa", account, id_azione, scadenza)
+        logger.info(f"Esito azione compensativa: {esito}")
+        return esito
 
 
     def get_address(self):
@@ -197,8 +201,6 @@ class BlockchainController:
             
             # Ottieni l'account dall'indirizzo blockchain dell'utente corrente
             account = Web3.to_checksum_address(account_address)
-            nonce = w3.eth.get_transaction_count(account)
-            gas_price = w3.eth.gas_price
             
             # Assicurati che i tipi di dati siano corretti per il contratto
             # Converti i tipi se necessario - usa try/except per gestire casi di stringa
@@ -212,19 +214,14 @@ class BlockchainController:
             
             # Il contratto registerCompensationAction accetta solo 3 parametri, non 4
             # L'identificazione dell'azienda avviene tramite msg.sender nel contratto
-            tx = self.contract.functions.registerCompensationAction(
+            funzione = self.contract.functions.registerCompensationAction(
                 tipo_azione,
                 co2_compensata_int,
                 description
-            ).build_transaction({
-                'from': account,
-                'nonce': nonce,
-                'gasPrice': gas_price,
-                'gas': 300000,
-            })
+            )
 
             # Firma e invia la transazione
-            tx_hash = w3.eth.send_transaction(tx)
+            tx_hash = self.invia_transazione(account, funzione, 300000)
             
             # Aggiorna lo stato dell'azione compensativa nel database
             try:
@@ -243,33 +240,25 @@ class BlockchainController:
                     id_azione_param = id_azione
                 
                 if id_azione_param:
-                    conn = sqlite3.connect(DATABASE_PATH)
-                    cursor = conn.cursor()
-                    
-                    # Verifica se l'azione esiste prima di aggiornare
-                    cursor.execute(
-                        "SELECT COUNT(*) FROM Azioni_compensative WHERE Id_azione = ?",
-                        (id_azione_param,)
-                    )
-                    if cursor.fetchone()[0] > 0:
-                        # Aggiorna il flag blockchain_registered
+                    with Database().scrittura() as cursor:
+                        # Aggiorna il flag blockchain_registered, se l'azione esiste
                         cursor.execute(
                             "UPDATE Azioni_compensative SET blockchain_registered = 1 WHERE Id_azione = ?",
                             (id_azione_param,)
                         )
-                        conn.commit()
+                        aggiornate = cursor.rowcount
+
+                    if aggiornate > 0:
                         logger.info(f"Azione compensativa {id_azione_param} marcata come registrata sulla blockchain")
                     else:
                         logger.warning(f"Azione compensativa con ID {id_azione_param} non trovata nel database")
-                    
-                    conn.close()
                 else:
                     logger.warning("Impossibile aggiornare lo stato dell'azione compensativa: ID azione non disponibile")
             except Exception as e:
                 logger.error(f"Errore nell'aggiornamento dello stato dell'azione compensativa: {e}")
                 # Non solleviamo l'eccezione qui per non interrompere il flusso principale
             
-            return tx_hash.hex()
+            return tx_hash
         
         except Exception as e:
             logger.error(f"Errore durante l'invio dell'operazione sulla blockchain: {e}")
@@ -278,141 +267,14 @@ class BlockchainController:
     def invia_operazione(self, operation_type, description, batch_id, id_operazione, account_address):
         """Registra un'operazione sulla blockchain"""
         try:
-            # Log dei parametri di input con formato strutturato
-            logger.info(f"[Operazione #{id_operazione}] Parametri: tipo={operation_type}, lotto={batch_id}, descrizione='{description}'")
-            
-            # Recupero informazioni sui lotti di input dal database
-            db = Database()
-            query = "SELECT id_lotto_input, quantità_utilizzata FROM ComposizioneLotto WHERE id_lotto_output = ? "
-            params = (batch_id,)
-            result = db.fetch_results(query=query, params=params)
-            
-            # Estrazione dei dati dai risultati della query
-            id_lotti = [row[0] for row in result] if result else []
-            quantita_lotti = [row[1] for row in result] if result else []
-            
-            # Log dei lotti di input con formato strutturato
-            if id_lotti:
-                logger.info(f"[Operazione #{id_operazione}] Composizione: lotto {batch_id} composto da {len(id_lotti)} lotti di input")
-                for i, (lotto_id, quantita) in enumerate(zip(id_lotti, quantita_lotti)):
-                    logger.info(f"  - Input #{i+1}: lotto {lotto_id}, quantità {quantita}")
-            else:
-                logger.info(f"[Operazione #{id_operazione}] Nessun lotto di input (operazione di produzione primaria)")
-
-            query_op = "SELECT Id_prodotto, Consumo_CO2, quantita FROM Operazione WHERE Id_operazione = ? "
-            params = (id_operazione,)
-            result = db.fetch_results(query=query_op,params=params)
-
-            if result:
-                id_prodotto, co2Consumed_db, quantita_db = result[0]
-                
-            else:
-                raise Exception("Errore nel'inserimento dell'operazione")
-            
-            try:
-                co2Consumed = int(co2Consumed_db)
-                quantita = int(quantita_db)
-            except ValueError as e:
-                raise ValueError(f"co2 o quantita non interi")
-
-
-            operation_type_map = {
-                "produzione": 0,
-                "trasformazione": 1,
-                "distribuzione": 2,
-                "vendita": 3
-            }
-            tipo_bc = operation_type_map.get(operation_type, 0)
-
-            if operation_type != db_default_string.TIPO_OP_VENDITA:
-
-                query = """
-                SELECT c.Address
-                FROM Magazzino AS m
-                JOIN Azienda AS a ON m.id_azienda = a.Id_azienda
-                JOIN Credenziali AS c ON a.Id_credenziali = c.Id_credenziali
-                WHERE m.id_lotto = ?
-                """
-                params = (batch_id,)
-                account_lotto = db.fetch_results(query=query, params=params)
-
-                logger.info(f"account destinazione lotto: {account_lotto}")
-                
-                azienda_proprietaria_lotto = Web3.to_checksum_address(account_lotto[0][0]) 
-            else:
-                azienda_proprietaria_lotto =  Web3.to_checksum_address('0x0000000000000000000000000000000000000000')
-
-
-
-            
-            rep = OperationRepositoryImpl()
-            soglia_op = rep.recupera_soglia(operation_type,id_prodotto)
-            logger.info(f"soglia_recuperata = {soglia_op}")
-
-
-            
-            # Verifica e gestisci tipi di dati anomali
-            if isinstance(operation_type, list):
-                logger.warning(f"operation_type è una lista: {operation_type}, usando il primo elemento o 0")
-                operation_type = operation_type[0] if operation_type else 0
-            
-            if isinstance(batch_id, list):
-                logger.warning(f"batch_id è una lista: {batch_id}, usando il primo elemento o 1")
-                batch_id = batch_id[0] if batch_id else 1
-                
-            # Ottieni l'account dall'indirizzo blockchain dell'utente corrente
-            account = Web3.to_checksum_address(account_address)
-            nonce = w3.eth.get_transaction_count(account)
-            gas_price = w3.eth.gas_price
-
-            
-            # Converti i tipi se necessario - usa try/except per gestire casi di stringa
-            try:
-                operation_type_int = int(tipo_bc)  # Converti in intero per uint8
-            except (ValueError, TypeError):
-                logger.warning(f"Impossibile convertire operation_type a intero: {operation_type}, impostando a 0")
-                operation_type_int = 0
-                
-            try:
-                batch_id_int = int(batch_id)  # Converti in intero per uint256
-            except (ValueError, TypeError):
-                logger.warning(f"Impossibile convertire batch_id a intero: {batch_id}, impostando a 1")
-                batch_id_int = 1
+            account, funzione_registrazione = self.prepara_operazione(
+                operation_type, description, batch_id, id_operazione, account_address
+            )
 
-
-            logger.info(f"indirizzo destinaario {azienda_proprietaria_lotto}")
-            
-            logger.info(f"[Operazione #{id_operazione}] Preparazione transazione: lotto={batch_id_int}, tipo={operation_type_int}")
-
-            input_struct = {
-                'idOperazione': id_operazione,  # Converti esplicitamente in intero
-                'operationType': operation_type_int,
-                'batchId': batch_id_int,
-                'quantita': quantita,  # Converti esplicitamente in intero
-                'idLotti': id_lotti ,  # Converti ogni ID in intero
-                'quantitaLotti': quantita_lotti,  # Converti ogni quantità in intero
-                'sogliaCO2': soglia_op,  # Converti esplicitamente in intero
-                'consumoCO2': co2Consumed  # Converti esplicitamente in intero
-            }
-            
             # 1. Registra l'operazione
-
-
-
-            tx_register = self.contract.functions.registerOperation(
-                input_struct,
-                azienda_proprietaria_lotto  # Usa il valore convertito a intero
-            ).build_transaction({
-                'from': account,
-                'nonce': nonce,
-                'gasPrice': gas_price,
-                'gas': 650000,
-            })
-            
-            # Invia la prima transazione
-            tx_hash_register = w3.eth.send_transaction(tx_register)
+            tx_hash_register = self.invia_transazione(account, funzione_registrazione, 650000)
             receipt_register = w3.eth.wait_for_transaction_receipt(tx_hash_register, timeout=120)
-            logger.info(f"[Operazione #{id_operazione}] Transazione 1/3 (registerOperation): {tx_hash_register.hex()}, status={receipt_register.status}")
+            logger.info(f"[Operazione #{id_operazione}] Transazione 1/3 (registerOperation): {tx_hash_register}, status={receipt_register.status}")
             
             """
             # Incrementa il nonce per la prossima transazione
@@ -458,58 +320,189 @@ class BlockchainController:
             # Usa l'hash della prima transazione come riferimento principale
             tx_hash = tx_hash_register
 
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
-
-            if receipt.status == 1:
+            if receipt_register.status == 1:
+                # Aggiorna lo stato dell'operazione nel database
+                self.sincronizza_operazione_registrata(id_operazione)
             
-            # Aggiorna lo stato dell'operazione nel database
-                if id_operazione is not None:
-                    try:
-                        conn = sqlite3.connect(DATABASE_PATH)
-                        cursor = conn.cursor()
-                        # Recupera i dettagli dell'operazione per calcolare i token da assegnare
-                        cursor.execute(
-                            """SELECT O.Id_azienda, O.Id_prodotto, O.Consumo_CO2, O.Tipo 
-                            FROM Operazione O 
-                            WHERE O.Id_operazione = ?""",
-                            (id_operazione,)
-                        )
-                        op_details = cursor.fetchone()
-                        
-                        if op_details:
-                            id_azienda, id_prodotto, co2_consumata, tipo_operazione = op_details
-                            
-                            op_repo = OperationRepositoryImpl()
-                            token_assegnati = op_repo.token_opeazione(co2_consumata, tipo_operazione, id_prodotto)
-                            
-                            # Aggiorna l'operazione come registrata sulla blockchain
-                            cursor.execute(
-                                "UPDATE Operazione SET blockchain_registered = 1 WHERE Id_operazione = ?",
-                                (id_operazione,)
-                            )
-
-                            cursor.execute(
-                                    "UPDATE Azienda SET Token = Token + ? WHERE Id_azienda = ?",
-                                    (token_assegnati, id_azienda)
-                                )
-                            logger.info(f"Database locale sincronizzato con lo stato on-chain: {token_assegnati} token")
-                    except Exception as e:
-                        #gestire roll back
-                        pass
-
-                    finally:
-                        conn.commit()
-                        conn.close()
-
-                        
-                        # Invece di aggiornare direttamente i token nel DB, assegna i token tramite il contratto
-            
-            return tx_hash.hex()
+            return tx_hash
         
         except Exception as e:
             logger.error(f"Errore durante l'invio dell'operazione sulla blockchain: {e}")
             raise Exception(f"Errore durante l'invio dell'operazione sulla blockchain: {str(e)}")
-            
+
+    def prepara_operazione(self, operation_type, description, batch_id, id_operazione, account_address):
+        """
+        Legge dal database i dati dell'operazione e prepara la chiamata registerOperation.
+        Restituisce l'account mittente e la funzione del contratto, ancora da firmare e inviare.
+        """
+        # Log dei parametri di input con formato strutturato
+        logger.info(f"[Operazione #{id_operazione}] Parametri: tipo={operation_type}, lotto={batch_id}, descrizione='{description}'")
+
+        # Recupero informazioni sui lotti di input dal database
+        db = Database()
+        query = "SELECT id_lotto_input, quantità_utilizzata FROM ComposizioneLotto WHERE id_lotto_output = ? "
+        params = (batch_id,)
+        result = db.fetch_results(query=query, params=params)
+
+        # Estrazione dei dati dai risultati della query
+        id_lotti = [row[0] for row in result] if result else []
+        quantita_lotti = [row[1] for row in result] if result else []
+
+        # Log dei lotti di input con formato strutturato
+        if id_lotti:
+            logger.info(f"[Operazione #{id_operazione}] Composizione: lotto {batch_id} composto da {len(id_lotti)} lotti di input")
+            for i, (lotto_id, quantita) in enumerate(zip(id_lotti, quantita_lotti)):
+                logger.info(f"  - Input #{i+1}: lotto {lotto_id}, quantità {quantita}")
+        else:
+            logger.info(f"[Operazione #{id_operazione}] Nessun lotto di input (operazione di produzione primaria)")
+
+        query_op = "SELECT Id_prodotto, Consumo_CO2, quantita FROM Operazione WHERE Id_operazione = ? "
+        params = (id_operazione,)
+        result = db.fetch_results(query=query_op,params=params)
+
+        if result:
+            id_prodotto, co2Consumed_db, quantita_db = result[0]
+
+        else:
+            raise Exception("Errore nel'inserimento dell'operazione")
+
+        try:
+            co2Consumed = int(co2Consumed_db)
+            quantita = int(quantita_db)
+        except ValueError as e:
+            raise ValueError(f"co2 o quantita non interi")
+
+
+        operation_type_map = {
+            "produzione": 0,
+            "trasformazione": 1,
+            "distribuzione": 2,
+            "vendita": 3
+        }
+        tipo_bc = operation_type_map.get(operation_type, 0)
+
+        if operation_type != db_default_string.TIPO_OP_VENDITA:
+
+            query = """
+            SELECT c.Address
+            FROM Magazzino AS m
+            JOIN Azienda AS a ON m.id_azienda = a.Id_azienda
+            JOIN Credenziali AS c ON a.Id_credenziali = c.Id_credenziali
+            WHERE m.id_lotto = ?
+            """
+            params = (batch_id,)
+            account_lotto = db.fetch_results(query=query, params=params)
+
+            logger.info(f"account destinazione lotto: {account_lotto}")
+
+            azienda_proprietaria_lotto = Web3.to_checksum_address(account_lotto[0][0]) 
+        else:
+            azienda_proprietaria_lotto =  Web3.to_checksum_address('0x0000000000000000000000000000000000000000')
+
+
+
+
+        rep = OperationRepositoryImpl()
+        soglia_op = rep.recupera_soglia(operation_type,id_prodotto)
+        logger.info(f"soglia_recuperata = {soglia_op}")
+
+
+
+        # Verifica e gestisci tipi di dati anomali
+        if isinstance(operation_type, list):
+            logger.warning(f"operation_type è una lista: {operation_type}, usando il primo elemento o 0")
+            operation_type = operation_type[0] if operation_type else 0
+
+        if isinstance(batch_id, list):
+            logger.warning(f"batch_id è una lista: {batch_id}, usando il primo elemento o 1")
+            batch_id = batch_id[0] if batch_id else 1
+
+        # Ottieni l'account dall'indirizzo blockchain dell'utente corrente
+        account = Web3.to_checksum_address(account_address)
+
+
+        # Converti i tipi se necessario - usa try/except per gestire casi di stringa
+        try:
+            operation_type_int = int(tipo_bc)  # Converti in intero per uint8
+        except (ValueError, TypeError):
+            logger.warning(f"Impossibile convertire operation_type a intero: {operation_type}, impostando a 0")
+            operation_type_int = 0
+
+        try:
+            batch_id_int = int(batch_id)  # Converti in intero per uint256
+        except (ValueError, TypeError):
+            logger.warning(f"Impossibile convertire batch_id a intero: {batch_id}, impostando a 1")
+            batch_id_int = 1
+
+
+        logger.info(f"indirizzo destinaario {azienda_proprietaria_lotto}")
+
+        logger.info(f"[Operazione #{id_operazione}] Preparazione transazione: lotto={batch_id_int}, tipo={operation_type_int}")
+
+        input_struct = {
+            'idOperazione': id_operazione,  # Converti esplicitamente in intero
+            'operationType': operation_type_int,
+            'batchId': batch_id_int,
+            'quantita': quantita,  # Converti esplicitamente in intero
+            'idLotti': id_lotti ,  # Converti ogni ID in intero
+            'quantitaLotti': quantita_lotti,  # Converti ogni quantità in intero
+            'sogliaCO2': soglia_op,  # Converti esplicitamente in intero
+            'consumoCO2': co2Consumed  # Converti esplicitamente in intero
+        }
+
+        return account, self.contract.functions.registerOperation(
+            input_struct,
+            azienda_proprietaria_lotto
+        )
+
+    def sincronizza_operazione_registrata(self, id_operazione):
+        """Dopo la conferma on-chain segna l'operazione come registrata e accredita i token nel database locale."""
+        if id_operazione is None:
+            return
+
+        try:
+            with Database().scrittura() as cursor:
+                self.accredita_operazione(cursor, id_operazione)
+        except Exception as e:
+            # La transazione è già stata annullata
+            logger.error(f"[Operazione #{id_operazione}] Errore nella sincronizzazione del database locale: {e}")
+
+    @staticmethod
+    def accredita_operazione(cursor, id_operazione) -> bool:
+        """
+        Segna l'operazione come registrata e accredita i token all'azienda, con il cursore di una transazione
+        già aperta. L'accredito avviene solo la prima volta: restituisce False se l'operazione era già registrata
+        (o non esiste). Gli errori vengono propagati, così il chiamante annulla tutta la transazione.
+        """
+        # Recupera i dettagli dell'operazione per calcolare i token da assegnare
+        cursor.execute(
+            """SELECT O.Id_azienda, O.Id_prodotto, O.Consumo_CO2, O.Tipo 
+            FROM Operazione O 
+            WHERE O.Id_operazione = ?""",
+            (id_operazione,)
+        )
+        op_details = cursor.fetchone()
+        if not op_details:
+            return False
+
+        # Solo chi porta blockchain_registered da 0 a 1 accredita i token
+        cursor.execute(
+            "UPDATE Operazione SET blockchain_registered = 1 WHERE Id_operazione = ? AND blockchain_registered = 0",
+            (id_operazione,)
+        )
+        if cursor.rowcount != 1:
+            logger.info(f"[Operazione #{id_operazione}] Già registrata: token non accreditati di nuovo")
+            return False
+
+        id_azienda, id_prodotto, co2_consumata, tipo_operazione = op_details
+        token_assegnati = OperationRepositoryImpl().token_opeazione(co2_consumata, tipo_operazione, id_prodotto)
+        cursor.execute(
+            "UPDATE Azienda SET Token = Token + ? WHERE Id_azienda = ?",
+            (token_assegnati, id_azienda)
+        )
+        logger.info(f"Database locale sincronizzato con lo stato on-chain: {token_assegnati} token")
+        return True
+
     def get_operazioni_company(self):
         try:
             address = self.get_address()
@@ -616,13 +609,14 @@ class BlockchainController:
             logger.error(f"Errore nella verifica della registrazione dell'azienda {address}: {e}")
             return False
             
-    def firma_richiesta_token(self, destinatario, quantita):
+    def firma_richiesta_token(self, destinatario, quantita, scadenza=None):
         """
         Gestisce la firma di una richiesta di token tramite MetaMask.
         
         Args:
             destinatario: L'ID dell'azienda destinataria della richiesta
             quantita: La quantità di token richiesti
+            scadenza: Secondi di attesa della firma (predefinito SCADENZA_FIRMA)
         
         Returns:
             str: L'esito dell'operazione
@@ -634,7 +628,7 @@ class BlockchainController:
         messaggio_encoded = messaggio.replace(" ", "%20")
 
         # Costruisci l'URL con tutti i parametri necessari
-        url = f"http://localhost:5001/firma_richiesta_token.html?messaggio={messaggio_encoded}&destinatario={destinatario}&quantita={quantita}"
+        url = f"{BACKEND_URL}/firma_richiesta_token.html?messaggio={messaggio_encoded}&destinatario={destinatario}&quantita={quantita}"
         
         # Rileva il sistema operativo e apri il browser in modo appropriato
         import platform
@@ -656,28 +650,11 @@ class BlockchainController:
             raise Exception(f"Errore nell'apertura del browser: {str(e)}")
         
         # Attendi la risposta dal servizio web
-        max_wait = 60  # secondi
-        wait_interval = 3  # secondi
-        start_time = time.time()
-
-        while time.time() - start_time < max_wait:
-            try:
-                print(f"Attendo esito richiesta token per l'account {account} e destinatario {destinatario}")
-                response = requests.get(f"http://localhost:5001/esito_richiesta_token/{account}/{destinatario}", timeout=10)
-                data = response.json()
-                if "esito" in data:
-                    esito = data["esito"]
-                    logger.info(f"Esito richiesta token: {esito}")
-                    return esito
-            except requests.RequestException as e:
-                print(f"Errore nella richiesta HTTP: {e}")
-                pass  # Continua a riprovare
+        esito = self.attendi_esito("richiesta_token", account, destinatario, scadenza)
+        logger.info(f"Esito richiesta token: {esito}")
+        return esito
 
-            time.sleep(wait_interval)
-
-        raise TimeoutError("Timeout in attesa della firma tramite MetaMask")
-
-    def firma_accettazione_token(self, id_richiesta, mittente, quantita):
+    def firma_accettazione_token(self, id_richiesta, mittente, quantita, scadenza=None):
         """
         Gestisce la firma di un'accettazione di token tramite MetaMask.
         
@@ -685,6 +662,7 @@ class BlockchainController:
             id_richiesta: L'ID della richiesta di token
             mittente: L'ID dell'azienda mittente della richiesta
             quantita: La quantità di token richiesti
+            scadenza: Secondi di attesa della firma (predefinito SCADENZA_FIRMA)
         
         Returns:
             str: L'esito dell'operazione
@@ -696,7 +674,7 @@ class BlockchainController:
         messaggio_encoded = messaggio.replace(" ", "%20")
 
         # Costruisci l'URL con tutti i parametri necessari
-        url = f"http://localhost:5001/firma_accetta_token.html?messaggio={messaggio_encoded}&mittente={mittente}&quantita={quantita}&id_richiesta={id_richiesta}"
+        url = f"{BACKEND_URL}/firma_accetta_token.html?messaggio={messaggio_encoded}&mittente={mittente}&quantita={quantita}&id_richiesta={id_richiesta}"
         
         # Rileva il sistema operativo e apri il browser in modo appropriato
         import platform
@@ -718,26 +696,9 @@ class BlockchainController:
             raise Exception(f"Errore nell'apertura del browser: {str(e)}")
         
         # Attendi la risposta dal servizio web
-        max_wait = 60  # secondi
-        wait_interval = 3  # secondi
-        start_time = time.time()
-
-        while time.time() - start_time < max_wait:
-            try:
-                print(f"Attendo esito accettazione token per l'account {account} e richiesta {id_richiesta}")
-                response = requests.get(f"http://localhost:5001/esito_accettazione_token/{account}/{id_richiesta}", timeout=10)
-                data = response.json()
-                if "esito" in data:
-                    esito = data["esito"]
-                    logger.info(f"Esito accettazione token: {esito}")
-                    return esito
-            except requests.RequestException as e:
-                print(f"Errore nella richiesta HTTP: {e}")
-                pass  # Continua a riprovare
-
-            time.sleep(wait_interval)
-
-        raise TimeoutError("Timeout in attesa della firma tramite MetaMask")
+        esito = self.attendi_esito("accettazione_token", account, id_richiesta, scadenza)
+        logger.info(f"Esito accettazione token: {esito}")
+        return esito
 
     def crea_richiesta_token(self, provider_address, amount, purpose, co2_reduction, account_address):
         """
@@ -760,34 +721,26 @@ class BlockchainController:
             
             logger.info(f"Invio richiesta token: provider={provider_address_checksum}, amount={amount}, purpose={purpose}, co2_reduction={co2_reduction}")
             
-            # Ottieni il nonce per l'account
-            nonce = w3.eth.get_transaction_count(requester_address_checksum)
-            
-            # Costruisci la transazione
-            txn = self.contract.functions.createTokenRequest(
+            # Costruisci la transazione (il nonce viene assegnato dal NonceManager)
+            funzione = self.contract.functions.createTokenRequest(
                 provider_address_checksum,
                 amount,
                 purpose,
                 co2_reduction
-            ).build_transaction({
-                'from': requester_address_checksum,
-                'gas': 2000000,  # Gas limit
-                'gasPrice': w3.eth.gas_price,
-                'nonce': nonce,
-            })
+            )
             
             # NOTA: In un ambiente reale, qui dovremmo firmare la transazione con la chiave privata
             # Ma poiché stiamo usando Hardhat in modalità sviluppo, possiamo inviare direttamente
             # la transazione senza firmarla, e Hardhat la firmerà automaticamente
             
             # Invia la transazione
-            tx_hash = w3.eth.send_transaction(txn)
+            tx_hash = self.invia_transazione(requester_address_checksum, funzione, 2000000)
             tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
             
             # Verifica lo stato della transazione
             if tx_receipt['status'] == 1:
-                logger.info(f"Richiesta token inviata con successo. Tx hash: {tx_hash.hex()}")
-                return tx_hash.hex()
+                logger.info(f"Richiesta token inviata con successo. Tx hash: {tx_hash}")
+                return tx_hash
             else:
                 error_msg = f"Errore nell'invio della richiesta token. Transazione fallita. Status: {tx_receipt['status']}"
                 logger.error(error_msg)
@@ -818,31 +771,23 @@ class BlockchainController:
             
             logger.info(f"Accetto richiesta token: provider={account_address}, id={id_richiesta}")
             
-            # Ottieni il nonce per l'account
-            nonce = w3.eth.get_transaction_count(requester_address_checksum)
-            
-            # Costruisci la transazione
-            txn = self.contract.functions.acceptTokenRequest(
+            # Costruisci la transazione (il nonce viene assegnato dal NonceManager)
+            funzione = self.contract.functions.acceptTokenRequest(
                 id_richiesta
-            ).build_transaction({
-                'from': requester_address_checksum,
-                'gas': 2000000,  # Gas limit
-                'gasPrice': w3.eth.gas_price,
-                'nonce': nonce,
-            })
+            )
             
             # NOTA: In un ambiente reale, qui dovremmo firmare la transazione con la chiave privata
             # Ma poiché stiamo usando Hardhat in modalità sviluppo, possiamo inviare direttamente
             # la transazione senza firmarla, e Hardhat la firmerà automaticamente
             
             # Invia la transazione
-            tx_hash = w3.eth.send_transaction(txn)
+            tx_hash = self.invia_transazione(requester_address_checksum, funzione, 2000000)
             tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
             
             # Verifica lo stato della transazione
             if tx_receipt['status'] == 1:
-                logger.info(f"Accettazione token inviata con successo. Tx hash: {tx_hash.hex()}")
-                return tx_hash.hex()
+                logger.info(f"Accettazione token inviata con successo. Tx hash: {tx_hash}")
+                return tx_hash
             else:
                 error_msg = f"Errore nell'accettazione della richiesta token. Transazione fallita. Status: {tx_receipt['status']}"
                 logger.error(error_msg)
@@ -0,0 +1,158 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from web3.exceptions import TransactionNotFound
+from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
+from model.outbox_model import OutboxModel
+from persistence.repository_impl.outbox_repository_impl import OutboxRepositoryImpl
+from presentation.controller.blockchain_controller import BlockchainController, nonce_manager, w3
+
+
+class BlockchainOutbox:
+    """
+    Invio asincrono delle operazioni firmate sulla blockchain.
+
+    Le operazioni vengono salvate nella tabella OutboxBlockchain e la richiesta HTTP ritorna subito.
+    Un dispatcher preleva le righe in coda e le affida a un pool di worker, che inviano le transazioni
+    con i nonce assegnati dal NonceManager; un thread separato attende le ricevute e
+    comunica l'esito tramite la callback `on_esito(address, id_operazione, esito)`.
+    """
+
+    NUM_WORKER = 4
+    INTERVALLO_POLLING = 1  # secondi tra due controlli della coda e delle ricevute
+    GAS_OPERAZIONE = 650000
+    TENTATIVI_SEGNA_INVIATA = 3
+
+    def __init__(self, on_esito=None, controller_factory=BlockchainController):
+        self.repository = OutboxRepositoryImpl()
+        self.on_esito = on_esito or (lambda address, id_operazione, esito: None)
+        self.controller_factory = controller_factory
+
+        self._executor = ThreadPoolExecutor(max_workers=self.NUM_WORKER, thread_name_prefix="outbox-worker")
+        self._nuove_operazioni = threading.Event()
+        self._stop = threading.Event()
+        self._thread_locale = threading.local()
+
+    def avvia(self):
+        """Riprende le operazioni interrotte e avvia il dispatcher e il thread delle ricevute."""
+        self._ripristina_in_invio()
+        threading.Thread(target=self._ciclo_invio, name="outbox-dispatcher", daemon=True).start()
+        threading.Thread(target=self._ciclo_ricevute, name="outbox-ricevute", daemon=True).start()
+        logger.info("BlockchainOutbox: avviato")
+
+    def ferma(self):
+        self._stop.set()
+        self._nuove_operazioni.set()
+        self._executor.shutdown(wait=False)
+
+    def accoda(self, address: str, id_operazione: int, tipo: str, id_lotto: int, messaggio: str) -> bool:
+        """Salva l'operazione nell'outbox e sveglia il dispatcher. Restituisce False se era già in corso."""
+        accodata = self.repository.accoda_operazione(address, id_operazione, tipo, id_lotto, messaggio)
+        self._nuove_operazioni.set()
+        return accodata
+
+    def _controller(self) -> BlockchainController:
+        # Un controller (e quindi un oggetto contratto) per ogni thread
+        controller = getattr(self._thread_locale, "controller", None)
+        if controller is None:
+            controller = self.controller_factory()
+            self._thread_locale.controller = controller
+        return controller
+
+    def _ciclo_invio(self):
+        while not self._stop.is_set():
+            self._nuove_operazioni.wait(self.INTERVALLO_POLLING)
+            self._nuove_operazioni.clear()
+            try:
+                for operazione in self.repository.preleva_in_coda(self.NUM_WORKER * 4):
+                    self._executor.submit(self._invia, operazione)
+            except Exception as e:
+                logger.error(f"BlockchainOutbox: errore nel prelievo delle operazioni in coda: {e}")
+
+    def _ripristina_in_invio(self):
+        """
+        All'avvio controlla le operazioni rimaste 'In invio' per un'interruzione del processo.
+        Quelle con un nonce salvato possono essere già state inviate: si cerca la transazione sulla
+        blockchain e solo se il nodo non ha mai usato quel nonce l'operazione torna in coda.
+        """
+        for operazione in self.repository.get_in_invio():
+            try:
+                tx_hash = None
+                if operazione.nonce is not None:
+                    tx_hash = nonce_manager.cerca_transazione(operazione.address, operazione.nonce)
+                if tx_hash is None:
+                    self.repository.rimetti_in_coda(operazione.id_outbox)
+                else:
+                    self.repository.segna_inviata(operazione.id_outbox, tx_hash, operazione.nonce)
+                    logger.info(f"[Operazione #{operazione.id_operazione}] Già inviata: {tx_hash} (nonce {operazione.nonce})")
+            except Exception as e:
+                # Nel dubbio la riga resta 'In invio': rimetterla in coda potrebbe inviarla due volte
+                logger.error(f"[Operazione #{operazione.id_operazione}] Impossibile verificare l'invio "
+                             f"(nonce {operazione.nonce}), resta 'In invio': {e}")
+
+    def _invia(self, operazione: OutboxModel):
+        try:
+            account, funzione_registrazione = self._controller().prepara_operazione(
+                operazione.tipo, operazione.messaggio, operazione.id_lotto,
+                operazione.id_operazione, operazione.address
+            )
+            tx_hash, nonce = nonce_manager.invia(account, lambda nonce: funzione_registrazione.build_transaction({
+                'from': account,
+                'nonce': nonce,
+                'gasPrice': w3.eth.gas_price,
+                'gas': self.GAS_OPERAZIONE,
+            }), prenotato=lambda nonce: self.repository.segna_nonce(operazione.id_outbox, nonce))
+        except Exception as e:
+            logger.error(f"[Operazione #{operazione.id_operazione}] Errore durante l'invio sulla blockchain: {e}")
+            self.repository.segna_fallita(operazione.id_outbox, str(e))
+            self.on_esito(operazione.address, operazione.id_operazione, f"❌ Errore: {e}")
+            return
+
+        logger.info(f"[Operazione #{operazione.id_operazione}] Inviata: {tx_hash} (nonce {nonce})")
+        # La transazione è ormai nel nodo: l'operazione non va mai segnata come fallita
+        for tentativo in range(1, self.TENTATIVI_SEGNA_INVIATA + 1):
+            try:
+                self.repository.segna_inviata(operazione.id_outbox, tx_hash, nonce)
+                return
+            except Exception as e:
+                logger.warning(f"[Operazione #{operazione.id_operazione}] Salvataggio dell'invio fallito "
+                               f"(tentativo {tentativo}): {e}")
+                self._stop.wait(self.INTERVALLO_POLLING)
+        logger.error(f"[Operazione #{operazione.id_operazione}] Transazione {tx_hash} (nonce {nonce}) inviata ma non salvata: "
+                     f"resta 'In invio' e verrà cercata sulla blockchain al prossimo avvio")
+
+    def _ciclo_ricevute(self):
+        while not self._stop.wait(self.INTERVALLO_POLLING):
+            try:
+                inviate = self.repository.get_inviate()
+            except Exception as e:
+                logger.error(f"BlockchainOutbox: errore nel controllo delle ricevute: {e}")
+                continue
+            for operazione in inviate:
+                try:
+                    self._controlla_ricevuta(operazione)
+                except Exception as e:
+                    # L'operazione resta 'Inviata': verrà ricontrollata al prossimo giro
+                    logger.error(f"[Operazione #{operazione.id_operazione}] Errore nella conferma: {e}")
+
+    @response_metrics.measure_latency('blockchain_operation')
+    def _controlla_ricevuta(self, operazione: OutboxModel):
+        try:
+            receipt = w3.eth.get_transaction_receipt(operazione.tx_hash)
+        except TransactionNotFound:
+            return  # Non ancora inclusa in un blocco
+
+        logger.info(f"[Operazione #{operazione.id_operazione}] Ricevuta {operazione.tx_hash}: status={receipt.status}")
+        if receipt.status == 1:
+            # Accredito dei token e conferma nella stessa transazione: o entrambi o nessuno
+            controller = self._controller()
+            self.repository.segna_confermata(
+                operazione.id_outbox,
+                lambda cursor: controller.accredita_operazione(cursor, operazione.id_operazione)
+            )
+            self.on_esito(operazione.address, operazione.id_operazione,
+                          f"✅ Operazione registrata con successo. Tx hash: {operazione.tx_hash}")
+        else:
+            errore = f"Transazione {operazione.tx_hash} annullata dal contratto"
+            self.repository.segna_fallita(operazione.id_outbox, errore)
+            self.on_esito(operazione.address, operazione.id_operazione, f"❌ Errore: {errore}")
@@ -13,11 +13,12 @@ from model.prodotto_finito_model import ProdottoLottoModel
 from model.info_product_for_choice_model import ProductForChoiceModel
 from model.product_standard_model import ProductStandardModel
 from model.company_model import CompanyModel
-from model.operation_estesa_model import OperazioneEstesaModel
+from model.operation_estesa_model import OperazioneEstesaRiga
 from model.compensation_action_model import CompensationActionModel
 from model.prodotto_finito_model import ProdottoLottoModel
 from model.richiesta_model import RichiestaModel
 from model.richiesta_token_model import RichiestaTokenModel
+from model.pagina_model import Pagina
 from session import Session
 from persistence.repository_impl.company_repository_impl import CompanyRepositoryImpl
 from persistence.repository_impl.threshold_repository_impl import ThresholdRepositoryImpl
@@ -65,7 +66,7 @@ class ControllerAzienda:
             logger.error(f"Errore {e}", exc_info=True)
             return []
 
-    def lista_operazioni(self, azienda: int) -> list[OperazioneEstesaModel]:
+    def lista_operazioni(self, azienda: int) -> list[OperazioneEstesaRiga]:
         try:
             lista_operazioni = self.operation_repository.get_operazioni_by_azienda(azienda)
             return lista_operazioni
@@ -73,6 +74,30 @@ class ControllerAzienda:
             logger.error(f"Error al obtener la lista di operazioni: {e}", exc_info=True)
             return []
 
+    def esporta_operazioni(self, azienda: int, percorso_file: str) -> int:
+        """Esporta tutte le operazioni dell'azienda in CSV o JSON; restituisce quante ne sono state scritte."""
+        try:
+            return self.operation_repository.esporta_operazioni(percorso_file, azienda)
+        except Exception as e:
+            logger.error(f"Errore nell'esportazione delle operazioni: {e}", exc_info=True)
+            return 0
+
+    def pagina_operazioni(self, azienda: int, token: str = None) -> Pagina:
+        """Operazioni dell'azienda una pagina alla volta: token è quello restituito dalla pagina precedente."""
+        try:
+            return self.operation_repository.get_operazioni_by_azienda_pagina(azienda, token)
+        except Exception as e:
+            logger.error(f"Errore nel caricamento della pagina di operazioni: {e}", exc_info=True)
+            return Pagina()
+
+    def cerca_operazioni(self, azienda: int, testo: str, token: str = None) -> Pagina:
+        """Operazioni dell'azienda che corrispondono al testo, dalla più rilevante, una pagina alla volta."""
+        try:
+            return self.operation_repository.cerca_operazioni_azienda_pagina(azienda, testo, token)
+        except Exception as e:
+            logger.error(f"Errore nella ricerca delle operazioni: {e}", exc_info=True)
+            return Pagina()
+
     def lista_azioni_compensative(self, azienda: int) -> list[CompensationActionModel]:
         try:
             lista_azioni_compensative = self.compensation_action.get_lista_azioni(azienda)
@@ -81,6 +106,13 @@ class ControllerAzienda:
             logger.error(f"Errore nell'ottenere la lista delle azioni compensative: {e}", exc_info=True)
             return []
 
+    def pagina_azioni_compensative(self, azienda: int, token: str = None) -> Pagina:
+        try:
+            return self.compensation_action.get_lista_azioni_pagina(azienda, token=token)
+        except Exception as e:
+            logger.error(f"Errore nel caricamento della pagina di azioni compensative: {e}", exc_info=True)
+            return Pagina()
+
     def get_materie_prime_magazzino_azienda(self) -> list[ProdottoLottoModel]:
         try:
             materie_prime = self.product.get_materie_prime_magazzino_azienda(Session().current_user["id_azienda"])
@@ -184,6 +216,17 @@ class ControllerAzienda:
             logger.error(f"Errore nell'ottenere la lista delle richieste ricevute: {e}", exc_info=True)
             return []
 
+    def pagina_richieste_ricevute(self, token: str = None) -> Pagina:
+        try:
+            return self.richieste.get_richieste_ricevute_pagina(
+                Session().current_user["id_azienda"],
+                check_trasporto=Session().current_user["role"] == "Trasportatore",
+                token=token
+            )
+        except Exception as e:
+            logger.error(f"Errore nel caricamento della pagina di richieste ricevute: {e}", exc_info=True)
+            return Pagina()
+
     def get_richieste_effettuate(self) -> list[RichiestaModel]:
         try:
             richieste = self.richieste.get_richieste_effettuate(Session().current_user["id_azienda"])
@@ -192,6 +235,13 @@ class ControllerAzienda:
             logger.error(f"Errore nell'ottenere la lista delle richieste effettuate: {e}", exc_info=True)
             return []
 
+    def pagina_richieste_effettuate(self, token: str = None) -> Pagina:
+        try:
+            return self.richieste.get_richieste_effettuate_pagina(Session().current_user["id_azienda"], token=token)
+        except Exception as e:
+            logger.error(f"Errore nel caricamento della pagina di richieste effettuate: {e}", exc_info=True)
+            return Pagina()
+
     def update_richiesta(self, id_richiesta: int, nuovo_stato: str):
         try:
             self.richieste.update_richiesta(id_richiesta, nuovo_stato, Session().current_user["role"])
@@ -11,7 +11,9 @@ from persistence.repository_impl.company_repository_impl import CompanyRepositor
 from persistence.repository_impl.threshold_repository_impl import ThresholdRepositoryImpl
 from persistence.repository_impl.product_repository_impl import ProductRepositoryImpl
 from persistence.repository_impl.certification_repository_impl import CertificationRepositoryImpl
+from persistence.repository_impl.search_repository_impl import SearchRepositoryImpl
 from persistence.repository_impl.database_standard import aziende_enum
+from model.pagina_model import Pagina
 
 
 class ControllerGuest:
@@ -31,6 +33,7 @@ class ControllerGuest:
         self.product = ProductRepositoryImpl()
         self.threshold = ThresholdRepositoryImpl()
         self.company = CompanyRepositoryImpl()
+        self.search = SearchRepositoryImpl()
         logger.info(
             "BackEnd: Successful initialization of 'class instances' for repository implements")
 
@@ -88,7 +91,7 @@ class ControllerGuest:
 
     def scarto_soglia(self, co2, operazione, prodotto):
         # repo17 = ThresholdRepositoryImpl()
-        soglia = self.threshold.get_soglia_by_operazione_and_prodotto(operazione, prodotto)
+        soglia = self.threshold.get_soglia(operazione, prodotto)
         return soglia - int(co2)
     
 
@@ -110,6 +113,33 @@ class ControllerGuest:
             logger.error(f"Errore durante il recupero dei prodotti: {str(e)}")
             return []
             
+    def get_catalogo_co2(self, ordine: str = None) -> list[ProdottoFinito]:
+        """
+        Restituisce tutti i prodotti in vendita con la CO2 totale e unitaria del loro lotto,
+        calcolata in blocco e conservata nel catalogo (ordine: "ASC", "DESC" o None).
+        """
+        try:
+            return self.product.get_catalogo_co2(ordine)
+        except Exception as e:
+            logger.error(f"Errore nel recupero del catalogo della CO2: {str(e)}")
+            return []
+
+    def cerca(self, testo: str, tipo: str = None, token: str = None) -> Pagina:
+        """Ricerca su prodotti, aziende, certificati e lotti, dal risultato più rilevante, una pagina alla volta."""
+        try:
+            return self.search.cerca(testo, tipo, token=token)
+        except Exception as e:
+            logger.error(f"Errore nella ricerca di '{testo}': {str(e)}")
+            return Pagina()
+
+    def cerca_prodotti(self, testo: str, token: str = None) -> Pagina:
+        """Prodotti in vendita il cui prodotto, tipo o numero di lotto corrisponde al testo, una pagina alla volta."""
+        try:
+            return self.product.cerca_prodotti_in_vendita_pagina(testo, token)
+        except Exception as e:
+            logger.error(f"Errore nella ricerca dei prodotti '{testo}': {str(e)}")
+            return Pagina()
+
     def get_certificazioni_by_lotto(self,lotto_id : int)-> list[CertificationModel]:
         try:
             return self.certification.get_certificati_catena(lotto_id) or []
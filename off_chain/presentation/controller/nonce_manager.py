@@ -0,0 +1,140 @@
+import heapq
+import threading
+from typing import Optional
+
+from web3 import Web3
+from configuration.log_load_setting import logger
+from enforcement.guarantee_response_enforcer import response_metrics
+
+
+class NonceManager:
+    """
+    Assegna localmente i nonce delle transazioni, per account (indirizzo checksum).
+
+    Il nodo viene interrogato solo al primo utilizzo di un account o dopo un errore "nonce too low":
+    così più transazioni dello stesso account possono essere inviate senza attendere le ricevute.
+    I nonce di invii falliti vengono riassegnati per primi, per non lasciare buchi nella sequenza
+    (una transazione successiva a un buco resterebbe bloccata nella mempool).
+    """
+
+    MAX_TENTATIVI = 3
+
+    # Messaggi con cui il nodo segnala un nonce già usato
+    ERRORI_NONCE = ("nonce too low", "nonce has already been used")
+    # La stessa identica transazione è già nella mempool (es. reinvio dopo un timeout): non è un errore
+    ERRORE_GIA_NOTA = "already known"
+
+    def __init__(self, w3: Web3):
+        self.w3 = w3
+        self._prossimo: dict[str, int] = {}
+        self._liberi: dict[str, list[int]] = {}
+        self._lock_account: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _lock_per(self, account: str) -> threading.Lock:
+        with self._lock:
+            return self._lock_account.setdefault(account, threading.Lock())
+
+    def prenota(self, account: str) -> int:
+        """Restituisce il prossimo nonce da usare per l'account."""
+        account = Web3.to_checksum_address(account)
+        with self._lock_per(account):
+            return self._prenota(account)
+
+    def rilascia(self, account: str, nonce: int) -> None:
+        """Restituisce un nonce non usato (invio fallito): verrà assegnato alla prossima transazione."""
+        account = Web3.to_checksum_address(account)
+        with self._lock_per(account):
+            self._rilascia(account, nonce)
+
+    def risincronizza(self, account: str) -> None:
+        """Dimentica lo stato locale dell'account: il prossimo nonce verrà riletto dal nodo."""
+        account = Web3.to_checksum_address(account)
+        with self._lock_per(account):
+            self._risincronizza(account)
+
+    @response_metrics.measure_latency('blockchain_operation')
+    def invia(self, account: str, costruisci_tx, prenotato=None) -> tuple[str, int]:
+        """
+        Invia una transazione senza attenderne la ricevuta.
+
+        :param costruisci_tx: funzione nonce -> dizionario della transazione
+        :param prenotato: funzione nonce chiamata prima dell'invio (es. per salvare il nonce);
+            se fallisce la transazione non viene inviata
+        :return: (hash della transazione, nonce usato)
+        """
+        account = Web3.to_checksum_address(account)
+        # Il lock per account mantiene l'ordine di invio uguale all'ordine dei nonce
+        with self._lock_per(account):
+            for _ in range(self.MAX_TENTATIVI):
+                nonce = self._prenota(account)
+                if prenotato is not None:
+                    try:
+                        prenotato(nonce)
+                    except Exception:
+                        self._rilascia(account, nonce)
+                        raise
+                try:
+                    tx_hash = self.w3.eth.send_transaction(costruisci_tx(nonce))
+                except Exception as e:
+                    if self.ERRORE_GIA_NOTA in str(e).lower():
+                        logger.info(f"NonceManager: transazione con nonce {nonce} di {account} già nota al nodo")
+                        return self.cerca_transazione(account, nonce), nonce
+                    if self.is_errore_nonce(e):
+                        logger.warning(f"NonceManager: nonce {nonce} già usato per {account}, risincronizzo: {e}")
+                        self._risincronizza(account)
+                        continue
+                    self._rilascia(account, nonce)
+                    raise
+                return Web3.to_hex(tx_hash), nonce
+        raise Exception(f"Impossibile ottenere un nonce valido per {account} dopo {self.MAX_TENTATIVI} tentativi")
+
+    def cerca_transazione(self, account: str, nonce: int) -> Optional[str]:
+        """
+        Cerca la transazione dell'account con il nonce indicato, minata o ancora nella mempool.
+
+        :return: hash della transazione, None se il nodo non ha ancora usato il nonce
+        """
+        account = Web3.to_checksum_address(account)
+        eth = self.w3.eth
+        if eth.get_transaction_count(account, "pending") <= nonce:
+            return None
+        if eth.get_transaction_count(account, "latest") > nonce:
+            # Primo blocco in cui il conteggio dell'account supera il nonce: la transazione è lì
+            basso, alto = 0, eth.block_number
+            while basso < alto:
+                medio = (basso + alto) // 2
+                if eth.get_transaction_count(account, medio) > nonce:
+                    alto = medio
+                else:
+                    basso = medio + 1
+            blocco = basso
+        else:
+            blocco = "pending"
+        for tx in eth.get_block(blocco, True)["transactions"]:
+            if Web3.to_checksum_address(tx["from"]) == account and tx["nonce"] == nonce:
+                return Web3.to_hex(tx["hash"])
+        raise Exception(f"Transazione con nonce {nonce} di {account} non trovata nel blocco {blocco}")
+
+    @classmethod
+    def is_errore_nonce(cls, errore: Exception) -> bool:
+        messaggio = str(errore).lower()
+        return any(testo in messaggio for testo in cls.ERRORI_NONCE)
+
+    def _prenota(self, account: str) -> int:
+        liberi = self._liberi.get(account)
+        if liberi:
+            return heapq.heappop(liberi)
+        if account not in self._prossimo:
+            self._prossimo[account] = self.w3.eth.get_transaction_count(account, "pending")
+        nonce = self._prossimo[account]
+        self._prossimo[account] = nonce + 1
+        return nonce
+
+    def _rilascia(self, account: str, nonce: int) -> None:
+        if account in self._prossimo and nonce < self._prossimo[account]:
+            heapq.heappush(self._liberi.setdefault(account, []), nonce)
+
+    def _risincronizza(self, account: str) -> None:
+        self._prossimo.pop(account, None)
+        self._liberi.pop(account, None)
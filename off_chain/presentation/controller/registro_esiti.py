@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class RegistroEsiti:
+    """
+    Esiti delle firme MetaMask (operazioni, azioni compensative, richieste e accettazioni di token),
+    indicizzati per (tipo, address, id).
+
+    Chi aspetta un esito si mette in attesa su una condition variable dedicata alla sua chiave
+    e viene svegliato appena conferma_* registra l'esito, senza interrogare il backend a intervalli.
+    Address e id vengono normalizzati: '0xAB..'/'0xab..' e 5/'5' indicano la stessa firma.
+
+    In memoria restano al massimo `massimo_esiti` esiti, per `durata` secondi: oltre il limite
+    si scarta quello usato meno di recente. Con un `repository` (EsitiFirmaRepositoryImpl) gli esiti
+    vengono salvati anche su SQLite, così sopravvivono al riavvio e sono visti dagli altri processi del backend.
+    """
+
+    OPERAZIONE = "operazione"
+    AZIONE_COMPENSATIVA = "azione_compensativa"
+    RICHIESTA_TOKEN = "richiesta_token"
+    ACCETTAZIONE_TOKEN = "accettazione_token"
+    TIPI = (OPERAZIONE, AZIONE_COMPENSATIVA, RICHIESTA_TOKEN, ACCETTAZIONE_TOKEN)
+
+    MASSIMO_ESITI = 10_000
+    DURATA = 3600  # secondi
+    # Con il repository, ogni quanto chi attende controlla gli esiti scritti da altri processi
+    INTERVALLO_CONDIVISO = 1  # secondi
+    # Ogni quante registrazioni vengono eliminati dal database gli esiti scaduti
+    PULIZIA_OGNI = 100
+
+    def __init__(self, massimo_esiti: int = MASSIMO_ESITI, durata: float = DURATA, repository=None):
+        self.massimo_esiti = massimo_esiti
+        self.durata = durata
+        self.repository = repository
+        self._lock = threading.Lock()
+        self._esiti: OrderedDict[tuple, tuple[str, float]] = OrderedDict()  # chiave -> (esito, scadenza), dal meno recente
+        self._attese: dict[tuple, list] = {}  # chiave -> [Condition, numero di thread in attesa]
+        self._registrazioni = 0
+
+    @staticmethod
+    def _chiave(tipo: str, address: str, id_riferimento) -> tuple:
+        if tipo not in RegistroEsiti.TIPI:
+            raise ValueError(f"Tipo di esito non valido: {tipo}")
+        return tipo, str(address).lower(), str(id_riferimento).strip()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._esiti)
+
+    def registra(self, tipo: str, address: str, id_riferimento, esito: str) -> None:
+        """Salva l'esito e sveglia chi lo sta aspettando."""
+        chiave = self._chiave(tipo, address, id_riferimento)
+        scadenza = time.time() + self.durata
+        with self._lock:
+            self._memorizza(chiave, esito, scadenza)
+            self._registrazioni += 1
+            pulizia = self._registrazioni % self.PULIZIA_OGNI == 0
+            attesa = self._attese.get(chiave)
+            if attesa is not None:
+                with attesa[0]:
+                    attesa[0].notify_all()
+
+        if self.repository is not None:
+            self.repository.salva(*chiave, esito, scadenza)
+            if pulizia:
+                self.repository.elimina_scaduti(time.time(), self.massimo_esiti)
+
+    def get(self, tipo: str, address: str, id_riferimento) -> Optional[str]:
+        chiave = self._chiave(tipo, address, id_riferimento)
+        adesso = time.time()
+        with self._lock:
+            esito = self._leggi(chiave, adesso)
+        if esito is None and self.repository is not None:
+            esito = self._leggi_repository(chiave, adesso)
+        return esito
+
+    def primo(self, tipo: str, address: str) -> Optional[str]:
+        """Il primo esito ancora valido registrato per l'address, qualunque sia l'id."""
+        address = str(address).lower()
+        adesso = time.time()
+        with self._lock:
+            esito = next((e for (t, a, _), (e, scadenza) in self._esiti.items()
+                          if t == tipo and a == address and scadenza > adesso), None)
+        if esito is None and self.repository is not None:
+            esito = self.repository.primo(tipo, address, adesso)
+        return esito
+
+    def attendi(self, tipo: str, address: str, id_riferimento, timeout: float) -> Optional[str]:
+        """Esito della firma, atteso al massimo timeout secondi; None se non arriva in tempo."""
+        esito = self.get(tipo, address, id_riferimento)
+        if esito is not None:
+            return esito
+
+        chiave = self._chiave(tipo, address, id_riferimento)
+        fine = time.monotonic() + timeout
+        with self._lock:
+            attesa = self._attese.setdefault(chiave, [threading.Condition(), 0])
+            attesa[1] += 1
+            # La condition viene acquisita prima di rilasciare il lock: una registra() intermedia non va persa
+            attesa[0].acquire()
+
+        try:
+            while (rimanente := fine - time.monotonic()) > 0:
+                if self.repository is not None:
+                    # Un altro processo può registrare l'esito senza svegliare questa condition
+                    rimanente = min(rimanente, self.INTERVALLO_CONDIVISO)
+                if attesa[0].wait_for(lambda: chiave in self._esiti, rimanente):
+                    break
+                if self.repository is not None:
+                    # Il database si legge senza la condition: registra() acquisisce prima il lock e poi la condition
+                    attesa[0].release()
+                    try:
+                        trovato = self._leggi_repository(chiave, time.time()) is not None
+                    finally:
+                        attesa[0].acquire()
+                    if trovato:
+                        break
+        finally:
+            attesa[0].release()
+            with self._lock:
+                attesa[1] -= 1
+                if attesa[1] == 0:
+                    del self._attese[chiave]
+        return self.get(tipo, address, id_riferimento)
+
+    def _memorizza(self, chiave: tuple, esito: str, scadenza: float) -> None:
+        # Da chiamare con il lock acquisito
+        self._esiti[chiave] = (esito, scadenza)
+        self._esiti.move_to_end(chiave)
+        adesso = time.time()
+        while self._esiti:
+            _, (_, scadenza_primo) = next(iter(self._esiti.items()))
+            if len(self._esiti) <= self.massimo_esiti and scadenza_primo > adesso:
+                break
+            self._esiti.popitem(last=False)  # Oltre il limite, o scaduto: via il meno recente
+
+    def _leggi(self, chiave: tuple, adesso: float) -> Optional[str]:
+        # Da chiamare con il lock acquisito
+        valore = self._esiti.get(chiave)
+        if valore is None:
+            return None
+        if valore[1] <= adesso:
+            del self._esiti[chiave]
+            return None
+        self._esiti.move_to_end(chiave)
+        return valore[0]
+
+    def _leggi_repository(self, chiave: tuple, adesso: float) -> Optional[str]:
+        riga = self.repository.get(*chiave, adesso)
+        if riga is None:
+            return None
+        esito, scadenza = riga
+        with self._lock:
+            self._memorizza(chiave, esito, scadenza)
+            attesa = self._attese.get(chiave)
+        if attesa is not None:
+            with attesa[0]:
+                attesa[0].notify_all()
+        return esito
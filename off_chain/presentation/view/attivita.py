@@ -0,0 +1,113 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+from typing import Any, Callable, Optional
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from configuration.log_load_setting import logger
+
+
+# Le attività aspettano I/O (SQLite, nodo Ethereum) più che la CPU: anche su una macchina con un solo
+# core il pool deve poter eseguire insieme, ad esempio, il saldo dal nodo e una query
+THREAD_MINIMI = 4
+
+
+class _SegnaliAttivita(QObject):
+    # Creato nel thread della GUI: emesso dal thread del pool, il segnale arriva accodato nel thread della GUI
+    terminata = pyqtSignal(object, object, object)  # attività, risultato, eccezione
+
+
+class Attivita(QRunnable):
+    """Una chiamata bloccante (query, chiamata alla blockchain) eseguita in un thread del QThreadPool."""
+
+    def __init__(self, funzione: Callable, args: tuple, kwargs: dict, al_termine: Optional[Callable[[Any], None]],
+                 in_errore: Optional[Callable[[Exception], None]], chiave: Optional[str]):
+        super().__init__()
+        self.funzione = funzione
+        self.args = args
+        self.kwargs = kwargs
+        self.al_termine = al_termine
+        self.in_errore = in_errore
+        self.chiave = chiave
+        self.annullata = False
+        self.segnali = _SegnaliAttivita()
+
+    def run(self):
+        risultato, errore = None, None
+        if not self.annullata:
+            try:
+                risultato = self.funzione(*self.args, **self.kwargs)
+            except Exception as e:
+                errore = e
+        # Emesso anche se annullata, perché l'esecutore rilasci il riferimento
+        self.segnali.terminata.emit(self, risultato, errore)
+
+
+class EsecutoreAttivita(QObject):
+    """
+    Esegue le chiamate ai controller fuori dal thread della GUI e consegna il risultato (o l'eccezione)
+    alle callback nel thread della GUI, così la finestra si apre subito e si riempie man mano.
+
+    Un'attività avviata con una chiave sostituisce quella ancora in corso con la stessa chiave.
+    Se la precedente è già in esecuzione la sostituta parte solo quando quella termina: due attività
+    con la stessa chiave (ad esempio le pagine di una tabella, che usano lo stesso controller)
+    non sono mai eseguite insieme.
+    annulla() scarta le attività in corso, da chiamare quando la finestra viene chiusa.
+    """
+
+    def __init__(self, parent: QObject = None, pool: QThreadPool = None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        if self.pool.maxThreadCount() < THREAD_MINIMI:
+            self.pool.setMaxThreadCount(THREAD_MINIMI)
+        self._attive: dict[int, Attivita] = {}
+        self._in_attesa: dict[str, Attivita] = {}  # chiave -> sostituta in attesa che la precedente termini
+
+    def avvia(self, funzione: Callable, *args, al_termine: Callable[[Any], None] = None,
+              in_errore: Callable[[Exception], None] = None, chiave: str = None, **kwargs) -> Attivita:
+        attivita = Attivita(funzione, args, kwargs, al_termine, in_errore, chiave)
+        attivita.setAutoDelete(False)  # Il riferimento Python resta in _attive fino alla consegna
+        attivita.segnali.terminata.connect(self._consegna)
+        if chiave is not None:
+            self.annulla(chiave)
+            # Quelle rimaste in _attive con la stessa chiave sono già in esecuzione
+            if any(a.chiave == chiave for a in self._attive.values()):
+                self._in_attesa[chiave] = attivita
+                return attivita
+        self._avvia(attivita)
+        return attivita
+
+    def _avvia(self, attivita: Attivita) -> None:
+        self._attive[id(attivita)] = attivita
+        self.pool.start(attivita)
+
+    def annulla(self, chiave: str = None) -> None:
+        """Scarta le attività con la chiave indicata, o tutte: quelle non ancora partite non vengono eseguite."""
+        for chiave_attesa in list(self._in_attesa):
+            if chiave is None or chiave_attesa == chiave:
+                del self._in_attesa[chiave_attesa]
+        for attivita in list(self._attive.values()):
+            if chiave is None or attivita.chiave == chiave:
+                attivita.annullata = True
+                if self.pool.tryTake(attivita):
+                    del self._attive[id(attivita)]
+                # Se è già in esecuzione resta in _attive fino alla fine, ma il risultato viene scartato
+
+    def in_corso(self, chiave: str = None) -> bool:
+        return (any(chiave is None or c == chiave for c in self._in_attesa)
+                or any(not a.annullata and (chiave is None or a.chiave == chiave) for a in self._attive.values()))
+
+    def _consegna(self, attivita: Attivita, risultato, errore):
+        consegnata = self._attive.pop(id(attivita), None) is not None
+        if attivita.chiave is not None and attivita.chiave in self._in_attesa:
+            # La precedente con questa chiave è terminata: ora può partire la sostituta
+            self._avvia(self._in_attesa.pop(attivita.chiave))
+        if not consegnata or attivita.annullata:
+            return  # Attività annullata o sostituita: il risultato è ormai superato
+        if errore is None:
+            if attivita.al_termine is not None:
+                attivita.al_termine(risultato)
+        elif attivita.in_errore is not None:
+            attivita.in_errore(errore)
+        else:
+            logger.error(f"Errore nel caricamento in background ({getattr(attivita.funzione, '__qualname__', attivita.funzione)}): {errore}")
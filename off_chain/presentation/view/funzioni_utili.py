@@ -148,3 +148,4 @@ def config_menubar(self, stringa, img, _str2, tasti, menu_bar):
 def timeout():
     """Restituisce il timeout di inattività in millisecondi (30 minuti)"""
     return 30 * 60 * 1000  # 30 minuti in millisecondi
+
@@ -0,0 +1,196 @@
+# pylint: disable= no-name-in-module,
+# pylint: disable= import-error
+# pylint: disable= line-too-long
+# pylint: disable= trailing-whitespace
+# pylint: disable= invalid-name
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel, QTimer
+from model.pagina_model import Pagina
+from configuration.log_load_setting import logger
+
+
+@dataclass(slots=True)
+class Colonna:
+    """Una colonna della tabella: intestazione, valore letto dalla riga e, facoltativo, colore di sfondo."""
+    titolo: str
+    valore: Callable[[Any], Any]
+    sfondo: Optional[Callable[[Any], Any]] = None  # riga -> QColor, o None per lo sfondo normale
+
+
+def _chiave_ordinamento(valore):
+    # Numeri prima dei testi: una colonna non mescola mai tipi non confrontabili
+    if isinstance(valore, (int, float)):
+        return (0, valore)
+    return (1, str(valore))
+
+
+class ModelloTabellaPaginata(QAbstractTableModel):
+    """
+    Modello di tabella che legge le righe a pagine con carica_pagina(token) -> Pagina.
+    La vista chiede la pagina successiva (canFetchMore / fetchMore) solo quando viene scorsa fino in fondo,
+    e legge con data() solo le celle visibili: nessun widget viene creato per le righe.
+    Con un esecutore, carica_pagina viene chiamata fuori dal thread della GUI e non deve leggere widget.
+    """
+
+    def __init__(self, colonne: list[Colonna], carica_pagina: Callable[[Optional[str]], Pagina] = None, parent=None,
+                 esecutore=None):
+        super().__init__(parent)
+        self.colonne = colonne
+        self._carica_pagina = carica_pagina
+        self._esecutore = esecutore  # EsecutoreAttivita, o None per caricare nel thread della GUI
+        self._chiave = f"pagina-{id(self)}"
+        self._in_caricamento = False
+        self._caricate: list = []  # Nell'ordine di lettura
+        self._righe: list = []  # Nell'ordine mostrato
+        self._ordinamento = None  # (colonna, Qt.SortOrder) o None
+        self._token = None
+        self._altre_righe = carica_pagina is not None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._righe)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.colonne)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        colonna = self.colonne[index.column()]
+        if role == Qt.DisplayRole:
+            valore = colonna.valore(self._righe[index.row()])
+            return "" if valore is None else str(valore)
+        if role == Qt.BackgroundRole and colonna.sfondo is not None:
+            return colonna.sfondo(self._righe[index.row()])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.colonne[section].titolo
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._altre_righe and not self._in_caricamento
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        if self._esecutore is None:
+            self._aggiungi_pagina(self._carica_pagina(self._token))
+            return
+        self._in_caricamento = True
+        self._esecutore.avvia(self._carica_pagina, self._token, al_termine=self._aggiungi_pagina,
+                              in_errore=self._errore_pagina, chiave=self._chiave)
+
+    def _errore_pagina(self, errore):
+        logger.error(f"Errore nel caricamento di una pagina della tabella: {errore}")
+        self._in_caricamento = False
+        self._altre_righe = False
+
+    def _aggiungi_pagina(self, pagina: Pagina):
+        self._in_caricamento = False
+        self._token = pagina.token_successivo
+        self._altre_righe = not pagina.ultima
+        if pagina.elementi:
+            inizio = len(self._righe)
+            self.beginInsertRows(QModelIndex(), inizio, inizio + len(pagina.elementi) - 1)
+            self._caricate.extend(pagina.elementi)
+            self._righe.extend(pagina.elementi)
+            self.endInsertRows()
+            if self._ordinamento is not None:
+                self._ordina()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """
+        Ordina le righe caricate calcolando una chiave per riga in Python, invece di far confrontare a Qt
+        ogni coppia di righe con data(). Valori mancanti in fondo; colonna -1 torna all'ordine di lettura.
+        """
+        self._ordinamento = None if column < 0 else (column, order)
+        self._ordina()
+
+    def _ordina(self):
+        righe = self._caricate
+        if self._ordinamento is not None:
+            colonna, ordine = self._ordinamento
+            valori = [self.colonne[colonna].valore(r) for r in righe]
+            presenti = sorted((i for i, v in enumerate(valori) if v is not None),
+                              key=lambda i: _chiave_ordinamento(valori[i]), reverse=ordine == Qt.DescendingOrder)
+            righe = [righe[i] for i in presenti] + [r for r, v in zip(righe, valori) if v is None]
+
+        self.layoutAboutToBeChanged.emit()
+        # Selezione e indici persistenti seguono le righe nella nuova posizione
+        nuova_posizione = {id(r): i for i, r in enumerate(righe)}
+        vecchi = self.persistentIndexList()
+        nuovi = [self.index(nuova_posizione[id(self._righe[i.row()])], i.column()) for i in vecchi]
+        self._righe = list(righe)
+        self.changePersistentIndexList(vecchi, nuovi)
+        self.layoutChanged.emit()
+
+    def riga(self, indice: int):
+        """Oggetto nella riga indicata del modello (prima del filtro del proxy)."""
+        return self._righe[indice]
+
+    def imposta_righe(self, righe: list):
+        """Mostra una lista già completa, senza pagine successive."""
+        if self._esecutore is not None:
+            self._esecutore.annulla(self._chiave)
+        self._in_caricamento = False
+        self.beginResetModel()
+        self._caricate = list(righe)
+        self._righe = list(righe)
+        self._carica_pagina = None
+        self._token = None
+        self._altre_righe = False
+        self.endResetModel()
+
+    def ricarica(self, carica_pagina: Callable[[Optional[str]], Pagina] = None):
+        """Svuota il modello e riparte dalla prima pagina, eventualmente di un'altra sorgente."""
+        if self._esecutore is not None:
+            # La pagina in arrivo appartiene al caricamento precedente; se è ancora in lettura,
+            # la prima pagina nuova parte solo quando quella termina (stessa chiave)
+            self._esecutore.annulla(self._chiave)
+        self._in_caricamento = False
+        self.beginResetModel()
+        if carica_pagina is not None:
+            self._carica_pagina = carica_pagina
+        self._caricate = []
+        self._righe = []
+        self._token = None
+        self._altre_righe = self._carica_pagina is not None
+        self.endResetModel()
+
+
+class ProxyTabella(QSortFilterProxyModel):
+    """
+    Nasconde le righe per cui il predicato impostato con imposta_filtro() è falso.
+    L'ordinamento chiesto dalla vista è passato al modello sorgente (vedi ModelloTabellaPaginata.sort).
+    """
+
+    def __init__(self, modello: ModelloTabellaPaginata, parent=None):
+        super().__init__(parent)
+        self._predicato = None
+        self.setSourceModel(modello)
+
+    def imposta_filtro(self, predicato: Callable[[Any], bool] = None):
+        self._predicato = predicato
+        self.invalidate()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self._predicato is None or self._predicato(self.sourceModel().riga(source_row))
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+    def riga(self, indice: int):
+        """Oggetto mostrato nella riga indicata della vista (dopo filtro e ordinamento)."""
+        return self.sourceModel().riga(self.mapToSource(self.index(indice, 0)).row())
+
+
+def collega_filtro_ritardato(campo, applica: Callable[[], None], ritardo_ms: int = 250) -> QTimer:
+    """Chiama applica() quando l'utente smette di scrivere in campo per ritardo_ms, non a ogni tasto."""
+    timer = QTimer(campo)
+    timer.setSingleShot(True)
+    timer.setInterval(ritardo_ms)
+    timer.timeout.connect(applica)
+    campo.textChanged.connect(lambda _testo: timer.start())
+    return timer
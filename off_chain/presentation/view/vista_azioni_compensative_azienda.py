@@ -16,6 +16,7 @@ from presentation.controller.company_controller import ControllerAzienda
 from presentation.controller.blockchain_controller import BlockchainController
 from presentation.view.vista_aggiungi_az_compensativa import VistaAggiungiAzioneCompensativa
 from session import Session
+from configuration.database import Database
 
 
 class AzioniAziendaView(QWidget):
@@ -193,23 +194,12 @@ class AzioniAziendaView(QWidget):
             if esito:
                 # Aggiorna il database direttamente
                 try:
-                    # Importa le dipendenze necessarie
-                    import sqlite3
-                    import os
-                    
-                    # Ottieni il percorso del database
-                    PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
-                    DATABASE_PATH = os.path.join(PROJECT_ROOT, 'off_chain', 'database', 'database.db')
-                    
                     # Aggiorna il flag blockchain_registered nel database
-                    conn = sqlite3.connect(DATABASE_PATH)
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "UPDATE Azioni_compensative SET blockchain_registered = 1 WHERE Id_azione = ?",
-                        (azione.id_azione,)
-                    )
-                    conn.commit()
-                    conn.close()
+                    with Database().scrittura() as cursor:
+                        cursor.execute(
+                            "UPDATE Azioni_compensative SET blockchain_registered = 1 WHERE Id_azione = ?",
+                            (azione.id_azione,)
+                        )
                     
                     QMessageBox.information(
                         self,
@@ -11,6 +11,7 @@ from PyQt5.QtCore import Qt
 from model.certification_model import CertificationModel
 from persistence.repository_impl.product_repository_impl import ProductRepositoryImpl
 from presentation.controller.guest_controller import ControllerGuest
+from presentation.view.attivita import EsecutoreAttivita
 
 
 class LottoTreeView(QMainWindow):
@@ -62,11 +63,37 @@ class LottoTreeView(QMainWindow):
         container.setLayout(layout)
         self.setCentralWidget(container)
 
-        self.carica_albero_lotti(self.lotto_id, self.tree.invisibleRootItem())
-        self.carica_certificazioni_lotto()
+        # Catena e certificazioni vengono lette in parallelo, fuori dal thread della GUI:
+        # la finestra si apre subito e ciascuna sezione si riempie appena il suo caricamento termina
+        self.lotto = None
+        self.esecutore = EsecutoreAttivita(self)
+        self.tree.addTopLevelItem(QTreeWidgetItem(["Caricamento...", "", "", "", ""]))
+        self.certificazioni_list.addItem(QListWidgetItem("Caricamento..."))
+        # Il grafo della catena viene caricato una sola volta e riusato per il rendering
+        self.esecutore.avvia(self.manager.carica_lotto_con_composizione, self.lotto_id,
+                             al_termine=self.mostra_albero_lotti, in_errore=self.errore_albero_lotti)
+        self.esecutore.avvia(self.controller.get_certificazioni_by_lotto, self.lotto_id,
+                             al_termine=self.carica_certificazioni_lotto, in_errore=self.errore_certificazioni)
+
+    def closeEvent(self, event):
+        # I caricamenti ancora in corso non servono più
+        self.esecutore.annulla()
+        super().closeEvent(event)
+
+    def mostra_albero_lotti(self, lotto):
+        self.lotto = lotto
+        self.tree.clear()
+        self.carica_albero_lotti(self.lotto, self.tree.invisibleRootItem())
+
+    def errore_albero_lotti(self, errore):
+        self.tree.clear()
+        self.tree.addTopLevelItem(QTreeWidgetItem([f"Errore nel caricamento della catena: {errore}", "", "", "", ""]))
+
+    def errore_certificazioni(self, errore):
+        self.certificazioni_list.clear()
+        self.certificazioni_list.addItem(QListWidgetItem(f"Errore nel caricamento delle certificazioni: {errore}"))
 
-    def carica_albero_lotti(self, id_lotto, parent_item, quantita_usata=""):
-        lotto = self.manager.carica_lotto_con_composizione(id_lotto)
+    def carica_albero_lotti(self, lotto, parent_item, quantita_usata=""):
         if not lotto:
             item = QTreeWidgetItem(["[Lotto non trovato]", "", "", "", ""])
             parent_item.addChild(item)
@@ -86,10 +113,10 @@ class LottoTreeView(QMainWindow):
         parent_item.addChild(item)
 
         for comp in lotto.composizione:
-            self.carica_albero_lotti(comp.id_lotto_input, item, comp.quantita_utilizzata)
+            self.carica_albero_lotti(comp.lotto_input, item, comp.quantita_utilizzata)
 
     def aggiorna_campo_consumo_unitario(self):
-        lotto = self.manager.carica_lotto_con_composizione(self.lotto_id)
+        lotto = self.lotto
         if lotto:
             try:
                 consumo_unitario = lotto.get_costo_totale_lotto_unitario()
@@ -99,8 +126,7 @@ class LottoTreeView(QMainWindow):
         else:
             self.co2_unit_field.setText("Lotto non trovato")
 
-    def carica_certificazioni_lotto(self):
-        certificati : list[CertificationModel]= self.controller.get_certificazioni_by_lotto(self.lotto_id)
+    def carica_certificazioni_lotto(self, certificati: list[CertificationModel]):
         self.certificazioni_list.clear()
 
         if not certificati:
@@ -4,28 +4,48 @@
 # pylint: disable= trailing-whitespace
 import datetime
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QLineEdit, QTableWidget, QTableWidgetItem,
+    QWidget, QVBoxLayout, QLabel, QLineEdit, QTableView,
     QHeaderView, QPushButton, QHBoxLayout, QMessageBox, QInputDialog
 )
 from PyQt5.QtGui import QColor
-from model.operation_estesa_model import OperazioneEstesaModel 
 from presentation.view.vista_composizione_prodotto import VistaCreaProdottoTrasformato
 from presentation.controller.company_controller import ControllerAzienda
 from presentation.view.vista_aggiungi_operazione import AggiungiOperazioneView
 from presentation.controller.blockchain_controller import BlockchainController
+from presentation.view.modello_tabella import Colonna, ModelloTabellaPaginata, ProxyTabella, collega_filtro_ritardato
+from presentation.view.attivita import EsecutoreAttivita
 from session import Session
 
 
+def formatta_data(operazione) -> str:
+    data = operazione.data_operazione
+    if not data:
+        return 'N/A'
+    if isinstance(data, (datetime.datetime, datetime.date)):
+        return data.strftime('%d/%m/%Y')
+    return str(data)
+
+
 class OperazioniAziendaView(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.id_azienda : int = Session().current_user["id_azienda"]
         self.role = Session().current_user["role"]
         self.controller = ControllerAzienda()
-        
-
-        self.operazioni : list[OperazioneEstesaModel]= self.controller.lista_operazioni(self.id_azienda)
-        self.operazioni_filtrate = self.operazioni.copy()
+        self.testo_filtro = ""
+        self.esecutore = EsecutoreAttivita(self)
+
+        # Le operazioni vengono caricate a pagine, la successiva quando la tabella arriva in fondo,
+        # fuori dal thread della GUI
+        self.modello = ModelloTabellaPaginata([
+            Colonna("Tipo", lambda op: op.nome_operazione),
+            Colonna("Data", formatta_data),
+            Colonna("Prodotto", lambda op: op.nome_prodotto),
+            Colonna("CO2", lambda op: op.consumo_co2),
+            Colonna("Su Blockchain", lambda op: "Sì" if op.blockchain_registered else "No",
+                    sfondo=lambda op: QColor(200, 255, 200) if op.blockchain_registered else QColor(255, 200, 200)),
+        ], self.pagina_operazioni, self, self.esecutore)
+        self.proxy = ProxyTabella(self.modello, self)
 
         self.init_ui()
 
@@ -36,19 +56,19 @@ class OperazioniAziendaView(QWidget):
 
         self.filtro_input = QLineEdit()
         self.filtro_input.setPlaceholderText("Filtra operazioni...")
-        self.filtro_input.textChanged.connect(self.filtra_operazioni)
+        collega_filtro_ritardato(self.filtro_input, self.filtra_operazioni)
         layout.addWidget(self.filtro_input)
 
-        self.tabella = QTableWidget()
-        self.tabella.setColumnCount(5)  # Aggiunto una colonna per lo stato blockchain
-        self.tabella.setHorizontalHeaderLabels(["Tipo", "Data", "Prodotto", "CO2", "Su Blockchain"])
+        self.tabella = QTableView()
+        self.tabella.setModel(self.proxy)
         self.tabella.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.tabella.setSelectionBehavior(QTableView.SelectRows)
+        self.tabella.setEditTriggers(QTableView.NoEditTriggers)
         self.tabella.setSortingEnabled(True)
 
         layout.addWidget(self.tabella)
         self.setLayout(layout)
 
-        self.aggiorna_tabella()
         self.setWindowTitle("Operazioni Azienda")
 
         # Crea un layout orizzontale per i bottoni
@@ -68,53 +88,22 @@ class OperazioniAziendaView(QWidget):
         # Aggiungi il layout dei bottoni al layout principale
         layout.addLayout(button_layout)
 
-    def filtra_operazioni(self, testo):
-        try:
-            testo = testo.strip()
-        except Exception as err :
-            print(f"Errore durante il filtraggio delle operazioni: {err}")
-            return
-        if isinstance(testo, str):
-
-            testo = testo.lower()
-            self.operazioni_filtrate = [
-                op for op in self.operazioni
-                if testo in op.nome_operazione.lower() or testo in op.nome_prodotto.lower()
-            ]
-            self.aggiorna_tabella()
+    def closeEvent(self, event):
+        self.esecutore.annulla()
+        super().closeEvent(event)
 
-    def aggiorna_tabella(self):
-        self.tabella.setRowCount(len(self.operazioni_filtrate))
+    def pagina_operazioni(self, token):
+        # Eseguita nel thread del pool: legge il testo salvato da filtra_operazioni, non il widget
+        testo = self.testo_filtro
+        if testo:
+            # Ricerca sull'indice full-text di tutte le operazioni dell'azienda, non solo su quelle caricate
+            return self.controller.cerca_operazioni(self.id_azienda, testo, token)
+        return self.controller.pagina_operazioni(self.id_azienda, token)
 
-        for row, oper in enumerate(self.operazioni_filtrate):
-            # Colonna Tipo Operazione
-            self.tabella.setItem(row, 0, QTableWidgetItem(oper.nome_operazione))
-            
-            # Colonna Data
-            data_str = 'N/A'
-            if hasattr(oper, 'data_operazione') and oper.data_operazione:
-                if isinstance(oper.data_operazione, datetime.datetime) or isinstance(oper.data_operazione, datetime.date):
-                    data_str = oper.data_operazione.strftime('%d/%m/%Y')
-                else:
-                    data_str = str(oper.data_operazione)
-            self.tabella.setItem(row, 1, QTableWidgetItem(data_str))
-            
-            # Colonna Prodotto
-            self.tabella.setItem(row, 2, QTableWidgetItem(oper.nome_prodotto if hasattr(oper, 'nome_prodotto') else ''))
-            
-            # Colonna CO2
-            co2_str = str(oper.consumo_co2) if hasattr(oper, 'consumo_co2') else ''
-            self.tabella.setItem(row, 3, QTableWidgetItem(co2_str))
-            
-            # Colonna Stato Blockchain
-            blockchain_status = "Sì" if hasattr(oper, 'blockchain_registered') and oper.blockchain_registered else "No"
-            item = QTableWidgetItem(blockchain_status)
-            # Imposta il colore di sfondo in base allo stato
-            if blockchain_status == "Sì":
-                item.setBackground(QColor(200, 255, 200))  # Verde chiaro
-            else:
-                item.setBackground(QColor(255, 200, 200))  # Rosso chiaro
-            self.tabella.setItem(row, 4, item)
+    def filtra_operazioni(self):
+        # Il modello riparte dalla prima pagina della nuova ricerca
+        self.testo_filtro = self.filtro_input.text().strip()
+        self.modello.ricarica()
 
     def apri_aggiungi_operazione(self):
         if Session().current_user["role"] == "Trasformatore":
@@ -128,21 +117,17 @@ class OperazioniAziendaView(QWidget):
 
 
     def ricarica_operazioni(self):
-        self.operazioni = self.controller.lista_operazioni(self.id_azienda)
-        self.filtra_operazioni(self.filtro_input.text())
+        self.modello.ricarica()
         
     def deploy_operazione_blockchain(self):
         # Verifica se è stata selezionata un'operazione
-        selected_items = self.tabella.selectedItems()
-        if not selected_items:
+        selected_rows = self.tabella.selectionModel().selectedRows()
+        if not selected_rows:
             QMessageBox.warning(self, "Nessuna selezione", "Seleziona un'operazione dalla tabella prima di procedere.")
             return
         
-        # Ottieni la riga selezionata
-        selected_row = selected_items[0].row()
-        
         # Recupera l'operazione selezionata
-        operazione = self.operazioni_filtrate[selected_row]
+        operazione = self.proxy.riga(selected_rows[0].row())
         
         # Verifica se l'operazione è già registrata sulla blockchain
         if operazione.blockchain_registered:
@@ -179,12 +164,8 @@ class OperazioniAziendaView(QWidget):
 
             )
 
-            if esito:                 
-                                      
-                    # Aggiorna lo stato dell'operazione nella tabella
-                operazione.blockchain_registered = True
-                self.aggiorna_tabella()
-                # Ricarica le operazioni per mostrare lo stato aggiornato
+            if esito:
+                # Le righe sono in sola lettura (OperazioneEstesaRiga): la ricarica mostra lo stato aggiornato
                 self.ricarica_operazioni()
                 
             
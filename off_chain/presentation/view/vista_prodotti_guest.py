@@ -2,11 +2,14 @@
 # pylint: disable= import-error
 # pylint: disable= line-too-long
 # pylint: disable= trailing-whitespace
+from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget,
-    QTableWidgetItem, QLabel, QHeaderView, QComboBox, QMessageBox
+    QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableView,
+    QLabel, QHeaderView, QComboBox, QMessageBox
 )
 from presentation.view.vista_catena_prodotto import LottoTreeView
+from presentation.view.modello_tabella import Colonna, ModelloTabellaPaginata, ProxyTabella, collega_filtro_ritardato
+from presentation.view.attivita import EsecutoreAttivita
 from presentation.controller.guest_controller import ControllerGuest
 from model.prodotto_finito_cliente import ProdottoFinito
 
@@ -16,11 +19,40 @@ class ProdottiFinitiView(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.controller = ControllerGuest()
-        self.prodotti : list[ProdottoFinito]= self.controller.get_prodotti()  # Tutti i prodotti
-        self.prodotti_filtrati = self.prodotti.copy()  # Quelli attualmente visibili
+        self.esecutore = EsecutoreAttivita(self)
+        self.prodotti : list[ProdottoFinito] = []
+        self.testo_ricerca = ""
+
+        # Senza ricerca mostra il catalogo completo; con una ricerca ne legge i risultati a pagine
+        self.modello = ModelloTabellaPaginata([
+            Colonna("Nome", lambda p: p.nome),
+            Colonna("Numero Lotto", lambda p: p.numero_lotto),
+            Colonna("Nome Azienda", lambda p: p.nome_azienda),
+            Colonna("CO₂ Unitaria", lambda p: p.co2_unitaria),
+        ], parent=self, esecutore=self.esecutore)
+        # Filtro e ordinamento avvengono nel proxy: le righe non vengono ricreate
+        self.proxy = ProxyTabella(self.modello, self)
 
         self.init_ui()
 
+        # Tutti i prodotti, con la CO2 già letta dal catalogo: l'ordinamento non richiede altre query.
+        # Il catalogo arriva dopo l'apertura della vista
+        self.esecutore.avvia(self.controller.get_catalogo_co2, al_termine=self.mostra_catalogo,
+                             in_errore=self.errore_catalogo)
+
+    def closeEvent(self, event):
+        self.esecutore.annulla()
+        super().closeEvent(event)
+
+    def mostra_catalogo(self, prodotti: list[ProdottoFinito]):
+        self.prodotti = prodotti
+        if not self.testo_ricerca:  # Con una ricerca in corso la tabella mostra i suoi risultati
+            self.modello.imposta_righe(self.prodotti)
+            self.applica_ordinamento()
+
+    def errore_catalogo(self, errore):
+        QMessageBox.warning(self, "Errore", f"Impossibile caricare i prodotti: {errore}")
+
     def init_ui(self):
         self.setWindowTitle("Visualizza Prodotti Finiti")
         layout = QVBoxLayout()
@@ -30,19 +62,19 @@ class ProdottiFinitiView(QWidget):
 
         self.input_nome = QLineEdit()
         self.input_nome.setPlaceholderText("Filtra per nome...")
-        self.input_nome.textChanged.connect(self.applica_filtri)  # Ricerca live
+        collega_filtro_ritardato(self.input_nome, self.applica_filtri)  # Ricerca quando si smette di scrivere
         filtro_layout.addWidget(QLabel("Nome:"))
         filtro_layout.addWidget(self.input_nome)
 
         self.input_lotto = QLineEdit()
         self.input_lotto.setPlaceholderText("Filtra per numero di lotto...")
-        self.input_lotto.textChanged.connect(self.applica_filtri)  # Ricerca live
+        collega_filtro_ritardato(self.input_lotto, self.applica_filtri)
         filtro_layout.addWidget(QLabel("Numero Lotto:"))
         filtro_layout.addWidget(self.input_lotto)
 
         self.ordina_combo = QComboBox()
         self.ordina_combo.addItems(["Nessun Ordinamento", "CO₂ Crescente", "CO₂ Decrescente"])
-        self.ordina_combo.currentIndexChanged.connect(self.applica_filtri)  # Cambia ordinamento live
+        self.ordina_combo.currentIndexChanged.connect(self.applica_ordinamento)  # Cambia ordinamento live
         filtro_layout.addWidget(QLabel("Ordina:"))
         filtro_layout.addWidget(self.ordina_combo)
 
@@ -53,56 +85,53 @@ class ProdottiFinitiView(QWidget):
         layout.addLayout(filtro_layout)
 
         # --- Tabella ---
-        self.tabella = QTableWidget()
-        self.tabella.setColumnCount(3)
-        self.tabella.setHorizontalHeaderLabels(["Nome", "Numero Lotto", "Nome Azienda"])
+        self.tabella = QTableView()
+        self.tabella.setModel(self.proxy)
         self.tabella.horizontalHeader().setStretchLastSection(True)
         self.tabella.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.tabella.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.tabella.cellDoubleClicked.connect(self.mostra_dettagli_prodotto)
+        self.tabella.setSelectionBehavior(QTableView.SelectRows)
+        self.tabella.setEditTriggers(QTableView.NoEditTriggers)
+        self.tabella.doubleClicked.connect(self.mostra_dettagli_prodotto)
 
         layout.addWidget(self.tabella)
 
         self.setLayout(layout)
         self.resize(900, 600)
 
-        # Carica iniziale
-        self.aggiorna_tabella()
-
-    def aggiorna_tabella(self):
-        self.tabella.setRowCount(len(self.prodotti_filtrati))
-
-        for row, prodotto in enumerate(self.prodotti_filtrati):
-            if isinstance(prodotto, ProdottoFinito):
-                self.tabella.setItem(row, 0, QTableWidgetItem(prodotto.nome))
-                self.tabella.setItem(row, 1, QTableWidgetItem(str(prodotto.numero_lotto)))
-                self.tabella.setItem(row, 2, QTableWidgetItem(f"{prodotto.nome_azienda}"))
-
     def applica_filtri(self):
-        nome_filtro = self.input_nome.text().lower()
+        nome_filtro = self.input_nome.text().strip()
         lotto_filtro = self.input_lotto.text().lower()
-        
-
-        # Filtra
-        self.prodotti_filtrati = [
-            p for p in self.prodotti
-            
-            if nome_filtro in p.nome.lower() and lotto_filtro in p.numero_lotto.lower()
-        ]
-
-
 
-        self.aggiorna_tabella()
+        if nome_filtro != self.testo_ricerca:
+            self.testo_ricerca = nome_filtro
+            if nome_filtro:
+                # Il nome è cercato nell'indice full-text (prefissi di parola) sui lotti in vendita:
+                # la tabella riparte dalla prima pagina dei risultati, le successive quando viene scorsa
+                self.modello.ricarica(lambda token: self.controller.cerca_prodotti(nome_filtro, token))
+            else:
+                self.modello.imposta_righe(self.prodotti)
+            self.applica_ordinamento()
+
+        self.proxy.imposta_filtro((lambda p: lotto_filtro in str(p.numero_lotto)) if lotto_filtro else None)
+
+    def applica_ordinamento(self):
+        # Ordina per CO₂ unitaria, già presente su ogni prodotto
+        indice = self.ordina_combo.currentIndex()
+        if indice == 0:
+            self.proxy.sort(-1)  # Ordine del catalogo
+        else:
+            self.proxy.sort(3, Qt.AscendingOrder if indice == 1 else Qt.DescendingOrder)
 
     def reset_filtri(self):
         self.input_nome.clear()
         self.input_lotto.clear()
         self.ordina_combo.setCurrentIndex(0)
-        self.prodotti_filtrati = self.prodotti.copy()
-        self.aggiorna_tabella()
+        self.testo_ricerca = ""
+        self.modello.imposta_righe(self.prodotti)
+        self.proxy.imposta_filtro(None)
 
-    def mostra_dettagli_prodotto(self, row):
-        prodotto = self.prodotti_filtrati[row]
+    def mostra_dettagli_prodotto(self, indice):
+        prodotto = self.proxy.riga(indice.row())
 
         if not isinstance(prodotto, ProdottoFinito):
             QMessageBox.warning(self, "Errore", "Dettagli non disponibili per questo prodotto.")
@@ -4,26 +4,46 @@
 # pylint: disable= trailing-whitespace
 
 from PyQt5.QtWidgets import (
-    QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+    QDialog, QVBoxLayout, QHBoxLayout, QTableView,
     QPushButton, QMessageBox, QGroupBox, QHeaderView , QInputDialog
 )
 
 from presentation.controller.company_controller import ControllerAzienda
 from presentation.view.vista_richiesta_prodotto import RichiestaProdottoView
+from presentation.view.modello_tabella import Colonna, ModelloTabellaPaginata, ProxyTabella
+from presentation.view.attivita import EsecutoreAttivita
 from session import Session
-from model.richiesta_model import RichiestaModel
+
+
+def colonne_richieste(nome_azienda) -> list[Colonna]:
+    return [
+        Colonna("Azienda Destinataria", nome_azienda),
+        Colonna("Prodotto", lambda r: r.nome_prodotto),
+        Colonna("Quantità", lambda r: r.quantita),
+        Colonna("Stato Ricevente", lambda r: r.stato_ricevente),
+        Colonna("Stato Trasportatore", lambda r: r.stato_trasportatore),
+        Colonna("Data", lambda r: r.data),
+    ]
 
 
 class VisualizzaRichiesteView(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.controller = ControllerAzienda()
+        self.esecutore = EsecutoreAttivita(self)
+        # Chiusa la finestra, le pagine ancora in lettura vengono scartate
+        self.finished.connect(lambda _esito: self.esecutore.annulla())
 
-    
+        # Le richieste vengono lette a pagine, quando la tabella viene scorsa, fuori dal thread della GUI
+        self.modello_ricevute = ModelloTabellaPaginata(
+            colonne_richieste(lambda r: r.nome_azienda_richiedente), self.controller.pagina_richieste_ricevute, self,
+            self.esecutore)
+        self.proxy_ricevute = ProxyTabella(self.modello_ricevute, self)
 
-        self.richieste_ricevute: list[RichiestaModel] = self.controller.get_richieste_ricevute()
-
-        self.richieste_effettuate: list[RichiestaModel] = self.controller.get_richieste_effettuate()
+        self.modello_effettuate = ModelloTabellaPaginata(
+            colonne_richieste(lambda r: r.nome_azienda_ricevente), self.controller.pagina_richieste_effettuate, self,
+            self.esecutore)
+        self.proxy_effettuate = ProxyTabella(self.modello_effettuate, self)
 
         self.init_ui()
 
@@ -37,14 +57,12 @@ class VisualizzaRichiesteView(QDialog):
             group_ricevute = QGroupBox("Richieste Ricevute")
             layout_ricevute = QVBoxLayout()
 
-            self.tabella_ricevute = QTableWidget()
-            self.tabella_ricevute.setColumnCount(6)  # 6 colonne!
-            self.tabella_ricevute.setHorizontalHeaderLabels([
-                "Azienda Destinataria", "Prodotto", "Quantità", "Stato Ricevente", "Stato Trasportatore", "Data"
-            ])
-            self.tabella_ricevute.setSelectionBehavior(QTableWidget.SelectRows)
-            self.tabella_ricevute.setSelectionMode(QTableWidget.SingleSelection)
-            self.tabella_ricevute.setEditTriggers(QTableWidget.NoEditTriggers)
+            self.tabella_ricevute = QTableView()
+            self.tabella_ricevute.setModel(self.proxy_ricevute)
+            self.tabella_ricevute.setSortingEnabled(True)
+            self.tabella_ricevute.setSelectionBehavior(QTableView.SelectRows)
+            self.tabella_ricevute.setSelectionMode(QTableView.SingleSelection)
+            self.tabella_ricevute.setEditTriggers(QTableView.NoEditTriggers)
             self.tabella_ricevute.horizontalHeader().setStretchLastSection(True)  # Fa allungare l'ultima colonna
             self.tabella_ricevute.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
             # Auto resize
@@ -68,12 +86,10 @@ class VisualizzaRichiesteView(QDialog):
             group_effettuate = QGroupBox("Richieste Effettuate")
             layout_effettuate = QVBoxLayout()
 
-            self.tabella_effettuate = QTableWidget()
-            self.tabella_effettuate.setColumnCount(6)  # 6 colonne!
-            self.tabella_effettuate.setHorizontalHeaderLabels([
-                "Azienda Destinataria", "Prodotto", "Quantità", "Stato Ricevente", "Stato Trasportatore", "Data"
-            ])
-            self.tabella_effettuate.setEditTriggers(QTableWidget.NoEditTriggers)
+            self.tabella_effettuate = QTableView()
+            self.tabella_effettuate.setModel(self.proxy_effettuate)
+            self.tabella_effettuate.setSortingEnabled(True)
+            self.tabella_effettuate.setEditTriggers(QTableView.NoEditTriggers)
             self.tabella_effettuate.horizontalHeader().setStretchLastSection(True)
             self.tabella_ricevute.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
             self.tabella_effettuate.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
@@ -83,39 +99,21 @@ class VisualizzaRichiesteView(QDialog):
 
             group_effettuate.setLayout(layout_effettuate)
             layout.addWidget(group_effettuate)
-            self.carica_effettuate()
         
         
 
             self.bottone_aggiungi = QPushButton("Invia Richiesta")
             self.bottone_aggiungi.clicked.connect(self.apri_invia_richiesta)
             layout.addWidget(self.bottone_aggiungi)
-        
-        self.carica_ricevute()
 
         self.setLayout(layout)
         self.resize(1000, 700)
 
     def carica_ricevute(self):
-        self.tabella_ricevute.setRowCount(len(self.richieste_ricevute))
-        for row, richiesta in enumerate(self.richieste_ricevute):
-            self.tabella_ricevute.setItem(row, 0, QTableWidgetItem(richiesta.nome_azienda_richiedente))
-            self.tabella_ricevute.setItem(row, 1, QTableWidgetItem(richiesta.nome_prodotto))
-            self.tabella_ricevute.setItem(row, 2, QTableWidgetItem(str(richiesta.quantita)))
-            self.tabella_ricevute.setItem(row, 3, QTableWidgetItem(richiesta.stato_ricevente))
-            self.tabella_ricevute.setItem(row, 4, QTableWidgetItem(richiesta.stato_trasportatore))
-            self.tabella_ricevute.setItem(row, 5, QTableWidgetItem(str(richiesta.data)))
+        self.modello_ricevute.ricarica()
 
     def carica_effettuate(self):
-        self.richieste_effettuate = self.controller.get_richieste_effettuate()
-        self.tabella_effettuate.setRowCount(len(self.richieste_effettuate))
-        for row, richiesta in enumerate(self.richieste_effettuate):
-            self.tabella_effettuate.setItem(row, 0, QTableWidgetItem(richiesta.nome_azienda_ricevente))
-            self.tabella_effettuate.setItem(row, 1, QTableWidgetItem(richiesta.nome_prodotto))
-            self.tabella_effettuate.setItem(row, 2, QTableWidgetItem(str(richiesta.quantita)))
-            self.tabella_effettuate.setItem(row, 3, QTableWidgetItem(richiesta.stato_ricevente))
-            self.tabella_effettuate.setItem(row, 4, QTableWidgetItem(richiesta.stato_trasportatore))
-            self.tabella_effettuate.setItem(row, 5, QTableWidgetItem(str(richiesta.data)))
+        self.modello_effettuate.ricarica()
 
 
     def accetta_richiesta(self):
@@ -125,12 +123,12 @@ class VisualizzaRichiesteView(QDialog):
         self._gestisci_richiesta("Rifiutata")
 
     def _gestisci_richiesta(self, nuovo_stato):
-        row = self.tabella_ricevute.currentRow()
-        if row == -1:
+        indice = self.tabella_ricevute.currentIndex()
+        if not indice.isValid():
             QMessageBox.warning(self, "Attenzione", "Seleziona una richiesta.")
             return
 
-        richiesta = self.richieste_ricevute[row]
+        richiesta = self.proxy_ricevute.riga(indice.row())
 
         if Session().current_user["role"] == "Trasportatore":
 
@@ -12,6 +12,7 @@ from session import Session
 
 from presentation.controller.credential_controller import ControllerAutenticazione
 from presentation.view import funzioni_utili
+from presentation.view.attivita import EsecutoreAttivita
 from presentation.view.vista_cambia_password import VistaCambiaPassword
 
 
@@ -27,7 +28,7 @@ class VistaStatoAzienda(QMainWindow):
         self.callback = callback
         self.controller = ControllerAutenticazione()
         azienda : CompanyModel = self.controller.get_user()
-        address = self.controller.blockchainconroller.get_address()
+        self.esecutore = EsecutoreAttivita(self)
         
 
         # Elementi di layout
@@ -41,7 +42,7 @@ class VistaStatoAzienda(QMainWindow):
         self.tipo_input = QLineEdit(str(azienda.tipo))
 
         self.addresslabel = QLabel("Indirizzo Blockchain")
-        self.addressinput = QLineEdit(str(address))
+        self.addressinput = QLineEdit("Caricamento...")
 
         self.co2_consumata_totale_label = QLabel("CO2 consumata totale")
         self.co2_consumata_totale_input = QLineEdit(str(azienda.co2_consumata))
@@ -50,8 +51,7 @@ class VistaStatoAzienda(QMainWindow):
         self.co2_risparmiata_totale_input = QLineEdit(str(azienda.co2_compensata)) 
 
         self.token_label = QLabel("Token accumulati")
-        token_balance = self.controller.blockchainconroller.get_my_token_balance()
-        self.token_label_input = QLineEdit(str(token_balance))
+        self.token_label_input = QLineEdit("Caricamento...")
 
         self.cambia_password_button = QPushButton('Cambia password')
         self.cambia_password_button.clicked.connect(self.apri_cambia_password)
@@ -59,11 +59,23 @@ class VistaStatoAzienda(QMainWindow):
         self.setWindowIcon(QIcon("presentation\\resources\\logo_centro.png"))
 
         self.init_ui()
+
+        # Indirizzo e saldo (una eth_call al nodo) arrivano dopo l'apertura della finestra;
+        # il certificatore non li vede e non vengono letti
+        if Session().current_user["role"] != "Certificatore":
+            blockchain = self.controller.blockchainconroller
+            self.esecutore.avvia(blockchain.get_address,
+                                 al_termine=lambda address: self.addressinput.setText(str(address)),
+                                 in_errore=lambda e: self.addressinput.setText("Non disponibile"))
+            self.esecutore.avvia(blockchain.get_my_token_balance,
+                                 al_termine=lambda saldo: self.token_label_input.setText(str(saldo)),
+                                 in_errore=lambda e: self.token_label_input.setText("Non disponibile"))
         
     def closeEvent(self, event):
         """
         Override the close event to emit the closed signal
         """
+        self.esecutore.annulla()
         self.closed.emit()
         super().closeEvent(event)
 
@@ -1,10 +1,61 @@
-# Add the project root to Python path for imports
+import contextlib
+import io
 import os
+import shutil
 import sys
 
+import pytest
+
+# Add the project root to Python path for imports
 # Get the absolute path to the project root
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
 # Add the project root to Python path if it's not already there
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
+
+# Lo stesso modulo importato dai repository (senza il prefisso off_chain)
+import configuration.database as database  # noqa: E402
+import off_chain.database.db_migrations as db_migrations  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def schema_migrato(tmp_path_factory):
+    """Percorso di un database creato una volta sola con DatabaseMigrations.run_migrations(), dati di seed compresi."""
+    cartella = tmp_path_factory.mktemp("schema")
+    cwd = os.getcwd()
+    os.chdir(cartella)  # Le migrazioni scrivono database.db nella cartella corrente
+    try:
+        db_migrations.Database._instance = None
+        db_migrations.DatabaseMigrations._migrations_executed = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            db_migrations.DatabaseMigrations.run_migrations()
+            db_migrations.Database().close()
+    finally:
+        db_migrations.DatabaseMigrations._migrations_executed = False
+        os.chdir(cwd)
+    return str(cartella / "database.db")
+
+
+@pytest.fixture
+def database_migrato(request, schema_migrato, tmp_path):
+    """
+    Database di prova: una copia dello schema migrato in una cartella temporanea, usata dal singleton
+    Database e quindi da ogni repository creato durante il test.
+    Nelle classi unittest (con @pytest.mark.usefixtures("database_migrato")) è disponibile come self.db,
+    e la cartella temporanea come self.cartella.
+    """
+    percorso = tmp_path / "database.db"
+    shutil.copyfile(schema_migrato, percorso)
+    path_originale = database.DATABASE_PATH
+    database.DATABASE_PATH = str(percorso)
+    database.Database._instance = None
+    db = database.Database()
+    if request.instance is not None:
+        request.instance.db = db
+        request.instance.cartella = str(tmp_path)
+    try:
+        yield db
+    finally:
+        db.close()
+        database.DATABASE_PATH = path_originale
@@ -0,0 +1,102 @@
+import threading
+import unittest
+
+from PyQt5.QtCore import QCoreApplication, QThreadPool
+
+from off_chain.model.pagina_model import Pagina
+from off_chain.presentation.view.attivita import EsecutoreAttivita
+from off_chain.presentation.view.modello_tabella import Colonna, ModelloTabellaPaginata
+
+
+class TestEsecutoreAttivita(unittest.TestCase):
+
+    def setUp(self):
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.pool = QThreadPool()
+        self.esecutore = EsecutoreAttivita(pool=self.pool)
+
+    def tearDown(self):
+        self.pool.waitForDone()
+
+    def _attendi(self):
+        # Una sostituta parte solo alla consegna della precedente: si attende finché ne restano
+        self.pool.waitForDone()
+        QCoreApplication.processEvents()
+        while self.esecutore.in_corso():
+            self.pool.waitForDone()
+            QCoreApplication.processEvents()
+
+    def test_risultato_nel_thread_della_gui(self):
+        risultati, errori = [], []
+        self.esecutore.avvia(lambda a, b: (a + b, threading.current_thread()), 1, b=2,
+                             al_termine=lambda r: risultati.append((r, threading.current_thread())))
+        self.esecutore.avvia(lambda: 1 / 0, in_errore=errori.append)
+        self._attendi()
+
+        (somma, thread_lavoro), thread_consegna = risultati[0]
+        self.assertEqual(somma, 3)
+        self.assertIsNot(thread_lavoro, threading.main_thread())
+        self.assertIs(thread_consegna, threading.main_thread())
+        self.assertIsInstance(errori[0], ZeroDivisionError)
+        self.assertFalse(self.esecutore.in_corso())
+
+    def test_annullate_e_sostituite(self):
+        sblocca = threading.Event()
+        consegnati = []
+        self.esecutore.avvia(sblocca.wait, chiave="ricerca", al_termine=lambda _r: consegnati.append("prima"))
+        self.esecutore.avvia(lambda: "seconda", chiave="ricerca", al_termine=consegnati.append)
+        self.esecutore.avvia(lambda: "chiusa", al_termine=consegnati.append)
+        self.esecutore.annulla()
+        self.assertFalse(self.esecutore.in_corso())
+        sblocca.set()
+        self._attendi()
+        self.assertEqual(consegnati, [])
+
+        self.esecutore.avvia(sblocca.wait, chiave="ricerca", al_termine=lambda _r: consegnati.append("vecchia"))
+        self.esecutore.avvia(lambda: "nuova", chiave="ricerca", al_termine=consegnati.append)
+        self._attendi()
+        self.assertEqual(consegnati, ["nuova"])
+
+    def test_sostituta_dopo_la_precedente(self):
+        sblocca, partita = threading.Event(), threading.Event()
+        in_esecuzione, sovrapposte, consegnati = [], [], []
+
+        def lavora(nome):
+            sovrapposte.append(bool(in_esecuzione))
+            in_esecuzione.append(nome)
+            if nome == "vecchia":
+                partita.set()
+                sblocca.wait()
+            in_esecuzione.remove(nome)
+            return nome
+
+        self.esecutore.avvia(lavora, "vecchia", chiave="pagina", al_termine=consegnati.append)
+        partita.wait()
+        # La vecchia è in esecuzione: le sostitute aspettano, e ne parte solo l'ultima
+        self.esecutore.avvia(lavora, "intermedia", chiave="pagina", al_termine=consegnati.append)
+        self.esecutore.avvia(lavora, "nuova", chiave="pagina", al_termine=consegnati.append)
+        self.assertTrue(self.esecutore.in_corso("pagina"))
+        sblocca.set()
+        self._attendi()
+        self.assertEqual((consegnati, sovrapposte), (["nuova"], [False, False]))
+
+    def test_modello_con_esecutore(self):
+        righe = list(range(6))
+        modello = ModelloTabellaPaginata(
+            [Colonna("Id", lambda r: r)],
+            lambda token: Pagina(righe[int(token or 0):int(token or 0) + 4], None if token else "4"),
+            esecutore=self.esecutore)
+        modello.fetchMore()
+        self.assertFalse(modello.canFetchMore())  # Una sola pagina in lettura alla volta
+        self._attendi()
+        self.assertEqual(modello.rowCount(), 4)
+
+        modello.fetchMore()
+        modello.ricarica()  # La pagina già richiesta non finisce nel modello svuotato
+        self._attendi()
+        self.assertEqual(modello.rowCount(), 0)
+        self.assertTrue(modello.canFetchMore())
+
+
+if __name__ == "__main__":
+    unittest.main()
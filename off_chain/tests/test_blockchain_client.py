@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from off_chain.configuration.blockchain_client import RegistroBlockchain
+
+ABI = [{"type": "function", "name": "nextRequestId", "inputs": [], "outputs": [{"name": "", "type": "uint256"}],
+        "stateMutability": "view"}]
+INDIRIZZO = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+
+
+class TestRegistroBlockchain(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.artifacts = os.path.join(self.tmp.name, "artifacts", "contracts")
+        os.makedirs(os.path.join(self.artifacts, "Altro.sol"))
+        os.makedirs(os.path.join(self.artifacts, "SustainableFoodChain.sol"))
+        self._scrivi(os.path.join(self.artifacts, "Altro.sol", "Altro.json"), {"contractName": "Altro", "abi": []})
+        self.percorso_abi = os.path.join(self.artifacts, "SustainableFoodChain.sol", "SustainableFoodChain.json")
+        self._scrivi(self.percorso_abi, {"contractName": "SustainableFoodChain", "abi": ABI})
+        # Istanza separata dal singleton del processo
+        self.registro = object.__new__(RegistroBlockchain)
+        self.registro._initialize()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _scrivi(percorso, contenuto, mtime=None):
+        with open(percorso, "w", encoding="utf-8") as f:
+            json.dump(contenuto, f)
+        if mtime is not None:
+            os.utime(percorso, (mtime, mtime))
+
+    def test_json_e_contratti_in_cache(self):
+        with mock.patch("builtins.open", wraps=open) as apertura:
+            contratto = self.registro.contratto(INDIRIZZO.lower(), self.percorso_abi)
+            self.assertIs(self.registro.contratto(INDIRIZZO, self.percorso_abi), contratto)
+            self.assertEqual(apertura.call_count, 1)
+        self.assertEqual(contratto.address, INDIRIZZO)
+
+        # Artefatto ricompilato: ABI riletta e nuovo oggetto contratto
+        self._scrivi(self.percorso_abi, {"contractName": "SustainableFoodChain", "abi": []}, mtime=1_000_000)
+        self.assertIsNot(self.registro.contratto(INDIRIZZO, self.percorso_abi), contratto)
+        self.assertEqual(self.registro.abi(self.percorso_abi), [])
+        self.assertEqual(len(self.registro._contratti), 1)
+
+    def test_trova_artefatto(self):
+        self.assertEqual(self.registro.trova_artefatto(self.artifacts, "SustainableFoodChain"), self.percorso_abi)
+        with mock.patch("os.walk") as walk:
+            self.assertEqual(self.registro.trova_artefatto(self.artifacts, "SustainableFoodChain"), self.percorso_abi)
+            walk.assert_not_called()
+        self.assertIsNone(self.registro.trova_artefatto(self.artifacts, "Inesistente"))
+
+    def test_nodo_disponibile(self):
+        with mock.patch.object(self.registro, "_sonda", side_effect=lambda: setattr(self.registro, "_disponibile", False)) as sonda, \
+                mock.patch("threading.Thread") as thread:
+            self.assertFalse(self.registro.nodo_disponibile())
+            self.registro._disponibile = True  # Aggiornato dalla sonda in background
+            self.assertTrue(self.registro.nodo_disponibile())
+        sonda.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
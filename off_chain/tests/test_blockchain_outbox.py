@@ -0,0 +1,166 @@
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import off_chain.presentation.controller.blockchain_controller as blockchain_controller
+import off_chain.presentation.controller.blockchain_outbox as blockchain_outbox
+from off_chain.persistence.repository_impl import db_default_string
+from off_chain.presentation.controller.blockchain_controller import BlockchainController
+from off_chain.presentation.controller.blockchain_outbox import BlockchainOutbox
+
+ADDRESS = "0xabc"
+TOKEN_OPERAZIONE = 5
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestBlockchainOutbox(unittest.TestCase):
+
+    def setUp(self):
+        # Operazione 7 dell'azienda 1 (dati di seed), non ancora registrata sulla blockchain
+        self.db.execute_query("INSERT INTO Operazione (Id_operazione, Id_azienda, Id_prodotto, Id_lotto, Consumo_CO2, quantita, Tipo) "
+                              "VALUES (7, 1, 3, 1, 10, 1, 'produzione')")
+        self.token_iniziali = self.db.fetch_one("SELECT Token FROM Azienda WHERE Id_azienda = 1")
+
+        # Nodo che conferma ogni transazione e soglie fisse: nessuna rete né tabella Soglie
+        nodo = mock.patch.object(blockchain_outbox, "w3")
+        nodo.start().eth.get_transaction_receipt.return_value = SimpleNamespace(status=1)
+        soglie = mock.patch.object(blockchain_controller, "OperationRepositoryImpl")
+        soglie.start().return_value.token_opeazione.return_value = TOKEN_OPERAZIONE
+        self.addCleanup(mock.patch.stopall)
+
+        self.esiti = []
+        self.controller = SimpleNamespace(accredita_operazione=BlockchainController.accredita_operazione)
+        self.outbox = BlockchainOutbox(on_esito=lambda *esito: self.esiti.append(esito),
+                                       controller_factory=lambda: self.controller)
+        self.addCleanup(self.outbox.ferma)
+
+    def _invia(self):
+        self.assertTrue(self.outbox.accoda(ADDRESS, 7, "produzione", 1, "messaggio"))
+        operazione, = self.outbox.repository.preleva_in_coda(10)
+        self.outbox.repository.segna_inviata(operazione.id_outbox, "0xhash", 0)
+        operazione, = self.outbox.repository.get_inviate()
+        return operazione
+
+    def _stato(self):
+        return (self.db.fetch_one("SELECT Token FROM Azienda WHERE Id_azienda = 1") - self.token_iniziali,
+                self.db.fetch_one("SELECT blockchain_registered FROM Operazione WHERE Id_operazione = 7"),
+                self.outbox.repository.get_esito(ADDRESS, 7)[0])
+
+    def test_conferma_accredita_una_sola_volta(self):
+        operazione = self._invia()
+        self.outbox._controlla_ricevuta(operazione)
+        self.assertEqual(self._stato(), (TOKEN_OPERAZIONE, 1, db_default_string.STATO_OUTBOX_CONFERMATA))
+        self.assertTrue(self.esiti[-1][2].startswith("✅"))
+
+        # Stessa ricevuta ricontrollata (es. riga tornata 'Inviata' dopo un'interruzione): nessun secondo accredito
+        self.db.execute_query("UPDATE OutboxBlockchain SET Stato = ?", (db_default_string.STATO_OUTBOX_INVIATA,))
+        self.outbox._controlla_ricevuta(operazione)
+        self.assertEqual(self._stato(), (TOKEN_OPERAZIONE, 1, db_default_string.STATO_OUTBOX_CONFERMATA))
+
+    def test_sincronizzazione_fallita_resta_inviata(self):
+        operazione = self._invia()
+
+        def accredita_e_fallisci(cursor, id_operazione):
+            BlockchainController.accredita_operazione(cursor, id_operazione)
+            raise RuntimeError("disco pieno")
+
+        self.controller.accredita_operazione = accredita_e_fallisci
+        with self.assertRaises(RuntimeError):
+            self.outbox._controlla_ricevuta(operazione)
+        # Né token né conferma: la transazione è stata annullata per intero
+        self.assertEqual(self._stato(), (0, 0, db_default_string.STATO_OUTBOX_INVIATA))
+        self.assertEqual(self.esiti, [])
+
+        # Al giro successivo la conferma riesce
+        self.controller.accredita_operazione = BlockchainController.accredita_operazione
+        self.outbox._controlla_ricevuta(self.outbox.repository.get_inviate()[0])
+        self.assertEqual(self._stato(), (TOKEN_OPERAZIONE, 1, db_default_string.STATO_OUTBOX_CONFERMATA))
+
+    def _in_invio(self, *id_operazioni):
+        for id_operazione in id_operazioni:
+            self.outbox.accoda(ADDRESS, id_operazione, "produzione", 1, "messaggio")
+        return self.outbox.repository.preleva_in_coda(10)
+
+    def _righe(self):
+        return self.db.fetch_results("SELECT Id_operazione, Stato, Tx_hash, Nonce FROM OutboxBlockchain ORDER BY Id_outbox")
+
+    def test_invio_riuscito_mai_fallito(self):
+        operazione, = self._in_invio(7)
+        funzione = mock.Mock(build_transaction=lambda tx: tx)
+        self.controller.prepara_operazione = lambda *args: (ADDRESS, funzione)
+
+        def invia(account, costruisci_tx, prenotato):
+            prenotato(3)
+            self.assertEqual(self._righe(), [(7, db_default_string.STATO_OUTBOX_IN_INVIO, None, 3)])
+            return "0xhash", 3
+
+        manager = mock.patch.object(blockchain_outbox, "nonce_manager").start()
+        manager.invia.side_effect = invia
+        mock.patch.object(BlockchainOutbox, "INTERVALLO_POLLING", 0).start()
+        # Transazione inviata ma database non disponibile: la riga resta 'In invio' con il nonce
+        with mock.patch.object(self.outbox.repository, "segna_inviata", side_effect=RuntimeError("database bloccato")) as segna:
+            self.outbox._invia(operazione)
+        self.assertEqual(segna.call_count, BlockchainOutbox.TENTATIVI_SEGNA_INVIATA)
+        self.assertEqual(self._righe(), [(7, db_default_string.STATO_OUTBOX_IN_INVIO, None, 3)])
+        self.assertEqual(self.esiti, [])
+
+        # Al riavvio la transazione viene trovata sulla blockchain: nessun secondo invio
+        manager.cerca_transazione.return_value = "0xhash"
+        self.outbox._ripristina_in_invio()
+        manager.cerca_transazione.assert_called_once_with(ADDRESS, 3)
+        self.assertEqual(self._righe(), [(7, db_default_string.STATO_OUTBOX_INVIATA, "0xhash", 3)])
+
+    def test_ripristino_in_invio(self):
+        # 1: interrotta prima della prenotazione, 2: nonce mai usato dal nodo, 3: nodo non raggiungibile
+        operazioni = self._in_invio(1, 2, 3)
+        for operazione in operazioni[1:]:
+            self.outbox.repository.segna_nonce(operazione.id_outbox, operazione.id_operazione)
+        manager = mock.patch.object(blockchain_outbox, "nonce_manager").start()
+        manager.cerca_transazione.side_effect = lambda account, nonce: None if nonce == 2 else 1 / 0
+
+        self.outbox._ripristina_in_invio()
+        self.assertEqual(self._righe(), [(1, db_default_string.STATO_OUTBOX_IN_CODA, None, None),
+                                         (2, db_default_string.STATO_OUTBOX_IN_CODA, None, None),
+                                         (3, db_default_string.STATO_OUTBOX_IN_INVIO, None, 3)])
+
+    def test_repository_condiviso_tra_thread(self):
+        repository = self.outbox.repository
+        for id_operazione in range(20):
+            repository.accoda_operazione(ADDRESS, id_operazione, "produzione", id_operazione, "messaggio")
+        for operazione in repository.preleva_in_coda(20):
+            repository.segna_inviata(operazione.id_outbox, f"0x{operazione.id_operazione}", operazione.id_operazione)
+
+        errori = []
+
+        def usa(numero):
+            try:
+                for _ in range(50):
+                    for id_operazione in range(20):
+                        stato, tx_hash, _ = repository.get_esito(ADDRESS.upper(), id_operazione)
+                        self.assertEqual((stato, tx_hash), (db_default_string.STATO_OUTBOX_INVIATA, f"0x{id_operazione}"))
+                    self.assertEqual(len(repository.get_inviate()), 20)
+                    # Riscrive gli stessi valori (Id_outbox numero + 1 è l'operazione numero): le letture restano confrontabili
+                    repository.segna_inviata(numero + 1, f"0x{numero}", numero)
+            except Exception as e:
+                errori.append(e)
+
+        # Cambi di thread frequenti: con uno stato condiviso tra le chiamate le query si mescolerebbero
+        intervallo = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=usa, args=(numero,)) for numero in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(intervallo)
+        self.assertEqual(errori, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+
+import pytest
+
+from off_chain.persistence.repository_impl.certification_repository_impl import CertificationRepositoryImpl
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestCertificatiCatena(unittest.TestCase):
+
+    def setUp(self):
+        # Il lotto 1 alimenta sia il lotto 3 che il lotto 4, entrambi usati dal lotto 5
+        self.db.execute_many("INSERT INTO Operazione (Id_azienda, Id_prodotto, Id_lotto, Consumo_CO2, quantita, Tipo) "
+                             "VALUES (1, 1, ?, 1, 10, ?)",
+                             [(1, "produzione"), (2, "produzione"), (3, "trasformazione"), (4, "trasformazione"),
+                              (5, "vendita"), (6, "produzione")])
+        self.db.execute_many("INSERT INTO ComposizioneLotto (id_lotto_output, id_lotto_input, quantità_utilizzata) "
+                             "VALUES (?, ?, 1)", [(3, 1), (3, 2), (4, 1), (5, 3), (5, 4)])
+        # Certificati dell'azienda 5 ("cert BioCheck" nei dati di seed)
+        self.db.execute_many("INSERT INTO Certificato (Id_lotto, Descrizione, Id_azienda_certificatore) VALUES (?, ?, 5)",
+                             [(1, "bio"), (2, "dop"), (4, "km0"), (6, "altro")])
+        CertificationRepositoryImpl._cache_catene = {}
+        self.repository = CertificationRepositoryImpl()
+
+    def tearDown(self):
+        CertificationRepositoryImpl._cache_catene = {}
+
+    def _descrizioni(self, id_lotto):
+        return [c.descrizione_certificato for c in self.repository.get_certificati_catena(id_lotto)]
+
+    def test_lotto_condiviso_una_volta(self):
+        self.assertEqual(self._descrizioni(5), ["bio", "dop", "km0"])
+        self.assertEqual(self._descrizioni(3), ["bio", "dop"])
+        self.assertEqual(self._descrizioni(42), [])
+
+    def test_cache_e_invalidazione(self):
+        self._descrizioni(5)
+        self._descrizioni(4)
+        self._descrizioni(2)
+        with mock.patch.object(self.db, "fetch_models", wraps=self.db.fetch_models) as letture:
+            self._descrizioni(5)
+        letture.assert_not_called()
+
+        # Un certificato sul lotto 1 cambia le catene di 1, 3, 4 e 5 ma non quella del lotto 2
+        self.repository.aggiungi_certificazione(1, "igp", 1)
+        self.assertNotIn(5, CertificationRepositoryImpl._cache_catene)
+        self.assertIn(2, CertificationRepositoryImpl._cache_catene)
+        self.assertEqual(self._descrizioni(5), ["bio", "dop", "km0", "igp"])
+
+    def test_catena_invalidata_non_salvata(self):
+        leggi = self.db.fetch_models
+
+        def certificato_durante_la_lettura(*args):
+            # La catena è già letta quando un altro thread aggiunge un certificato a monte
+            certificati = leggi(*args)
+            self.repository.aggiungi_certificazione(1, "igp", 1)
+            return certificati
+
+        with mock.patch.object(self.db, "fetch_models", side_effect=certificato_durante_la_lettura):
+            self.assertEqual(self._descrizioni(5), ["bio", "dop", "km0"])
+        self.assertNotIn(5, CertificationRepositoryImpl._cache_catene)
+        self.assertEqual(self._descrizioni(5), ["bio", "dop", "km0", "igp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+from unittest import mock
+
+import pytest
+
+import off_chain.persistence.repository_impl.co2_repository_impl as co2_repository_impl
+from off_chain.persistence.repository_impl.co2_repository_impl import (
+    Co2RepositoryImpl, calcola_co2_totale, calcola_co2_unitaria)
+
+
+class TestCo2Unitaria(unittest.TestCase):
+
+    def setUp(self):
+        # Il lotto 1 alimenta sia il lotto 3 che il lotto 4, entrambi usati dal lotto 5
+        self.nodi = {1: (100, 1000), 2: (50, 2000), 3: (10, 5), 4: (10, 5), 5: (5, 1)}
+        self.archi = {3: [(1, 10), (2, 5)], 4: [(1, 20)], 5: [(3, 2), (4, 3)]}
+
+    def test_calcolo_grafo(self):
+        risultato = calcola_co2_unitaria(self.nodi, self.archi)
+        self.assertEqual(risultato, {1: 10, 2: 40, 3: 30, 4: 20, 5: 24})
+
+    def test_valori_noti_non_ricalcolati(self):
+        risultato = calcola_co2_unitaria(self.nodi, self.archi, noti={3: 100})
+        self.assertEqual(risultato[3], 100)
+        self.assertEqual(risultato[5], int((100 * 2 + 20 * 3 + 1) / 5))
+
+    def test_ciclo(self):
+        archi = {1: [(2, 1)], 2: [(1, 1)]}
+        risultato = calcola_co2_unitaria({1: (1, 1), 2: (1, 1)}, archi)
+        self.assertEqual(set(risultato), {1, 2})
+
+    def test_totale(self):
+        unitarie = calcola_co2_unitaria(self.nodi, self.archi)
+        self.assertEqual(calcola_co2_totale(self.nodi, self.archi, unitarie, [3, 5, 9]), {3: 305, 5: 121})
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestCatalogoCo2(unittest.TestCase):
+
+    def setUp(self):
+        Co2RepositoryImpl._cache_co2_unitaria.clear()
+        self.repository = Co2RepositoryImpl()
+        # Due lotti in vendita (3 e 4) ricavati dallo stesso lotto prodotto (1)
+        self.db.execute_many("INSERT INTO Operazione (Id_azienda, Id_prodotto, Id_lotto, quantita, Consumo_CO2, Tipo) "
+                             "VALUES (1, 1, ?, ?, ?, ?)",
+                             [(1, 100, 1000, "produzione"), (3, 10, 5, "vendita"), (4, 10, 5, "vendita")])
+        self.db.execute_many("INSERT INTO ComposizioneLotto (id_lotto_output, id_lotto_input, quantità_utilizzata) VALUES (?, ?, ?)",
+                             [(3, 1, 10), (4, 1, 20)])
+
+    def tearDown(self):
+        Co2RepositoryImpl._cache_co2_unitaria.clear()
+
+    def _catalogo(self):
+        return self.db.fetch_results("SELECT Id_lotto, Co2_totale, Co2_unitaria FROM CatalogoCo2 ORDER BY Id_lotto")
+
+    def test_aggiornamento_e_invalidazione(self):
+        self.assertEqual(self.repository.aggiorna_catalogo(), 2)
+        self.assertEqual(self._catalogo(), [(3, 105, 10), (4, 205, 20)])
+        # Tutti i lotti in vendita sono già nel catalogo
+        self.assertEqual(self.repository.aggiorna_catalogo(), 0)
+
+        self.db.execute_query("UPDATE Operazione SET Consumo_CO2 = 2000 WHERE Id_lotto = 1")
+        self.repository.invalida_lotto(1)
+        self.assertEqual(self._catalogo(), [])
+        self.assertEqual(self.repository.aggiorna_catalogo(), 2)
+        self.assertEqual(self._catalogo(), [(3, 205, 20), (4, 405, 40)])
+
+    def _invalida_durante_la_lettura(self):
+        # Il lotto 1 cambia mentre il grafo viene letto: il calcolo in corso è obsoleto
+        carica_grafo = self.repository._carica_grafo
+
+        def carica_e_invalida(*args):
+            risultato = carica_grafo(*args)
+            self.db.execute_query("UPDATE Operazione SET Consumo_CO2 = 2000 WHERE Id_lotto = 1")
+            self.repository.invalida_lotto(1)
+            return risultato
+        return mock.patch.object(self.repository, "_carica_grafo", side_effect=carica_e_invalida)
+
+    def test_calcolo_invalidato_non_salvato(self):
+        with self._invalida_durante_la_lettura():
+            self.assertEqual(self.repository.get_co2_unitaria_lotti([3, 4]), {3: 10, 4: 20})
+            self.assertEqual(self.repository.aggiorna_catalogo(), 0)
+        self.assertEqual(Co2RepositoryImpl._cache_co2_unitaria, {})
+        self.assertEqual(self._catalogo(), [])
+
+        # Senza invalidazioni concorrenti i valori letti sono quelli aggiornati
+        self.assertEqual(self.repository.get_co2_unitaria_lotti([3, 4]), {3: 20, 4: 40})
+        self.assertEqual(self.repository.aggiorna_catalogo(), 2)
+        self.assertEqual(self._catalogo(), [(3, 205, 20), (4, 405, 40)])
+
+    def test_lotti_a_blocchi(self):
+        # Un blocco per lotto: l'antenato comune (1) viene letto da entrambi, i suoi archi una volta sola
+        with mock.patch.object(co2_repository_impl, "MAX_PARAMETRI_IN", 1):
+            self.assertEqual(self.repository.get_co2_unitaria_lotti([3, 4, 3]), {3: 10, 4: 20})
+
+
+if __name__ == "__main__":
+    unittest.main()
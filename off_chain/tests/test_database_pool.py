@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+import unittest
+from typing import NamedTuple
+
+import pytest
+
+# Lo stesso modulo usato dalla fixture database_migrato (senza il prefisso off_chain)
+import configuration.database as database
+
+# Tabella senza vincoli e vuota dopo il seed: le righe di prova non dipendono da altre tabelle
+INSERISCI = "INSERT INTO CatalogoCo2 (Co2_totale, Co2_unitaria) VALUES (?, 0)"
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestDatabasePool(unittest.TestCase):
+
+    def test_wal_e_connessioni_riusate(self):
+        self.assertEqual(self.db.fetch_results("PRAGMA journal_mode")[0][0], "wal")
+
+        # Thread che si succedono (come le richieste HTTP) riusano la stessa connessione
+        for _ in range(5):
+            thread = threading.Thread(target=self.db.fetch_one, args=("SELECT COUNT(*) FROM CatalogoCo2",))
+            thread.start()
+            thread.join()
+        self.assertEqual(self.db._pool.aperte, 1)
+
+    def test_pool_limitato(self):
+        pool = database.PoolConnessioni(lambda: sqlite3.connect(":memory:", check_same_thread=False), 3, 5)
+        attive, massimo = set(), 0
+        lock = threading.Lock()
+
+        def usa():
+            nonlocal massimo
+            conn = pool.acquisisci()
+            with lock:
+                attive.add(id(conn))
+                massimo = max(massimo, len(attive))
+            time.sleep(0.01)
+            with lock:
+                attive.discard(id(conn))
+            pool.rilascia(conn)
+
+        threads = [threading.Thread(target=usa) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((massimo, pool.aperte), (3, 3))
+
+        # Pool esaurito: dopo l'attesa massima un errore, non una connessione in più
+        pool = database.PoolConnessioni(lambda: sqlite3.connect(":memory:", check_same_thread=False), 1, 0.05)
+        conn = pool.acquisisci()
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.acquisisci()
+        pool.rilascia(conn)
+        self.assertIs(pool.acquisisci(), conn)
+        pool.chiudi()
+
+    def test_scrittura_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.db.scrittura() as cur:
+                cur.execute(INSERISCI, (1,))
+                raise ValueError()
+        self.assertEqual(self.db.fetch_one("SELECT COUNT(*) FROM CatalogoCo2"), 0)
+
+        with self.db.scrittura() as cur:
+            cur.execute(INSERISCI, (1,))
+        self.assertEqual(self.db.fetch_one("SELECT COUNT(*) FROM CatalogoCo2"), 1)
+
+    def test_scritture_raggruppate(self):
+        self.db.execute_transaction([(INSERISCI, (i,)) for i in range(5)]
+                                    + [("UPDATE CatalogoCo2 SET Co2_totale = Co2_totale + 1", ())])
+        self.assertEqual(self.db.fetch_one("SELECT SUM(Co2_totale) FROM CatalogoCo2"), 15)
+
+        self.assertEqual(self.db.execute_many(INSERISCI, [(1,), (2,)]), 2)
+        with self.assertRaises(Exception):
+            # Un errore annulla anche le righe già inserite dello stesso gruppo
+            self.db.execute_transaction([(INSERISCI, (1,)), (INSERISCI, (2,)), ("INSERT INTO Inesistente VALUES (1)", ())])
+        self.assertEqual(self.db.fetch_one("SELECT COUNT(*) FROM CatalogoCo2"), 7)
+
+    def test_lettura_durante_scrittura(self):
+        letti = []
+
+        def leggi():
+            letti.append(database.Database().fetch_one("SELECT COUNT(*) FROM CatalogoCo2"))
+
+        with self.db.scrittura() as cur:
+            cur.execute(INSERISCI, (1,))
+            # Lo stesso thread usa la connessione della transazione e vede la riga non ancora confermata
+            self.assertEqual(self.db.fetch_one("SELECT COUNT(*) FROM CatalogoCo2"), 1)
+            # In WAL un altro thread legge l'ultima versione confermata senza attendere il lock
+            thread = threading.Thread(target=leggi)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(letti, [0])
+        self.assertEqual(self.db.fetch_one("SELECT COUNT(*) FROM CatalogoCo2"), 1)
+
+    def test_iter_results(self):
+        self.db.execute_many(INSERISCI, [(i,) for i in range(10)])
+        righe = self.db.iter_results("SELECT Co2_totale FROM CatalogoCo2 ORDER BY Id_lotto", arraysize=3, row_factory=lambda r: r[0] * 2)
+        letti = [next(righe)]
+        # Una query sul cursore del thread non interrompe l'iterazione
+        self.assertEqual(self.db.fetch_one("SELECT COUNT(*) FROM CatalogoCo2"), 10)
+        letti.extend(righe)
+        self.assertEqual(letti, [i * 2 for i in range(10)])
+
+    def test_fetch_models(self):
+        class Riga(NamedTuple):
+            id: int
+            valore: int
+
+        self.db.execute_many(INSERISCI, [(5,), (6,)])
+        self.assertEqual(self.db.fetch_models("SELECT Id_lotto, Co2_totale FROM CatalogoCo2 ORDER BY Id_lotto", (), Riga),
+                         [Riga(1, 5), Riga(2, 6)])
+
+
+if __name__ == "__main__":
+    unittest.main()
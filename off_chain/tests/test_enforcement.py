@@ -75,3 +75,32 @@ def test_valid_emissions():
 def test_invalid_emissions():
     with pytest.raises(SafetyViolationError):
         check_product_emissions(co2_emissions=1500)  # Exceeds maximum allowed
+
+def test_latency_histograms():
+    enforcer = GuaranteeResponseEnforcer()
+    for i in range(1, 1001):
+        enforcer.observe('database_query', 'Repository.get', i / 1000)
+
+    stats = enforcer.get_latency_stats()[0]
+    assert stats['count'] == 1000
+    # Estimates within one bucket (~19%) of the exact quantiles 0.5s / 0.95s / 0.99s
+    for quantile, exact in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        assert abs(stats[quantile] - exact) / exact < 0.19
+
+    text = enforcer.export_prometheus()
+    labels = 'operation_type="database_query",function="Repository.get"'
+    assert f'offchain_operation_latency_seconds_bucket{{{labels},le="+Inf"}} 1000' in text
+    assert f'offchain_operation_latency_seconds_bucket{{{labels},le="0.4096"}} 409' in text
+    assert f'offchain_operation_latency_seconds_count{{{labels}}} 1000' in text
+
+def test_measure_latency_records_errors():
+    enforcer = GuaranteeResponseEnforcer()
+
+    @enforcer.measure_latency('blockchain_operation')
+    def send():
+        raise ValueError("nonce too low")
+
+    with pytest.raises(ValueError):
+        send()
+    stats = enforcer.get_latency_stats()[0]
+    assert (stats['count'], stats['errors']) == (1, 1)
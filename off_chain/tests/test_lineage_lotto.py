@@ -0,0 +1,64 @@
+import unittest
+import sqlite3
+from off_chain.persistence.repository_impl.product_repository_impl import (
+    QUERY_LINEAGE_LOTTO,
+    costruisci_grafo_lotti
+)
+
+
+class TestLineageLotto(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("""
+            CREATE TABLE Operazione (
+                Id_operazione INTEGER PRIMARY KEY AUTOINCREMENT,
+                Id_lotto INTEGER UNIQUE NOT NULL,
+                Consumo_CO2 INTEGER NOT NULL,
+                quantita INTEGER NOT NULL,
+                Tipo TEXT NOT NULL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE ComposizioneLotto (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_lotto_output INTEGER NOT NULL,
+                id_lotto_input INTEGER NOT NULL,
+                quantità_utilizzata INTEGER NOT NULL
+            )""")
+        # Il lotto 1 alimenta sia il lotto 3 che il lotto 4, entrambi usati dal lotto 5
+        self.conn.executemany(
+            "INSERT INTO Operazione (Id_lotto, Consumo_CO2, quantita, Tipo) VALUES (?, ?, ?, ?)",
+            [(1, 10, 100, "produzione"), (2, 20, 50, "produzione"),
+             (3, 5, 10, "trasformazione"), (4, 5, 10, "trasformazione"),
+             (5, 1, 5, "vendita")])
+        self.conn.executemany(
+            "INSERT INTO ComposizioneLotto (id_lotto_output, id_lotto_input, quantità_utilizzata) VALUES (?, ?, ?)",
+            [(3, 1, 10), (3, 2, 5), (4, 1, 20), (5, 3, 2), (5, 4, 3)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _carica(self, id_lotto):
+        rows = self.conn.execute(QUERY_LINEAGE_LOTTO, (id_lotto,)).fetchall()
+        return costruisci_grafo_lotti(rows).get(id_lotto)
+
+    def test_catena_completa(self):
+        lotto = self._carica(5)
+        self.assertEqual([c.id_lotto_input for c in lotto.composizione], [3, 4])
+        lotto_3 = lotto.composizione[0].lotto_input
+        self.assertEqual([(c.id_lotto_input, c.quantita_utilizzata) for c in lotto_3.composizione],
+                         [(1, 10), (2, 5)])
+
+    def test_nodi_condivisi(self):
+        lotto = self._carica(5)
+        via_3 = lotto.composizione[0].lotto_input.composizione[0].lotto_input
+        via_4 = lotto.composizione[1].lotto_input.composizione[0].lotto_input
+        self.assertIs(via_3, via_4)
+
+    def test_lotto_inesistente(self):
+        rows = self.conn.execute(QUERY_LINEAGE_LOTTO, (42,)).fetchall()
+        self.assertEqual(rows, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
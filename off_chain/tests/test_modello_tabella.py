@@ -0,0 +1,51 @@
+import unittest
+
+from PyQt5.QtCore import Qt
+
+from off_chain.model.pagina_model import Pagina
+from off_chain.presentation.view.modello_tabella import Colonna, ModelloTabellaPaginata, ProxyTabella
+
+
+class TestModelloTabella(unittest.TestCase):
+
+    def setUp(self):
+        self.righe = [(i, None if i % 4 == 0 else 10 - i) for i in range(1, 11)]
+        self.token_richiesti = []
+        self.modello = ModelloTabellaPaginata([Colonna("Id", lambda r: r[0]), Colonna("CO2", lambda r: r[1])],
+                                              self._carica_pagina)
+        self.proxy = ProxyTabella(self.modello)
+
+    def _carica_pagina(self, token):
+        self.token_richiesti.append(token)
+        inizio = int(token or 0)
+        fine = inizio + 4
+        return Pagina(self.righe[inizio:fine], str(fine) if fine < len(self.righe) else None)
+
+    def test_pagine(self):
+        self.assertEqual(self.modello.rowCount(), 0)
+        while self.modello.canFetchMore():
+            self.modello.fetchMore()
+        self.assertEqual(self.token_richiesti, [None, "4", "8"])
+        self.assertEqual(self.modello.rowCount(), 10)
+        self.assertEqual(self.modello.data(self.modello.index(3, 1)), "")
+
+        self.modello.ricarica()
+        self.assertEqual(self.modello.rowCount(), 0)
+        self.assertTrue(self.modello.canFetchMore())
+
+    def test_ordinamento_e_filtro(self):
+        self.modello.imposta_righe(self.righe)
+        self.proxy.sort(1, Qt.DescendingOrder)
+        # Valori mancanti in fondo anche in ordine decrescente
+        self.assertEqual([self.proxy.riga(i)[0] for i in range(10)], [1, 2, 3, 5, 6, 7, 9, 10, 4, 8])
+
+        self.proxy.imposta_filtro(lambda r: r[0] % 2 == 1)
+        self.assertEqual([self.proxy.riga(i)[0] for i in range(self.proxy.rowCount())], [1, 3, 5, 7, 9])
+
+        self.proxy.sort(-1)
+        self.proxy.imposta_filtro(None)
+        self.assertEqual([self.proxy.riga(i)[0] for i in range(self.proxy.rowCount())], list(range(1, 11)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+from web3 import Web3
+
+from off_chain.presentation.controller.nonce_manager import NonceManager
+
+ACCOUNT = "0x5aaeb6053f3e94c9b9a09f33669435e7ef1beaed"
+
+
+class NodoFinto:
+    """Nodo minimale: accetta solo il nonce atteso, come farebbe Hardhat per un account."""
+
+    def __init__(self, nonce_iniziale=0):
+        self.nonce_nodo = nonce_iniziale
+        self.letture = 0
+        self.inviate = []
+        self.fallisci = set()
+        self.timeout = set()  # Nonce accettati dal nodo ma senza risposta al client
+        self.mempool = []
+        self.blocchi = [([], nonce_iniziale)]  # (transazioni, conteggio dell'account a fine blocco)
+        self.eth = SimpleNamespace(get_transaction_count=self.get_transaction_count,
+                                   send_transaction=self.send_transaction, get_block=self.get_block)
+
+    def get_transaction_count(self, account, blocco):
+        self.letture += 1
+        if blocco == "pending":
+            return self.nonce_nodo
+        return self.blocchi[-1 if blocco == "latest" else blocco][1]
+
+    def get_block(self, blocco, transazioni_complete):
+        return {"transactions": self.mempool if blocco == "pending" else self.blocchi[blocco][0]}
+
+    def mina(self):
+        self.blocchi.append((self.mempool, self.nonce_nodo))
+        self.mempool = []
+        self.eth.block_number = len(self.blocchi) - 1
+
+    def send_transaction(self, tx):
+        nonce = tx["nonce"]
+        if nonce in self.fallisci:
+            self.fallisci.discard(nonce)
+            raise ValueError("gas required exceeds allowance")
+        if any(dict(t, hash=None) == dict(tx, hash=None) for t in self.mempool):
+            raise ValueError("already known")
+        if nonce < self.nonce_nodo or nonce in self.inviate:
+            raise ValueError(f"Nonce too low. Expected nonce to be {self.nonce_nodo} but got {nonce}.")
+        self.inviate.append(nonce)
+        self.mempool.append(dict(tx, hash=bytes([nonce]) * 32))
+        if nonce == self.nonce_nodo:
+            self.nonce_nodo += 1
+        if nonce in self.timeout:
+            raise TimeoutError("nessuna risposta dal nodo")
+        return bytes([nonce]) * 32
+
+
+class TestNonceManager(unittest.TestCase):
+
+    def test_nonce_consecutivi_senza_rileggere_il_nodo(self):
+        nodo = NodoFinto(7)
+        manager = NonceManager(nodo)
+        nonce = [manager.invia(ACCOUNT, lambda n: {"nonce": n})[1] for _ in range(5)]
+        self.assertEqual(nonce, [7, 8, 9, 10, 11])
+        self.assertEqual(nodo.letture, 1)
+
+    def test_risincronizza_su_nonce_too_low(self):
+        nodo = NodoFinto(0)
+        manager = NonceManager(nodo)
+        manager.invia(ACCOUNT, lambda n: {"nonce": n})
+        # Transazioni inviate da fuori (es. script JS) con lo stesso account
+        nodo.nonce_nodo = 4
+        _, nonce = manager.invia(ACCOUNT, lambda n: {"nonce": n})
+        self.assertEqual(nonce, 4)
+        self.assertEqual(nodo.letture, 2)
+
+    def test_invio_fallito_riusa_il_nonce(self):
+        nodo = NodoFinto(0)
+        manager = NonceManager(nodo)
+        manager.invia(ACCOUNT, lambda n: {"nonce": n})
+        nodo.fallisci.add(1)
+        with self.assertRaises(ValueError):
+            manager.invia(ACCOUNT, lambda n: {"nonce": n})
+        _, nonce = manager.invia(ACCOUNT, lambda n: {"nonce": n})
+        self.assertEqual(nonce, 1)
+        self.assertEqual(nodo.inviate, [0, 1])
+
+        # Prenotazione non salvata: la transazione non parte e il nonce resta libero
+        def disco_pieno(nonce):
+            raise OSError("disco pieno")
+
+        with self.assertRaises(OSError):
+            manager.invia(ACCOUNT, lambda n: {"nonce": n}, prenotato=disco_pieno)
+        prenotati = []
+        self.assertEqual(manager.invia(ACCOUNT, lambda n: {"nonce": n}, prenotato=prenotati.append)[1], 2)
+        self.assertEqual((prenotati, nodo.inviate), ([2], [0, 1, 2]))
+
+    def test_transazione_gia_nota(self):
+        nodo = NodoFinto(0)
+        manager = NonceManager(nodo)
+        costruisci_tx = lambda n: {"from": Web3.to_checksum_address(ACCOUNT), "nonce": n}
+        nodo.timeout.add(0)
+        with self.assertRaises(TimeoutError):
+            manager.invia(ACCOUNT, costruisci_tx)
+        # Il nonce torna libero e la stessa transazione viene reinviata: il nodo la conosce già
+        hash_0 = Web3.to_hex(bytes([0]) * 32)
+        self.assertEqual(manager.invia(ACCOUNT, costruisci_tx), (hash_0, 0))
+        self.assertEqual(nodo.inviate, [0])
+
+        nodo.mina()
+        hash_1, _ = manager.invia(ACCOUNT, costruisci_tx)
+        nodo.mina()
+        nodo.mina()
+        self.assertEqual([manager.cerca_transazione(ACCOUNT, nonce) for nonce in range(3)], [hash_0, hash_1, None])
+
+    def test_invii_concorrenti(self):
+        nodo = NodoFinto(0)
+        manager = NonceManager(nodo)
+        thread = [threading.Thread(target=manager.invia, args=(ACCOUNT, lambda n: {"nonce": n}))
+                  for _ in range(20)]
+        for t in thread:
+            t.start()
+        for t in thread:
+            t.join()
+        self.assertEqual(nodo.inviate, list(range(20)))
+
+
+if __name__ == "__main__":
+    unittest.main()
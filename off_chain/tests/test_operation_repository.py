@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import unittest
+
+import pytest
+
+from off_chain.persistence.repository_impl.operation_repository_impl import OperationRepositoryImpl
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestRiservaLotti(unittest.TestCase):
+
+    def setUp(self):
+        # Database su file: i thread prendono in prestito connessioni diverse dal pool
+        self.db.execute_query("UPDATE Sequenza SET Valore = 41 WHERE Nome = 'lotto'")
+        self.repository = OperationRepositoryImpl()
+
+    def test_blocco_contiguo(self):
+        self.assertEqual(self.repository.get_next_id_lotto_output(5), 42)  # Riservati 42..46
+        self.assertEqual(self.repository.get_next_id_lotto_output(), 47)
+        self.assertEqual(self.db.fetch_one("SELECT Valore FROM Sequenza WHERE Nome = 'lotto'"), 47)
+
+    def test_blocchi_concorrenti_disgiunti(self):
+        blocchi = []
+        lock = threading.Lock()
+
+        def riserva(dimensione):
+            for _ in range(20):
+                primo = self.repository.get_next_id_lotto_output(dimensione)
+                with lock:
+                    blocchi.append(range(primo, primo + dimensione))
+
+        threads = [threading.Thread(target=riserva, args=(dimensione,)) for dimensione in (1, 3, 5, 7)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        id_riservati = [id_lotto for blocco in blocchi for id_lotto in blocco]
+        self.assertEqual(len(blocchi), 80)
+        self.assertEqual(sorted(id_riservati), list(range(42, 42 + 20 * (1 + 3 + 5 + 7))))
+
+    def test_sequenza_mancante(self):
+        self.db.execute_query("DELETE FROM Sequenza WHERE Nome = 'lotto'")
+        with self.assertRaises(ValueError):
+            self.repository.get_next_id_lotto_output()
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestImportazioneOperazioni(unittest.TestCase):
+
+    def setUp(self):
+        # Aziende 1 e 2 e prodotti 3-5 vengono dai dati di seed
+        self.db.execute_query("UPDATE Sequenza SET Valore = 10 WHERE Nome = 'lotto'")
+        self.repository = OperationRepositoryImpl()
+
+    def _file(self, nome, contenuto):
+        percorso = os.path.join(self.cartella, nome)
+        with open(percorso, "w", encoding="utf-8", newline="") as file:
+            file.write(contenuto)
+        return percorso
+
+    def _conteggio(self, tabella):
+        return self.db.fetch_one(f"SELECT COUNT(*) FROM {tabella}")
+
+    def test_importa_csv(self):
+        percorso = self._file("operazioni.csv", (
+            "Id_azienda,Id_prodotto,Consumo_CO2,quantita,Tipo,Data_operazione\n"
+            "1,3,20,100,produzione,2024-05-01 10:00:00\n"
+            "2,4,5,30,produzione,\n"
+            "1,3,7,100,produzione,\n"
+        ))
+        self.assertEqual(self.repository.importa_operazioni(percorso), [11, 12, 13])
+        self.assertEqual(self.db.fetch_results("SELECT Id_azienda, Co2_emessa FROM Azienda WHERE Id_azienda IN (1, 2) "
+                                               "ORDER BY Id_azienda"), [(1, 27), (2, 5)])
+        self.assertEqual(self.db.fetch_results("SELECT id_azienda, id_lotto, quantita FROM Magazzino ORDER BY id_lotto"),
+                         [("1", "11", 100), ("2", "12", 30), ("1", "13", 100)])  # Colonne TEXT nello schema
+        self.assertEqual(self.db.fetch_one("SELECT Data_operazione FROM Operazione WHERE Id_lotto = 11"),
+                         "2024-05-01 10:00:00")
+        self.assertIsNotNone(self.db.fetch_one("SELECT Data_operazione FROM Operazione WHERE Id_lotto = 12"))
+
+    def test_importa_json(self):
+        percorso = self._file("operazioni.json", json.dumps([
+            {"Id_azienda": 2, "Id_prodotto": 5, "Consumo_CO2": 12, "quantita": 40, "Tipo": "trasformazione"},
+        ]))
+        self.assertEqual(self.repository.importa_operazioni(percorso), [11])
+        self.assertEqual(self.db.fetch_one("SELECT Co2_emessa FROM Azienda WHERE Id_azienda = 2"), 12)
+
+    def test_righe_non_valide(self):
+        valida = {"Id_azienda": 1, "Id_prodotto": 3, "Consumo_CO2": 20, "quantita": 100, "Tipo": "produzione"}
+        casi = {
+            "campo mancante (CSV)": ("csv", "Id_azienda,Id_prodotto,Consumo_CO2,quantita,Tipo\n1,3,,100,produzione\n"),
+            "campo mancante (JSON)": ("json", json.dumps([valida, {k: v for k, v in valida.items() if k != "quantita"}])),
+            "tipo non valido": ("csv", "Id_azienda,Id_prodotto,Consumo_CO2,quantita,Tipo\n1,3,20,100,raccolta\n"),
+            "valore non numerico": ("json", json.dumps([dict(valida, quantita="cento")])),
+            "oggetto al posto della lista": ("json", json.dumps(valida)),
+            "riga non oggetto": ("json", json.dumps([valida, [1, 3, 20, 100, "produzione"]])),
+        }
+        for caso, (estensione, contenuto) in casi.items():
+            with self.subTest(caso=caso):
+                with self.assertRaises(ValueError):
+                    self.repository.importa_operazioni(self._file(f"operazioni.{estensione}", contenuto))
+                # Nessuna riga scritta e nessun id lotto consumato
+                self.assertEqual(self._conteggio("Operazione"), 0)
+                self.assertEqual(self.db.fetch_one("SELECT Valore FROM Sequenza WHERE Nome = 'lotto'"), 10)
+
+        with self.assertRaises(ValueError):
+            self.repository.importa_operazioni(self._file("operazioni.xml", ""))
+
+    def test_importazione_annullata(self):
+        # Il secondo executemany fallisce: anche le operazioni già inserite vengono annullate
+        self.db.execute_query("DROP TABLE Magazzino")
+        percorso = self._file("operazioni.csv", "Id_azienda,Id_prodotto,Consumo_CO2,quantita,Tipo\n1,3,20,100,produzione\n")
+        with self.assertRaises(Exception):
+            self.repository.importa_operazioni(percorso)
+        self.assertEqual(self._conteggio("Operazione"), 0)
+        self.assertEqual(self.db.fetch_one("SELECT Co2_emessa FROM Azienda WHERE Id_azienda = 1"), 0)
+
+    def _operazioni(self, id_lotti):
+        segnaposto = ", ".join("?" * len(id_lotti))
+        return self.db.fetch_results(
+            "SELECT Id_azienda, Id_prodotto, Consumo_CO2, quantita, Tipo, Data_operazione FROM Operazione "
+            f"WHERE Id_lotto IN ({segnaposto}) ORDER BY Id_lotto", tuple(id_lotti))
+
+    def test_esporta_e_reimporta(self):
+        self.db.execute_query(
+            "INSERT INTO Operazione (Id_azienda, Id_prodotto, Id_lotto, Data_operazione, Consumo_CO2, quantita, Tipo) VALUES "
+            "(1, 3, 1, '2024-05-01 10:00:00', 20, 100, 'produzione'), "
+            "(2, 4, 2, '2024-05-02 11:00:00', 5, 30, 'trasformazione'), "
+            "(1, 4, 3, '2024-05-03 12:00:00', 8, 10, 'vendita')")
+
+        # Solo l'azienda 1 (lotti 1 e 3, reimportati come 11 e 12), poi tutte le operazioni
+        for estensione, azienda, originali in (("json", 1, [1, 3]), ("csv", None, [1, 2, 3, 11, 12])):
+            with self.subTest(estensione=estensione, azienda=azienda):
+                percorso = os.path.join(self.cartella, f"esportazione.{estensione}")
+                self.assertEqual(self.repository.esporta_operazioni(percorso, azienda), len(originali))
+
+                id_lotti = self.repository.importa_operazioni(percorso)
+                self.assertEqual(len(id_lotti), len(originali))
+                self.assertEqual(self._operazioni(id_lotti), self._operazioni(originali))
+
+        with self.assertRaises(ValueError):
+            self.repository.esporta_operazioni(os.path.join(self.cartella, "esportazione.xml"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import sqlite3
+import unittest
+from off_chain.persistence.query_builder import QueryBuilder
+from off_chain.persistence.paginazione import decodifica_token, leggi_pagina
+
+
+class TestQueryBuilderCache(unittest.TestCase):
+
+    def setUp(self):
+        QueryBuilder.clear_cache()
+        self.qb = QueryBuilder()
+
+    def tearDown(self):
+        QueryBuilder.clear_cache()
+
+    def _select(self, id_azienda, limite):
+        return (self.qb.select("Id_lotto").table("Operazione")
+                .where("Id_azienda", "=", id_azienda).where("Tipo", "=", "produzione")
+                .order_by("Id_lotto", "DESC").limit(limite).get_query())
+
+    def test_stessa_forma_riusa_la_query(self):
+        query_1, values_1 = self._select(1, 10)
+        query_2, values_2 = self._select(2, 5)
+
+        self.assertIs(query_1, query_2)
+        self.assertEqual(values_1, [1, "produzione", 10])
+        self.assertEqual(values_2, [2, "produzione", 5])
+        self.assertEqual((QueryBuilder.cache_stats()["hits"], QueryBuilder.cache_stats()["misses"]), (1, 1))
+
+    def test_valori_update_e_insert(self):
+        for token in (3, 7):
+            query, values = (self.qb.table("Azienda").update(Token=("Token + ?", [token]), Nome="x")
+                             .where("Id_azienda", "=", 4).get_query())
+            self.assertEqual(query, "UPDATE Azienda SET Token = Token + ?, Nome = ? WHERE Id_azienda = ?")
+            self.assertEqual(values, [token, "x", 4])
+
+        for quantita in (1, 2):
+            query, values = self.qb.table("Magazzino").insert(id_azienda=1, id_lotto=2, quantita=quantita).get_query()
+            self.assertEqual(values, [1, 2, quantita])
+        self.assertEqual(QueryBuilder.cache_stats()["hits"], 2)
+
+    def test_forma_diversa_non_condivide_la_query(self):
+        query_1, _ = self.qb.select("*").table("Operazione").where("Id_azienda", "=", 1).get_query()
+        query_2, _ = self.qb.select("*").table("Operazione").where("Id_azienda", ">", 1).get_query()
+        self.assertNotEqual(query_1, query_2)
+
+    def test_insert_many(self):
+        righe = [{"id_azienda": 1, "id_lotto": 2, "quantita": 3}, {"id_azienda": 1, "id_lotto": 4, "quantita": 5}]
+        query, values = self.qb.table("Magazzino").insert_many(righe).get_query()
+        self.assertEqual(query, "INSERT INTO Magazzino (id_azienda, id_lotto, quantita) VALUES (?, ?, ?)")
+        self.assertEqual(values, [(1, 2, 3), (1, 4, 5)])
+
+        with self.assertRaises(ValueError):
+            self.qb.table("Magazzino").insert_many([{"id_lotto": 1}, {"quantita": 1}])
+
+    def test_lru_limitata(self):
+        for i in range(QueryBuilder.CACHE_MAX_SIZE + 10):
+            self.qb.select(f"campo_{i}").table("Operazione").get_query()
+        self.assertEqual(QueryBuilder.cache_stats()["size"], QueryBuilder.CACHE_MAX_SIZE)
+
+
+class TestPaginazioneKeyset(unittest.TestCase):
+
+    def setUp(self):
+        self.qb = QueryBuilder()
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE Operazione (Id_operazione INTEGER PRIMARY KEY, Id_azienda INTEGER, Tipo TEXT, Consumo_CO2 INTEGER)")
+        self.conn.executemany("INSERT INTO Operazione VALUES (?, ?, ?, ?)",
+                              [(i, i % 2, "vendita" if i % 3 else "produzione", i % 4) for i in range(1, 51)])
+        # leggi_pagina usa solo fetch_results del database
+        self.db = type("DatabaseMemoria", (), {"fetch_results": lambda _, q, p=(): self.conn.execute(q, p).fetchall()})()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_after_con_or(self):
+        query, values = (self.qb.select("Id_operazione").table("Operazione")
+                         .where("Tipo", "=", "vendita").or_where("Id_azienda", "=", 1)
+                         .after(("Consumo_CO2", "Id_operazione"), (2, 10), "DESC").limit(5).get_query())
+        self.assertEqual(query, "SELECT Id_operazione FROM Operazione WHERE (Tipo = ? OR Id_azienda = ?) "
+                                "AND (Consumo_CO2, Id_operazione) < (?, ?) "
+                                "ORDER BY Consumo_CO2 DESC, Id_operazione DESC LIMIT ?")
+        self.assertEqual(values, ["vendita", 1, 2, 10, 5])
+
+    def _scorri(self, colonne, indici, direzione):
+        righe, token, pagine = [], None, 0
+        while True:
+            self.qb.select("Id_operazione", "Consumo_CO2").table("Operazione").where("Id_azienda", "=", 0)
+            pagina, token = leggi_pagina(self.db, self.qb, colonne, indici, 7, token, direzione)
+            righe.extend(pagina)
+            pagine += 1
+            if token is None:
+                return righe, pagine
+
+    def test_tutte_le_pagine(self):
+        righe, pagine = self._scorri(("Id_operazione",), (0,), "ASC")
+        self.assertEqual([r[0] for r in righe], list(range(2, 51, 2)))
+        self.assertEqual(pagine, 4)
+
+        righe, _ = self._scorri(("Consumo_CO2", "Id_operazione"), (1, 0), "DESC")
+        attese = sorted(((i % 4, i) for i in range(2, 51, 2)), reverse=True)
+        self.assertEqual([(r[1], r[0]) for r in righe], attese)
+
+    def test_token_non_valido(self):
+        with self.assertRaises(ValueError):
+            decodifica_token("non-un-token")
+
+
+if __name__ == "__main__":
+    unittest.main()
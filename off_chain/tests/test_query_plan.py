@@ -0,0 +1,334 @@
+import contextlib
+import importlib
+import inspect
+import io
+import os
+import pkgutil
+import re
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+# Gli stessi moduli importati dai repository tra loro (senza il prefisso off_chain): vanno sostituiti anche
+# i Database dei repository annidati
+import persistence.repository_impl as repository_impl
+import persistence.repository_impl.credential_repository_impl as credential_repository_impl
+import persistence.repository_impl.richieste_repository_impl as richieste_repository_impl
+import off_chain.database.db_migrations as db_migrations
+from model.richiesta_token_model import RichiestaTokenModel
+from persistence.paginazione import codifica_token
+from persistence.repository_impl.database_standard import aziende_enum
+from persistence.repository_impl.richieste_repository_impl import RichiesteRepositoryImpl
+
+# Tabelle che crescono con l'uso: una SCAN completa su queste è una regressione
+TABELLE_GRANDI = {"Operazione", "ComposizioneLotto", "Magazzino", "Richiesta",
+                  "RichiestaToken", "Certificato", "Azioni_compensative", "OutboxBlockchain", "EsitiFirma"}
+
+# Metodi che per costruzione leggono tutta la tabella (cataloghi completi)
+SCAN_AMMESSE = {
+    "get_prodotti_ordinabili": {"Magazzino"},
+    "get_lotti_certificabili": {"Operazione"},  # Elenco completo; le viste usano get_lotti_certificabili_pagina
+    "elimina_scaduti": {"EsitiFirma"},  # Percorre l'indice sulla scadenza solo fino al numero massimo di esiti
+}
+
+# Query che oggi non compilano sullo schema: metodo -> errore atteso.
+# Ogni altro errore fa fallire il test, e una query di questo elenco che torna a compilare va tolta dall'elenco.
+QUERY_NON_COMPATIBILI = {
+    "get_certifications_by_product_interface": "no such column: Certificato.Id_prodotto",
+    "get_certificazione_by_prodotto": "no such column: Certificato.Id_prodotto",
+    "is_certificato": "no such column: Id_prodotto",
+    "get_richiesta_token_by_id": "no such column: rt.Data_richiesta",
+}
+
+# Metodi pubblici dei repository che non eseguono query: metodo -> motivo
+SENZA_SQL = {
+    "OperationRepositoryImpl.verifica_dati": "verifica solo la firma HMAC del payload",
+    "ThresholdRepositoryImpl.invalida": "svuota solo il registro in memoria",
+}
+
+# Tabelle e alias nelle clausole FROM/JOIN: il piano riporta l'alias al posto del nome della tabella
+ALIAS_TABELLA = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+AS)?\s+(?!ON\b|WHERE\b|JOIN\b|LEFT\b|INNER\b|GROUP\b|ORDER\b|LIMIT\b)(\w+)", re.IGNORECASE)
+
+
+class CursoreRegistro:
+    """Cursore di Database.scrittura() per il registro: registra le query, non restituisce righe."""
+
+    rowcount = 0
+
+    def __init__(self, registro):
+        self.registro = registro
+
+    def execute(self, query, params=()):
+        self.registro.queries.append((query, params))
+        return self
+
+    def executemany(self, query, seq_of_params):
+        for params in seq_of_params:
+            self.registro.queries.append((query, params))
+            break  # Il piano non dipende dai valori: basta la prima riga
+        return self
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+
+class RegistroQuery:
+    """Sostituisce Database nei repository: registra le query senza eseguirle."""
+
+    def __init__(self):
+        self.queries = []
+
+    def fetch_results(self, query, params=()):
+        self.queries.append((query, params))
+        return []
+
+    def fetch_models(self, query, params=(), modello=None):
+        self.queries.append((query, params))
+        return []
+
+    def iter_results(self, query, params=(), arraysize=None, row_factory=None):
+        self.queries.append((query, params))
+        return iter([])
+
+    def fetch_one(self, query, params=()):
+        self.queries.append((query, params))
+        return None
+
+    def execute_query(self, query, params=()):
+        self.queries.append((query, params))
+        return True
+
+    def execute_returning(self, query, params=()):
+        self.queries.append((query, params))
+        return None
+
+    def execute_many(self, query, seq_of_params):
+        CursoreRegistro(self).executemany(query, seq_of_params)
+        return 0
+
+    def execute_transaction(self, queries):
+        self.queries.extend(queries)
+
+    @contextlib.contextmanager
+    def scrittura(self):
+        yield CursoreRegistro(self)
+
+
+def _classi_repository():
+    """Tutte le classi *RepositoryImpl del package, con il rispettivo modulo."""
+    classi = {}
+    for modulo in pkgutil.iter_modules(repository_impl.__path__):
+        modulo = importlib.import_module(f"{repository_impl.__name__}.{modulo.name}")
+        for nome, classe in inspect.getmembers(modulo, inspect.isclass):
+            if nome.endswith("RepositoryImpl") and classe.__module__ == modulo.__name__:
+                classi[nome] = (classe, modulo)
+    return classi
+
+
+def _metodi_pubblici(classe):
+    return sorted(nome for nome, valore in vars(classe).items()
+                  if not nome.startswith("_") and (callable(valore) or isinstance(valore, (staticmethod, classmethod))))
+
+
+class TestQueryPlan(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cwd = os.getcwd()
+        cls.tmp = tempfile.TemporaryDirectory()
+        os.chdir(cls.tmp.name)
+        try:
+            db_migrations.Database._instance = None
+            db_migrations.DatabaseMigrations._migrations_executed = False
+            with contextlib.redirect_stdout(io.StringIO()):
+                db_migrations.DatabaseMigrations.run_migrations()
+                # Una seconda esecuzione non deve fare nulla
+                db_migrations.DatabaseMigrations.run_index_migrations(db_migrations.Database())
+                db_migrations.Database().close()
+            cls.conn = sqlite3.connect(os.path.join(cls.tmp.name, "database.db"))
+        finally:
+            os.chdir(cls.cwd)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        db_migrations.DatabaseMigrations._migrations_executed = False
+        cls.tmp.cleanup()
+
+    def _chiamate(self):
+        """Argomenti di esempio per ogni metodo pubblico dei repository: "Classe.metodo" -> lista di argomenti."""
+        oggi = datetime.now()
+        importazione = os.path.join(self.tmp.name, "operazioni.csv")
+        with open(importazione, "w", encoding="utf-8") as file:
+            file.write("Id_azienda,Id_prodotto,Consumo_CO2,quantita,Tipo\n1,3,20,100,produzione\n")
+        richiesta_token = RichiestaTokenModel(1, 1, "Mittente", 2, "Destinatario", 10, "In attesa")
+        return {
+            "CertificationRepositoryImpl.aggiungi_certificazione": [(1, "biologico", 1)],
+            "CertificationRepositoryImpl.get_certifications_by_product_interface": [(1,)],
+            "CertificationRepositoryImpl.get_certificati_catena": [(1,)],
+            "CertificationRepositoryImpl.get_certificati_lotto": [(1,)],
+            "CertificationRepositoryImpl.get_certificazione_by_prodotto": [(1,)],
+            "CertificationRepositoryImpl.get_lotti_certificabili": [()],
+            "CertificationRepositoryImpl.get_lotti_certificabili_pagina": [(codifica_token([5]),)],
+            "CertificationRepositoryImpl.get_numero_certificazioni": [(1,)],
+            "CertificationRepositoryImpl.invalida_lotto": [(1,)],
+            "CertificationRepositoryImpl.is_certificato": [(1,)],
+            "Co2RepositoryImpl.aggiorna_catalogo": [(), (True,)],
+            "Co2RepositoryImpl.get_co2_unitaria": [(1,)],
+            "Co2RepositoryImpl.get_co2_unitaria_lotti": [([1, 2],)],
+            "Co2RepositoryImpl.invalida_lotto": [(1,)],
+            "CompanyRepositoryImpl.get_azienda": [(1,)],
+            "CompanyRepositoryImpl.get_aziende_trasporto": [()],
+            "CompanyRepositoryImpl.get_lista_aziende": [(), (aziende_enum.PRODUTTORI, "agri", None, 1)],
+            "CompensationActionRepositoryImpl.get_co2_compensata": [(1,)],
+            "CompensationActionRepositoryImpl.get_lista_azioni": [(1, oggi, oggi)],
+            "CompensationActionRepositoryImpl.get_lista_azioni_pagina": [(1, None, None, True, codifica_token([10, 5]))],
+            "CompensationActionRepositoryImpl.inserisci_azione": [(oggi, 1, 50, "alberi")],
+            "CredentialRepositoryImpl.cambia_password": [("Password1!", 1)],
+            "CredentialRepositoryImpl.get_address_by_id": [(1,)],
+            "CredentialRepositoryImpl.get_azienda_by_id": [(1,)],
+            "CredentialRepositoryImpl.get_user": [("utente",)],
+            "CredentialRepositoryImpl.register": [("utente", "Password1!", aziende_enum.PRODUTTORI, "via Roma", "0xabc")],
+            "CredentialRepositoryImpl.verifica_password": [("Password1!", 1)],
+            "EsitiFirmaRepositoryImpl.elimina_scaduti": [(50.0, 1000)],
+            "EsitiFirmaRepositoryImpl.get": [("operazione", "0xabc", "1", 50.0)],
+            "EsitiFirmaRepositoryImpl.primo": [("azione_compensativa", "0xabc", 50.0)],
+            "EsitiFirmaRepositoryImpl.salva": [("operazione", "0xabc", "1", "ok", 100.0)],
+            "OperationRepositoryImpl.cerca_operazioni_azienda_pagina": [(1, "mela", codifica_token([-1.5, 7]))],
+            "OperationRepositoryImpl.esporta_operazioni": [(os.path.join(self.tmp.name, "esportazione.csv"), 1)],
+            "OperationRepositoryImpl.get_next_id_lotto_output": [()],
+            "OperationRepositoryImpl.get_operazioni_by_azienda": [(1,)],
+            "OperationRepositoryImpl.get_operazioni_by_azienda_pagina": [(1, codifica_token([5]))],
+            "OperationRepositoryImpl.importa_operazioni": [(importazione,)],
+            "OperationRepositoryImpl.inserisci_operazione_azienda_agricola": [(1, "mele", 100, 1, oggi, 20)],
+            "OperationRepositoryImpl.inserisci_operazione_azienda_rivenditore": [(1, 3, oggi, 5, "vendita", 1, 10)],
+            "OperationRepositoryImpl.inserisci_operazione_trasporto": [(3, 1, 2, 4, 5, 10, 7)],
+            "OperationRepositoryImpl.inserisci_prodotto_trasformato": [(2, "succo", 10, {1: 5}, 1, 8)],
+            "OperationRepositoryImpl.recupera_soglia": [("produzione", 1)],
+            "OperationRepositoryImpl.token_opeazione": [(10, "produzione", 1)],
+            "OutboxRepositoryImpl.accoda_operazione": [("0xabc", 1, "produzione", 1, "messaggio")],
+            "OutboxRepositoryImpl.get_esito": [("0xabc", 1)],
+            "OutboxRepositoryImpl.get_in_invio": [()],
+            "OutboxRepositoryImpl.get_inviate": [()],
+            "OutboxRepositoryImpl.preleva_in_coda": [(10,)],
+            "OutboxRepositoryImpl.rimetti_in_coda": [(1,)],
+            "OutboxRepositoryImpl.segna_confermata": [(1,)],
+            "OutboxRepositoryImpl.segna_fallita": [(1, "errore")],
+            "OutboxRepositoryImpl.segna_inviata": [(1, "0xhash", 0)],
+            "OutboxRepositoryImpl.segna_nonce": [(1, 0)],
+            "ProductRepositoryImpl.carica_lotto_con_composizione": [(1,)],
+            "ProductRepositoryImpl.cerca_prodotti_in_vendita_pagina": [("mela",), ("mela", codifica_token([-1.5, 7]))],
+            "ProductRepositoryImpl.get_catalogo_co2": [("DESC",)],
+            "ProductRepositoryImpl.get_lista_prodotti": [()],
+            "ProductRepositoryImpl.get_lista_prodotti_pagina": [(codifica_token([5]),)],
+            "ProductRepositoryImpl.get_materie_prime_magazzino_azienda": [(1,)],
+            "ProductRepositoryImpl.get_prodotti_finiti_magazzino_azienda": [(1,)],
+            "ProductRepositoryImpl.get_prodotti_ordinabili": [()],
+            "ProductRepositoryImpl.get_prodotti_standard_agricoli": [()],
+            "ProductRepositoryImpl.get_prodotti_standard_trasformazione": [()],
+            "ProductRepositoryImpl.iter_catalogo_co2": [(), ("ASC",)],
+            "RichiesteRepositoryImpl.get_operazioni_token": [(1,)],
+            "RichiesteRepositoryImpl.get_richiesta_inviata_token": [(1,)],
+            "RichiesteRepositoryImpl.get_richiesta_inviata_token_pagina": [(1, codifica_token([5]))],
+            "RichiesteRepositoryImpl.get_richiesta_token_by_id": [(1,)],
+            "RichiesteRepositoryImpl.get_richieste_effettuate": [(1,)],
+            "RichiesteRepositoryImpl.get_richieste_effettuate_pagina": [(1, codifica_token([5]))],
+            "RichiesteRepositoryImpl.get_richieste_ric_token": [(1,)],
+            "RichiesteRepositoryImpl.get_richieste_ric_token_pagina": [(1, codifica_token([5]))],
+            "RichiesteRepositoryImpl.get_richieste_ricevute": [(1,), (1, True)],
+            "RichiesteRepositoryImpl.get_richieste_ricevute_pagina": [(1, False, codifica_token([5]))],
+            "RichiesteRepositoryImpl.inserisci_richiesta": [(1, 2, 3, 4, 10)],
+            "RichiesteRepositoryImpl.register_company_on_blockchain": [(1,)],
+            "RichiesteRepositoryImpl.send_richiesta_token": [(1, 2, 10)],
+            "RichiesteRepositoryImpl.update_richiesta": [(1, "Accettata", "Trasportatore"), (1, "Accettata", "Agricola")],
+            "RichiesteRepositoryImpl.update_richiesta_token": [(richiesta_token, "Accettata")],
+            "SearchRepositoryImpl.cerca": [("mela rossa",), ("mela", "lotto", 1, codifica_token([-1.5, 7]))],
+            "ThresholdRepositoryImpl.get_lista_soglie": [()],
+            "ThresholdRepositoryImpl.get_soglia": [("produzione", 1)],
+            "ThresholdRepositoryImpl.get_soglie": [([("produzione", 1)],)],
+        }
+
+    def _query_repository(self):
+        """
+        Esegue ogni chiamata di _chiamate su repository che registrano le query invece di eseguirle.
+        Restituisce (metodo, query, params) e gli errori delle chiamate che non hanno eseguito query.
+        """
+        registro = RegistroQuery()
+        classi = _classi_repository()
+        with contextlib.ExitStack() as patch:
+            for _, modulo in classi.values():
+                patch.enter_context(mock.patch.object(modulo, "Database", return_value=registro))
+            # Le transazioni sul contratto non raggiungono un nodo: interessano solo le query locali
+            patch.enter_context(mock.patch.object(RichiesteRepositoryImpl, "blockchain_config", mock.MagicMock()))
+            patch.enter_context(mock.patch.object(richieste_repository_impl, "BlockchainConfig"))
+            # Cambio e verifica della password richiedono l'utente in sessione
+            sessione = patch.enter_context(mock.patch.object(credential_repository_impl, "Session"))
+            sessione.return_value.current_user = {"id_azienda": 1}
+            istanze = {nome: classe() for nome, (classe, _) in classi.items()}
+
+            queries, senza_query = [], {}
+            for chiave, lista_args in self._chiamate().items():
+                nome_classe, nome_metodo = chiave.split(".")
+                for args in lista_args:
+                    registro.queries = []
+                    errore = None
+                    try:
+                        getattr(istanze[nome_classe], nome_metodo)(*args)
+                    except Exception as e:
+                        # Con il registro le letture restituiscono risultati vuoti: un errore dopo le query è atteso
+                        errore = e
+                    if not registro.queries:
+                        senza_query[f"{chiave}{args}"] = errore
+                    queries.extend((nome_metodo, query, params) for query, params in registro.queries)
+        return queries, senza_query
+
+    def test_tutti_i_metodi_pubblici_elencati(self):
+        chiamate = self._chiamate()
+        metodi = {f"{nome}.{metodo}" for nome, (classe, _) in _classi_repository().items()
+                  for metodo in _metodi_pubblici(classe)}
+        self.assertEqual(metodi - chiamate.keys() - SENZA_SQL.keys(), set(),
+                         "metodi pubblici senza argomenti in _chiamate né motivo in SENZA_SQL")
+        self.assertEqual((chiamate.keys() | SENZA_SQL.keys()) - metodi, set(), "metodi non più esistenti")
+
+    def test_migrazioni_indici(self):
+        versione = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(versione, db_migrations.DatabaseMigrations.INDEX_MIGRATIONS[-1][0])
+
+        oggetti = {r[0] for r in self.conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger', 'table')")}
+        for _, queries in db_migrations.DatabaseMigrations.INDEX_MIGRATIONS:
+            for query in queries:
+                if query.startswith("CREATE"):
+                    parole = query.split()
+                    self.assertIn(parole[parole.index("EXISTS") + 1], oggetti)
+
+    def test_nessuna_scan_su_tabelle_grandi(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            queries, senza_query = self._query_repository()
+        # Ogni chiamata deve arrivare al database: un errore prima della prima query nasconderebbe il metodo
+        self.assertEqual(senza_query, {})
+
+        for metodo, query, params in queries:
+            with self.subTest(metodo=metodo, query=" ".join(query.split())):
+                try:
+                    piano = self.conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+                except sqlite3.OperationalError as e:
+                    self.assertIn(metodo, QUERY_NON_COMPATIBILI, f"query non compatibile con lo schema: {e}")
+                    self.assertEqual(str(e), QUERY_NON_COMPATIBILI[metodo])
+                    continue
+                self.assertNotIn(metodo, QUERY_NON_COMPATIBILI, "la query ora compila: toglierla da QUERY_NON_COMPATIBILI")
+
+                alias = {a: tabella for tabella, a in ALIAS_TABELLA.findall(query)}
+                for *_, dettaglio in piano:
+                    parole = dettaglio.split()
+                    # Anche SCAN ... USING [COVERING] INDEX percorre tutto l'indice
+                    if parole[0] == "SCAN":
+                        tabella = alias.get(parole[1], parole[1])
+                        self.assertNotIn(tabella, TABELLE_GRANDI - SCAN_AMMESSE.get(metodo, set()), dettaglio)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+import pytest
+
+from off_chain.persistence.repository_impl.esiti_firma_repository_impl import EsitiFirmaRepositoryImpl
+from off_chain.presentation.controller.blockchain_controller import BlockchainController
+from off_chain.presentation.controller.registro_esiti import RegistroEsiti
+
+
+class TestRegistroEsiti(unittest.TestCase):
+
+    def setUp(self):
+        self.esiti = RegistroEsiti()
+
+    def test_attesa_svegliata_dalla_registrazione(self):
+        risultati = []
+        attesa = threading.Thread(target=lambda: risultati.append(
+            self.esiti.attendi(RegistroEsiti.OPERAZIONE, "0xAbC", 5, timeout=5)))
+        inizio = time.monotonic()
+        attesa.start()
+        time.sleep(0.05)
+        self.esiti.registra(RegistroEsiti.OPERAZIONE, "0xabc", "5", "✅ ok")
+        attesa.join()
+
+        self.assertEqual(risultati, ["✅ ok"])
+        self.assertLess(time.monotonic() - inizio, 1)
+        # Esito già presente: nessuna attesa
+        self.assertEqual(self.esiti.attendi(RegistroEsiti.OPERAZIONE, "0xABC", 5, timeout=5), "✅ ok")
+        self.assertFalse(self.esiti._attese)
+
+    def test_scadenza_e_tipi(self):
+        self.assertIsNone(self.esiti.attendi(RegistroEsiti.RICHIESTA_TOKEN, "0xabc", 1, timeout=0.05))
+        # Stessa chiave ma tipo diverso: l'esito non viene confuso
+        self.esiti.registra(RegistroEsiti.AZIONE_COMPENSATIVA, "0xabc", 1, "azione")
+        self.assertIsNone(self.esiti.get(RegistroEsiti.RICHIESTA_TOKEN, "0xabc", 1))
+        self.assertEqual(self.esiti.primo(RegistroEsiti.AZIONE_COMPENSATIVA, "0xABC"), "azione")
+        with self.assertRaises(ValueError):
+            self.esiti.get("sconosciuto", "0xabc", 1)
+
+    def test_limite_e_scadenza(self):
+        esiti = RegistroEsiti(massimo_esiti=3, durata=60)
+        for i in range(3):
+            esiti.registra(RegistroEsiti.OPERAZIONE, "0xabc", i, f"esito {i}")
+        esiti.get(RegistroEsiti.OPERAZIONE, "0xabc", 0)  # Usato di recente: resta
+        esiti.registra(RegistroEsiti.OPERAZIONE, "0xabc", 3, "esito 3")
+
+        self.assertEqual(len(esiti), 3)
+        self.assertIsNone(esiti.get(RegistroEsiti.OPERAZIONE, "0xabc", 1))
+        self.assertEqual(esiti.get(RegistroEsiti.OPERAZIONE, "0xabc", 0), "esito 0")
+
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertIsNone(esiti.get(RegistroEsiti.OPERAZIONE, "0xabc", 3))
+            esiti.registra(RegistroEsiti.OPERAZIONE, "0xabc", 4, "esito 4")
+        self.assertEqual(len(esiti), 1)
+
+
+class TestAttendiEsito(unittest.TestCase):
+
+    def test_richiesta_non_valida_non_ripetuta(self):
+        risposta = mock.Mock(status_code=400, text="")
+        risposta.json.return_value = {"message": "Tipo non valido: sconosciuto"}
+        with mock.patch("requests.get", return_value=risposta) as get:
+            with self.assertRaisesRegex(ValueError, "Tipo non valido"):
+                BlockchainController.attendi_esito("sconosciuto", "0xabc", 1, scadenza=5)
+        get.assert_called_once()
+
+    def test_esito_ricevuto(self):
+        risposta = mock.Mock(status_code=200)
+        risposta.json.return_value = {"status": "completed", "esito": "✅ ok"}
+        with mock.patch("requests.get", return_value=risposta):
+            self.assertEqual(BlockchainController.attendi_esito(RegistroEsiti.OPERAZIONE, "0xabc", 1, scadenza=5), "✅ ok")
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestEsitiPersistenti(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = EsitiFirmaRepositoryImpl()
+
+    def test_esiti_condivisi(self):
+        # Due registri sullo stesso database, come due processi del backend
+        scrittore = RegistroEsiti(repository=self.repository)
+        lettore = RegistroEsiti(repository=self.repository)
+        lettore.INTERVALLO_CONDIVISO = 0.05
+
+        threading.Timer(0.1, lambda: scrittore.registra(RegistroEsiti.RICHIESTA_TOKEN, "0xAbC", 2, "inviata")).start()
+        self.assertEqual(lettore.attendi(RegistroEsiti.RICHIESTA_TOKEN, "0xabc", "2", timeout=5), "inviata")
+
+        # Un registro nuovo (backend riavviato) trova l'esito nel database
+        self.assertEqual(RegistroEsiti(repository=self.repository).get(RegistroEsiti.RICHIESTA_TOKEN, "0xABC", 2), "inviata")
+
+        self.repository.elimina_scaduti(time.time() + RegistroEsiti.DURATA + 1, 10)
+        self.assertIsNone(RegistroEsiti(repository=self.repository).get(RegistroEsiti.RICHIESTA_TOKEN, "0xabc", 2))
+
+    def test_accessi_concorrenti(self):
+        # Come sotto app.run(threaded=True): conferme e attese in parallelo sullo stesso repository
+        scrittore = RegistroEsiti(repository=self.repository)
+        lettore = RegistroEsiti(repository=self.repository)
+        lettore.INTERVALLO_CONDIVISO = 0.01
+        risultati, errori = {}, []
+
+        def attendi(numero):
+            try:
+                risultati[numero] = lettore.attendi(RegistroEsiti.OPERAZIONE, "0xabc", numero, timeout=10)
+                for _ in range(20):
+                    # Registro vuoto (un altro processo): ogni lettura passa dal database
+                    altro_processo = RegistroEsiti(repository=self.repository)
+                    self.assertEqual(altro_processo.get(RegistroEsiti.OPERAZIONE, "0xABC", numero), f"esito {numero}")
+                    self.assertEqual(altro_processo.primo(RegistroEsiti.OPERAZIONE, f"0x{numero}"), f"primo {numero}")
+            except Exception as e:
+                errori.append(e)
+
+        def registra(numero):
+            try:
+                scrittore.registra(RegistroEsiti.OPERAZIONE, f"0x{numero}", 1, f"primo {numero}")
+                time.sleep(0.05)
+                scrittore.registra(RegistroEsiti.OPERAZIONE, "0xabc", numero, f"esito {numero}")
+            except Exception as e:
+                errori.append(e)
+
+        intervallo = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=funzione, args=(numero,))
+                       for numero in range(8) for funzione in (attendi, registra)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(intervallo)
+
+        self.assertEqual(errori, [])
+        self.assertEqual(risultati, {numero: f"esito {numero}" for numero in range(8)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+
+import pytest
+
+from off_chain.persistence.repository_impl import threshold_repository_impl
+from off_chain.persistence.repository_impl.threshold_repository_impl import ThresholdRepositoryImpl, firma_soglia
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestRegistroSoglie(unittest.TestCase):
+
+    def setUp(self):
+        # Al posto delle soglie di seed, tre soglie note
+        self.db.execute_query("DELETE FROM Soglie")
+        self.db.execute_many("INSERT INTO Soglie VALUES (?, ?, ?, ?)", [
+            (operazione, prodotto, soglia, firma_soglia(operazione, prodotto, soglia))
+            for operazione, prodotto, soglia in [("produzione", 1, 50), ("trasporto", 1, 20), ("vendita", 2, 70)]
+        ])
+
+        ThresholdRepositoryImpl._soglie_verificate = {}
+        ThresholdRepositoryImpl._soglie_manomesse = set()
+        ThresholdRepositoryImpl.invalida()
+        self.repository = ThresholdRepositoryImpl()
+
+    def tearDown(self):
+        ThresholdRepositoryImpl._soglie_verificate = {}
+        ThresholdRepositoryImpl._soglie_manomesse = set()
+        ThresholdRepositoryImpl.invalida()
+
+    def test_get_soglie(self):
+        soglie = self.repository.get_soglie([("produzione", 1), ("vendita", "2"), ("vendita", 9)])
+        self.assertEqual(soglie, {("produzione", 1): 50, ("vendita", 2): 70})
+        self.assertEqual(self.repository.get_soglia("trasporto", 1), 20)
+        with self.assertRaises(ValueError):
+            self.repository.get_soglia("vendita", 9)
+
+    def test_firma_verificata_una_volta(self):
+        with mock.patch.object(threshold_repository_impl, "firma_soglia", wraps=firma_soglia) as firma:
+            self.repository.get_soglia("produzione", 1)
+            self.repository.get_soglia("trasporto", 1)
+            self.assertEqual(firma.call_count, 3)
+
+            # Dopo una scrittura viene verificata solo la riga cambiata
+            self.db.execute_query("UPDATE Soglie SET Soglia_Massima = 60, firma = ? WHERE Operazione = 'produzione'",
+                                 (firma_soglia("produzione", 1, 60),))
+            self.assertEqual(self.repository.get_soglia("produzione", 1), 60)
+            self.assertEqual(firma.call_count, 4)
+
+    def test_manomissione(self):
+        self.assertEqual(self.repository.get_soglia("vendita", 2), 70)
+        # Valore modificato senza una firma valida
+        self.db.execute_query("UPDATE Soglie SET Soglia_Massima = 1000 WHERE Operazione = 'vendita'")
+        with self.assertRaises(ValueError):
+            self.repository.get_soglia("vendita", 2)
+        with self.assertRaises(ValueError):
+            self.repository.get_soglie([("produzione", 1), ("vendita", 2)])
+        self.assertEqual(self.repository.get_soglia("produzione", 1), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
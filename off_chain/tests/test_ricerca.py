@@ -0,0 +1,76 @@
+import unittest
+from unittest import mock
+
+import pytest
+
+from off_chain.persistence.repository_impl.product_repository_impl import ProductRepositoryImpl
+from off_chain.persistence.repository_impl.search_repository_impl import SearchRepositoryImpl, espressione_ricerca
+
+INSERISCI_OPERAZIONE = ("INSERT INTO Operazione (Id_azienda, Id_prodotto, Id_lotto, Tipo, Consumo_CO2, quantita) "
+                        "VALUES (?, ?, ?, ?, 1, 1)")
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestRicerca(unittest.TestCase):
+
+    def setUp(self):
+        # Oltre ai dati di seed (prodotti 1-20 tra cui 9 "mele" e 14 "passata di pomodoro", aziende 1-5
+        # tra cui 4 "riv BioCheck" e 5 "cert BioCheck"): prodotti 21 e 22 e azienda 6
+        self.db.execute_many("INSERT INTO Prodotto (Id_prodotto, Nome) VALUES (?, ?)", [(21, "Mela rossa"), (22, "Pera")])
+        self.db.execute_query("INSERT INTO Azienda (Id_azienda, Id_credenziali, Tipo, Nome, Indirizzo) "
+                              "VALUES (6, 1, 'Agricola', 'Frutteto Rossi', 'Via delle Mele 3, Trento')")
+        self.db.execute_many(INSERISCI_OPERAZIONE,
+                             [(6, 21, 101, "produzione"), (6, 22, 102, "produzione"), (4, 14, 103, "vendita")])
+        self.db.execute_query("INSERT INTO Certificato VALUES (1, 103, 'Biologico certificato', 5, CURRENT_TIMESTAMP)")
+
+        self.repository = SearchRepositoryImpl()
+
+    def _trovati(self, testo, tipo=None, id_azienda=None):
+        return {(r.tipo, r.id_riferimento) for r in self.repository.cerca(testo, tipo, id_azienda).elementi}
+
+    def test_espressione(self):
+        self.assertEqual(espressione_ricerca('mela "OR pera*'), '"mela"* "OR"* "pera"*')
+        self.assertEqual(espressione_ricerca("  -- "), "")
+
+    def test_prefissi_e_filtri(self):
+        self.assertEqual(self._trovati("mel"), {("prodotto", 9), ("prodotto", 21), ("lotto", 101), ("azienda", 6)})
+        self.assertEqual(self._trovati("mel", tipo="lotto"), {("lotto", 101)})
+        self.assertEqual(self._trovati("103"), {("lotto", 103), ("certificato", 1)})
+        self.assertEqual(self._trovati("pomodoro vend"), {("lotto", 103)})
+        self.assertEqual(self._trovati("pera", id_azienda=4), set())
+        self.assertEqual(self._trovati("bio", tipo="certificato"), {("certificato", 1)})
+
+    def test_trigger(self):
+        self.db.execute_query("UPDATE Prodotto SET Nome = 'Mela gialla' WHERE Id_prodotto = 22")
+        self.assertEqual(self._trovati("gialla"), {("prodotto", 22), ("lotto", 102)})
+        self.db.execute_query("DELETE FROM Operazione WHERE Id_lotto = 102")
+        self.db.execute_query("UPDATE Azienda SET Indirizzo = 'Piazza Duomo 1' WHERE Id_azienda = 6")
+        self.assertEqual(self._trovati("gialla"), {("prodotto", 22)})
+        self.assertEqual(self._trovati("duomo"), {("azienda", 6)})
+
+    def test_pagine(self):
+        self.db.execute_many(INSERISCI_OPERAZIONE, [(6, 22, 200 + i, "trasporto") for i in range(7)])
+        letti, token = [], None
+        while True:
+            pagina = self.repository.cerca("pera", "lotto", token=token, dimensione=3)
+            letti.extend(r.id_riferimento for r in pagina.elementi)
+            if pagina.ultima:
+                break
+            token = pagina.token_successivo
+        self.assertEqual(sorted(letti), [102] + [200 + i for i in range(7)])
+
+    def test_prodotti_in_vendita(self):
+        self.db.execute_query("INSERT INTO CatalogoCo2 (Id_lotto, Co2_totale, Co2_unitaria) VALUES (103, 50, 5)")
+        prodotti = ProductRepositoryImpl()
+        prodotti.co2_repository = mock.Mock()
+
+        pagina = prodotti.cerca_prodotti_in_vendita_pagina("pomod")
+        self.assertEqual([(p.nome, p.numero_lotto, p.nome_azienda, p.co2_unitaria) for p in pagina.elementi],
+                         [("passata di pomodoro", 103, "riv BioCheck", 5)])
+        prodotti.co2_repository.aggiorna_catalogo.assert_called_once()
+        # Il lotto 101 corrisponde al testo ma non è in vendita
+        self.assertEqual(prodotti.cerca_prodotti_in_vendita_pagina("mela").elementi, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+import pytest
+
+# Lo stesso modulo usato dalla fixture database_migrato (senza il prefisso off_chain)
+import configuration.database as database
+from off_chain.configuration.sql_tracing import TracciamentoSQL, normalizza_sql
+
+
+@pytest.mark.usefixtures("database_migrato")
+class TestTracciamentoSQL(unittest.TestCase):
+
+    def tearDown(self):
+        database.Database.disattiva_tracciamento()
+
+    def test_normalizzazione(self):
+        self.assertEqual(normalizza_sql("SELECT *  FROM Prova\n WHERE id IN (?, ?, ?) AND valore = 5;"),
+                         "SELECT * FROM Prova WHERE id IN (?, ...) AND valore = ?")
+        self.assertEqual(normalizza_sql("SELECT Co2_emessa FROM Azienda WHERE Nome = 'x'"),
+                         "SELECT Co2_emessa FROM Azienda WHERE Nome = ?")
+
+    def test_disattivo_per_default(self):
+        self.assertIsNone(database.Database.tracciamento)
+        self.db.fetch_results("SELECT * FROM CatalogoCo2")
+        self.assertEqual(database.Database.report_query(), [])
+
+    def test_report_per_forma(self):
+        tracciamento = database.Database.attiva_tracciamento(TracciamentoSQL(soglia_lenta=0))
+        self.db.execute_many("INSERT INTO CatalogoCo2 (Co2_totale, Co2_unitaria) VALUES (?, 0)", [(i,) for i in range(5)])
+        for i in range(3):
+            self.db.fetch_results("SELECT Co2_totale FROM CatalogoCo2 WHERE Id_lotto > ?", (i,))
+        self.db.fetch_one("SELECT COUNT(*) FROM CatalogoCo2 WHERE Co2_totale > 1")
+
+        with self.assertLogs(TracciamentoSQL.NOME_LOGGER, "WARNING") as log:
+            list(self.db.iter_results("SELECT Co2_totale FROM CatalogoCo2", arraysize=2))
+        self.assertIn("5 righe", log.output[0])
+
+        report = {s.forma: s for s in tracciamento.report()}
+        select = report["SELECT Co2_totale FROM CatalogoCo2 WHERE Id_lotto > ?"]
+        self.assertEqual((select.chiamate, select.righe), (3, 5 + 4 + 3))
+        self.assertEqual(list(select.chiamanti), ["test_sql_tracing:TestTracciamentoSQL.test_report_per_forma"])
+        self.assertEqual(report["INSERT INTO CatalogoCo2 (Co2_totale, Co2_unitaria) VALUES (?, ...)"].righe, 5)
+        self.assertEqual(len(tracciamento.report(2)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
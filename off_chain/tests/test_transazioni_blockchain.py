@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from eth_abi import encode
+from web3 import Web3
+from web3.contract.contract import ContractFunction
+from web3.datastructures import AttributeDict
+
+import off_chain.persistence.repository_impl.richieste_repository_impl as richieste_repository_impl
+from off_chain.persistence.repository_impl.richieste_repository_impl import BlockchainConfig
+
+AZIENDA = "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+CONTRATTO = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+
+# Firme di on_chain/contracts/SustainableFoodChain.sol usate da esegui_transazione
+ABI = [
+    {"type": "function", "name": "createTokenRequest", "stateMutability": "nonpayable", "outputs": [{"name": "", "type": "uint256"}],
+     "inputs": [{"name": "_provider", "type": "address"}, {"name": "_amount", "type": "uint256"},
+                {"name": "_sustainabilityPurpose", "type": "string"}, {"name": "_estimatedCO2Reduction", "type": "uint256"}]},
+    {"type": "function", "name": "acceptTokenRequest", "stateMutability": "nonpayable", "outputs": [],
+     "inputs": [{"name": "_requestId", "type": "uint256"}]},
+    {"type": "event", "name": "RequestCreated", "anonymous": False,
+     "inputs": [{"name": "requestId", "type": "uint256", "indexed": True},
+                {"name": "requester", "type": "address", "indexed": True},
+                {"name": "provider", "type": "address", "indexed": True},
+                {"name": "amount", "type": "uint256", "indexed": False},
+                {"name": "sustainabilityPurpose", "type": "string", "indexed": False},
+                {"name": "estimatedCO2Reduction", "type": "uint256", "indexed": False}]},
+]
+
+
+def _ricevuta(*id_richieste):
+    """Ricevuta con un evento RequestCreated per ogni id, come la produrrebbe il nodo."""
+    firma = Web3.keccak(text="RequestCreated(uint256,address,address,uint256,string,uint256)")
+    indirizzo = bytes(12) + bytes.fromhex(AZIENDA[2:])
+    logs = [AttributeDict({
+        "address": CONTRATTO, "topics": [firma, id_richiesta.to_bytes(32, "big"), indirizzo, indirizzo],
+        "data": encode(["uint256", "string", "uint256"], [5, "compensazione", 10]),
+        "blockHash": bytes(32), "blockNumber": 7, "transactionHash": bytes(32), "transactionIndex": 0, "logIndex": i,
+    }) for i, id_richiesta in enumerate(id_richieste)]
+    return AttributeDict({"status": 1, "blockNumber": 7, "logs": logs})
+
+
+class TestTransazioniBlockchain(unittest.TestCase):
+
+    def setUp(self):
+        self.registro = mock.MagicMock()
+        self.registro.w3.eth.accounts = ["0xf39Fd6e51aad88F6F4cE6aB8827279cffFb92266", AZIENDA]
+        self.registro.nonce_manager.invia.return_value = ("0xhash", 0)
+        self.registro.w3.eth.wait_for_transaction_receipt.return_value = _ricevuta(3)
+        # Oggetto contratto vero: una funzione o un evento assenti dall'ABI fanno fallire il test
+        self.registro.contratto.return_value = Web3().eth.contract(address=CONTRATTO, abi=ABI)
+
+        # Configurazione già caricata, senza nodo
+        self.config = object.__new__(BlockchainConfig)
+        self.config.registro = self.registro
+        self.config.contract_files = {"SustainableFoodChain": "SustainableFoodChain.json"}
+        self.config.contract_abis = {}
+
+    def test_web3_nel_processo(self):
+        params = {"contract_address": CONTRATTO, "provider_address": AZIENDA, "amount": 5,
+                  "purpose": "compensazione", "co2_reduction": 10, "company_address": AZIENDA.lower()}
+        with mock.patch("subprocess.run") as run:
+            self.assertEqual(self.config.esegui_transazione("create_token", params), 3)
+            run.assert_not_called()
+
+        account, costruisci_tx = self.registro.nonce_manager.invia.call_args.args
+        self.assertEqual(account, AZIENDA)  # Firma l'account dell'azienda, gestito dal nodo
+        with mock.patch.object(ContractFunction, "build_transaction", autospec=True,
+                               side_effect=lambda funzione, tx: dict(tx, chiamata=(funzione.fn_name, funzione.args))):
+            self.assertEqual(costruisci_tx(4), {'from': AZIENDA, 'nonce': 4, 'chiamata': (
+                "createTokenRequest", (AZIENDA, 5, "compensazione", 10))})
+
+        # Senza evento nella ricevuta: ValueError, non un errore di web3
+        self.registro.w3.eth.wait_for_transaction_receipt.return_value = _ricevuta()
+        with self.assertRaisesRegex(ValueError, "RequestCreated"):
+            self.config.esegui_transazione("create_token", params)
+
+        # Errore del contratto riportato come ValueError, come lo stderr dello script
+        self.registro.nonce_manager.invia.side_effect = Exception("execution reverted: Request not pending")
+        with self.assertRaisesRegex(ValueError, "Request not pending"):
+            self.config.esegui_transazione("accept_token", {"contract_address": CONTRATTO, "request_id": 3})
+
+    def test_script_node_esplicito(self):
+        with tempfile.TemporaryDirectory() as cartella, \
+                mock.patch.object(BlockchainConfig, "SCRIPT_NODE", True), \
+                mock.patch.object(richieste_repository_impl, "SCRIPTS_DIR", cartella), \
+                mock.patch("subprocess.run", return_value=mock.Mock(returncode=1, stdout="", stderr="Error: boom")) as run:
+            with self.assertRaisesRegex(ValueError, "boom"):
+                self.config.esegui_transazione("reject_token", {"contract_address": CONTRATTO, "request_id": 3,
+                                                                "reason": "no"})
+            self.assertEqual(run.call_args.args[0][0], "node")
+            self.assertEqual(os.listdir(cartella), [])  # Lo script temporaneo viene rimosso
+        self.registro.nonce_manager.invia.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()